@@ -1 +1,7 @@
-from .applaunch import prepareApp, launchApp
+def __getattr__(name):
+    # Imported lazily so that the framework and model packages can be used
+    # without loading Qt, e.g. with the pure framework backend.
+    if name in ('prepareApp', 'launchApp'):
+        from . import applaunch
+        return getattr(applaunch, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1 +1,8 @@
-from .qt import *
+import os
+
+# The framework backend is selected at startup through the IMSWITCH_FRAMEWORK
+# environment variable; "qt" (default) or "pure" for headless deployments.
+if os.environ.get('IMSWITCH_FRAMEWORK', 'qt').lower() == 'pure':
+    from .pure import *
+else:
+    from .qt import *
@@ -0,0 +1,436 @@
+""" Pure-Python implementation of the framework interfaces, for running
+managers and the REST server without Qt. Select it by setting the
+environment variable ``IMSWITCH_FRAMEWORK=pure`` before ImSwitch is
+imported.
+
+Delivery of signals follows the Qt auto-connection rules: slots that are
+bound methods of a SignalInterface living in another thread with a running
+event loop are queued to that thread, everything else is called directly.
+Coroutine functions can be connected as slots; they are scheduled on the
+asyncio event loop that was running when they were connected. """
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import sys
+import threading
+import time
+from collections import deque
+
+import imswitch.imcommon.framework.base as base
+
+
+class _EventLoop:
+    """ Per-thread queue of posted callables and timers. """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._events = deque()
+        self._timers = []  # heap of (deadline, sequenceNumber, func)
+        self._sequence = itertools.count()
+        self._running = False
+        self._quitRequested = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def post(self, func):
+        with self._condition:
+            self._events.append(func)
+            self._condition.notify()
+
+    def callLater(self, delay, func):
+        with self._condition:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._sequence), func))
+            self._condition.notify()
+
+    def prepare(self):
+        with self._condition:
+            self._running = True
+            self._quitRequested = False
+
+    def quit(self):
+        with self._condition:
+            self._quitRequested = True
+            self._condition.notify()
+
+    def exec(self):
+        """ Processes events until quit is called. Like QThread.exec, returns
+        immediately if quit was called after prepare, e.g. by a slot
+        connected to a thread's started signal. """
+        with self._condition:
+            self._running = True
+        try:
+            while True:
+                with self._condition:
+                    while not self._quitRequested and not self._hasDueEvents():
+                        self._condition.wait(self._timeToNextTimer())
+                    if self._quitRequested:
+                        return
+                self.processPendingEvents()
+        finally:
+            with self._condition:
+                self._running = False
+                self._quitRequested = False
+
+    def processPendingEvents(self):
+        with self._condition:
+            funcs = list(self._events)
+            self._events.clear()
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                funcs.append(heapq.heappop(self._timers)[2])
+
+        for func in funcs:
+            _invokeSlot(func)
+
+    def _hasDueEvents(self):
+        return len(self._events) > 0 or (self._timers and self._timers[0][0] <= time.monotonic())
+
+    def _timeToNextTimer(self):
+        if not self._timers:
+            return None
+        return max(0.0, self._timers[0][0] - time.monotonic())
+
+
+_eventLoopsLock = threading.Lock()
+
+
+def _getCurrentEventLoop():
+    thread = threading.current_thread()
+    loop = getattr(thread, '_imswitchEventLoop', None)
+    if loop is None:
+        with _eventLoopsLock:
+            loop = getattr(thread, '_imswitchEventLoop', None)
+            if loop is None:
+                loop = _EventLoop()
+                thread._imswitchEventLoop = loop
+    return loop
+
+
+def _invokeSlot(func, *args):
+    """ Calls the slot and passes exceptions to the exception hook, so that
+    one failing slot doesn't prevent the others from being called. """
+    try:
+        func(*args)
+    except Exception:
+        sys.excepthook(*sys.exc_info())
+
+
+def _getMaxArgCount(func):
+    """ Returns the maximum number of positional arguments the function
+    accepts, or None if unlimited or unknown. """
+    try:
+        signature = inspect.signature(func)
+    except (TypeError, ValueError):
+        return None
+
+    count = 0
+    for parameter in signature.parameters.values():
+        if parameter.kind == inspect.Parameter.VAR_POSITIONAL:
+            return None
+        if parameter.kind in (inspect.Parameter.POSITIONAL_ONLY,
+                              inspect.Parameter.POSITIONAL_OR_KEYWORD):
+            count += 1
+    return count
+
+
+class Mutex(base.Mutex):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def lock(self) -> None:
+        self._lock.acquire()
+
+    def unlock(self) -> None:
+        self._lock.release()
+
+    def tryLock(self, timeout: int = 0) -> bool:
+        """ Tries to lock the mutex, waiting at most timeout milliseconds. """
+        if timeout < 0:
+            return self._lock.acquire()
+        if timeout == 0:
+            return self._lock.acquire(blocking=False)
+        return self._lock.acquire(timeout=timeout / 1000)
+
+
+class BoundSignal(base.Signal):
+    """ Signal instance belonging to a specific object. Created on first
+    access of a Signal class attribute through an instance. """
+
+    def __init__(self, *argTypes) -> None:
+        self._argTypes = argTypes
+        self._slotsLock = threading.Lock()
+        self._slots = []  # list of (func, maxArgCount, asyncioLoop)
+
+    def connect(self, func, loop=None) -> None:
+        asyncioLoop = None
+        if asyncio.iscoroutinefunction(func):
+            asyncioLoop = loop
+            if asyncioLoop is None:
+                try:
+                    asyncioLoop = asyncio.get_running_loop()
+                except RuntimeError:
+                    raise ValueError('Coroutine slots must be connected from a running asyncio'
+                                     ' event loop or with the loop argument set') from None
+
+        maxArgCount = None if isinstance(func, BoundSignal) else _getMaxArgCount(func)
+        with self._slotsLock:
+            self._slots.append((func, maxArgCount, asyncioLoop))
+
+    def disconnect(self, func=None) -> None:
+        with self._slotsLock:
+            if func is None:
+                self._slots.clear()
+                return
+
+            for i, (slot, _, _) in enumerate(self._slots):
+                if slot == func:
+                    del self._slots[i]
+                    return
+
+        raise TypeError('Slot is not connected to this signal')
+
+    def emit(self, *args) -> None:
+        with self._slotsLock:
+            slots = list(self._slots)
+
+        for func, maxArgCount, asyncioLoop in slots:
+            slotArgs = args if maxArgCount is None else args[:maxArgCount]
+            if asyncioLoop is not None:
+                asyncio.run_coroutine_threadsafe(func(*slotArgs), asyncioLoop)
+                continue
+
+            if isinstance(func, BoundSignal):
+                func.emit(*slotArgs)
+                continue
+
+            receiver = getattr(func, '__self__', None)
+            receiverLoop = getattr(receiver, '_eventLoop', None)
+            if (receiverLoop is None or not receiverLoop.running
+                    or receiverLoop is _getCurrentEventLoop()):
+                _invokeSlot(func, *slotArgs)
+            else:
+                receiverLoop.post(lambda func=func, slotArgs=slotArgs: func(*slotArgs))
+
+    async def asyncWait(self):
+        """ Waits until the signal is emitted and returns the emitted
+        arguments as a tuple. Must be awaited from a running asyncio event
+        loop. """
+        asyncioLoop = asyncio.get_running_loop()
+        future = asyncioLoop.create_future()
+
+        def resolve(*args):
+            asyncioLoop.call_soon_threadsafe(
+                lambda: future.set_result(args) if not future.done() else None
+            )
+
+        self.connect(resolve)
+        try:
+            return await future
+        finally:
+            self.disconnect(resolve)
+
+
+class Signal(base.Signal):
+    """ Signal declared as a class attribute. Accessing it through an instance
+    returns a BoundSignal specific to that instance. """
+
+    def __init__(self, *argTypes) -> None:
+        self._argTypes = argTypes
+        self._attrName = f'_boundSignal_{id(self)}'
+
+    def __set_name__(self, owner, name):
+        self._attrName = f'_boundSignal_{name}'
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        boundSignal = instance.__dict__.get(self._attrName)
+        if boundSignal is None:
+            boundSignal = instance.__dict__.setdefault(self._attrName,
+                                                       BoundSignal(*self._argTypes))
+        return boundSignal
+
+    def connect(self, func) -> None:
+        raise TypeError('Signals must be accessed through an instance to be connected')
+
+    def disconnect(self, func) -> None:
+        raise TypeError('Signals must be accessed through an instance to be disconnected')
+
+    def emit(self, *args) -> None:
+        raise TypeError('Signals must be accessed through an instance to be emitted')
+
+
+class SignalInterface(base.SignalInterface):
+    def __init__(self) -> None:
+        self._eventLoop = _getCurrentEventLoop()
+
+
+class Thread(SignalInterface, base.Thread):
+    started = Signal()
+    finished = Signal()
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._threadEventLoop = _EventLoop()
+        self._pythonThread = None
+
+    def start(self) -> None:
+        if self.isRunning():
+            return
+
+        self._threadEventLoop.prepare()
+        self._pythonThread = threading.Thread(target=self._run, daemon=True)
+        self._pythonThread.start()
+
+    def quit(self) -> None:
+        self._threadEventLoop.quit()
+
+    def wait(self) -> None:
+        if (self._pythonThread is not None
+                and self._pythonThread is not threading.current_thread()):
+            self._pythonThread.join()
+
+    def isRunning(self) -> bool:
+        return self._pythonThread is not None and self._pythonThread.is_alive()
+
+    def _run(self):
+        threading.current_thread()._imswitchEventLoop = self._threadEventLoop
+        self.started.emit()
+        self._threadEventLoop.exec()
+        self.finished.emit()
+
+
+class Timer(SignalInterface, base.Timer):
+    timeout = Signal()
+
+    def __init__(self, singleShot: bool = False) -> None:
+        super().__init__()
+        self._singleShot = singleShot
+        self._interval = 0
+        self._active = False
+        self._generation = 0
+        self._stopEvent = None
+        self._stateLock = threading.Lock()
+
+    def setSingleShot(self, singleShot: bool) -> None:
+        self._singleShot = singleShot
+
+    def isSingleShot(self) -> bool:
+        return self._singleShot
+
+    def setInterval(self, periodMilliseconds: int) -> None:
+        self._interval = periodMilliseconds
+
+    def interval(self) -> int:
+        return self._interval
+
+    def isActive(self) -> bool:
+        return self._active
+
+    def start(self, periodMilliseconds: int = None) -> None:
+        if periodMilliseconds is not None:
+            self._interval = periodMilliseconds
+
+        self.stop()
+        with self._stateLock:
+            self._active = True
+            generation = self._generation
+            if self._eventLoop.running:
+                self._schedule(generation)
+            else:
+                # No event loop in the timer's thread; fire from a helper thread instead
+                self._stopEvent = threading.Event()
+                threading.Thread(target=self._runFallback, args=(generation, self._stopEvent),
+                                 daemon=True).start()
+
+    def stop(self) -> None:
+        with self._stateLock:
+            self._active = False
+            self._generation += 1
+            if self._stopEvent is not None:
+                self._stopEvent.set()
+                self._stopEvent = None
+
+    def _schedule(self, generation):
+        self._eventLoop.callLater(self._interval / 1000,
+                                  lambda: self._fireScheduled(generation))
+
+    def _fireScheduled(self, generation):
+        with self._stateLock:
+            if generation != self._generation:
+                return
+            if self._singleShot:
+                self._active = False
+            else:
+                self._schedule(generation)
+        self.timeout.emit()
+
+    def _runFallback(self, generation, stopEvent):
+        nextTime = time.monotonic() + self._interval / 1000
+        while not stopEvent.wait(max(0.0, nextTime - time.monotonic())):
+            with self._stateLock:
+                if generation != self._generation:
+                    return
+                if self._singleShot:
+                    self._active = False
+            self.timeout.emit()
+            if self._singleShot:
+                return
+            nextTime = max(nextTime + self._interval / 1000, time.monotonic())
+
+
+class Worker(SignalInterface, base.Worker):
+    def __init__(self) -> None:
+        super().__init__()
+
+    def moveToThread(self, thread: Thread) -> None:
+        self._eventLoop = thread._threadEventLoop
+
+
+class FrameworkUtils(base.FrameworkUtils):
+    @staticmethod
+    def processPendingEventsCurrThread():
+        _getCurrentEventLoop().processPendingEvents()
+
+    @staticmethod
+    def runEventLoop():
+        """ Runs the event loop of the main thread until quitEventLoop is
+        called. This is the headless replacement for the Qt application's
+        exec, and must be called from the main thread. """
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError('runEventLoop must be called from the main thread')
+        loop = _getCurrentEventLoop()
+        loop.prepare()
+        loop.exec()
+
+    @staticmethod
+    def quitEventLoop():
+        """ Stops the event loop of the main thread. Can be called from any
+        thread. """
+        mainThread = threading.main_thread()
+        with _eventLoopsLock:
+            loop = getattr(mainThread, '_imswitchEventLoop', None)
+        if loop is not None:
+            loop.quit()
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -2,4 +2,6 @@ from .SharedAttributes import SharedAttributes
 from .VFileCollection import VFileItem, VFileCollection
 from .api import APIExport, generateAPI
 from .logging import initLogger
+from .metrics import getMetricsRegistry
+from .statecache import StateCache
 from .shortcut import shortcut, generateShortcuts
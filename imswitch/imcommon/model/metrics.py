@@ -0,0 +1,257 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+
+_defaultLatencyBuckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                          1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    """ Base class for metrics. A metric holds one value (or set of values)
+    per unique combination of label values. """
+
+    metricType = None
+
+    def __init__(self, name, description=''):
+        self._name = name
+        self._description = description
+        self._lock = threading.Lock()
+        self._values = {}  # { labels tuple: value }
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def description(self):
+        return self._description
+
+    def clear(self):
+        """ Removes all recorded values. """
+        with self._lock:
+            self._values.clear()
+
+    def getValues(self):
+        """ Returns a dict with the current value for each label combination,
+        the keys being tuples of ``(labelName, labelValue)`` pairs. """
+        with self._lock:
+            return {labels: self._copyValue(value) for labels, value in self._values.items()}
+
+    def renderPrometheus(self):
+        """ Returns the metric in the Prometheus text exposition format. """
+        lines = [f'# HELP {self._name} {_escapeHelp(self._description)}',
+                 f'# TYPE {self._name} {self.metricType}']
+        for labels, value in sorted(self.getValues().items()):
+            lines.extend(self._renderValue(labels, value))
+        return '\n'.join(lines)
+
+    def _renderValue(self, labels, value):
+        return [f'{self._name}{_formatLabels(labels)} {_formatNumber(value)}']
+
+    def _copyValue(self, value):
+        return value
+
+    @staticmethod
+    def _labelsKey(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Counter(_Metric):
+    """ A monotonically increasing value, e.g. number of frames acquired. """
+
+    metricType = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only be increased')
+
+        key = self._labelsKey(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """ A value that can go up and down, e.g. a queue depth. """
+
+    metricType = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._labelsKey(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._labelsKey(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """ Samples observations, e.g. latencies in seconds, into buckets and
+    keeps track of their count and sum. """
+
+    metricType = 'histogram'
+
+    def __init__(self, name, description='', buckets=_defaultLatencyBuckets):
+        super().__init__(name, description)
+        self._buckets = tuple(sorted(buckets))
+
+    @property
+    def buckets(self):
+        return self._buckets
+
+    def observe(self, value, **labels):
+        key = self._labelsKey(labels)
+        bucketIndex = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = {
+                    'buckets': [0] * (len(self._buckets) + 1), 'count': 0, 'sum': 0.0
+                }
+            data['buckets'][bucketIndex] += 1
+            data['count'] += 1
+            data['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """ Context manager that observes the time in seconds spent in the
+        enclosed block. """
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - startTime, **labels)
+
+    def _copyValue(self, value):
+        return {'buckets': list(value['buckets']), 'count': value['count'], 'sum': value['sum']}
+
+    def _renderValue(self, labels, value):
+        lines = []
+        cumulative = 0
+        for bound, bucketCount in zip(self._buckets + (float('inf'),), value['buckets']):
+            cumulative += bucketCount
+            bucketLabels = labels + (('le', _formatNumber(bound)),)
+            lines.append(f'{self._name}_bucket{_formatLabels(bucketLabels)} {cumulative}')
+        lines.append(f'{self._name}_sum{_formatLabels(labels)} {_formatNumber(value["sum"])}')
+        lines.append(f'{self._name}_count{_formatLabels(labels)} {value["count"]}')
+        return lines
+
+
+class MetricsRegistry:
+    """ Keeps track of metrics by name. Requesting a metric that already
+    exists returns the existing instance, so instrumented code can simply ask
+    for its metrics where it needs them. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def counter(self, name, description=''):
+        """ Returns the counter with the specified name, creating it if it
+        doesn't exist. """
+        return self._getOrCreate(Counter, name, description)
+
+    def gauge(self, name, description=''):
+        """ Returns the gauge with the specified name, creating it if it
+        doesn't exist. """
+        return self._getOrCreate(Gauge, name, description)
+
+    def histogram(self, name, description='', buckets=_defaultLatencyBuckets):
+        """ Returns the histogram with the specified name, creating it if it
+        doesn't exist. """
+        return self._getOrCreate(Histogram, name, description, buckets=buckets)
+
+    def getMetrics(self):
+        """ Returns a JSON-serializable dict with the current values of all
+        metrics. """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        result = {}
+        for metric in metrics:
+            result[metric.name] = {
+                'type': metric.metricType,
+                'description': metric.description,
+                'values': [{'labels': dict(labels), 'value': value}
+                           for labels, value in metric.getValues().items()]
+            }
+        return result
+
+    def renderPrometheus(self):
+        """ Returns all metrics in the Prometheus text exposition format. """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return '\n'.join(metric.renderPrometheus() for metric in metrics) + '\n'
+
+    def clear(self):
+        """ Resets the recorded values of all metrics. """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+    def _getOrCreate(self, metricClass, name, description, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metricClass(name, description, **kwargs)
+            elif not isinstance(metric, metricClass):
+                raise TypeError(f'Metric "{name}" is already registered as a'
+                                f' {metric.metricType}')
+            return metric
+
+
+_registry = MetricsRegistry()
+
+
+def getMetricsRegistry():
+    """ Returns the process-wide metrics registry. """
+    return _registry
+
+
+def _formatLabels(labels):
+    if not labels:
+        return ''
+    formatted = ','.join(f'{key}="{_escapeLabelValue(value)}"' for key, value in labels)
+    return f'{{{formatted}}}'
+
+
+def _formatNumber(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def _escapeLabelValue(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _escapeHelp(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,125 @@
+import threading
+import time
+
+from .metrics import getMetricsRegistry
+
+
+_metrics = getMetricsRegistry()
+_hitsCounter = _metrics.counter(
+    'imswitch_state_cache_hits_total', 'Number of device getter calls served from the cache'
+)
+_missesCounter = _metrics.counter(
+    'imswitch_state_cache_misses_total', 'Number of device getter calls that queried the device'
+)
+
+
+class StateCache:
+    """ Read-through cache for values read back from a device. Each value is
+    kept for a limited time (TTL) and can be invalidated explicitly, e.g.
+    when the device is moved or reconfigured. Concurrent readers of an
+    expired value share a single query to the device. """
+
+    def __init__(self, name='', defaultTTL=1.0):
+        """
+        Args:
+            name: Name of the device that the cache belongs to, used for
+              metrics.
+            defaultTTL: Time in seconds that a value stays valid unless
+              another TTL is specified in get. None means that values only
+              expire when invalidated.
+        """
+        self._name = name
+        self._defaultTTL = defaultTTL
+        self._lock = threading.Lock()
+        self._entries = {}  # { key: (value, timestamp) }
+        self._fetchLocks = {}
+        self._generation = 0
+
+    @property
+    def defaultTTL(self):
+        return self._defaultTTL
+
+    def get(self, key, fetchFunc, ttl=None, fresh=False):
+        """ Returns the cached value for key, or calls fetchFunc to query the
+        device if there is no valid value. If fresh is set, the device is
+        always queried. """
+        ttl = self._defaultTTL if ttl is None else ttl
+        if not fresh:
+            value, valid = self._lookup(key, ttl)
+            if valid:
+                _hitsCounter.inc(device=self._name, key=_keyLabel(key))
+                return value
+
+        with self._lock:
+            fetchLock = self._fetchLocks.setdefault(key, threading.Lock())
+
+        with fetchLock:
+            if not fresh:
+                # Another thread may have fetched the value while we waited
+                value, valid = self._lookup(key, ttl)
+                if valid:
+                    _hitsCounter.inc(device=self._name, key=_keyLabel(key))
+                    return value
+
+            with self._lock:
+                generation = self._generation
+            _missesCounter.inc(device=self._name, key=_keyLabel(key))
+            value = fetchFunc()
+            with self._lock:
+                # Don't store values that may have been invalidated during the fetch
+                if generation == self._generation:
+                    self._entries[key] = (value, time.monotonic())
+            return value
+
+    def peek(self, key, default=None):
+        """ Returns the last stored value for key regardless of its age,
+        without querying the device. """
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else default
+
+    def set(self, key, value):
+        """ Stores a value that is known to be current, e.g. one that was just
+        written to the device. """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+
+    def invalidate(self, *keys):
+        """ Invalidates the values for the specified keys, or all values if no
+        keys are specified. """
+        with self._lock:
+            self._generation += 1
+            if not keys:
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+
+    def _lookup(self, key, ttl):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None, False
+        value, timestamp = entry
+        return value, ttl is None or time.monotonic() - timestamp < ttl
+
+
+def _keyLabel(key):
+    return key[0] if isinstance(key, tuple) else key
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
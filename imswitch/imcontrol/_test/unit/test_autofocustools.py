@@ -0,0 +1,131 @@
+import time
+
+import numpy as np
+import pytest
+import scipy.ndimage as ndi
+
+from imswitch.imcontrol.model import autofocustools
+
+
+class SimulatedFocus:
+    """ A textured sample that gets blurrier the further it is from focus. """
+
+    def __init__(self, focus):
+        self.focus = focus
+        self.position = 0.0
+        self.moves = 0
+        self.sample = np.random.default_rng(0).uniform(0, 1000, (128, 128))
+
+    def moveTo(self, position):
+        self.position = position
+        self.moves += 1
+
+    def grabFrame(self):
+        return ndi.gaussian_filter(self.sample, 0.5 + abs(self.position - self.focus) / 10)
+
+
+class SweepingFocus(SimulatedFocus):
+    """ Moves at constant speed and streams a frame every frameTime. """
+
+    def __init__(self, focus, speed, frameTime):
+        super().__init__(focus)
+        self.speed = speed
+        self.frameTime = frameTime
+        self.sweep = None
+        self.frames = {}
+
+    def sweepTo(self, position):
+        self.sweep = (time.monotonic(), self.position, position)
+
+    def positionAt(self, t):
+        if self.sweep is None:
+            return self.position
+        start, origin, target = self.sweep
+        travel = min(self.speed * max(t - start, 0), abs(target - origin))
+        return origin + np.sign(target - origin) * travel
+
+    def latestFrame(self):
+        index = int(time.monotonic() / self.frameTime)
+        if index not in self.frames:
+            self.position = self.positionAt(index * self.frameTime)
+            self.frames[index] = self.grabFrame()
+        return self.frames[index]
+
+
+@pytest.mark.parametrize('metric', sorted(autofocustools.focusMetrics))
+def test_metrics_peak_in_focus(metric):
+    stage = SimulatedFocus(focus=0)
+    engine = autofocustools.AutofocusEngine(stage.moveTo, stage.grabFrame, metric=metric)
+    values = []
+    for position in [-40, -10, 0, 10, 40]:
+        stage.moveTo(position)
+        values.append(engine.focusValue(stage.grabFrame()))
+    assert np.argmax(values) == 2
+    assert values[1] > values[0] and values[3] > values[4]
+
+
+@pytest.mark.parametrize('method', ['coarsetofine', 'golden'])
+def test_search_finds_focus_with_few_moves(method):
+    stage = SimulatedFocus(focus=23)
+    engine = autofocustools.AutofocusEngine(stage.moveTo, stage.grabFrame)
+    result = engine.run(center=0, rangez=100, resolutionz=10, method=method)
+
+    assert result.bestPosition == pytest.approx(23, abs=5)
+    # a linear scan at the same resolution takes 20 steps
+    assert result.numEvaluations == stage.moves <= 10
+
+    result = engine.run(center=0, rangez=100, resolutionz=10, method=method,
+                        isRunning=lambda: False)
+    assert result.canceled and result.bestPosition == 0
+
+
+def test_sweep_finds_focus_in_one_move():
+    stage = SweepingFocus(focus=-12, speed=200, frameTime=0.01)
+    engine = autofocustools.AutofocusEngine(stage.moveTo, stage.grabFrame)
+    result = engine.runSweep(0, 100, stage.sweepTo, stage.latestFrame, stage.speed,
+                             frameLatency=stage.frameTime / 2)
+
+    assert stage.moves == 1  # only to the start of the range
+    assert result.numEvaluations > 30
+    assert np.all(np.diff(result.positions) >= 0)
+    assert result.bestPosition == pytest.approx(-12, abs=5)
+
+
+def test_sweep_uses_position_sample_times():
+    stage = SweepingFocus(focus=-12, speed=200, frameTime=0.01)
+    pollingInterval = 0.02
+
+    def readPositionSample():
+        # read back by a polling thread, up to one polling interval ago
+        sampleTime = np.floor(time.monotonic() / pollingInterval) * pollingInterval
+        return stage.positionAt(sampleTime), sampleTime
+
+    engine = autofocustools.AutofocusEngine(stage.moveTo, stage.grabFrame)
+    result = engine.runSweep(0, 100, stage.sweepTo, stage.latestFrame, stage.speed,
+                             readPositionSample=readPositionSample)
+
+    # frames are stamped on arrival, i.e. at most one frame after their exposure
+    frameTimes = np.array(sorted(stage.frames)) * stage.frameTime
+    assert result.numEvaluations > 30
+    assert np.all(np.diff(result.positions) >= 0)
+    for position in result.positions:
+        distances = np.abs([stage.positionAt(t) - position for t in frameTimes])
+        assert distances.min() <= stage.speed * stage.frameTime * 1.5
+    assert result.bestPosition == pytest.approx(-12, abs=5)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
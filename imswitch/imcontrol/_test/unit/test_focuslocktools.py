@@ -0,0 +1,83 @@
+import threading
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import focuslocktools
+
+
+def spotImage(spots, shape=(480, 640), width=6, noise=0):
+    rows, columns = np.indices(shape)
+    image = np.full(shape, 100.0)
+    for row, column, amplitude in spots:
+        image += amplitude * np.exp(-((rows - row) ** 2 + (columns - column) ** 2) / (2 * width ** 2))
+    if noise:
+        image += np.random.default_rng(0).normal(0, noise, shape)
+    return image.astype(np.uint16)
+
+
+@pytest.mark.parametrize('column', [101.3, 320.0, 517.6])
+def test_focus_signal_follows_spot(column):
+    image = spotImage([(240, column, 1000)], noise=5)
+    assert focuslocktools.focusSignal(image) == pytest.approx(column, abs=0.3)
+
+
+def test_focus_signal_two_foci_takes_left_spot():
+    image = spotImage([(200, 400, 1000), (260, 150.5, 800), (100, 600, 200)])
+    assert focuslocktools.focusSignal(image, twoFoci=True) == pytest.approx(150.5, abs=0.3)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 0)
+
+
+def test_loop_runs_at_rate():
+    clock = FakeClock()
+    steps = []
+    done = threading.Event()
+
+    def step():
+        steps.append(clock())
+        if len(steps) == 3:
+            clock.now += 0.012  # an iteration that takes 2.4 periods
+        elif len(steps) == 10:
+            loop.stop()
+            done.set()
+
+    loop = focuslocktools.FocusLockLoop(step, rate=200, clock=clock, sleep=clock.sleep)
+    loop.start()
+    assert done.wait(timeout=5)
+    loop.stop()
+
+    # the iterations stay on the time grid, the ones missed by the long iteration are skipped
+    assert steps == pytest.approx([0, 0.005, 0.01, 0.025, 0.03, 0.035, 0.04, 0.045, 0.05, 0.055])
+    stats = loop.stats()
+    assert stats['count'] == 10 and stats['overruns'] == 1
+    assert stats['latencyMax'] == pytest.approx(0.012)
+    assert stats['rate'] == pytest.approx(9 / 0.055)
+    assert stats['jitter'] == pytest.approx(np.std([0.005] * 8 + [0.015]))
+    assert not loop.isRunning
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
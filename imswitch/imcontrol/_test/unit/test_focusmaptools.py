@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import focusmaptools
+
+
+def scan(focusMap, positions, surface, groups=None):
+    """ Visits the positions in order and returns the number of focus
+    measurements and the largest error of the focus used at each position. """
+    groups = groups if groups is not None else [None] * len(positions)
+    measurements, errors = 0, []
+    for (x, y), group in zip(positions, groups):
+        focus = focusMap.nextFocus(x, y, group)
+        if focus is None:
+            measurements += 1
+            focusMap.addPoint(x, y, surface(x, y, group), group)
+        else:
+            errors.append(abs(focus - surface(x, y, group)))
+    return measurements, max(errors)
+
+
+def grid(n, step=1000):
+    return [(x * step, y * step) for y in range(n) for x in range(n)]
+
+
+def test_plane_predicts_tilted_slide():
+    def tilted(x, y, group):
+        return 50 + 0.002 * x - 0.001 * y
+
+    focusMap = focusmaptools.FocusMap('plane', residualTolerance=1, sampleInterval=4)
+    measurements, maxError = scan(focusMap, grid(10), tilted)
+    assert measurements < 100 / 4
+    assert maxError < 10  # until the first row is sampled, y is assumed flat
+    assert focusMap.sampleInterval == 16
+    assert focusMap.predict(4500, 4500) == pytest.approx(tilted(4500, 4500, None))
+
+
+def test_spline_follows_curved_sample():
+    def curved(x, y, group):
+        return 20 * np.sin(x / 3000) + 10 * np.cos(y / 4000)
+
+    positions = grid(12)
+    plane = focusmaptools.FocusMap('plane', residualTolerance=0.5, sampleInterval=4)
+    spline = focusmaptools.FocusMap('spline', residualTolerance=0.5, sampleInterval=4)
+    scan(plane, positions, curved)
+    scan(spline, positions, curved)
+    assert np.mean(spline.residuals[-5:]) < np.mean(plane.residuals[-5:])
+    assert spline.predict(5500, 5500) == pytest.approx(curved(5500, 5500, None), abs=0.5)
+
+
+def test_offsets_measure_every_well_and_resample_on_residuals():
+    wellOffsets = {'A1': 0, 'A2': 30, 'B1': -20, 'B2': 5}
+
+    def plate(x, y, well):
+        return 100 + 0.001 * x + wellOffsets[well]
+
+    positions, wells = [], []
+    for well, (x0, y0) in zip(wellOffsets, [(0, 0), (9000, 0), (0, 9000), (9000, 9000)]):
+        for dx in range(0, 3000, 1000):
+            for dy in range(0, 3000, 1000):
+                positions.append((x0 + dx, y0 + dy))
+                wells.append(well)
+
+    focusMap = focusmaptools.FocusMap('offsets', residualTolerance=1, sampleInterval=3)
+    measurements, maxError = scan(focusMap, positions, plate, wells)
+    assert measurements < len(positions) / 2
+    assert maxError < 1
+    # the median well offset is used in other wells
+    assert focusMap.predict(100, 100, 'C1') == pytest.approx(100 + 0.1 + 2.5)
+
+    # a measurement far off the map makes the next ones more frequent
+    interval = focusMap.sampleInterval
+    focusMap.addPoint(0, 0, 150, 'A1')
+    assert focusMap.sampleInterval == interval // 2
+
+
+def test_offsets_predict_new_wells_of_regular_plate():
+    def plate(x, y, well):
+        return 100 + 0.001 * x - 0.0005 * y + 0.2 * (sum(well) % 3 - 1)
+
+    def rows(first, last):
+        positions, wells = [], []
+        for row in range(first, last):
+            for col in range(12):
+                positions.extend([(col * 9000, row * 9000), (col * 9000 + 1000, row * 9000)])
+                wells.extend([(row, col)] * 2)
+        return positions, wells
+
+    focusMap = focusmaptools.FocusMap('offsets', residualTolerance=1, sampleInterval=4)
+    # until the second row is sampled, the tilt of the plate is unknown
+    positions, wells = rows(0, 2)
+    firstMeasurements, _ = scan(focusMap, positions, plate, wells)
+    positions, wells = rows(2, 8)
+    measurements, maxError = scan(focusMap, positions, plate, wells)
+    assert firstMeasurements + measurements < 96 / 4  # far fewer than one per well
+    assert maxError < 1
+
+
+def test_unknown_model():
+    with pytest.raises(ValueError):
+        focusmaptools.FocusMap('paraboloid')
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
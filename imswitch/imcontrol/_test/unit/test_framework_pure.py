@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+from imswitch.imcommon.framework import pure
+
+
+class Emitter(pure.SignalInterface):
+    sigValue = pure.Signal(int)
+
+    def __init__(self):
+        super().__init__()
+
+
+class CollectingWorker(pure.Worker):
+    def __init__(self):
+        super().__init__()
+        self.values = []
+        self.threads = []
+        self.timer = None
+
+    def run(self):
+        self.timer = pure.Timer()
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(5)
+
+    def tick(self):
+        self.threads.append(threading.current_thread())
+
+    def stop(self):
+        self.timer.stop()
+
+    def receive(self, value):
+        self.values.append(value)
+        self.threads.append(threading.current_thread())
+
+
+class QuittingWorker(pure.Worker):
+    def __init__(self, thread):
+        super().__init__()
+        self.thread = thread
+        self.runs = 0
+
+    def run(self):
+        self.runs += 1
+        self.thread.quit()
+
+
+def test_signals_are_per_instance():
+    emitterA, emitterB = Emitter(), Emitter()
+    received = []
+    emitterA.sigValue.connect(received.append)
+    emitterB.sigValue.emit(1)
+    emitterA.sigValue.emit(2)
+    assert received == [2]
+
+    emitterA.sigValue.disconnect(received.append)
+    emitterA.sigValue.emit(3)
+    assert received == [2]
+
+
+def test_slot_with_fewer_arguments():
+    emitter = Emitter()
+    calls = []
+    emitter.sigValue.connect(lambda: calls.append(True))
+    emitter.sigValue.emit(5)
+    assert calls == [True]
+
+
+def test_worker_thread_queued_delivery_and_timer():
+    worker = CollectingWorker()
+    thread = pure.Thread()
+    worker.moveToThread(thread)
+    thread.started.connect(worker.run)
+    thread.finished.connect(worker.stop)
+    thread.start()
+
+    emitter = Emitter()
+    emitter.sigValue.connect(worker.receive)
+    emitter.sigValue.emit(42)
+
+    time.sleep(0.1)
+    thread.quit()
+    thread.wait()
+
+    assert not thread.isRunning()
+    assert worker.values == [42]
+    assert len(worker.threads) > 2  # received value and timer ticks
+    assert threading.current_thread() not in worker.threads
+
+
+def test_worker_quitting_thread_from_started_slot():
+    thread = pure.Thread()
+    worker = QuittingWorker(thread)
+    worker.moveToThread(thread)
+    thread.started.connect(worker.run)
+    for _ in range(2):
+        thread.start()
+        thread.wait()  # returns since the quit isn't lost before the event loop runs
+        assert not thread.isRunning()
+    assert worker.runs == 2
+
+
+def test_coroutine_slot_and_async_wait():
+    emitter = Emitter()
+    received = []
+
+    async def slot(value):
+        received.append(value)
+
+    async def main():
+        emitter.sigValue.connect(slot)
+        threading.Timer(0.01, lambda: emitter.sigValue.emit(7)).start()
+        args = await asyncio.wait_for(emitter.sigValue.asyncWait(), timeout=5)
+        await asyncio.sleep(0.01)
+        return args
+
+    assert asyncio.run(main()) == (7,)
+    assert received == [7]
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,137 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from imswitch.imcontrol.model.interfaces import grbldriver
+
+
+class FakeGrblSerial:
+    """ Simulates GRBL's receive buffer, planner and status reports. """
+
+    plannerSize = 4
+    moveTime = 0.005
+
+    def __init__(self, *args, **kwargs):
+        self.settings = {'$100': 780.0}
+        self.received = []
+        self.rxUsed = 0
+        self.maxRxUsed = 0
+        self._partialLine = ''
+        self._output = queue.Queue()
+        self._rx = queue.Queue()
+        self._planner = queue.Queue(maxsize=self.plannerSize)
+        self._moving = False
+        threading.Thread(target=self._parse, daemon=True).start()
+        threading.Thread(target=self._execute, daemon=True).start()
+
+    def write(self, data):
+        for char in data.decode('ascii'):
+            if char == '?':
+                state = 'Run' if self._moving or not self._planner.empty() else 'Idle'
+                self._respond(f'<{state}|WPos:0.000,0.000,0.000>')
+            elif char == '\r':
+                line, self._partialLine = self._partialLine.strip(), ''
+                self.rxUsed += len(line) + 1
+                self.maxRxUsed = max(self.maxRxUsed, self.rxUsed)
+                assert self.rxUsed <= grbldriver.GRBL_RX_BUFFER_SIZE
+                self._rx.put(line)
+            else:
+                self._partialLine += char
+
+    def readline(self):
+        try:
+            return self._output.get(timeout=0.01)
+        except queue.Empty:
+            return b''
+
+    def reset_input_buffer(self):
+        while not self._output.empty():
+            self._output.get()
+
+    def close(self):
+        pass
+
+    def _respond(self, message):
+        self._output.put(message.encode('ascii') + b'\r\n')
+
+    def _parse(self):
+        while True:
+            line = self._rx.get()
+            if line.startswith('G90 G0') or line.startswith('G91 G0'):
+                self._planner.put(line)  # blocks while the planner is full
+            elif line == '$$':
+                for key, value in self.settings.items():
+                    self._respond(f'{key}={value:.3f}')
+            elif line.startswith('$1') and '=' in line:
+                key, value = line.split('=')
+                self.settings[key] = float(value)
+            elif line == 'BAD':
+                self.rxUsed -= len(line) + 1
+                self._respond('error:20')
+                continue
+            self.received.append(line)
+            self.rxUsed -= len(line) + 1
+            self._respond('ok')
+
+    def _execute(self):
+        while True:
+            self._planner.get()
+            self._moving = True
+            time.sleep(self.moveTime)
+            self._moving = self._planner.qsize() > 0
+
+
+@pytest.fixture
+def board(monkeypatch):
+    monkeypatch.setattr(grbldriver.serial, 'Serial', FakeGrblSerial)
+    board = grbldriver.GrblDriver('fake')
+    yield board
+    board.close()
+
+
+def test_streaming_and_settings(board):
+    moves = 50
+    startTime = time.monotonic()
+    for _ in range(moves):
+        board.move_rel((1000, 0, 0), blocking=False)
+    assert board.wait_for_idle(timeout=5)
+    # the planner limits the rate, not a status poll per move
+    assert time.monotonic() - startTime < moves * FakeGrblSerial.moveTime + 1
+    assert board.ser.received.count('G91 G0 X1.0000Y0.0000Z0.0000') == moves
+    assert list(board.positions) == [moves * 1000, 0, 0]
+
+    # streamed lines fill GRBL's receive buffer without waiting for each ack
+    acks = []
+    line = 'G91 G0 X-1.0000'
+    assert board.stream_gcode([line] * moves, ack_callback=acks.append)
+    assert acks == list(range(moves))
+    assert board.ser.maxRxUsed > 3 * (len(line) + 1)
+
+    with pytest.raises(RuntimeError):
+        board.stream_gcode(['G0 X1', 'BAD', 'G0 X2'])
+
+    board.ser.received.clear()
+    board.write_all_settings()
+    # only settings that differ from the stored ones are written
+    assert '$100=780.000' not in board.ser.received
+    assert '$110=200.000' in board.ser.received
+    assert board.read_settings()['$110'] == 200.0
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
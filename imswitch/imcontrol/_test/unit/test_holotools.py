@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import holotools
+
+
+pixelsize = 3.45e-6
+wavelength = 488e-9
+n = 1.518
+
+
+def referenceHologram(image, dz, roiSize):
+    """ The NanoImagingPack-based reconstruction, with complex FFTs. """
+    def ft(field):
+        return np.fft.fftshift(np.fft.fft2(np.fft.ifftshift(field), norm='ortho'))
+
+    field = np.zeros((roiSize, roiSize))
+    rows, cols = image.shape
+    start = (roiSize // 2 - rows // 2, roiSize // 2 - cols // 2)
+    field[start[0]:start[0] + rows, start[1]:start[1] + cols] = np.sqrt(image)
+
+    frequencies = (np.arange(roiSize) - roiSize // 2) / (roiSize * pixelsize)
+    sinAlpha = np.minimum(np.hypot(frequencies[:, np.newaxis], frequencies[np.newaxis, :])
+                          * wavelength / n, 1 - 1e-9)
+    phase = 2 * np.pi * n / wavelength * np.sqrt(1 - sinAlpha ** 2) * dz
+    return np.flip(np.abs(ft(np.exp(1j * phase) * ft(field))), 1)
+
+
+@pytest.mark.parametrize('shape, roiSize', [((256, 256), 256), ((200, 150), 256)])
+def test_hologram_reconstruction_matches_complex_fft(shape, roiSize):
+    image = np.random.default_rng(0).integers(0, 4000, shape).astype(np.uint16)
+    image[20:40, 10:15] = 0  # asymmetric feature
+    result = holotools.reconstructHologram(image, pixelsize, wavelength, 40e-6, n=n,
+                                           roiSize=roiSize)
+    reference = referenceHologram(image, 40e-6, roiSize)
+    assert result.shape == (roiSize, roiSize)
+    assert np.allclose(result, reference, atol=1e-4 * reference.max())
+
+
+def test_hologram_refocused_to_many_planes():
+    image = np.random.default_rng(1).integers(0, 4000, (128, 128)).astype(np.uint16)
+    dzs = [-20e-6, 0, 35e-6]
+    stack = holotools.refocusHologram(image, pixelsize, wavelength, dzs, n=n, roiSize=128)
+    assert stack.shape == (3, 128, 128)
+    for plane, dz in zip(stack, dzs):
+        assert np.allclose(plane, holotools.reconstructHologram(image, pixelsize, wavelength, dz,
+                                                                n=n, roiSize=128))
+
+
+def test_propagation_kernel_cached():
+    kernel = holotools.propagationKernel((64, 64), pixelsize, wavelength, 10e-6, n)
+    assert kernel.shape == (2, 64, 33)
+    assert holotools.propagationKernel((64, 64), pixelsize, wavelength, 10e-6, n) is kernel
+    assert not kernel.flags.writeable
+
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,158 @@
+import time
+
+import numpy as np
+import tifffile
+
+from imswitch.imcontrol.model.managers.MDAManager import (
+    MDAManager, buildMDAEvents, orderMDAEvents, parseMDASequence
+)
+
+
+class FakeDetector:
+    parameters = {}
+
+    def __init__(self, log):
+        self.frames = 0
+        self.log = log
+
+    def getLatestFrame(self):
+        # a new frame on every call
+        self.frames += 1
+        self.log.append(('frame', self.frames))
+        return np.full((4, 4), self.frames)
+
+
+class FakeDetectorsManager:
+    def __init__(self, log=None):
+        self.detector = FakeDetector(log if log is not None else [])
+
+    def getCurrentDetectorName(self):
+        return 'Camera'
+
+    def __getitem__(self, name):
+        return self.detector
+
+    def startAcquisition(self):
+        return 1
+
+    def stopAcquisition(self, handle):
+        pass
+
+
+class FakePositioner:
+    axes = ['X', 'Y', 'Z']
+    forPositioning = True
+
+    def __init__(self, log):
+        self.position = {'X': 0, 'Y': 0, 'Z': 0}
+        self.moves = []
+        self.log = log
+
+    def move(self, value, axis, is_absolute=False, is_blocking=True):
+        self.position[axis] = value if is_absolute else self.position[axis] + value
+        self.moves.append((axis, self.position[axis], is_blocking))
+        self.log.append(('move', axis, self.position[axis], is_blocking))
+
+    def waitUntilSettled(self, tolerance=1.0, timeout=10.0, axes=None, target=None):
+        self.log.append(('settled', tuple(axes)))
+        return True
+
+
+class FakePositionersManager:
+    def __init__(self, log=None):
+        self.positioner = FakePositioner(log if log is not None else [])
+
+    def __iter__(self):
+        yield 'Stage', self.positioner
+
+
+def test_order_minimizes_travel_and_channel_switches():
+    events = buildMDAEvents(positions=[(0, 0), (1000, 0), (10, 0)], zOffsets=[0, 1, 2],
+                            channels=['488', '635'], timePoints=2, interval=10)
+    ordered = orderMDAEvents(events, startPosition=(0, 0))
+    assert len(ordered) == len(events)
+
+    firstBlock = ordered[:len(ordered) // 2]
+    positions = [e.x for e in firstBlock]
+    assert positions == [0] * 6 + [10] * 6 + [1000] * 6
+
+    channels = [e.channel for e in ordered]
+    channelSwitches = sum(a != b for a, b in zip(channels, channels[1:]))
+    assert channelSwitches == 6  # one per position visit, none between positions
+
+    deadlines = [e.minStartTime for e in ordered if e.minStartTime is not None]
+    assert deadlines == [0, 10]
+
+
+def test_parse_json_sequence():
+    events = parseMDASequence('{"positions": [[1, 2, 3]], "zOffsets": [-1, 1], "timePoints": 2}')
+    assert [(e.x, e.y, e.z) for e in events] == [(1, 2, 2), (1, 2, 4)] * 2
+
+
+def test_mda_run_acquires_all_events(tmp_path):
+    detectorsManager = FakeDetectorsManager()
+    positionersManager = FakePositionersManager()
+    manager = MDAManager(detectorsManager, positionersManager)
+
+    manager.startMDA({'positions': [[0, 0], [100, 0]], 'zOffsets': [0, 5]},
+                     savePath=str(tmp_path))
+    startTime = time.time()
+    while manager.running and time.time() - startTime < 10:
+        time.sleep(0.01)
+
+    assert not manager.running
+    assert len(list(tmp_path.glob('mda_*.tif'))) == 4
+    assert positionersManager.positioner.position['X'] == 100
+    manager.finalize()
+
+
+def _runMDA(manager, sequence, savePath):
+    manager.startMDA(sequence, savePath=str(savePath))
+    startTime = time.time()
+    while manager.running and time.time() - startTime < 10:
+        time.sleep(0.01)
+    assert not manager.running
+    # the frames saved, in order of acquisition
+    return [tifffile.imread(path)[0, 0] for path in sorted(savePath.glob('mda_*.tif'))]
+
+
+def test_mda_grabs_frames_after_stage_settled(tmp_path):
+    log = []
+    manager = MDAManager(FakeDetectorsManager(log), FakePositionersManager(log))
+    frames = _runMDA(manager, {'positions': [[0, 0], [100, 0]]}, tmp_path)
+
+    settled = [i for i, entry in enumerate(log) if entry[0] == 'settled']
+    assert len(settled) == 2 and len(frames) == 2
+    for i, frame in zip(settled, frames):
+        # the frame saved is a new one, grabbed after the stage settled
+        assert ('frame', frame) in log[i:]
+        assert ('frame', frame - 1) in log[i:]
+    # the stage only starts moving to the next position once the frame is grabbed
+    prefetch = log.index(('move', 'X', 100, False))
+    assert log.index(('frame', frames[0])) < prefetch < settled[1]
+    manager.finalize()
+
+
+def test_mda_restarts_after_finishing(tmp_path):
+    manager = MDAManager(FakeDetectorsManager(), FakePositionersManager())
+    for run in range(3):
+        frames = _runMDA(manager, {'positions': [[0, 0]], 'timePoints': 2}, tmp_path / str(run))
+        assert len(frames) == 2
+    manager.finalize()
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
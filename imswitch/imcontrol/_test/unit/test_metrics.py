@@ -0,0 +1,58 @@
+import pytest
+
+from imswitch.imcommon.model.metrics import MetricsRegistry
+
+
+def test_counter_and_gauge():
+    registry = MetricsRegistry()
+    counter = registry.counter('frames_total', 'Frames')
+    counter.inc(detector='CAM')
+    counter.inc(2, detector='CAM')
+    assert registry.counter('frames_total') is counter
+    assert counter.getValues() == {(('detector', 'CAM'),): 3}
+
+    with pytest.raises(ValueError):
+        counter.inc(-1)
+
+    gauge = registry.gauge('queue_depth')
+    gauge.set(5)
+    gauge.dec(2)
+    assert gauge.getValues() == {(): 3}
+
+    with pytest.raises(TypeError):
+        registry.gauge('frames_total')
+
+
+def test_histogram_prometheus_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    histogram.observe(0.05, port='COM1')
+    histogram.observe(0.5, port='COM1')
+    histogram.observe(5.0, port='COM1')
+
+    text = registry.renderPrometheus()
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{port="COM1",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{port="COM1",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{port="COM1",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{port="COM1"} 3' in text
+
+    metrics = registry.getMetrics()
+    assert metrics['latency_seconds']['values'][0]['value']['count'] == 3
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
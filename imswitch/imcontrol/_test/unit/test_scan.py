@@ -4,6 +4,7 @@ import numpy as np
 
 from imswitch.imcontrol._test import setupInfoBasic
 from imswitch.imcontrol.model import ScanManager
+from imswitch.imcontrol.model.signaldesigners import SegmentedSignal, iterSignalBlocks
 
 
 def test_scan_signals():
@@ -50,6 +51,77 @@ def test_scan_signals():
     assert np.count_nonzero(fullsig['TTLCycleSignalsDict']['405']) == 51840
     assert np.all(~fullsig['TTLCycleSignalsDict']['488'])
 
+
+def test_scan_signals_reused_for_same_parameters():
+    stageParameters = {'target_device': ['X', 'Y', 'Z'],
+                       'axis_length': [5, 5, 5],
+                       'axis_step_size': [1, 1, 1],
+                       'axis_centerpos': [0, 0, 0],
+                       'axis_startpos': [[0], [0], [0]],
+                       'sequence_time': 0.005,
+                       'return_time': 0.001,
+                       'phase_delay': 40}
+    TTLParameters = {'target_device': ['405', '488'],
+                     'TTL_start': [[0.0001, 0.004], [0, 0]],
+                     'TTL_end': [[0.0015, 0.005], [0, 0]],
+                     'sequence_time': 0.005}
+
+    sh = ScanManager(setupInfo=setupInfoBasic)
+    fullsig, scanInfo = sh.makeFullScan(stageParameters, TTLParameters)
+    scanInfo.clear()  # callers may modify the returned dicts
+
+    sameParameters = dict(reversed(list(stageParameters.items())), axis_length=np.array([5, 5, 5]))
+    fullsigAgain, scanInfoAgain = sh.makeFullScan(sameParameters, TTLParameters)
+    assert fullsigAgain['scanSignalsDict']['X'] is fullsig['scanSignalsDict']['X']
+    assert len(scanInfoAgain) > 0
+
+    fullsigOther, _ = sh.makeFullScan(dict(stageParameters, axis_length=[5, 5, 10]), TTLParameters)
+    assert fullsigOther['scanSignalsDict']['Z'].max() == 1.0
+
+
+def test_scan_signal_stream_matches_full_scan():
+    stageParameters = {'target_device': ['X', 'Y', 'Z'],
+                       'axis_length': [5, 5, 5],
+                       'axis_step_size': [1, 1, 1],
+                       'axis_centerpos': [0, 0, 0],
+                       'axis_startpos': [[0], [0], [0]],
+                       'sequence_time': 0.005,
+                       'return_time': 0.001,
+                       'phase_delay': 40}
+    TTLParameters = {'target_device': ['405', '488'],
+                     'TTL_start': [[0.0001, 0.004], [0, 0]],
+                     'TTL_end': [[0.0015, 0.005], [0, 0]],
+                     'sequence_time': 0.005}
+
+    sh = ScanManager(setupInfo=setupInfoBasic)
+    fullsig, _ = sh.makeFullScan(stageParameters, TTLParameters)
+    streamsig, _ = sh.makeFullScanStream(stageParameters, TTLParameters)
+
+    for signalsDict in ['scanSignalsDict', 'TTLCycleSignalsDict']:
+        blocks = list(iterSignalBlocks(streamsig[signalsDict], 10000))
+        assert len(blocks) == 12
+        for device, signal in fullsig[signalsDict].items():
+            streamed = np.concatenate([block[device] for block in blocks])
+            assert streamed.dtype == signal.dtype
+            assert np.array_equal(streamed, signal)
+
+
+def test_segmented_signal():
+    frame = np.arange(7, dtype=float)
+    signal = SegmentedSignal([(np.zeros(3), 1), (frame, 4)])
+    expected = np.concatenate([np.zeros(3), np.tile(frame, 4)])
+    assert len(signal) == len(expected)
+    assert np.array_equal(signal.toArray(), expected)
+    assert np.array_equal(np.concatenate(list(signal.blocks(5))), expected)
+    assert np.array_equal(signal.read(9, 20), expected[9:20])
+    assert signal.min() == 0 and signal.max() == 6
+
+    signal.resize(20)  # cut off in the middle of a repetition
+    assert np.array_equal(signal.toArray(), expected[:20])
+    signal.resize(25)
+    assert np.array_equal(signal.toArray(), np.append(expected[:20], np.zeros(5)))
+
+
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import scanpathtools
+
+
+def test_serpentine_grid():
+    grid = scanpathtools.serpentineGrid(0, 3, 1, 0, 2, 1)
+    assert grid.tolist() == [[0, 0], [1, 0], [2, 0], [2, 1], [1, 1], [0, 1]]
+
+    grid = scanpathtools.serpentineGrid(0, 2, 1, 0, 3, 1, fastAxis=1)
+    assert grid.tolist() == [[0, 0], [0, 1], [0, 2], [1, 2], [1, 1], [1, 0]]
+
+
+def test_orderings_visit_every_position_once():
+    positions = np.array(np.where(np.ones((6, 5)))).T * (10, 20)
+    np.random.default_rng(0).shuffle(positions)
+
+    for method in ['serpentine', 'hilbert', 'tsp']:
+        scanPath = scanpathtools.planScanPath(positions, method=method)
+        assert sorted(scanPath.order.tolist()) == list(range(len(positions)))
+        # on a full grid, every step goes to a neighbouring tile
+        steps = np.abs(np.diff(scanPath.positions, axis=0))
+        assert np.all(steps.max(axis=1) <= 20), method
+
+
+def test_two_opt_improves_random_path():
+    positions = np.random.default_rng(1).uniform(0, 100, (200, 2))
+    nearestNeighbour = scanpathtools.orderNearestNeighbour(positions)
+    improved = scanpathtools.improveTwoOpt(positions, nearestNeighbour)
+    assert (scanpathtools.estimateTravelTime(positions[improved]) <
+            scanpathtools.estimateTravelTime(positions[nearestNeighbour]))
+    assert scanpathtools.planScanPath(positions).method == 'tsp'
+
+
+def test_travel_time_estimate():
+    kinematics = [scanpathtools.AxisKinematics(speed=2, backlash=1),
+                  scanpathtools.AxisKinematics(speed=1, acceleration=1)]
+    # x: 4/2, then reversal 4+1 units at speed 2; y: 1 unit without reaching full speed
+    assert scanpathtools.estimateTravelTime([[0, 0], [4, 0], [0, 1]], kinematics) == \
+        pytest.approx(2 + 2.5)
+
+    with pytest.raises(ValueError):
+        scanpathtools.estimateTravelTime([[0, 0, 0]], kinematics)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from imswitch.imcontrol.model.serialtransport import (
+    SerialTransport, PRIORITY_HIGH, PRIORITY_LOW
+)
+
+
+def test_priority_and_coalescing():
+    transport = SerialTransport('Test')
+    sent = []
+    release = threading.Event()
+    try:
+        blocking = transport.submit(release.wait)
+        low = transport.submit(sent.append, 'poll', priority=PRIORITY_LOW)
+        first = transport.submit(sent.append, 'P1', coalesceKey='power')
+        transport.submit(sent.append, 'enable')
+        last = transport.submit(sent.append, 'P3', coalesceKey='power')
+        high = transport.submit(sent.append, 'stop', priority=PRIORITY_HIGH)
+        release.set()
+
+        low.result(timeout=5)
+        assert blocking.result(timeout=5)
+        assert first is last and high.done
+        # the intermediate value is never sent, the latest one is sent in its own place
+        assert sent == ['stop', 'enable', 'P3', 'poll']
+        assert transport.latencyStats()['queued'] == 0
+
+        # a coalesced request takes the priority of the latest one
+        release.clear()
+        blocking = transport.submit(release.wait)
+        transport.submit(sent.append, 'P5', coalesceKey='power', priority=PRIORITY_LOW)
+        transport.submit(sent.append, 'enable')
+        transport.submit(sent.append, 'P6', coalesceKey='power', priority=PRIORITY_HIGH)
+        release.set()
+        blocking.result(timeout=5)
+
+        # once sent, a new value with the same key is queued again
+        transport.submit(sent.append, 'P4', coalesceKey='power').result(timeout=5)
+        assert sent[-3:] == ['P6', 'enable', 'P4']
+
+        stats = transport.latencyStats()
+        assert stats['count'] == 9 and stats['coalesced'] == 2 and stats['queued'] == 0
+        assert 0 <= stats['p50'] <= stats['max']
+    finally:
+        transport.close()
+
+
+def test_responses_go_to_their_callers():
+    transport = SerialTransport('Test')
+    results = {}
+
+    def query(i):
+        results[i] = transport.call(lambda arg: arg * 2, i)
+
+    try:
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == {i: i * 2 for i in range(20)}
+
+        with pytest.raises(ZeroDivisionError):
+            transport.call(lambda: 1 / 0)
+    finally:
+        transport.close()
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
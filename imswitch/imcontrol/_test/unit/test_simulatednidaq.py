@@ -0,0 +1,117 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import DetectorInfo
+from imswitch.imcontrol.model.managers import SimulatedNidaqManager, VirtualBeadSample
+from imswitch.imcontrol.model.managers.detectors.APDManager import APDManager
+from imswitch.imcontrol.model.signaldesigners.GalvoScanDesigner import GalvoScanDesigner
+from imswitch.imcontrol.model.signaldesigners.PointScanTTLCycleDesigner import \
+    PointScanTTLCycleDesigner
+
+
+def _setupInfo():
+    properties = {'conversionFactor': 1, 'minVolt': -10, 'maxVolt': 10,
+                  'vel_max': 1e-3, 'acc_max': 1e-4}
+    return SimpleNamespace(
+        scan=SimpleNamespace(sampleRate=100000),
+        positioners={name: SimpleNamespace(forScanning=True, managerProperties=properties)
+                     for name in ['G1', 'G2', 'Z']}
+    )
+
+
+def _scanImage(sample, linesPerRead=0, frames=1):
+    setupInfo = _setupInfo()
+    stageParameters = {'target_device': ['G1', 'G2', 'Z'],
+                       'axis_length': [6, 6, frames],
+                       'axis_step_size': [0.1, 0.1, 1],
+                       'axis_centerpos': [0, 0, 0],
+                       'axis_startpos': [0, 0, 0],
+                       'sequence_time': 20e-6,
+                       'phase_delay': 0}
+    TTLParameters = {'target_device': ['488'],
+                     'TTL_start': [[0]],
+                     'TTL_end': [[1]],
+                     'sequence_time': 20e-6}
+    scanSignals, _, scanInfo = GalvoScanDesigner().make_signal(stageParameters, setupInfo)
+    TTLSignals = PointScanTTLCycleDesigner().make_signal(TTLParameters, setupInfo, scanInfo)
+
+    nidaq = SimulatedNidaqManager(setupInfo, sample=sample, realtime=False, seed=0)
+    detectorInfo = DetectorInfo(analogChannel=None, digitalLine=None, managerName='APDManager',
+                                managerProperties={'terminal': 'PFI0', 'ctrInputLine': 0,
+                                                   'linesPerRead': linesPerRead},
+                                forAcquisition=True)
+    apd = APDManager(detectorInfo, 'APD', nidaqManager=nidaq)
+
+    # run the scan worker on this thread instead of when the scan starts
+    apd.initiateScan(scanInfo)
+    apd.acquisition = False
+    nidaq.runScan({'scanSignalsDict': scanSignals, 'TTLCycleSignalsDict': TTLSignals}, scanInfo)
+    apd._scanWorker.run()
+    return apd.getLatestFrame()
+
+
+def test_apd_scan_images_virtual_sample():
+    sample = VirtualBeadSample(spacing=2, beadSize=0.3)
+    image = _scanImage(sample)[0]
+    assert image.shape == (60, 60)
+
+    # lines are filled in from the bottom of the image
+    pixelCenters = (np.arange(60) + 0.5) * 0.1 - 3
+    x, y = np.meshgrid(pixelCenters, pixelCenters)
+    expected = sample(np.stack([x.ravel(), y.ravel()])).reshape(60, 60)[::-1]
+    assert np.corrcoef(image.ravel(), expected.ravel())[0, 1] > 0.9
+
+
+def test_apd_lines_per_read():
+    sample = VirtualBeadSample(spacing=2, beadSize=0.3)
+    image = _scanImage(sample, linesPerRead=1, frames=2)
+    assert image.shape == (2, 60, 60)
+    assert np.array_equal(_scanImage(sample, linesPerRead=7, frames=2), image)
+    assert np.array_equal(_scanImage(sample, linesPerRead=0, frames=2), image)
+
+
+def test_realtime_input_is_paced_and_buffered():
+    nidaq = SimulatedNidaqManager(_setupInfo(), sample=lambda positions: np.full(positions.shape[1], 1e6),
+                                  realtime=True, bufferSize=500)
+    nidaq.startInputTask('APD', 'ci', 'Dev1/ctr0', 'finite', None, 1e5, 2000, True)
+    nidaq.runScan({'scanSignalsDict': {'X': np.zeros(2000)}}, {})
+
+    data = nidaq.readInputTask('APD', 400)
+    assert time.perf_counter() - nidaq._inputTasks['APD'].startTime >= 400 / 1e5
+    assert data.dtype == np.uint32
+    assert np.all(np.diff(data.astype(int)) >= 0)  # counts accumulate
+    assert 8 < np.mean(np.diff(data.astype(int))) < 12  # 1e6 counts/s at 100 kHz
+
+    time.sleep(0.02)  # more than the buffer of 500 samples at 100 kHz
+    with pytest.raises(RuntimeError):
+        nidaq.readInputTask('APD', 100)
+
+    nidaq.inputTaskDone('APD')
+
+
+def test_finite_input_task_ends():
+    nidaq = SimulatedNidaqManager(_setupInfo(), realtime=False)
+    nidaq.startInputTask('APD', 'ci', 'Dev1/ctr0', 'finite', None, 1e6, 100)
+    assert len(nidaq.readInputTask('APD', 100)) == 100
+    with pytest.raises(RuntimeError):
+        nidaq.readInputTask('APD', 1)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from imswitch.imcontrol.model.interfaces import squid
+from imswitch.imcontrol.model.interfaces.squid_def import (
+    CMD_EXECUTION_STATUS, CMD_SET, MicrocontrollerDef
+)
+
+
+class FakeSquidSerial:
+    """ Simulates a microcontroller that executes moves one after another and
+    reports its state every few milliseconds. """
+
+    moveTime = 0.01
+
+    def __init__(self, *args, **kwargs):
+        self.received = []
+        self.position = [0, 0, 0, 0]
+        self._lastCmdId = 0
+        self._status = CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
+        self._commands = []
+        self._output = bytearray()
+        self._lock = threading.Condition()
+        self._closed = False
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @property
+    def in_waiting(self):
+        return len(self._output)
+
+    def write(self, data):
+        with self._lock:
+            self._commands.append(bytes(data))
+            self._lock.notify_all()
+
+    def read(self, size=1):
+        with self._lock:
+            self._lock.wait_for(lambda: self._output, 0.1)
+            data = bytes(self._output[:size])
+            del self._output[:size]
+            return data
+
+    def close(self):
+        self._closed = True
+
+    def _run(self):
+        busyUntil = 0
+        while not self._closed:
+            with self._lock:
+                now = time.monotonic()
+                if now >= busyUntil:
+                    if self._status == CMD_EXECUTION_STATUS.IN_PROGRESS:
+                        self._status = CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
+                    if self._commands:
+                        command = self._commands.pop(0)
+                        self.received.append(command)
+                        self._lastCmdId = command[0]
+                        if command[1] in (CMD_SET.MOVE_X, CMD_SET.MOVE_Y):
+                            axis = 0 if command[1] == CMD_SET.MOVE_X else 1
+                            self.position[axis] += int.from_bytes(command[2:6], 'big', signed=True)
+                            self._status = CMD_EXECUTION_STATUS.IN_PROGRESS
+                            busyUntil = now + self.moveTime
+                        elif command[1] == 255:
+                            self._status = CMD_EXECUTION_STATUS.CMD_INVALID
+                        else:
+                            self._status = CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
+                packet = bytearray(MicrocontrollerDef.MSG_LENGTH)
+                packet[0] = self._lastCmdId
+                packet[1] = self._status
+                for i, position in enumerate(self.position):
+                    packet[2 + 4 * i:6 + 4 * i] = position.to_bytes(4, 'big', signed=True)
+                self._output += packet
+                self._lock.notify_all()
+            time.sleep(0.002)
+
+
+@pytest.fixture
+def mcu(monkeypatch):
+    monkeypatch.setattr(squid.serial, 'Serial', FakeSquidSerial)
+    mcu = squid.SQUID(port='fake')
+    yield mcu
+    mcu.close()
+
+
+def test_commands_are_pipelined(mcu):
+    startTime = time.monotonic()
+    commands = [mcu.send_command(_command(CMD_SET.MOVE_X, 100)),
+                mcu.send_command(_command(CMD_SET.MOVE_Y, -50)),
+                mcu.send_command(_command(CMD_SET.TURN_ON_ILLUMINATION))]
+    # queueing doesn't wait for the microcontroller
+    assert time.monotonic() - startTime < FakeSquidSerial.moveTime
+    assert mcu.is_busy()
+
+    assert mcu.wait_until_idle(timeout=5)
+    assert not mcu.is_busy()
+    assert all(command.wait(0) for command in commands)
+    assert [command.cmd_id for command in commands] == [1, 2, 3]
+
+    time.sleep(0.02)  # let a packet with the final position arrive
+    state = mcu.get_state()
+    assert (state.x_pos, state.y_pos) == (100, -50)
+    assert mcu.get_pos()[:2] == (100, -50)
+
+    invalid = mcu.send_command(_command(255))
+    with pytest.raises(RuntimeError):
+        invalid.wait(timeout=5)
+
+
+def _command(commandType, value=0):
+    command = bytearray(MicrocontrollerDef.CMD_LENGTH)
+    command[1] = commandType
+    command[2:6] = value.to_bytes(4, 'big', signed=True)
+    return command
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,273 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from imswitch.imcommon.model import StateCache
+from imswitch.imcontrol.model.managers.detectors.DetectorManager import (
+    DetectorManager, DetectorNumberParameter
+)
+from imswitch.imcontrol.model.managers.positioners.PositionerManager import PositionerManager
+from imswitch.imcontrol.model.managers.positioners.SQUIDStageManager import SQUIDStageManager
+
+
+class CountingPositionerManager(PositionerManager):
+    def __init__(self, positionerInfo, name):
+        super().__init__(positionerInfo, name, initialPosition={'X': 0})
+        self.reads = 0
+
+    def move(self, dist, axis):
+        self._position[axis] += dist
+
+    def getPosition(self):
+        self.reads += 1
+        return dict(self._position)
+
+
+def makePositioner(ttl=10.0):
+    positionerInfo = SimpleNamespace(axes=['X'], managerProperties={'stateCacheTTL': ttl},
+                                     forPositioning=True, forScanning=False)
+    return CountingPositionerManager(positionerInfo, 'Stage')
+
+
+def test_cache_ttl_and_invalidation():
+    cache = StateCache(defaultTTL=0.05)
+    calls = []
+
+    def fetch():
+        calls.append(True)
+        return len(calls)
+
+    assert cache.get('value', fetch) == 1
+    assert cache.get('value', fetch) == 1
+    assert cache.get('value', fetch, fresh=True) == 2
+    time.sleep(0.06)
+    assert cache.get('value', fetch) == 3
+
+    cache.invalidate('value')
+    assert cache.peek('value') is None
+    assert cache.get('value', fetch) == 4
+
+
+def test_concurrent_reads_share_fetch():
+    cache = StateCache(defaultTTL=10)
+    calls = []
+
+    def fetch():
+        calls.append(True)
+        time.sleep(0.05)
+        return 'value'
+
+    threads = [threading.Thread(target=cache.get, args=('key', fetch)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+
+
+def test_positioner_position_invalidated_by_move():
+    positioner = makePositioner()
+    assert positioner.getPosition() == {'X': 0}
+    assert positioner.getPosition() == {'X': 0}
+    assert positioner.reads == 1
+
+    positioner.move(5, 'X')
+    assert positioner.getPosition() == {'X': 5}
+    assert positioner.reads == 2
+
+    positioner.getPosition(fresh=True)
+    assert positioner.reads == 3
+
+
+class LivePositionerManager(PositionerManager):
+    """ Positioner that returns its own position dict. """
+
+    def __init__(self, positionerInfo, name):
+        super().__init__(positionerInfo, name, initialPosition={'X': 0})
+
+    def move(self, dist, axis):
+        self._position[axis] += dist
+
+    def getPosition(self):
+        return self._position
+
+
+def test_cached_position_is_a_copy():
+    positionerInfo = SimpleNamespace(axes=['X'], managerProperties={'stateCacheTTL': 10},
+                                     forPositioning=True, forScanning=False)
+    positioner = LivePositionerManager(positionerInfo, 'Stage')
+    position = positioner.getPosition()
+    position['X'] = 5
+    assert positioner.position == {'X': 0}
+    assert positioner.getPosition() == {'X': 0}
+
+    positioner._position['X'] = 3  # e.g. changed by the device's own bookkeeping
+    assert positioner.getPosition() == {'X': 0}
+
+
+class CountingDetectorManager(DetectorManager):
+    """ Detector that reads its exposure time back, without overriding
+    setParameter. """
+
+    def __init__(self, detectorInfo, name):
+        parameters = {'Exposure': DetectorNumberParameter(group='Timings', value=10,
+                                                          valueUnits='ms', editable=True)}
+        super().__init__(detectorInfo, name, fullShape=(4, 4), supportedBinnings=[1],
+                         model='Test', parameters=parameters)
+        self.reads = 0
+
+    def getParameter(self, name):
+        self.reads += 1
+        return self.parameters[name].value
+
+    def pixelSizeUm(self):
+        return [1, 1, 1]
+
+    def crop(self, hpos, vpos, hsize, vsize):
+        pass
+
+    def getLatestFrame(self):
+        return None
+
+    def getChunk(self):
+        return None
+
+    def flushBuffers(self):
+        pass
+
+    def startAcquisition(self):
+        pass
+
+    def stopAcquisition(self):
+        pass
+
+
+def test_detector_parameter_invalidated_by_base_set_parameter():
+    detectorInfo = SimpleNamespace(managerProperties={'stateCacheTTL': 10},
+                                   forAcquisition=True, forFocusLock=False)
+    detector = CountingDetectorManager(detectorInfo, 'Camera')
+    assert detector.getParameter('Exposure') == 10
+    assert detector.getParameter('Exposure') == 10
+    assert detector.reads == 1
+
+    detector.setParameter('Exposure', 20)
+    assert detector.getParameter('Exposure') == 20
+    assert detector.reads == 2
+
+
+class MovingPositionerManager(PositionerManager):
+    """ Positioner whose read-back position approaches the commanded position
+    over a number of reads. """
+
+    def __init__(self, positionerInfo, name):
+        super().__init__(positionerInfo, name, initialPosition={'X': 0})
+        self._actual = 0
+
+    def move(self, dist, axis):
+        self._position[axis] += dist
+
+    def getPosition(self):
+        self._actual += max(-4, min(4, self._position['X'] - self._actual))
+        return {'X': self._actual}
+
+
+def test_wait_until_settled():
+    positionerInfo = SimpleNamespace(axes=['X'], managerProperties={},
+                                     forPositioning=True, forScanning=False)
+    positioner = MovingPositionerManager(positionerInfo, 'Stage')
+    positioner.move(20, 'X')
+    assert not positioner.waitUntilSettled(tolerance=0.5, timeout=0.1)
+    assert positioner.waitUntilSettled(tolerance=0.5, timeout=5)
+    assert positioner.lastPositionSample[0] == {'X': 20}
+
+    positioner.startPositionPolling(0.01)
+    try:
+        positioner.move(-20, 'X')
+        assert positioner.waitUntilSettled(tolerance=0.5, timeout=5)
+        assert positioner.getPosition() == {'X': 0}
+    finally:
+        positioner.finalize()
+    assert not positioner.isPollingPosition
+
+
+class FailingPositionerManager(PositionerManager):
+    """ Positioner whose first position reads fail. """
+
+    def __init__(self, positionerInfo, name, failures):
+        super().__init__(positionerInfo, name, initialPosition={'X': 0})
+        self.failures = failures
+
+    def move(self, dist, axis):
+        self._position[axis] += dist
+
+    def getPosition(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError('No response')
+        return dict(self._position)
+
+
+def test_failed_position_reads_are_not_samples():
+    positionerInfo = SimpleNamespace(axes=['X'], managerProperties={},
+                                     forPositioning=True, forScanning=False)
+    positioner = FailingPositionerManager(positionerInfo, 'Stage', failures=3)
+    positioner.move(8, 'X')
+    try:
+        positioner.getPosition()
+    except OSError:
+        pass
+    assert positioner.lastPositionSample is None
+
+    # the settle wait retries reads that fail instead of taking them for positions
+    assert positioner.waitUntilSettled(tolerance=0.5, timeout=5)
+    assert positioner.failures == 0
+    assert positioner.getPosition() == {'X': 8}
+
+
+
+class LaggingSquid:
+    """ SQUID microcontroller whose position lags behind the moves. """
+
+    def __init__(self):
+        self.position = [0, 0, 0, 0]
+
+    def move_x_usteps(self, steps):
+        self.position[0] += steps // 2  # still on its way
+
+    def get_pos(self):
+        return tuple(self.position)
+
+
+def test_squid_read_back_keeps_commanded_position():
+    positionerInfo = SimpleNamespace(axes=['X', 'Y', 'Z'],
+                                     managerProperties={'rs232device': 'Squid'},
+                                     forPositioning=True, forScanning=False)
+    rs232Manager = SimpleNamespace(_squid=LaggingSquid())
+    positioner = SQUIDStageManager(positionerInfo, 'Stage',
+                                   rs232sManager={'Squid': rs232Manager})
+    positioner.move(100, 'X')
+    reading = positioner.getPosition()
+    assert reading == {'X': 50, 'Y': 0, 'Z': 0}
+
+    # relative moves and the settle target are based on the commanded position
+    positioner.move(100, 'X')
+    assert positioner.position['X'] == 200
+    assert reading['X'] == 50 and positioner.getPosition()['X'] == 100
+    positioner.finalize()
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
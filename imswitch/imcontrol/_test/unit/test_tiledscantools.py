@@ -0,0 +1,113 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from imswitch.imcontrol.model import tiledscantools
+
+
+def test_next_move_overlaps_previous_write():
+    events = []
+    writeStarted = threading.Event()
+    releaseWrite = threading.Event()
+
+    def moveTo(position):
+        events.append(('move', position))
+        if position == 1:
+            # the second move must not wait for the first tile to be written
+            assert writeStarted.wait(timeout=5)
+            releaseWrite.set()
+
+    def write(index, position, data):
+        writeStarted.set()
+        assert releaseWrite.wait(timeout=5)
+        events.append(('write', data))
+
+    executor = tiledscantools.TiledScanExecutor(
+        moveTo, lambda index, position: position * 10, write
+    )
+    stats = executor.run([0, 1, 2])
+
+    assert stats['tiles'] == 3
+    assert [event for event in events if event[0] == 'write'] == \
+        [('write', 0), ('write', 10), ('write', 20)]
+    assert events.index(('move', 1)) < events.index(('write', 0))
+
+
+def test_write_error_stops_scan():
+    moves = []
+
+    def write(index, position, data):
+        time.sleep(0.01)
+        raise IOError('disk full')
+
+    executor = tiledscantools.TiledScanExecutor(
+        moves.append, lambda index, position: None, write, maxPendingWrites=1
+    )
+    with pytest.raises(IOError):
+        executor.run(range(100))
+    assert len(moves) < 100
+
+    executor = tiledscantools.TiledScanExecutor(
+        moves.append, lambda index, position: None, lambda *args: None
+    )
+    assert executor.run(range(100), isRunning=lambda: False)['tiles'] == 0
+
+
+class FrameCountingDetector:
+    def __init__(self):
+        self.reads = 0
+
+    def getLatestFrame(self):
+        self.reads += 1
+        return np.full((32, 32), self.reads // 3, dtype=np.uint16)
+
+
+def test_grab_fresh_frame():
+    detector = FrameCountingDetector()
+    firstFrame = detector.getLatestFrame()
+    frame = tiledscantools.grabFreshFrame(detector, skipFrames=1, pollInterval=0)
+    # one new frame was skipped, the second one is returned
+    assert frame[0, 0] == firstFrame[0, 0] + 2
+
+    class StaticDetector:
+        def getLatestFrame(self):
+            return np.zeros((8, 8))
+
+    assert tiledscantools.grabFreshFrame(StaticDetector(), timeout=0.02) is not None
+
+
+
+class SettlingPositioner:
+    def __init__(self, canReadPosition):
+        self.canReadPosition = canReadPosition
+
+    def waitUntilSettled(self, tolerance=1.0, timeout=10.0, axes=None):
+        return True
+
+
+@pytest.mark.parametrize('canReadPosition', [True, False])
+def test_settle_stage_waits_without_read_back(canReadPosition):
+    startTime = time.monotonic()
+    assert tiledscantools.settleStage(SettlingPositioner(canReadPosition), 0.2, axes=['Z'])
+    duration = time.monotonic() - startTime
+    # only the commanded position is known, so the settle time is waited
+    assert (duration >= 0.2) != canReadPosition
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,74 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from imswitch.imcontrol.model.managers.positioners.PositionerManager import (
+    PositionerManager, Waypoint
+)
+
+
+class RecordingPositionerManager(PositionerManager):
+    def __init__(self, positionerInfo, name):
+        super().__init__(positionerInfo, name, initialPosition={'X': 0, 'Y': 0})
+        self.moves = []
+        self.block = None
+
+    def move(self, dist, axis):
+        if self.block is not None:
+            self.block.wait()
+        self.moves.append((axis, dist))
+        self._position[axis] += dist
+
+
+def makePositioner():
+    positionerInfo = SimpleNamespace(axes=['X', 'Y'], managerProperties={},
+                                     forPositioning=True, forScanning=False)
+    return RecordingPositionerManager(positionerInfo, 'Stage')
+
+
+def test_trajectory_reports_progress():
+    positioner = makePositioner()
+    progress = []
+    run = positioner.runTrajectory(
+        [{'X': 10, 'Y': 0}, {'position': {'X': 10, 'Y': 5}, 'trigger': True},
+         Waypoint(position={'X': 0})],
+        progressCallback=lambda index, waypoint: progress.append((index, waypoint.trigger)),
+        is_blocking=True
+    )
+
+    assert run.done and run.lastReachedIndex == 2
+    assert progress == [(0, False), (1, True), (2, False)]
+    assert positioner.moves == [('X', 10), ('Y', 5), ('X', -10)]
+    assert positioner.position == {'X': 0, 'Y': 5}
+
+
+def test_trajectory_cancel_and_error():
+    positioner = makePositioner()
+    positioner.block = threading.Event()
+    run = positioner.runTrajectory([{'X': 1}, {'X': 2}, {'X': 3}])
+    run.cancel()
+    positioner.block.set()
+    assert run.wait(timeout=5)
+    assert run.lastReachedIndex < 2
+
+    run = positioner.runTrajectory([{'Z': 1}])
+    with pytest.raises(KeyError):
+        run.wait(timeout=5)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -2,7 +2,7 @@ from typing import Mapping
 
 import numpy as np
 from imswitch.imcommon.framework import Signal, SignalInterface
-from imswitch.imcommon.model import pythontools, APIExport, SharedAttributes
+from imswitch.imcommon.model import pythontools, APIExport, SharedAttributes, getMetricsRegistry
 from imswitch.imcommon.model import initLogger
 
 
@@ -152,6 +152,45 @@ class CommunicationChannel(SignalInterface):
     def isExecuting(self):
         return self._scriptExecution
 
+    @APIExport()
+    def runMDA(self, sequence: str, savePath: str = None, optimizeOrder: bool = True) -> None:
+        """ Starts a multi-dimensional acquisition. sequence is either a list
+        of events, a useq-schema MDASequence, or a JSON string with the keys
+        positions ([[x, y(, z)], ...]), zOffsets, channels, timePoints,
+        interval (seconds) and exposure. If savePath is specified, frames are
+        saved there as TIFF files. """
+        self.__main.masterController.mdaManager.startMDA(sequence, savePath=savePath,
+                                                         optimizeOrder=optimizeOrder)
+
+    @APIExport()
+    def pauseMDA(self) -> None:
+        """ Pauses the running multi-dimensional acquisition. """
+        self.__main.masterController.mdaManager.pauseMDA()
+
+    @APIExport()
+    def resumeMDA(self) -> None:
+        """ Resumes a paused multi-dimensional acquisition. """
+        self.__main.masterController.mdaManager.resumeMDA()
+
+    @APIExport()
+    def cancelMDA(self) -> None:
+        """ Cancels the running multi-dimensional acquisition. """
+        self.__main.masterController.mdaManager.cancelMDA()
+
+    @APIExport()
+    def getMDAStatus(self) -> dict:
+        """ Returns the progress of the current multi-dimensional
+        acquisition. """
+        return self.__main.masterController.mdaManager.getStatus()
+
+    @APIExport()
+    def getMetrics(self) -> dict:
+        """ Returns the current values of all collected metrics, such as
+        frame counts, recording buffer depths and device/API latencies. The
+        same metrics are available in the Prometheus text format on the
+        /metrics endpoint of the REST server. """
+        return getMetricsRegistry().getMetrics()
+
     @APIExport()
     def signals(self) -> Mapping[str, Signal]:
         """ Returns signals that can be used with e.g. the getWaitForSignal
@@ -89,6 +89,10 @@ class ImConMainController(MainController):
     def api(self):
         return self.__api
 
+    @property
+    def masterController(self):
+        return self.__masterController
+
     @property
     def shortcuts(self):
         return self.__shortcuts
@@ -1,7 +1,8 @@
-from imswitch.imcommon.model import VFileItem
+from imswitch.imcommon.model import VFileItem, initLogger
 from imswitch.imcontrol.model import (
     DetectorsManager, LasersManager, MultiManager, PositionersManager, LEDsManager,
-    RecordingManager, RS232sManager, ScanManager, SLMManager, SIMManager, LEDMatrixsManager, MCTManager, ISMManager, UC2ConfigManager, AutofocusManager, HistoScanManager, PixelCalibrationManager
+    RecordingManager, RS232sManager, ScanManager, SimulatedNidaqManager, SLMManager, SIMManager, LEDMatrixsManager, MCTManager, ISMManager, UC2ConfigManager, AutofocusManager, HistoScanManager, PixelCalibrationManager,
+    MDAManager
 )
 
 
@@ -15,6 +16,7 @@ class MasterController:
         self.__setupInfo = setupInfo
         self.__commChannel = commChannel
         self.__moduleCommChannel = moduleCommChannel
+        self.__logger = initLogger(self)
 
         # Init managers
         self.rs232sManager = RS232sManager(self.__setupInfo.rs232devices)
@@ -23,6 +25,13 @@ class MasterController:
             'rs232sManager': self.rs232sManager
         }
 
+        # there is no driver for NI-DAQ cards, point-scanning can only run on simulated input
+        self.nidaqManager = None
+        if self.__setupInfo.scan is not None and self.__setupInfo.scan.simulateNidaq:
+            self.__logger.warning('Using a simulated NI-DAQ card, scans acquire a virtual sample')
+            self.nidaqManager = SimulatedNidaqManager(self.__setupInfo)
+            lowLevelManagers['nidaqManager'] = self.nidaqManager
+
         self.detectorsManager = DetectorsManager(self.__setupInfo.detectors, updatePeriod=100,
                                                  **lowLevelManagers)
         self.lasersManager = LasersManager(self.__setupInfo.lasers,
@@ -43,6 +52,8 @@ class MasterController:
         self.PixelCalibrationManager = PixelCalibrationManager(self.__setupInfo.PixelCalibration)
         self.AutoFocusManager = AutofocusManager(self.__setupInfo.autofocus)
         self.ismManager = ISMManager(self.__setupInfo.ism)
+        self.mdaManager = MDAManager(self.detectorsManager, self.positionersManager,
+                                     self.lasersManager)
 
         # Connect signals
         cc = self.__commChannel
@@ -69,6 +80,7 @@ class MasterController:
 
     def closeEvent(self):
         self.recordingManager.endRecording(emitSignal=False, wait=True)
+        self.mdaManager.finalize()
 
         for attrName in dir(self):
             attr = getattr(self, attrName)
@@ -1 +1,7 @@
-from .ImConMainController import ImConMainController
+def __getattr__(name):
+    # Imported lazily so that MasterController and the server can be used
+    # headless without loading the widget controllers and Qt views.
+    if name == 'ImConMainController':
+        from .ImConMainController import ImConMainController
+        return ImConMainController
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,12 +1,10 @@
-import time
-
 import numpy as np
 from time import perf_counter
-import scipy.ndimage as ndi
 import threading
 
 from imswitch.imcommon.framework import Thread, Timer
 from imswitch.imcommon.model import initLogger, APIExport
+from imswitch.imcontrol.model import autofocustools, tiledscantools
 from ..basecontrollers import ImConWidgetController
 
 # import NanoImagingPack as nip
@@ -14,7 +12,7 @@ from ..basecontrollers import ImConWidgetController
 
 # global axis for Z-positioning - should be Z
 gAxis = "Z"
-T_DEBOUNCE = .2
+T_DEBOUNCE = .2  # time for the stage to settle, at most if it reads back its position
 
 
 class AutofocusController(ImConWidgetController):
@@ -28,6 +26,11 @@ class AutofocusController(ImConWidgetController):
             return
 
         self.isAutofusRunning = False
+        self.searchMethod = 'coarsetofine'
+        self.focusMetric = 'laplacian'
+        self.sweepSpeed = 100  # Z units per second for searchMethod "sweep"
+        self.frameLatency = 0.0  # time from the middle of the exposure to the frame arriving
+        self.lastAutofocusResult = None
 
         self.camera = self._setupInfo.autofocus.camera
         self.positioner = self._setupInfo.autofocus.positioner
@@ -57,16 +60,21 @@ class AutofocusController(ImConWidgetController):
 
     @APIExport(runOnUIThread=True)
     # Update focus lock
-    def autoFocus(self, rangez=100, resolutionz=10):
+    def autoFocus(self, rangez=100, resolutionz=10, initialz=None, searchMethod=None, focusMetric=None):
 
         '''
-        The stage moves from -rangez...+rangez with a resolution of resolutionz
-        For every stage-position a camera frame is captured and a contrast curve is determined
+        The stage searches -rangez...+rangez around initialz (default: the current
+        position) for the best focus with a precision of resolutionz.
+        searchMethod is "coarsetofine" (default), "golden" or "sweep" (one
+        continuous move at sweepSpeed while frames stream), focusMetric one of
+        "laplacian" (default), "brenner", "normvariance" or "fftband". Both only
+        apply to this run; the defaults are self.searchMethod and self.focusMetric.
 
         '''
-        # determine optimal focus position by stepping through all z-positions and cacluate the focus metric
         self.isAutofusRunning = True
-        self._AutofocusThead = threading.Thread(target=self.doAutofocusBackground, args=(rangez, resolutionz),
+        self._AutofocusThead = threading.Thread(target=self.doAutofocusBackground,
+                                                args=(rangez, resolutionz, initialz,
+                                                      searchMethod, focusMetric),
                                                 daemon=True)
         self._AutofocusThead.start()
 
@@ -74,85 +82,68 @@ class AutofocusController(ImConWidgetController):
         detectorManager = self._master.detectorsManager[self.camera]
         return detectorManager.getLatestFrame()
 
-    def doAutofocusBackground(self, rangez=100, resolutionz=10):
+    def doAutofocusBackground(self, rangez=100, resolutionz=10, initialz=None, searchMethod=None,
+                              focusMetric=None):
         self._commChannel.sigAutoFocusRunning.emit(True)  # inidicate that we are running the autofocus
-
-        allfocusvals = []
-        allfocuspositions = []
+        searchMethod = searchMethod if searchMethod is not None else self.searchMethod
+        focusMetric = focusMetric if focusMetric is not None else self.focusMetric
 
         # get current position
         initialPosition = self.stages.getPosition()["Z"]
+        centerPosition = initialPosition if initialz is None else initialz
+        detectorManager = self._master.detectorsManager[self.camera]
 
-        # precompute values for Z-scan
-        Nz = int(2 * rangez // resolutionz)
-        allfocusvals = np.zeros(Nz)
-        allfocuspositions = np.linspace(-abs(rangez), abs(rangez), Nz) + initialPosition
-        allfocusimages = []
-
-        # 0 move focus to initial position
-        self.stages.move(value=allfocuspositions[0], axis="Z", is_absolute=True, is_blocking=True)
-
-        # grab dummy frame?
-        self.grabCameraFrame()
-
-        # 1 compute focus for every z position
-        for iz in range(Nz):
-
-            # exit autofocus if necessary
-            if not self.isAutofusRunning:
-                break
-            # 0 Move stage to the predefined position - remember: stage moves in relative coordinates
-            self.stages.move(value=allfocuspositions[iz], axis="Z", is_absolute=True, is_blocking=True)
-
-            time.sleep(T_DEBOUNCE)
-            self._logger.debug(f'Moving focus to {allfocuspositions[iz]}')
-
-            # 1 Grab camera frame
-            self._logger.debug("Grabbing Frame")
-            img = self.grabCameraFrame()
-            # crop frame, only take inner 40%
-            # img = nip.extract(img, (int(img.shape[0] * 0.4), int(img.shape[1] * 0.4)))
-            allfocusimages.append(img)
-
-            # 2 Gaussian filter the image, to remove noise
-            self._logger.debug("Processing Frame")
-            # img_norm = img-np.min(img)
-            # img_norm = img_norm/np.mean(img_norm)
-            imagearraygf = ndi.filters.gaussian_filter(img, 3)
-
-            # 3 compute focus metric
-            focusquality = np.mean(ndi.filters.laplace(imagearraygf))
-            allfocusvals[iz] = focusquality
+        def moveTo(position):
+            self._logger.debug(f'Moving focus to {position}')
+            self.stages.move(value=position, axis="Z", is_absolute=True, is_blocking=True)
+            tiledscantools.settleStage(self.stages, T_DEBOUNCE, timeout=T_DEBOUNCE, axes=["Z"])
+
+        def grabFrame():
+            # a frame that was exposed after the stage arrived
+            return tiledscantools.grabFreshFrame(detectorManager, timeout=T_DEBOUNCE)
+
+        def sweepTo(position):
+            self.stages.move(value=position, axis="Z", is_absolute=True, is_blocking=False,
+                             speed=self.sweepSpeed)
+
+        def readPositionSample():
+            # the latest reading of the polling thread, with the time it was taken
+            sample = self.stages.lastPositionSample
+            return None if sample is None else (sample[0]["Z"], sample[1])
+
+        # search coarse to fine instead of stepping through all z-positions
+        engine = autofocustools.AutofocusEngine(moveTo, grabFrame, metric=focusMetric)
+        if searchMethod == 'sweep':
+            result = engine.runSweep(
+                centerPosition, rangez, sweepTo, detectorManager.getLatestFrame, self.sweepSpeed,
+                # the position read back in the background is more accurate than the model
+                readPositionSample=readPositionSample if self.stages.isPollingPosition else None,
+                frameLatency=self.frameLatency, isRunning=lambda: self.isAutofusRunning
+            )
+            tiledscantools.settleStage(self.stages, T_DEBOUNCE, timeout=T_DEBOUNCE, axes=["Z"])
+        else:
+            result = engine.run(centerPosition, rangez, resolutionz, method=searchMethod,
+                                isRunning=lambda: self.isAutofusRunning)
+        self.lastAutofocusResult = result
+        bestzpos = result.bestPosition
 
-        if self.isAutofusRunning:
+        if not result.canceled:
             # display the curve
-            self._widget.focusPlotCurve.setData(allfocuspositions, allfocusvals)
+            order = np.argsort(result.positions)
+            self._widget.focusPlotCurve.setData(np.array(result.positions)[order],
+                                                np.array(result.values)[order])
+            self._logger.info(f'Autofocus: {result.numEvaluations} positions in {result.duration:.2f} s')
 
-            # 4 find maximum focus value and move stage to this position
-            allfocusvals = np.array(allfocusvals)
-            zindex = np.where(np.max(allfocusvals) == allfocusvals)[0]
-            bestzpos = allfocuspositions[np.squeeze(zindex)]
-
-            # 5 move focus back to initial position (reduce backlash)
-            self.stages.move(value=allfocuspositions[0], axis="Z", is_absolute=True, is_blocking=True)
+            # 5 move focus back below the best position (reduce backlash)
+            self.stages.move(value=centerPosition - abs(rangez), axis="Z", is_absolute=True, is_blocking=True)
 
             # 6 Move stage to the position with max focus value
-            self._logger.debug(f'Moving focus to {zindex * resolutionz}')
+            self._logger.debug(f'Moving focus to {bestzpos}')
             self.stages.move(value=bestzpos, axis="Z", is_absolute=True, is_blocking=True)
 
-            if False:
-                allfocusimages = np.array(allfocusimages)
-                np.save('allfocusimages.npy', allfocusimages)
-                import tifffile as tif
-                tif.imsave("llfocusimages.tif", allfocusimages)
-                np.save('allfocuspositions.npy', allfocuspositions)
-                np.save('allfocusvals.npy', allfocusvals)
-
         else:
             self.stages.move(value=initialPosition, axis="Z", is_absolute=True, is_blocking=True)
 
-        # DEBUG
-
         # We are done!
         self._commChannel.sigAutoFocusRunning.emit(False)  # inidicate that we are running the autofocus
         self.isAutofusRunning = False
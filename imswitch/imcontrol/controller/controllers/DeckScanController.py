@@ -13,6 +13,7 @@ import tifffile as tif
 from imswitch.imcommon.framework import Signal
 from imswitch.imcommon.model import dirtools
 from imswitch.imcommon.model import initLogger, APIExport
+from imswitch.imcontrol.model import focusmaptools
 
 from locai.deck.deck_config import DeckConfig
 from locai.utils.utils import strfdelta
@@ -74,6 +75,9 @@ class DeckScanController(LiveUpdatedController):
         self.current_scanning_row = (None, None, (None, None), None, (None, None, None))
         # Time to settle image (stage vibrations)
         self.tUnshake = 0.2
+        self.focusMapModel = 'offsets'  # tilt of the plate plus one offset per well
+        self.focusMapSampleInterval = 4  # initial number of positions between autofocus positions
+        self.focusMap = None
         # From MCT:
         # mct parameters
         self.nRounds = 0
@@ -224,13 +228,16 @@ class DeckScanController(LiveUpdatedController):
                 try:
                     # want to do autofocus?
                     autofocusParams = self._widget.getAutofocusValues()
-                    if self._widget.isAutofocus() and np.mod(self.nRounds, int(autofocusParams['valuePeriod'])) == 0:
-                        self._widget.setNImages("Autofocusing...")
+                    measureFocus = self._widget.isAutofocus() and np.mod(self.nRounds, int(autofocusParams['valuePeriod'])) == 0
+                    if measureFocus:
+                        # measure a new focus map while scanning the positions of this round
                         if self.nRounds == 0:
                             self.z_focus = float(autofocusParams["valueInitial"])
                         else:
                             autofocusParams["valueInitial"] = self.z_focus
-                        self.doAutofocus(autofocusParams)
+                        self.focusMap = focusmaptools.FocusMap(self.focusMapModel,
+                                                               residualTolerance=float(autofocusParams['valueSteps']),
+                                                               sampleInterval=self.focusMapSampleInterval)
 
                     if self.LEDValue > 0:
                         timestamp_ = str(self.nRounds) + strfdelta(datetime.now() - self.timeStart,
@@ -241,7 +248,8 @@ class DeckScanController(LiveUpdatedController):
 
                         for pos_id, row_info, frame in self.takeImageIllu(illuMode=illu_mode,
                                                                           intensity=self.LEDValue,
-                                                                          timestamp=timestamp_):
+                                                                          timestamp=timestamp_,
+                                                                          measureFocus=measureFocus):
                             if not self.isScanrunning:
                                 break
                     self.nRounds += 1
@@ -294,25 +302,33 @@ class DeckScanController(LiveUpdatedController):
         z_focus = abs_pos[2] + float(self._widget.scan_list.item(0, 3).text())
         return slot, well, first_position_offset, z_focus, abs_pos
 
-    def doAutofocus(self, params):
-        self._logger.info("Autofocusing at first position...")
+    def doAutofocus(self, params, position: Optional[Point] = None):
+        if position is None:
+            self._logger.info("Autofocusing at first position...")
+            slot, well, first_position_offset, first_z_focus, position = self.get_first_row()
+        else:
+            self._logger.info(f"Autofocusing at {position}...")
         self._widget.setNImages("Autofocusing...")
-        slot, well, first_position_offset, first_z_focus, first_pos = self.get_first_row()
-        self.positioner.move(value=first_pos, axis="XYZ", is_absolute=True, is_blocking=True)
-        self._commChannel.sigAutoFocus.emit(float(params["valueRange"]), float(params["valueSteps"]),
-                                            float(params["valueInitial"]))
+        self.positioner.move(value=position, axis="XYZ", is_absolute=True, is_blocking=True)
         self.isAutofocusRunning = True
-        while self.isAutofocusRunning:
+        self._commChannel.sigAutoFocus.emit(float(params["valueRange"]), float(params["valueSteps"]),
+                                            float(position[2]))
+        while self.isAutofocusRunning and self.isScanrunning:
             time.sleep(0.1)
-            if not self.isAutofocusRunning:
-                self._logger.info("Autofocusing done.")
-                _, _, z_focus = self.positioner.get_position()  # Once done, update focal point
-                self.z_focus = z_focus
-                return
-            # # For Mock AutoFocus I need to break somehow:
-            # for i in range(10000):
-            #     pass
-            # return
+        self._logger.info("Autofocusing done.")
+        _, _, z_focus = self.positioner.get_position()  # Once done, update focal point
+        return z_focus
+
+    def focus_on_position(self, position: Point, well, params, measure_focus: bool,
+                          z_offset: float = 0) -> Point:
+        # returns the position with the focus measured where the focus map can't predict it well enough,
+        # the z offset of the scan list row is kept on top of the focus
+        focus = self.focusMap.predict(position.x, position.y, group=well)
+        if measure_focus and self.focusMap.nextFocus(position.x, position.y, group=well) is None:
+            start = position._replace(z=position.z - z_offset if focus is None else focus)
+            focus = self.doAutofocus(params, start)
+            self.focusMap.addPoint(position.x, position.y, focus, group=well)
+        return position if focus is None else position._replace(z=focus + z_offset)
 
     def get_current_scan_row(self):
         queue_item = self.scan_queue.get()
@@ -374,7 +390,7 @@ class DeckScanController(LiveUpdatedController):
         self._logger.debug(filePath)
         tif.imwrite(filePath, image)
 
-    def takeImageIllu(self, illuMode, intensity, timestamp: str = "", positions_list=[]):
+    def takeImageIllu(self, illuMode, intensity, timestamp: str = "", positions_list=[], measureFocus=False):
         # TODO: include exit/stop logic inside this loop: if I want to stop after 1 well, it need to complete the whole run before deleting the thread.
         image_index = 0
         self._widget.gridLayer = None
@@ -386,6 +402,9 @@ class DeckScanController(LiveUpdatedController):
             slot, well, offset, z_focus, current_pos = self.get_current_scan_row()
             # TODO: avoid this:
             current_pos = current_pos + Point(0, 0, self.z_focus + z_focus - current_pos.z) # Z-position calculated with z_focus column and self.z_focus
+            if self.focusMap is not None and self._widget.isAutofocus():
+                current_pos = self.focus_on_position(current_pos, well, self._widget.getAutofocusValues(),
+                                                     measureFocus, z_offset=z_focus)
 
             img_info = ImageInfo(slot, well, offset, z_focus, current_pos, illu_mode=illuMode,
                                  position_idx=image_index, timestamp=timestamp)  # TODO: avoid hardcoded position_idx
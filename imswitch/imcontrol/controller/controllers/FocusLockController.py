@@ -1,19 +1,21 @@
+import threading
 import time
 
 import numpy as np
 from time import perf_counter
-import scipy.ndimage as ndi
 from lantz import Q_
-from skimage.feature import peak_local_max
 
-from imswitch.imcommon.framework import Thread, Timer
+from imswitch.imcommon.framework import Signal, Thread, Timer
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model import focuslocktools
 from ..basecontrollers import ImConWidgetController
 
 
 class FocusLockController(ImConWidgetController):
     """Linked to FocusLockWidget."""
 
+    sigSafetyUnlocked = Signal()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__logger = initLogger(self)
@@ -42,6 +44,7 @@ class FocusLockController(ImConWidgetController):
 
         self._widget.zStackBox.stateChanged.connect(self.zStackVarChange)
         self._widget.twoFociBox.stateChanged.connect(self.twoFociVarChange)
+        self.sigSafetyUnlocked.connect(self.resetLockWidgets)
 
         self.setPointSignal = 0
         self.locked = False
@@ -50,6 +53,7 @@ class FocusLockController(ImConWidgetController):
         self.twoFociVar = False
         self.noStepVar = True
         self.focusTime = 1000 / self.updateFreq  # time between focus signal updates in ms
+        self.displayTime = max(self.focusTime, 50)  # time between display updates in ms
         self.lockPosition = 0
         self.currentPosition = 0
         self.lastZ = 0
@@ -58,16 +62,23 @@ class FocusLockController(ImConWidgetController):
         self.setPointData = np.zeros(self.buffer)
         self.timeData = np.zeros(self.buffer)
         self.lockingData = np.zeros(7)
+        self._plotDataLock = threading.Lock()  # the plot data is written by the focus lock loop
 
         self._master.detectorsManager[self.camera].startAcquisition()
         self.__processDataThread = ProcessDataThread(self)
+        self.startTime = perf_counter()
+
+        # the focus signal is processed and the PI loop runs on a dedicated thread, the
+        # GUI is only updated with the latest values
+        self.__focusLockLoop = focuslocktools.FocusLockLoop(self.updateFocusLock, self.updateFreq)
+        self.__focusLockLoop.start()
 
         self.timer = Timer()
         self.timer.timeout.connect(self.update)
-        self.timer.start(int(self.focusTime))
-        self.startTime = perf_counter()
+        self.timer.start(int(self.displayTime))
 
     def __del__(self):
+        self.__focusLockLoop.stop()
         self.__processDataThread.quit()
         self.__processDataThread.wait()
         if hasattr(super(), '__del__'):
@@ -76,8 +87,15 @@ class FocusLockController(ImConWidgetController):
     def unlockFocus(self):
         if self.locked:
             self.locked = False
-            self._widget.lockButton.setChecked(False)
-            self._widget.focusPlot.removeItem(self._widget.focusLockGraph.lineLock)
+            self.resetLockWidgets()
+
+    def resetLockWidgets(self):
+        self._widget.lockButton.setChecked(False)
+        self._widget.focusPlot.removeItem(self._widget.focusLockGraph.lineLock)
+
+    def getLoopStats(self):
+        """ Returns the rate, latency and jitter of the focus lock loop. """
+        return self.__focusLockLoop.stats()
 
     def toggleFocus(self):
         if self._widget.lockButton.isChecked():
@@ -117,40 +135,48 @@ class FocusLockController(ImConWidgetController):
         else:
             self.twoFociVar = True
 
-    # Update focus lock
-    def update(self):
-        # 1 Grab camera frame
-        img = self.__processDataThread.grabCameraFrame()
+    # Update focus lock, runs on the focus lock loop thread
+    def updateFocusLock(self):
+        # 1 Grab camera frame, nothing to do until there is a new one
+        if not self.__processDataThread.grabCameraFrame():
+            return
         # 2 Pass camera frame and get back focusSignalPosition from ProcessDataThread
         self.setPointSignal = self.__processDataThread.update(self.twoFociVar)
         # 3 Update PI with the new setPointSignal and get back the distance to move, send to
         # update the PI control, and then send the move-distance to the z-piezo
         if self.locked:
             value_move = self.updatePI()
-            if self.noStepVar and abs(value_move) > 0.002:
+            if self.locked and self.noStepVar and abs(value_move) > 0.002:
                 # self.zstepupdate = self.zstepupdate + 1
                 self._master.positionersManager[self.positioner].move(value_move, 0)
         # elif self.aboutToLock:
         #    self.lockingPI()
-        # 4 Update image and focusSignalPosition in FocusLockWidget
         self.updateSetPointData()
-        self._widget.camImg.setImage(img)
-        if self.currPoint < self.buffer:
-            self._widget.focusPlotCurve.setData(self.timeData[1:self.currPoint],
-                                                self.setPointData[1:self.currPoint])
-        else:
-            self._widget.focusPlotCurve.setData(self.timeData, self.setPointData)
+
+    # Update image and focusSignalPosition in FocusLockWidget
+    def update(self):
+        if self.__processDataThread.latestimg is not None:
+            self._widget.camImg.setImage(self.__processDataThread.latestimg)
+        with self._plotDataLock:
+            if self.currPoint < self.buffer:
+                timeData = self.timeData[1:self.currPoint].copy()
+                setPointData = self.setPointData[1:self.currPoint].copy()
+            else:
+                timeData = self.timeData.copy()
+                setPointData = self.setPointData.copy()
+        self._widget.focusPlotCurve.setData(timeData, setPointData)
 
     def updateSetPointData(self):
-        if self.currPoint < self.buffer:
-            self.setPointData[self.currPoint] = self.setPointSignal
-            self.timeData[self.currPoint] = perf_counter() - self.startTime
-        else:
-            self.setPointData[:-1] = self.setPointData[1:]
-            self.setPointData[-1] = self.setPointSignal
-            self.timeData[:-1] = self.timeData[1:]
-            self.timeData[-1] = perf_counter() - self.startTime
-        self.currPoint += 1
+        with self._plotDataLock:
+            if self.currPoint < self.buffer:
+                self.setPointData[self.currPoint] = self.setPointSignal
+                self.timeData[self.currPoint] = perf_counter() - self.startTime
+            else:
+                self.setPointData[:-1] = self.setPointData[1:]
+                self.setPointData[-1] = self.setPointSignal
+                self.timeData[:-1] = self.timeData[1:]
+                self.timeData[-1] = perf_counter() - self.startTime
+            self.currPoint += 1
 
     def updatePI(self):
         if not self.noStepVar:
@@ -162,7 +188,8 @@ class FocusLockController(ImConWidgetController):
 
         if abs(distance) > 5 or abs(move) > 3:
             self.__logger.debug(f'Safety unlocking! Distance: {distance}, move: {move}.')
-            self.unlockFocus()
+            self.locked = False
+            self.sigSafetyUnlocked.emit()  # the widgets are updated on the GUI thread
 
         return move
 
@@ -179,62 +206,28 @@ class FocusLockController(ImConWidgetController):
 class ProcessDataThread(Thread):
     def __init__(self, controller, *args, **kwargs):
         self._controller = controller
+        self._lastSample = None
+        self.latestimg = None
         super().__init__(*args, **kwargs)
 
     def grabCameraFrame(self):
+        """ Grabs the latest camera frame and returns whether it is a new
+        one. """
         detectorManager = self._controller._master.detectorsManager[self._controller.camera]
-        self.latestimg = detectorManager.getLatestFrame()
+        frame = detectorManager.getLatestFrame()
+        # a sparse copy of the pixels is enough to tell frames apart
+        sample = None if frame is None else np.array(frame[::17, ::17])
+        if sample is None or (self._lastSample is not None and np.array_equal(sample, self._lastSample)):
+            return False
+        self._lastSample = sample
         # 1.5 swap axes of frame (depending on setup, make this a variable in the json)
-        self.latestimg = np.swapaxes(self.latestimg,0,1)
-        return self.latestimg
+        self.latestimg = np.swapaxes(frame,0,1)
+        return True
 
     def update(self, twoFociVar):
-        # Gaussian filter the image, to remove noise and so on, to get a better center estimate
-        imagearraygf = ndi.filters.gaussian_filter(self.latestimg, 7)
-
-        # Update the focus signal
-        if twoFociVar:
-            allmaxcoords = peak_local_max(imagearraygf, min_distance=60)
-            size = allmaxcoords.shape
-            maxvals = np.zeros(size[0])
-            maxvalpos = np.zeros(2)
-            for n in range(0, size[0]):
-                if imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]] > maxvals[0]:
-                    if imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]] > maxvals[1]:
-                        tempval = maxvals[1]
-                        maxvals[0] = tempval
-                        maxvals[1] = imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]]
-                        tempval = maxvalpos[1]
-                        maxvalpos[0] = tempval
-                        maxvalpos[1] = n
-                    else:
-                        maxvals[0] = imagearraygf[allmaxcoords[n][0], allmaxcoords[n][1]]
-                        maxvalpos[0] = n
-            xcenter = allmaxcoords[maxvalpos[0]][0]
-            ycenter = allmaxcoords[maxvalpos[0]][1]
-            if allmaxcoords[maxvalpos[1]][1] < ycenter:
-                xcenter = allmaxcoords[maxvalpos[1]][0]
-                ycenter = allmaxcoords[maxvalpos[1]][1]
-            centercoords2 = np.array([xcenter, ycenter])
-        else:
-            centercoords = np.where(imagearraygf == np.array(imagearraygf.max()))
-            centercoords2 = np.array([centercoords[0][0], centercoords[1][0]])
-
-        subsizey = 50
-        subsizex = 50
-        xlow = max(0, (centercoords2[0] - subsizex))
-        xhigh = min(1024, (centercoords2[0] + subsizex))
-        ylow = max(0, (centercoords2[1] - subsizey))
-        yhigh = min(1280, (centercoords2[1] + subsizey))
-
-        imagearraygfsub = imagearraygf[xlow:xhigh, ylow:yhigh]
-
-        massCenter = np.array(ndi.measurements.center_of_mass(imagearraygfsub))
-
-        # add the information about where the center of the subarray is
-        massCenterGlobal = massCenter[1] + centercoords2[1]  # - subsizey - self.sensorSize[1] / 2
-
-        return massCenterGlobal
+        # the spot is located on a downsampled image and its center of mass computed
+        # on a small full-resolution region around it
+        return focuslocktools.focusSignal(self.latestimg, twoFoci=twoFociVar)
 
 
 class FocusCalibThread(Thread):
@@ -9,6 +9,7 @@ from datetime import datetime
 import cv2
 
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
+from imswitch.imcontrol.model import focusmaptools, scanpathtools, tiledscantools
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
 import time
@@ -47,6 +48,11 @@ class HistoScanController(LiveUpdatedController):
         self.updateRate=2
         self.pixelsizeZ=10
         self.tUnshake = .1
+        self.settleTolerance = 1  # stage units
+        self.settleTimeout = 1  # seconds
+        self.frameTimeout = 1  # seconds
+        self.focusMapModel = 'plane'  # predicts focus between autofocus positions
+        self.focusMap = None
         
         
         
@@ -90,6 +96,10 @@ class HistoScanController(LiveUpdatedController):
         self._widget.HistoUndoButton.clicked.connect(self.undoSelection)
                 
         self._widget.sigSliderLEDValueChanged.connect(self.valueLEDChanged)
+
+        # autofocus related
+        self.isAutofocusRunning = False
+        self._commChannel.sigAutoFocusRunning.connect(self.setAutoFocusIsRunning)
         
         # select detectors
         allDetectorNames = self._master.detectorsManager.getAllDeviceNames()
@@ -211,17 +221,42 @@ class HistoScanController(LiveUpdatedController):
             self._widget.setInformationLabel("No selection was made..")
             return
 
-        # 6. TODO: Sort list for faster acquisition
-        
+        # 6. Sort list for faster acquisition
+        kinematics = [scanpathtools.AxisKinematics(speed=self.speed,
+                                                   backlash=getattr(self.stages, f'backlash{axis}', 0) or 0)
+                      for axis in ("X", "Y")]
+        scanPath = scanpathtools.planScanPath(coordinateList, kinematics=kinematics)
+        coordinateList = scanPath.positions
+        self._logger.debug(f"Scanning {len(coordinateList)} tiles in {scanPath.method} order, "
+                           f"estimated travel time {scanPath.estimatedTime:.1f} s")
+
         # this should decouple the hardware-related actions from the GUI
         self.isHistoScanrunning = True
         self.HistoScanThread = threading.Thread(target=self.doScanThread, args=(coordinateList,), daemon=True)
         self.HistoScanThread.start()
 
-    def doAutofocus(self, params):
+    def setAutoFocusIsRunning(self, isRunning):
+        # this is set by the AutofocusController once the AF is finished/initiated
+        self.isAutofocusRunning = isRunning
+
+    def doAutofocus(self, params, initialz=None):
         self._logger.info("Autofocusing...")
-        isRunInBackground = False
-        self._commChannel.sigAutoFocus.emit(int(params["valueRange"]), int(params["valueSteps"], isRunInBackground))
+        if initialz is None:
+            initialz = self.stages.getPosition()["Z"]
+        self.isAutofocusRunning = True
+        self._commChannel.sigAutoFocus.emit(float(params["valueRange"]), float(params["valueSteps"]), float(initialz))
+        while self.isAutofocusRunning and self.isHistoScanrunning:
+            time.sleep(0.1)
+        return self.stages.getPosition()["Z"]
+
+    def focusOnTile(self, position, params):
+        # measure focus where the focus map can't predict it well enough
+        focus = self.focusMap.nextFocus(*position)
+        if focus is None:
+            self._widget.setInformationLabel("Autofocusing...")
+            self.focusMap.addPoint(*position, self.doAutofocus(params, self.focusMap.predict(*position)))
+        else:
+            self.stages.move(value=focus, axis="Z", is_absolute=True, is_blocking=True)
 
     def doScanThread(self, coordinateList):
         # store initial stage position
@@ -229,25 +264,45 @@ class HistoScanController(LiveUpdatedController):
 
         # reserve and free space for displayed stacks
         self.LastStackLED = []
-            
-        for iPos in range(len(coordinateList)):
-            # move to location
-            self._widget.setInformationLabel("Moving to : " + str(coordinateList[iPos,:]) + " µm ")
-            self.stages.move(value=coordinateList[iPos,:], axis="XY", speed=(self.speed,self.speed), is_absolute=True, is_blocking=True, timeout=5)
-            #self.stages.move(value=coordinateList[iPos,0], axis="X", speed=(self.speed), is_absolute=True, is_blocking=True)
-            #self.stages.move(value=coordinateList[iPos,1], axis="Y", speed=(self.speed), is_absolute=True, is_blocking=True)
-            
+
+        # autofocus every valuePeriod tiles at first, and more or less often depending on
+        # how well the focus map predicts the measured focus
+        autofocusParams = self._widget.getAutofocusValues()
+        self.focusMap = focusmaptools.FocusMap(self.focusMapModel,
+                                               residualTolerance=float(autofocusParams['valueSteps']),
+                                               sampleInterval=int(autofocusParams['valuePeriod']))
+
+        def moveTo(position):
+            self._widget.setInformationLabel("Moving to : " + str(position) + " µm ")
+            self.stages.move(value=position, axis="XY", speed=(self.speed,self.speed), is_absolute=True, is_blocking=True, timeout=5)
+
+        def settle(position):
+            if not tiledscantools.settleStage(self.stages, self.tUnshake, tolerance=self.settleTolerance,
+                                              timeout=self.settleTimeout, axes=["X", "Y"]):
+                self._logger.warning(f"Stage did not settle at {position} within {self.settleTimeout} s")
+
+        def acquire(iPos, position):
             # want to do autofocus?
-            autofocusParams = self._widget.getAutofocusValues()
-            if self._widget.isAutofocus() and np.mod(self.nImages, int(autofocusParams['valuePeriod'])) == 0:
-                self._widget.setInformationLabel("Autofocusing...")
-                self.doAutofocus(autofocusParams)
-            
-            # turn on illumination # TODO: ensure it's the right light source!    
+            if self._widget.isAutofocus():
+                self.focusOnTile(position, autofocusParams)
+
+            # turn on illumination # TODO: ensure it's the right light source!
             zstackParams = self._widget.getZStackValues()
             self._logger.debug("Take image")
-            time.sleep(0.2) # antishake
-            self.takeImageIlluStack(xycoords = coordinateList[iPos,:], intensity=self.LEDValue, zstackParams=zstackParams)
+            return self.takeImageIlluStack(xycoords=position, intensity=self.LEDValue, zstackParams=zstackParams)
+
+        def write(iPos, position, frames):
+            for filePath, frame, append in frames:
+                self._logger.debug(filePath)
+                tif.imwrite(filePath, frame, append=append)
+                # store frames for displaying
+                self.LastStackLED.append(frame)
+
+        # the next tile is approached while the previous one is written to disk
+        scanExecutor = tiledscantools.TiledScanExecutor(moveTo, acquire, write, settle=settle)
+        scanStats = scanExecutor.run(coordinateList, isRunning=lambda: self.isHistoScanrunning)
+        self._logger.info(f"Scanned {scanStats['tiles']} tiles in {scanStats['totalSeconds']:.1f} s "
+                          f"({scanStats['secondsPerTile']:.2f} s per tile)")
 
         # move stage back to origine
         self.stages.move(value=initialPosition, axis="XY", speed=(self.speed,self.speed), is_absolute=True, is_blocking=True, timeout=5)
@@ -261,11 +316,12 @@ class HistoScanController(LiveUpdatedController):
 
 
     def takeImageIlluStack(self, xycoords, intensity, zstackParams=None):
+        """ Acquires the frames for one tile and returns them as a list of
+        (filePath, frame, append) tuples to be written. The LED is only on
+        while a frame is exposed. """
         self._logger.debug("Take image: " + str(xycoords) + " - " + str(intensity))
         fileExtension = 'tif'
-
-        # sync with camera frame
-        time.sleep(.15)
+        frames = []
 
         if zstackParams[-1]:
             # perform a z-stack
@@ -280,36 +336,29 @@ class HistoScanController(LiveUpdatedController):
             for iZ in np.arange(zstackParams[0], zstackParams[1], zstackParams[2]):
                 stepsCounter += zstackParams[2]
                 self.stages.move(value=zstackParams[2], axis="Z", is_absolute=False, is_blocking=True)
+                tiledscantools.settleStage(self.stages, self.tUnshake, tolerance=self.settleTolerance,
+                                           timeout=self.settleTimeout, axes=["Z"])
                 filePath = self.getSaveFilePath(date=self.HistoScanDate, filename=f'{self.HistoScanFilename}_X{xycoords[0]}_Y{xycoords[1]}_Z_{stepsCounter}', extension=fileExtension)
-                
-                # turn on illuminationn
-                self.leds[0].setValue(intensity)
-                self.leds[0].setEnabled(True)
-                time.sleep(self.tUnshake) # unshake
-                lastFrame = self.detector.getLatestFrame()
-                self.leds[0].setEnabled(False)
-                
-                # write out filepath
-                self._logger.debug(filePath)
-                tif.imwrite(filePath, lastFrame, append=True)
-
-                # store frames for displaying
-                self.LastStackLED.append(lastFrame.copy())
+                frames.append((filePath, self.takeIlluminatedFrame(intensity), True))
             self.stages.setEnabled(is_enabled=False)
             self.stages.move(value=-(zstackParams[1]+backlash), axis="Z", is_absolute=False, is_blocking=True)
 
         else:
-            # turn on illuminationn
-            self.leds[0].setValue(intensity)
-            self.leds[0].setEnabled(True)
-
             filePath = self.getSaveFilePath(date=self.HistoScanDate, filename=f'{self.HistoScanFilename}_X{xycoords[0]}_Y{xycoords[1]}', extension=fileExtension)
-            lastFrame = self.detector.getLatestFrame()
-            self._logger.debug(filePath)
-            tif.imwrite(filePath, lastFrame)
-            # store frames for displaying
-            self.LastStackLED.append(lastFrame.copy())
+            frames.append((filePath, self.takeIlluminatedFrame(intensity), False))
+
+        return frames
+
+    def takeIlluminatedFrame(self, intensity):
+        """ Switches on the LED, waits for a frame that was exposed with it and
+        switches the LED off again. """
+        self.leds[0].setValue(intensity)
+        self.leds[0].setEnabled(True)
+        try:
+            lastFrame = tiledscantools.grabFreshFrame(self.detector, timeout=self.frameTimeout)
+        finally:
             self.leds[0].setEnabled(False)
+        return lastFrame.copy()
 
 
     def valueLEDChanged(self, value):
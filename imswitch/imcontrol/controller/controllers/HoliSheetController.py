@@ -12,6 +12,7 @@ import collections
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
 from imswitch.imcontrol.view import guitools
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.holotools import reconstructHologram
 from ..basecontrollers import LiveUpdatedController
 
 
@@ -239,23 +240,16 @@ class HoliSheetController(LiveUpdatedController):
             self.positioner = positioner
 
         def reconHoliSheet(self, image, PSFpara, N_subroi=1024, pixelsize=1e-3, dz=50e-3):
-            mimage = nip.image(np.sqrt(image))
-            mimage = nip.extract(mimage, [N_subroi,N_subroi])
-            mimage.pixelsize=(pixelsize, pixelsize)
-            mpupil = nip.ft(mimage)
-            #nip.__make_propagator__(mpupil, PSFpara, doDampPupil=True, shape=mpupil.shape, distZ=dz)
-            cos_alpha, sin_alpha = nip.cosSinAlpha(mimage, PSFpara)
-            defocus = self.dz #  defocus factor
-            PhaseMap = nip.defocusPhase(cos_alpha, defocus, PSFpara)
-            propagated = nip.ft2d((np.exp(1j * PhaseMap))*mpupil)
-            return np.squeeze(propagated)
+            # The propagator is cached for the shape, pixel size, wavelength and defocus
+            return reconstructHologram(image, pixelsize, PSFpara.wavelength, self.dz, n=PSFpara.n,
+                                       roiSize=N_subroi)
 
         def computeHoliSheetImage(self):
             """ Compute HoliSheet of an image. """
             try:
                 if self._numQueuedImages > 1:
                     return  # Skip this frame in order to catch up
-                HoliSheetrecon = np.flip(np.abs(self.reconHoliSheet(self._image, PSFpara=self.PSFpara, N_subroi=1024, pixelsize=self.pixelsize, dz=self.dz)),1)
+                HoliSheetrecon = self.reconHoliSheet(self._image, PSFpara=self.PSFpara, N_subroi=1024, pixelsize=self.pixelsize, dz=self.dz)
 
                 self.sigHoliSheetImageComputed.emit(np.array(HoliSheetrecon))
             finally:
@@ -263,7 +257,7 @@ class HoliSheetController(LiveUpdatedController):
                 self._numQueuedImages -= 1
                 self._numQueuedImagesMutex.unlock()
 
-        def sigHoliSheetImageComputed(self, image):
+        def prepareForNewImage(self, image):
             """ Must always be called before the worker receives a new image. """
             self._image = image
             self._numQueuedImagesMutex.lock()
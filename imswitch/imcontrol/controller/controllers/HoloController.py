@@ -9,6 +9,7 @@ except:
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex
 from imswitch.imcontrol.view import guitools
 from imswitch.imcommon.model import initLogger
+from imswitch.imcontrol.model.holotools import reconstructHologram
 from ..basecontrollers import LiveUpdatedController
 
 
@@ -120,23 +121,16 @@ class HoloController(LiveUpdatedController):
 
 
         def reconholo(self, image, PSFpara, N_subroi=1024, pixelsize=1e-3, dz=50e-3):
-            mimage = nip.image(np.sqrt(image))
-            mimage = nip.extract(mimage, [N_subroi,N_subroi])
-            mimage.pixelsize=(pixelsize, pixelsize)
-            mpupil = nip.ft(mimage)         
-            #nip.__make_propagator__(mpupil, PSFpara, doDampPupil=True, shape=mpupil.shape, distZ=dz)
-            cos_alpha, sin_alpha = nip.cosSinAlpha(mimage, PSFpara)
-            defocus = self.dz #  defocus factor
-            PhaseMap = nip.defocusPhase(cos_alpha, defocus, PSFpara)
-            propagated = nip.ft2d((np.exp(1j * PhaseMap))*mpupil)
-            return np.squeeze(propagated)
+            # The propagator is cached for the shape, pixel size, wavelength and defocus
+            return reconstructHologram(image, pixelsize, PSFpara.wavelength, self.dz, n=PSFpara.n,
+                                       roiSize=N_subroi)
 
         def computeHoloImage(self):
             """ Compute Holo of an image. """
             try:
                 if self._numQueuedImages > 1:
                     return  # Skip this frame in order to catch up
-                holorecon = np.flip(np.abs(self.reconholo(self._image, PSFpara=self.PSFpara, N_subroi=1024, pixelsize=self.pixelsize, dz=self.dz)),1)
+                holorecon = self.reconholo(self._image, PSFpara=self.PSFpara, N_subroi=1024, pixelsize=self.pixelsize, dz=self.dz)
                 
                 self.sigHoloImageComputed.emit(np.array(holorecon))
             finally:
@@ -249,6 +249,13 @@ class LaserController(ImConWidgetController):
         passed to other laser-related functions. """
         return self._master.lasersManager.getAllDeviceNames()
 
+    @APIExport()
+    def getLaserValue(self, laserName: str, fresh: bool = False) -> Union[int, float]:
+        """ Returns the value of the specified laser, in the units that the
+        laser uses. The last known value is returned unless fresh is true, in
+        which case the laser is queried if it supports it. """
+        return self._master.lasersManager[laserName].getValue(fresh=fresh)
+
     @APIExport(runOnUIThread=True)
     def setLaserActive(self, laserName: str, active: bool) -> None:
         """ Sets whether the specified laser is powered on. """
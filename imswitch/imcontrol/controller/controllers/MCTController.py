@@ -10,6 +10,7 @@ import cv2
 
 
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
+from imswitch.imcontrol.model import focusmaptools, scanpathtools, tiledscantools
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
 import time
@@ -57,6 +58,12 @@ class MCTController(ImConWidgetController):
         self.pixelsize=(10,1,1) # zxy
 
         self.tUnshake = .2
+        self.settleTolerance = 1  # stage units
+        self.settleTimeout = 1  # seconds
+        self.frameTimeout = 1  # seconds
+        self.focusMapModel = 'plane'  # predicts focus between autofocus positions
+        self.focusMapSampleInterval = 4  # initial number of tiles between autofocus positions
+        self.focusMap = None
 
         if self._setupInfo.mct is None:
             self._widget.replaceWithError('MCT is not configured in your setup file.')
@@ -270,17 +277,33 @@ class MCTController(ImConWidgetController):
             self.MCTThread = threading.Thread(target=self.takeTimelapseThread, args=(tperiod, ), daemon=True)
             self.MCTThread.start()
 
-    def doAutofocus(self, params):
+    def doAutofocus(self, params, initialz=None):
         self._logger.info("Autofocusing...")
         self._widget.setNImages("Autofocusing...")
-        self._commChannel.sigAutoFocus.emit(int(params["valueRange"]), int(params["valueSteps"]))
+        if initialz is None:
+            initialz = self.stages.getPosition()["Z"]
         self.isAutofocusRunning = True
+        self._commChannel.sigAutoFocus.emit(float(params["valueRange"]), float(params["valueSteps"]), float(initialz))
         
-        while self.isAutofocusRunning:
+        while self.isAutofocusRunning and self.isMCTrunning:
             time.sleep(0.1)
-            if not self.isAutofocusRunning:
-                self._logger.info("Autofocusing done.")
-                return
+        self._logger.info("Autofocusing done.")
+        return self.stages.getPosition()["Z"]
+
+    def focusOnTile(self, position, params, measureFocus):
+        # returns the focus of the tile, measured where the focus map can't predict it well enough
+        if measureFocus:
+            focus = self.focusMap.nextFocus(*position)
+            if focus is None:
+                focus = self.doAutofocus(params, self.focusMap.predict(*position))
+                self.focusMap.addPoint(*position, focus)
+                return focus
+        else:
+            focus = self.focusMap.predict(*position)
+            if focus is None:
+                return None
+        self.stages.move(value=focus, axis="Z", is_absolute=True, is_blocking=True)
+        return focus
         
 
     def takeTimelapseThread(self, tperiod = 1):
@@ -314,18 +337,23 @@ class MCTController(ImConWidgetController):
                 self.initialPosiionZ = currentPositions["Z"]
                 
                 try:    
-                    # want to do autofocus?
+                    # want to do autofocus? measure a new focus map every valuePeriod rounds,
+                    # during the first scan of the round
                     autofocusParams = self._widget.getAutofocusValues()
-                    if self._widget.isAutofocus() and np.mod(self.nImages, int(autofocusParams['valuePeriod'])) == 0:
-                        self._widget.setNImages("Autofocusing...")
-                        self.doAutofocus(autofocusParams)
+                    measureFocus = self._widget.isAutofocus() and np.mod(self.nImages, int(autofocusParams['valuePeriod'])) == 0
+                    if measureFocus:
+                        self.focusMap = focusmaptools.FocusMap(self.focusMapModel,
+                                                               residualTolerance=float(autofocusParams['valueSteps']),
+                                                               sampleInterval=self.focusMapSampleInterval)
 
                     if self.Laser1Value>0:
-                        self.takeImageIllu(illuMode = "Laser1", intensity=self.Laser1Value, timestamp=self.nImages)
+                        self.takeImageIllu(illuMode = "Laser1", intensity=self.Laser1Value, timestamp=self.nImages, measureFocus=measureFocus)
+                        measureFocus = False
                     if self.Laser2Value>0:
-                        self.takeImageIllu(illuMode = "Laser2", intensity=self.Laser2Value, timestamp=self.nImages)
+                        self.takeImageIllu(illuMode = "Laser2", intensity=self.Laser2Value, timestamp=self.nImages, measureFocus=measureFocus)
+                        measureFocus = False
                     if self.LEDValue>0:
-                        self.takeImageIllu(illuMode = "Brightfield", intensity=self.LEDValue, timestamp=self.nImages)
+                        self.takeImageIllu(illuMode = "Brightfield", intensity=self.LEDValue, timestamp=self.nImages, measureFocus=measureFocus)
 
                     self.nImages += 1
                     self._widget.setNImages(self.nImages)
@@ -344,39 +372,40 @@ class MCTController(ImConWidgetController):
                     
 
 
-    def takeImageIllu(self, illuMode, intensity, timestamp=0):
+    def takeImageIllu(self, illuMode, intensity, timestamp=0, measureFocus=False):
         self._logger.debug("Take image: " + illuMode + " - " + str(intensity))
         fileExtension = 'tif'
 
-        # turn on illuminationn
-        if illuMode == "Laser1" and len(self.lasers)>0:
-            self.lasers[0].setValue(intensity)
-            self.lasers[0].setEnabled(True)
-        elif illuMode == "Laser2" and len(self.lasers)>1:
-            self.lasers[1].setValue(intensity)
-            self.lasers[1].setEnabled(True)
-        elif illuMode == "Brightfield":
+        def setIllumination(enabled):
+            if illuMode == "Laser1" and len(self.lasers)>0:
+                self.lasers[0].setValue(intensity)
+                self.lasers[0].setEnabled(enabled)
+            elif illuMode == "Laser2" and len(self.lasers)>1:
+                self.lasers[1].setValue(intensity)
+                self.lasers[1].setEnabled(enabled)
+            elif illuMode == "Brightfield":
+                try:
+                    if len(self.leds)>0:
+                        self.leds[0].setValue(min(max(intensity, 0), 255))
+                        self.leds[0].setEnabled(enabled)
+                except:
+                    pass
+
+        def takeIlluminatedFrame():
+            # the sample is only illuminated while the frame is exposed
+            setIllumination(True)
             try:
-                if intensity > 255: intensity=255
-                if intensity < 0: intensity=0
-                if len(self.leds)>0:
-                    self.leds[0].setValue(intensity)
-                    self.leds[0].setEnabled(True)
-            except:
-                pass
+                lastFrame = tiledscantools.grabFreshFrame(self.detector, timeout=self.frameTimeout)
+            finally:
+                setIllumination(False)
+            return lastFrame.copy()
+
         # precompute steps for xy scan
         # snake scan
         if self.xyScanEnabled:
-            xyScanStepsAbsolute = []
-            fwdpath = np.arange(self.xScanMin, self.xScanMax, self.xScanStep)
-            bwdpath = np.flip(fwdpath)
-            for indexX, ix in enumerate(np.arange(self.xScanMin, self.xScanMax, self.yScanStep)): 
-                if indexX%2==0:
-                    for indexY, iy in enumerate(fwdpath):
-                        xyScanStepsAbsolute.append([ix, iy])
-                else:
-                    for indexY, iy in enumerate(bwdpath):
-                        xyScanStepsAbsolute.append([ix, iy])
+            xyScanStepsAbsolute = scanpathtools.serpentineGrid(self.xScanMin, self.xScanMax, self.xScanStep,
+                                                               self.yScanMin, self.yScanMax, self.yScanStep,
+                                                               fastAxis=1)
 
         else:
             xyScanStepsAbsolute = [[0,0]]
@@ -398,76 +427,75 @@ class MCTController(ImConWidgetController):
         # initialize xy coordinates
         self.stages.move(value=(self.xScanMin+self.initialPosition[0],self.yScanMin+self.initialPosition[1]), axis="XY", is_absolute=True, is_blocking=True)
         
-        # initialize iterator
-        imageIndex = 0
         self._widget.gridLayer = None
-        # iterate over all xy coordinates iteratively
-        for ipos, iXYPos in enumerate(xyScanStepsAbsolute):
-            if not self.isMCTrunning:
-                break
-            
+
+        def moveTo(iXYPos):
             # move to xy position is necessary
             self.stages.move(value=(iXYPos[0]+self.initialPosition[0],iXYPos[1]+self.initialPosition[1]), axis="XY", is_absolute=True, is_blocking=True)
-            
+
+        def settle(iXYPos):
+            if not tiledscantools.settleStage(self.stages, self.tUnshake, tolerance=self.settleTolerance,
+                                              timeout=self.settleTimeout, axes=["X", "Y"]):
+                self._logger.warning(f"Stage did not settle at {iXYPos} within {self.settleTimeout} s")
+
+        def acquire(ipos, iXYPos):
+            # returns a list of (filePath, frame, append) to be written
+            imageIndex = ipos * self.nZSteps
+            frames = []
+            focus = None
+            if self.focusMap is not None and self._widget.isAutofocus():
+                focus = self.focusOnTile((iXYPos[0]+self.initialPosition[0], iXYPos[1]+self.initialPosition[1]),
+                                         self._widget.getAutofocusValues(), measureFocus)
             if self.zStackEnabled:
                 # perform a z-stack
                 self.stages.move(value=self.zStackMin, axis="Z", is_absolute=False, is_blocking=True)
 
                 stepsCounter = 0
-                backlash=0
                 try: # only relevant for UC2 stuff
                     self.stages.setEnabled(is_enabled=True)
                 except:
                     pass
-                time.sleep(self.tUnshake) # unshake
                 for iZ in np.arange(self.zStackMin, self.zStackMax, self.zStackStep):
                     # move to each position
                     stepsCounter += self.zStackStep
                     self.stages.move(value=self.zStackStep, axis="Z", is_absolute=False, is_blocking=True)
+                    tiledscantools.settleStage(self.stages, self.tUnshake, tolerance=self.settleTolerance,
+                                               timeout=self.settleTimeout, axes=["Z"])
                     filePath = self.getSaveFilePath(date=self.MCTDate, 
                                                     timestamp=timestamp,
-                                                    filename=f'{self.MCTFilename}_{illuMode}_i_{imageIndex}_Z_{stepsCounter}_X_{xyScanStepsAbsolute[ipos][0]}_Y_{xyScanStepsAbsolute[ipos][1]}', 
+                                                    filename=f'{self.MCTFilename}_{illuMode}_i_{imageIndex}_Z_{stepsCounter}_X_{iXYPos[0]}_Y_{iXYPos[1]}', 
                                                     extension=fileExtension)
-                    time.sleep(self.tUnshake) # unshake
-                    lastFrame = self.detector.getLatestFrame()
-                    # self.switchOffIllumination()
-                    self._logger.debug(filePath)
-                    tif.imwrite(filePath, lastFrame, append=True)
+                    frames.append((filePath, takeIlluminatedFrame(), True))
                     imageIndex += 1
 
-                    # store frames for displaying
-                    if illuMode == "Laser1": self.LastStackLaser1.append(lastFrame.copy())
-                    if illuMode == "Laser2": self.LastStackLaser2.append(lastFrame.copy())
-                    if illuMode == "Brightfield": self.LastStackLED.append(lastFrame.copy())
-
                 self.stages.setEnabled(is_enabled=False)
-                #self.stages.move(value=-(self.zStackMax+backlash), axis="Z", is_absolute=False, is_blocking=True)
-                self.stages.move(value=self.initialPosiionZ, axis="Z", is_absolute=True, is_blocking=True)
-
+                self.stages.move(value=self.initialPosiionZ if focus is None else focus, axis="Z", is_absolute=True, is_blocking=True)
 
             else:
                 # single file timelapse
                 filePath = self.getSaveFilePath(date=self.MCTDate, 
                                                 timestamp=timestamp,
-                                                filename=f'{self.MCTFilename}_{illuMode}_i_{imageIndex}_X_{xyScanStepsAbsolute[ipos][0]}_Y_{xyScanStepsAbsolute[ipos][1]}', 
+                                                filename=f'{self.MCTFilename}_{illuMode}_i_{imageIndex}_X_{iXYPos[0]}_Y_{iXYPos[1]}', 
                                                 extension=fileExtension)            
-                
-                
-                lastFrame = self.detector.getLatestFrame()
-                
-                   
+                frames.append((filePath, takeIlluminatedFrame(), False))
+            return frames
+
+        def write(ipos, iXYPos, frames):
+            for filePath, lastFrame, append in frames:
                 self._logger.debug(filePath)
-                tif.imwrite(filePath, lastFrame)
-                imageIndex += 1
-                
+                tif.imwrite(filePath, lastFrame, append=append)
+
                 # store frames for displaying
-                if illuMode == "Laser1": self.LastStackLaser1=(lastFrame.copy())
-                if illuMode == "Laser2": self.LastStackLaser2=(lastFrame.copy())
-                if illuMode == "Brightfield": self.LastStackLED=(lastFrame.copy())
+                if self.zStackEnabled:
+                    if illuMode == "Laser1": self.LastStackLaser1.append(lastFrame)
+                    if illuMode == "Laser2": self.LastStackLaser2.append(lastFrame)
+                    if illuMode == "Brightfield": self.LastStackLED.append(lastFrame)
+                else:
+                    if illuMode == "Laser1": self.LastStackLaser1=lastFrame
+                    if illuMode == "Laser2": self.LastStackLaser2=lastFrame
+                    if illuMode == "Brightfield": self.LastStackLED=lastFrame
 
-            # lets try to visualize each slice in napari 
-            # def setImage(self, im, colormap="gray", name="", pixelsize=(1,1,1)):
-            # construct the tiled image
+            # construct the tiled image from the last frame of the tile
             iX = int((iXYPos[0]-self.xScanMin) // self.xScanStep)
             iY = int((iXYPos[1]-self.yScanMin) // self.yScanStep)
             
@@ -480,12 +508,24 @@ class MCTController(ImConWidgetController):
                             
             self.sigImageReceived.emit() # => displays image
 
+        # iterate over all xy coordinates; the stage moves on to the next
+        # position while the previous tile is written to disk
+        scanExecutor = tiledscantools.TiledScanExecutor(moveTo, acquire, write, settle=settle)
+        scanStats = scanExecutor.run(xyScanStepsAbsolute, isRunning=lambda: self.isMCTrunning)
+        self._logger.debug(f"Scanned {scanStats['tiles']} tiles with {illuMode} "
+                           f"({scanStats['secondsPerTile']:.2f} s per tile)")
 
         # initialize xy coordinates
         self.stages.move(value=(self.initialPosition[0], self.initialPosition[1]), axis="XY", is_absolute=True, is_blocking=True)
        
         self.switchOffIllumination()
 
+    @property
+    def nZSteps(self):
+        if not self.zStackEnabled:
+            return 1
+        return len(np.arange(self.zStackMin, self.zStackMax, self.zStackStep))
+
 
     def switchOffIllumination(self):
         # switch off all illu sources
@@ -12,7 +12,7 @@ from skimage.registration import phase_cross_correlation
 from imswitch.imcommon.model import dirtools, initLogger, APIExport
 from ..basecontrollers import ImConWidgetController
 from imswitch.imcommon.framework import Signal, Thread, Worker, Mutex, Timer
-from imswitch.imcontrol.model import configfiletools
+from imswitch.imcontrol.model import configfiletools, scanpathtools
 import time
 
 from ..basecontrollers import LiveUpdatedController
@@ -97,19 +97,15 @@ class PixelCalibrationController(LiveUpdatedController):
 
         # snake scan
         if 0:
-            xyScanStepsAbsolute = []
-            fwdpath = np.arange(self.xScanMin, self.xScanMax, self.xScanStep)
-            bwdpath = np.flip(fwdpath)
-            for indexX, ix in enumerate(np.arange(self.xScanMin, self.xScanMax, self.yScanStep)):
-                if indexX % 2 == 0:
-                    for indexY, iy in enumerate(fwdpath):
-                        xyScanStepsAbsolute.append([ix, iy])
-                else:
-                    for indexY, iy in enumerate(bwdpath):
-                        xyScanStepsAbsolute.append([ix, iy])
+            xyScanStepsAbsolute = scanpathtools.serpentineGrid(self.xScanMin, self.xScanMax, self.xScanStep,
+                                                               self.yScanMin, self.yScanMax, self.yScanStep,
+                                                               fastAxis=1)
         else:
-            # avoid grid pattern to be detected as same locations => random positions
+            # avoid grid pattern to be detected as same locations => random positions,
+            # visited in the order that minimizes the stage travel
             xyScanStepsAbsolute = np.random.randint(self.xScanMin, self.xScanMax, (10, 2))
+            xyScanStepsAbsolute = scanpathtools.planScanPath(xyScanStepsAbsolute, method='tsp',
+                                                             start=(0, 0)).positions
 
         # initialize xy coordinates
         value = xyScanStepsAbsolute[0, 0] + self.initialPosition[0], xyScanStepsAbsolute[0, 1] + self.initialPosition[1]
@@ -51,6 +51,13 @@ class PositionerController(ImConWidgetController):
     def getPos(self):
         return self._master.positionersManager.execOnAll(lambda p: p.position)
 
+    def _readPosition(self, positioner):
+        try:
+            return positioner.getPosition(fresh=True)
+        except Exception as e:
+            self.__logger.warning(f'Failed to read the position of {positioner.name}: {e}')
+            return positioner.position
+
     def getSpeed(self):
         return self._master.positionersManager.execOnAll(lambda p: p.speed)
 
@@ -139,9 +146,13 @@ class PositionerController(ImConWidgetController):
         return self._master.positionersManager.getAllDeviceNames()
 
     @APIExport()
-    def getPositionerPositions(self) -> Dict[str, Dict[str, float]]:
-        """ Returns the positions of all positioners. """
-        return self.getPos()
+    def getPositionerPositions(self, fresh: bool = False) -> Dict[str, Dict[str, float]]:
+        """ Returns the positions of all positioners. Set fresh to true to
+        read the positions back from the devices that support it, instead of
+        returning the last commanded positions. """
+        if not fresh:
+            return self.getPos()
+        return self._master.positionersManager.execOnAll(self._readPosition)
 
     @APIExport(runOnUIThread=True)
     def setPositionerStepSize(self, positionerName: str, stepSize: float) -> None:
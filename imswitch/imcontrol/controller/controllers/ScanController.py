@@ -50,13 +50,12 @@ class ScanController(SuperScanController):
         self.updateScanStageAttrs()
         self.updateScanTTLAttrs()
 
-        '''
-        self._master.nidaqManager.sigScanStarted.connect(
-            lambda: self.emitScanSignal(self._commChannel.sigScanStarted)
-        )
-        self._master.nidaqManager.sigScanDone.connect(self.scanDone)
-        self._master.nidaqManager.sigScanBuildFailed.connect(self.scanFailed)
-        '''
+        if self._master.nidaqManager is not None:
+            self._master.nidaqManager.sigScanStarted.connect(
+                lambda: self.emitScanSignal(self._commChannel.sigScanStarted)
+            )
+            self._master.nidaqManager.sigScanDone.connect(self.scanDone)
+            self._master.nidaqManager.sigScanBuildFailed.connect(self.scanFailed)
         # Connect CommunicationChannel signals
         self._commChannel.sigRunScan.connect(self.runScanExternal)
         self._commChannel.sigAbortScan.connect(self.abortScan)
@@ -192,6 +191,11 @@ class ScanController(SuperScanController):
     def runScanAdvanced(self, *, recalculateSignals=True, isNonFinalPartOfSequence=False,
                         sigScanStartingEmitted):
         """ Runs a scan with the set scanning parameters. """
+        if self._master.nidaqManager is None:
+            self.__logger.error('Cannot run a scan without an NI-DAQ card')
+            self.scanFailed()
+            return
+
         try:
             self._widget.setScanButtonChecked(True)
             self.isRunning = True
@@ -497,6 +497,15 @@ class SettingsController(ImConWidgetController):
         self.allParams[detectorName].height.setValue(shape[1])
         self.adjustFrame(detector=detector)
 
+    @APIExport()
+    def getDetectorParameter(self, detectorName: str, parameterName: str,
+                             fresh: bool = False) -> Any:
+        """ Returns the value of the specified detector-specific parameter.
+        Values read back from the detector recently are returned from cache;
+        set fresh to true to always query the detector. """
+        return self._master.detectorsManager[detectorName].getParameter(parameterName,
+                                                                        fresh=fresh)
+
     @APIExport(runOnUIThread=True)
     def setDetectorParameter(self, detectorName: str, parameterName: str, value: Any) -> None:
         """ Sets the specified detector-specific parameter to the specified
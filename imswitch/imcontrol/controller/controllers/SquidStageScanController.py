@@ -1,5 +1,4 @@
 import numpy as np
-import time
 import threading
 
 try:
@@ -138,10 +137,8 @@ class SquidStageScanController(LiveUpdatedController):
             positioner.homing()
             self.isHomed = False
             while(not self.isHomed):
-                time.sleep(.1)
-                self.isHomed = not positioner.is_busy()
                 # wait until we arrive at the home position
-            self.isHomed = True
+                self.isHomed = positioner.waitUntilSettled(timeout=1)
 
         def startScan(self, positioner, detector, coordinates, pixelsize):
             self.intensityMap = []
@@ -176,7 +173,7 @@ class SquidStageScanController(LiveUpdatedController):
                     if self.stopScan:
                         break
                     mMeanImage = np.mean(detector.getLatestFrame())
-                    mPos = positioner.getPosition()
+                    mPos = positioner.getPosition(fresh=True)
                     self.intensityMap.append((mMeanImage, mPos))
 
                 mCoordY += (fovY)
@@ -1,14 +1,24 @@
 import Pyro5
 import Pyro5.server
 from imswitch.imcommon.framework import Worker
-from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.model import initLogger, getMetricsRegistry
 from ._serialize import register_serializers
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 import uvicorn
+import time
 from functools import wraps
 
 app = FastAPI()
 
+_metrics = getMetricsRegistry()
+_requestHistogram = _metrics.histogram(
+    'imswitch_api_request_seconds', 'Time spent handling API requests per endpoint'
+)
+_requestErrorsCounter = _metrics.counter(
+    'imswitch_api_request_errors_total', 'Number of API requests that raised per endpoint'
+)
+
 
 class ImSwitchServer(Worker):
 
@@ -21,9 +31,6 @@ class ImSwitchServer(Worker):
         self._host = setupInfo.pyroServerInfo.host
         self._port = setupInfo.pyroServerInfo.port
 
-        self._paused = False
-        self._canceled = False
-
     def run(self):
         self.createAPI()
         uvicorn.run(app)
@@ -56,78 +63,21 @@ class ImSwitchServer(Worker):
             @app.get(str)
             @wraps(func)
             async def wrapper(*args, **kwargs):
-                return func(*args, **kwargs)
+                startTime = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    _requestErrorsCounter.inc(endpoint=str)
+                    raise
+                finally:
+                    _requestHistogram.observe(time.perf_counter() - startTime, endpoint=str)
             return wrapper
 
-
-        '''
-            @Pyro5.server.expose
-            def move(self, positionerName=None, axis="X", dist=0) -> np.ndarray:
-                return self._channel.move(positionerName, axis=axis, dist=dist)
-
-            @Pyro5.server.expose
-            def run_mda(self, sequence: MDASequence) -> None:
-                self.__logger.info("MDA Started: {}")
-                self._paused = False
-                paused_time = 0.0
-                t0 = time.perf_counter()  # reference time, in seconds
-
-                def check_canceled():
-                    if self._canceled:
-                        self.__logger.warning("MDA Canceled: ")
-                        self._canceled = False
-                        return True
-                    return False
-
-                for event in sequence:
-                    while self._paused and not self._canceled:
-                        paused_time += 0.1  # fixme: be more precise
-                        time.sleep(0.1)
-
-                    if check_canceled():
-                        break
-
-                    if event.min_start_time:
-                        go_at = event.min_start_time + paused_time
-                        # We need to enter a loop here checking paused and canceled.
-                        # otherwise you'll potentially wait a long time to cancel
-                        to_go = go_at - (time.perf_counter() - t0)
-                        while to_go > 0:
-                            while self._paused and not self._canceled:
-                                paused_time += 0.1  # fixme: be more precise
-                                to_go += 0.1
-                                time.sleep(0.1)
-
-                            if self._canceled:
-                                break
-                            if to_go > 0.5:
-                                time.sleep(0.5)
-                            else:
-                                time.sleep(to_go)
-                            to_go = go_at - (time.perf_counter() - t0)
-
-                    # check canceled again in case it was canceled
-                    # during the waiting loop
-                    if check_canceled():
-                        break
-
-                    self.__logger.info(event.x_pos)
-
-                    # prep hardware
-                    if event.x_pos is not None or event.y_pos is not None:
-                        x = event.x_pos or self.getXPosition()
-                        y = event.y_pos or self.getYPosition()
-                        self._channel.sigSetXYPosition.emit(x, y)
-                    if event.z_pos is not None:
-                        self._channel.sigSetZPosition.emit(event.z_pos)
-                    if event.exposure is not None:
-                        self._channel.sigSetExposure.emit(event.exposure)
-
-                self.__logger.info("MDA Finished: ")
-                pass
-
-        '''
-
+        @app.get('/metrics', response_class=PlainTextResponse)
+        def metrics():
+            """ Returns all collected metrics in the Prometheus text format. """
+            return PlainTextResponse(_metrics.renderPrometheus(),
+                                     media_type='text/plain; version=0.0.4')
 
         def includePyro(func):
             @Pyro5.server.expose
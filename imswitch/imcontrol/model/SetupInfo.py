@@ -280,6 +280,10 @@ class ScanInfo:
     sampleRate: int
     """ Scan sample rate. """
 
+    simulateNidaq: bool = False
+    """ Whether to run scans on a simulated NI-DAQ card, whose detectors
+    acquire a virtual sample instead of the real one. For testing only. """
+
 
 @dataclass(frozen=True)
 class EtSTEDInfo:
@@ -0,0 +1,372 @@
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+import numpy as np
+import scipy.ndimage as ndi
+
+from imswitch.imcommon.model import getMetricsRegistry, initLogger
+from imswitch.imcontrol.model.tiledscantools import isNewSample, sampleFrame
+
+
+_metrics = getMetricsRegistry()
+_autofocusHistogram = _metrics.histogram(
+    'imswitch_autofocus_seconds', 'Duration of autofocus runs per search method'
+)
+_evaluationsCounter = _metrics.counter(
+    'imswitch_autofocus_evaluations_total', 'Number of focus positions evaluated per search method'
+)
+
+
+def prepareFocusImage(image, roiFraction=0.5, downsample=2):
+    """ Returns the central roiFraction of the image, converted to a float32
+    grayscale image and downsampled by averaging downsample x downsample
+    blocks, which also suppresses pixel noise. """
+    image = np.asarray(image)
+    if image.ndim > 2:
+        image = image.mean(axis=-1)
+    if roiFraction < 1:
+        height, width = image.shape
+        roiHeight = max(int(height * roiFraction), 1)
+        roiWidth = max(int(width * roiFraction), 1)
+        top = (height - roiHeight) // 2
+        left = (width - roiWidth) // 2
+        image = image[top:top + roiHeight, left:left + roiWidth]
+    image = image.astype(np.float32, copy=False)
+    if downsample > 1:
+        height = image.shape[0] // downsample * downsample
+        width = image.shape[1] // downsample * downsample
+        image = image[:height, :width].reshape(
+            height // downsample, downsample, width // downsample, downsample
+        ).mean(axis=(1, 3))
+    return image
+
+
+def laplacianVariance(image):
+    """ Variance of the Laplacian; high for sharp edges. """
+    return float(ndi.laplace(image).var())
+
+
+def brenner(image):
+    """ Brenner gradient, the mean squared difference between pixels two
+    columns apart. """
+    return float(np.mean((image[:, 2:] - image[:, :-2]) ** 2))
+
+
+def normalizedVariance(image):
+    """ Intensity variance normalized by the mean intensity, which makes it
+    insensitive to illumination changes. """
+    mean = image.mean()
+    return float(image.var() / mean) if mean != 0 else 0.0
+
+
+def fftBandEnergy(image, lowFrequency=0.05, highFrequency=0.25):
+    """ Spectral energy at spatial frequencies between lowFrequency and
+    highFrequency (in cycles per pixel), relative to the energy of the mean
+    intensity. Ignores both the background and the highest frequencies,
+    which are dominated by noise. """
+    spectrum = np.abs(np.fft.rfft2(image)) ** 2
+    fy = np.fft.fftfreq(image.shape[0])[:, None]
+    fx = np.fft.rfftfreq(image.shape[1])[None, :]
+    frequency = np.sqrt(fx ** 2 + fy ** 2)
+    if spectrum[0, 0] == 0:
+        return 0.0
+    band = (frequency >= lowFrequency) & (frequency <= highFrequency)
+    return float(spectrum[band].sum() / spectrum[0, 0])
+
+
+focusMetrics: Dict[str, Callable[[np.ndarray], float]] = {
+    'laplacian': laplacianVariance,
+    'brenner': brenner,
+    'normvariance': normalizedVariance,
+    'fftband': fftBandEnergy,
+}
+""" Available focus metrics by name. All of them are largest in focus. """
+
+
+@dataclass
+class AutofocusResult:
+    """ Outcome of an autofocus search. """
+
+    bestPosition: float
+    """ Position with the highest estimated focus metric. """
+
+    positions: List[float] = field(default_factory=list)
+    """ Evaluated positions, in the order in which they were evaluated. """
+
+    values: List[float] = field(default_factory=list)
+    """ Focus metric at each evaluated position. """
+
+    duration: float = 0.0
+    """ Duration of the search in seconds. """
+
+    canceled: bool = False
+
+    @property
+    def numEvaluations(self):
+        return len(self.positions)
+
+
+class AutofocusEngine:
+    """ Finds the position that maximizes a focus metric with few stage
+    moves, by either a coarse scan followed by parabolic refinement
+    ("coarsetofine") or a golden-section search ("golden"), or with a single
+    continuous move (runSweep).
+
+    Args:
+        moveTo: Function that moves the focus axis to an absolute position and
+          returns once the stage has settled.
+        grabFrame: Function that returns a frame acquired at the current
+          position.
+        metric: Name of a focus metric in focusMetrics, or a function taking a
+          prepared image.
+        roiFraction: Fraction of the frame (centered) that the metric is
+          computed on.
+        downsample: Downsampling factor applied before computing the metric.
+    """
+
+    def __init__(self, moveTo, grabFrame, metric='laplacian', roiFraction=0.5, downsample=2):
+        self.__logger = initLogger(self)
+        self._moveTo = moveTo
+        self._grabFrame = grabFrame
+        self._metric = focusMetrics[metric] if isinstance(metric, str) else metric
+        self._roiFraction = roiFraction
+        self._downsample = downsample
+
+    def focusValue(self, frame):
+        """ Computes the focus metric of a frame. """
+        return self._metric(prepareFocusImage(frame, self._roiFraction, self._downsample))
+
+    def run(self, center, rangez, resolutionz, method='coarsetofine', coarseSteps=5,
+            isRunning=None) -> AutofocusResult:
+        """ Searches [center - rangez, center + rangez] for the best focus
+        position with a precision of about resolutionz. The stage is left at
+        the last evaluated position; isRunning can return False to cancel. """
+        startTime = time.perf_counter()
+        result = AutofocusResult(bestPosition=center)
+        low, high = center - abs(rangez), center + abs(rangez)
+        resolutionz = abs(resolutionz) if resolutionz else abs(rangez) / 10
+
+        try:
+            if method == 'coarsetofine':
+                self._searchCoarseToFine(result, low, high, resolutionz, coarseSteps, isRunning)
+            elif method == 'golden':
+                self._searchGoldenSection(result, low, high, resolutionz, isRunning)
+            else:
+                raise ValueError(f'Unknown autofocus method "{method}"')
+        except _Canceled:
+            result.canceled = True
+            result.bestPosition = center
+
+        result.duration = time.perf_counter() - startTime
+        _autofocusHistogram.observe(result.duration, method=method)
+        _evaluationsCounter.inc(result.numEvaluations, method=method)
+        self.__logger.debug(f'Autofocus found {result.bestPosition} after {result.numEvaluations}'
+                            f' evaluations in {result.duration:.2f} s')
+        return result
+
+    def runSweep(self, center, rangez, sweepTo, latestFrame, speed, readPositionSample=None,
+                 frameLatency=0.0, pollInterval=0.002, isRunning=None) -> AutofocusResult:
+        """ Searches [center - rangez, center + rangez] in a single continuous
+        move instead of stopping at every position. The stage is moved to the
+        start of the range, then sweepTo starts a move to the end at constant
+        speed (in position units per second) and returns immediately. Frames
+        are taken from latestFrame while the stage moves; each new frame is
+        timestamped on arrival minus frameLatency (e.g. half the exposure
+        time plus the readout time) and assigned the position interpolated at
+        that time, either from the position samples returned by
+        readPositionSample, if given, or from the constant-speed trajectory.
+        readPositionSample returns the latest position read back from the
+        stage as a tuple (position, timestamp), with the timestamp taken from
+        time.monotonic() when the position was read, or None. The best
+        position is found by fitting a parabola to the samples around the
+        peak. """
+        startTime = time.perf_counter()
+        result = AutofocusResult(bestPosition=center)
+        low, high = center - abs(rangez), center + abs(rangez)
+
+        try:
+            if isRunning is not None and not isRunning():
+                raise _Canceled
+            self._moveTo(low)
+            lastSample = sampleFrame(latestFrame())
+            sweepStart = time.monotonic()
+            sweepTo(high)
+            sweepEnd = sweepStart + (high - low) / abs(speed)
+            stopTime = sweepEnd + frameLatency + pollInterval
+            trajectory = [(sweepStart, low)]
+            frameTimes = []
+            while True:
+                now = time.monotonic()
+                if now > stopTime:
+                    break
+                if isRunning is not None and not isRunning():
+                    raise _Canceled
+                frame = latestFrame()
+                sample = sampleFrame(frame)
+                if isNewSample(sample, lastSample):
+                    lastSample = sample
+                    frameTimes.append(now - frameLatency)
+                    result.values.append(self.focusValue(frame))
+                if readPositionSample is not None:
+                    positionSample = readPositionSample()
+                    # only readings taken during the sweep, each one once
+                    if positionSample is not None and positionSample[1] > trajectory[-1][0]:
+                        trajectory.append((positionSample[1], positionSample[0]))
+                time.sleep(pollInterval)
+
+            if readPositionSample is None:
+                trajectory.append((sweepEnd, high))
+            trajectoryTimes, trajectoryPositions = np.array(trajectory).T
+            result.positions = [float(position) for position in np.interp(
+                frameTimes, trajectoryTimes, trajectoryPositions
+            )]
+            if result.numEvaluations > 0:
+                result.bestPosition = _fitPeak(result.positions, result.values, low, high)
+        except _Canceled:
+            result.canceled = True
+            result.bestPosition = center
+
+        result.duration = time.perf_counter() - startTime
+        _autofocusHistogram.observe(result.duration, method='sweep')
+        _evaluationsCounter.inc(result.numEvaluations, method='sweep')
+        self.__logger.debug(f'Autofocus sweep found {result.bestPosition} from'
+                            f' {result.numEvaluations} frames in {result.duration:.2f} s')
+        return result
+
+    def _searchCoarseToFine(self, result, low, high, resolutionz, coarseSteps, isRunning):
+        coarseSteps = max(int(coarseSteps), 3)
+        coarsePositions = np.linspace(low, high, coarseSteps)
+        if coarsePositions[1] - coarsePositions[0] <= resolutionz:
+            # the range is small enough to scan it at full resolution
+            coarsePositions = np.arange(low, high + resolutionz / 2, resolutionz)
+        for position in coarsePositions:
+            self._evaluate(result, position, isRunning)
+        estimate = _parabolicPeak(result.positions, result.values, low, high)
+        if coarsePositions[1] - coarsePositions[0] <= resolutionz:
+            result.bestPosition = estimate
+            return
+
+        # refine around the estimate, reusing samples that are close enough,
+        # and follow the slope if the peak is not bracketed yet
+        finePositions = list(np.unique(np.clip(
+            [estimate - resolutionz, estimate, estimate + resolutionz], low, high
+        )))
+        fineValues = [self._evaluateOrReuse(result, position, resolutionz, isRunning)
+                      for position in finePositions]
+        maxSteps = int(np.ceil((coarsePositions[1] - coarsePositions[0]) / resolutionz))
+        for _ in range(maxSteps):
+            best = int(np.argmax(fineValues))
+            if best == 0 and finePositions[0] > low:
+                position = max(finePositions[0] - resolutionz, low)
+                finePositions.insert(0, position)
+                fineValues.insert(0, self._evaluateOrReuse(result, position, resolutionz,
+                                                           isRunning))
+            elif best == len(finePositions) - 1 and finePositions[-1] < high:
+                position = min(finePositions[-1] + resolutionz, high)
+                finePositions.append(position)
+                fineValues.append(self._evaluateOrReuse(result, position, resolutionz, isRunning))
+            else:
+                break
+        result.bestPosition = _parabolicPeak(finePositions, fineValues, low, high)
+
+    def _searchGoldenSection(self, result, low, high, resolutionz, isRunning):
+        invPhi = (np.sqrt(5) - 1) / 2
+        a, b = low, high
+        c = b - invPhi * (b - a)
+        d = a + invPhi * (b - a)
+        fc = self._evaluate(result, c, isRunning)
+        fd = self._evaluate(result, d, isRunning)
+        while b - a > resolutionz:
+            if fc > fd:
+                b, d, fd = d, c, fc
+                c = b - invPhi * (b - a)
+                fc = self._evaluate(result, c, isRunning)
+            else:
+                a, c, fc = c, d, fd
+                d = a + invPhi * (b - a)
+                fd = self._evaluate(result, d, isRunning)
+        result.bestPosition = _parabolicPeak(result.positions, result.values, a, b)
+
+    def _evaluateOrReuse(self, result, position, resolutionz, isRunning):
+        distances = np.abs(np.array(result.positions) - position)
+        closest = int(np.argmin(distances))
+        if distances[closest] <= resolutionz / 4:
+            return result.values[closest]
+        return self._evaluate(result, position, isRunning)
+
+    def _evaluate(self, result, position, isRunning):
+        if isRunning is not None and not isRunning():
+            raise _Canceled
+        position = float(position)
+        self._moveTo(position)
+        value = self.focusValue(self._grabFrame())
+        result.positions.append(position)
+        result.values.append(value)
+        return value
+
+
+def _parabolicPeak(positions, values, low, high):
+    """ Fits a parabola through the best sample and its neighbours and
+    returns the position of its maximum, limited to [low, high] and to the
+    neighbouring samples. Falls back to the best sample. """
+    order = np.argsort(positions)
+    positions = np.asarray(positions, dtype=float)[order]
+    values = np.asarray(values, dtype=float)[order]
+    best = int(np.argmax(values))
+    if best == 0 or best == len(positions) - 1:
+        return float(np.clip(positions[best], low, high))
+
+    x = positions[best - 1:best + 2]
+    y = values[best - 1:best + 2]
+    a, b, _ = np.polyfit(x, y, 2)
+    if a >= 0:
+        return float(positions[best])
+    peak = -b / (2 * a)
+    return float(np.clip(peak, max(x[0], low), min(x[-1], high)))
+
+
+def _fitPeak(positions, values, low, high):
+    """ Least-squares fit of a parabola to the samples in the half-maximum
+    window around the best sample, for many noisy samples. Returns the
+    position of its maximum, limited to the window, or the best sample if
+    the window holds too few samples. """
+    order = np.argsort(positions)
+    positions = np.asarray(positions, dtype=float)[order]
+    values = np.asarray(values, dtype=float)[order]
+    best = int(np.argmax(values))
+    halfMaximum = (values.min() + values[best]) / 2
+    first, last = best, best
+    while first > 0 and values[first - 1] >= halfMaximum:
+        first -= 1
+    while last < len(values) - 1 and values[last + 1] >= halfMaximum:
+        last += 1
+
+    x, y = positions[first:last + 1], values[first:last + 1]
+    if len(np.unique(x)) < 3:
+        return float(np.clip(positions[best], low, high))
+    a, b, _ = np.polyfit(x, y, 2)
+    if a >= 0:
+        return float(np.clip(positions[best], low, high))
+    return float(np.clip(-b / (2 * a), max(x[0], low), min(x[-1], high)))
+
+
+class _Canceled(Exception):
+    pass
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import scipy.ndimage as ndi
+
+from imswitch.imcommon.model import getMetricsRegistry, initLogger
+
+
+_metrics = getMetricsRegistry()
+_latencyHistogram = _metrics.histogram(
+    'imswitch_focuslock_latency_seconds',
+    'Time from grabbing a frame to actuating the focus per loop'
+)
+_periodHistogram = _metrics.histogram(
+    'imswitch_focuslock_period_seconds',
+    'Time between consecutive focus lock iterations per loop'
+)
+_overrunCounter = _metrics.counter(
+    'imswitch_focuslock_overruns_total',
+    'Number of focus lock iterations that took longer than the period'
+)
+
+
+def focusSignal(image, twoFoci=False, sigma=7, subsize=50, downsample=4, minPeakDistance=60):
+    """ Returns the focus signal of a focus lock camera frame: the position,
+    along the second axis, of the center of mass of the reflected spot.
+
+    The spot is first located on a copy of the image downsampled by block
+    averaging, which is filtered with a correspondingly smaller Gaussian.
+    The center of mass is then computed on the full-resolution image, only
+    in the (2 * subsize)² region around the spot. With twoFoci, the spot is
+    the one of the two brightest maxima (at least minPeakDistance pixels
+    apart) that is closer to the start of the second axis. """
+    image = np.asarray(image)
+    downsample = max(int(downsample), 1)
+    coarse = _blockMean(image, downsample)
+    coarse = ndi.gaussian_filter(coarse, sigma / downsample, truncate=3)
+
+    if twoFoci:
+        peaks = _brightestPeaks(coarse, max(int(minPeakDistance / downsample), 1), 2)
+        peak = peaks[np.argmin(peaks[:, 1])]
+    else:
+        peak = np.unravel_index(np.argmax(coarse), coarse.shape)
+    center = (np.asarray(peak) * downsample + downsample // 2).astype(int)
+
+    low = np.maximum(center - subsize, 0)
+    high = np.minimum(center + subsize, image.shape)
+    sub = image[low[0]:high[0], low[1]:high[1]].astype(np.float32)
+    sub = ndi.gaussian_filter(sub, sigma, truncate=3)
+    sub -= sub.min()  # the background would pull the center towards the middle
+    total = sub.sum()
+    if total == 0:
+        return float(center[1])
+    return float((sub.sum(axis=0) @ np.arange(sub.shape[1])) / total + low[1])
+
+
+class FocusLockLoop:
+    """ Runs step() on a dedicated thread at a fixed rate (in Hz), for
+    control loops that should not be paced by the GUI. Iterations are
+    scheduled on an absolute time grid, so that a late iteration doesn't
+    delay the following ones; if an iteration takes longer than the period,
+    the missed iterations are skipped. The duration of each iteration
+    (latency) and the time between iterations are recorded. clock returns
+    the time in seconds and sleep(seconds) waits until the next iteration;
+    by default, the loop sleeps until the time elapsed or it is stopped. """
+
+    def __init__(self, step, rate, name='FocusLock', statsHistorySize=1000,
+                 clock=time.perf_counter, sleep=None):
+        self.__logger = initLogger(self, instanceName=name)
+        self._step = step
+        self._period = 1 / rate
+        self._clock = clock
+        self._sleep = sleep
+        self._name = name
+        self._latencies = deque(maxlen=statsHistorySize)
+        self._periods = deque(maxlen=statsHistorySize)
+        self._numOverruns = 0
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+    @property
+    def rate(self):
+        return 1 / self._period
+
+    @rate.setter
+    def rate(self, value):
+        self._period = 1 / value
+
+    @property
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.isRunning:
+            return
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopEvent.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            # when stopped from step(), the iteration still finishes
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        """ Returns the number of recent iterations, their achieved rate, the
+        latency (mean, p95, max) and jitter (standard deviation of the time
+        between iterations) in seconds, and the number of overruns. """
+        latencies = np.array(self._latencies)
+        periods = np.array(self._periods)
+        stats = {'count': len(latencies), 'overruns': self._numOverruns}
+        if len(latencies) > 0:
+            stats.update(latencyMean=float(latencies.mean()),
+                         latencyP95=float(np.percentile(latencies, 95)),
+                         latencyMax=float(latencies.max()))
+        if len(periods) > 0:
+            stats.update(rate=float(1 / periods.mean()), jitter=float(periods.std()))
+        return stats
+
+    def _run(self):
+        sleep = self._sleep if self._sleep is not None else self._stopEvent.wait
+        nextTime = self._clock()
+        lastStart = None
+        while not self._stopEvent.is_set():
+            start = self._clock()
+            if lastStart is not None:
+                self._periods.append(start - lastStart)
+                _periodHistogram.observe(start - lastStart, loop=self._name)
+            lastStart = start
+
+            try:
+                self._step()
+            except Exception as e:
+                self.__logger.error(f'Focus lock iteration failed: {e}')
+            latency = self._clock() - start
+            self._latencies.append(latency)
+            _latencyHistogram.observe(latency, loop=self._name)
+
+            nextTime += self._period
+            now = self._clock()
+            if now > nextTime:
+                self._numOverruns += 1
+                _overrunCounter.inc(loop=self._name)
+                nextTime += np.ceil((now - nextTime) / self._period) * self._period
+            sleep(nextTime - now)
+
+
+def _blockMean(image, factor):
+    if factor == 1:
+        return image.astype(np.float32)
+    height = image.shape[0] // factor * factor
+    width = image.shape[1] // factor * factor
+    return image[:height, :width].reshape(
+        height // factor, factor, width // factor, factor
+    ).mean(axis=(1, 3), dtype=np.float32)
+
+
+def _brightestPeaks(image, minDistance, numPeaks):
+    """ Returns the coordinates of the numPeaks highest local maxima that are
+    at least minDistance apart, brightest first. """
+    isPeak = image == ndi.maximum_filter(image, size=2 * minDistance + 1, mode='nearest')
+    coordinates = np.argwhere(isPeak)
+    coordinates = coordinates[np.argsort(image[isPeak])[::-1]]
+    peaks = [coordinates[0]]
+    for coordinate in coordinates[1:]:
+        if len(peaks) == numPeaks:
+            break
+        if np.all(np.max(np.abs(np.array(peaks) - coordinate), axis=1) >= minDistance):
+            peaks.append(coordinate)
+    return np.array(peaks)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
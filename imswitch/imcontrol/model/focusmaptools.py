@@ -0,0 +1,204 @@
+from typing import Hashable, Optional
+
+import numpy as np
+
+from imswitch.imcommon.model import getMetricsRegistry, initLogger
+
+
+_metrics = getMetricsRegistry()
+_positionsCounter = _metrics.counter(
+    'imswitch_focusmap_positions_total',
+    'Number of scan positions whose focus was measured or predicted'
+)
+_residualHistogram = _metrics.histogram(
+    'imswitch_focusmap_residual',
+    'Difference between measured and predicted focus per model'
+)
+
+
+class FocusMap:
+    """ Predicts the focal plane at every scan position from focus measured
+    at a few of them, so that a scan doesn't have to run an autofocus at each
+    position. The measurements are fitted by one of these models:
+
+    - ``plane``: a tilted plane, for slides and flat sample holders
+    - ``spline``: a thin-plate spline, for curved or warped samples
+    - ``offsets``: a plane plus a constant offset per group, e.g. per well of
+      a well plate. In groups without measurements, the offset is the median
+      of the others, unless they are spread further than residualTolerance
+      from it, in which case focus is measured in every group.
+
+    Call nextFocus for every position in scan order. It returns the predicted
+    focus, or None if focus should be measured at that position and passed to
+    addPoint. Focus is measured every sampleInterval positions, and before
+    that wherever the model cannot predict yet. The interval is halved when a
+    measurement differs from the prediction by more than residualTolerance,
+    and doubled (up to maxSampleInterval) when it agrees.
+
+    Args:
+        model: ``plane``, ``spline`` or ``offsets``.
+        residualTolerance: Largest acceptable difference between a measured
+          and a predicted focus, in stage units.
+        sampleInterval: Initial number of positions between measurements.
+        maxSampleInterval: Largest number of positions between measurements;
+          defaults to four times sampleInterval.
+        smoothing: Smoothing of the thin-plate spline; 0 interpolates the
+          measurements exactly.
+    """
+
+    models = ('plane', 'spline', 'offsets')
+
+    def __init__(self, model='plane', residualTolerance=1.0, sampleInterval=4,
+                 maxSampleInterval=None, smoothing=0.0):
+        if model not in self.models:
+            raise ValueError(f'Unknown focus map model "{model}"')
+
+        self.__logger = initLogger(self)
+        self._model = model
+        self._residualTolerance = abs(residualTolerance)
+        self._sampleInterval = max(int(sampleInterval), 1)
+        self._maxSampleInterval = (max(int(maxSampleInterval), self._sampleInterval)
+                                   if maxSampleInterval is not None else 4 * self._sampleInterval)
+        self._smoothing = smoothing
+        self._points = []
+        self._groups = []
+        self._residuals = []
+        self._positionsSinceSample = 0
+        self._fit = None
+        self._offsetSpread = 0.0
+
+    @property
+    def model(self) -> str:
+        return self._model
+
+    @property
+    def numPoints(self) -> int:
+        """ Number of focus measurements. """
+        return len(self._points)
+
+    @property
+    def sampleInterval(self) -> int:
+        """ Current number of positions between measurements. """
+        return self._sampleInterval
+
+    @property
+    def residuals(self):
+        """ Difference between each measurement and the focus predicted at
+        its position before it was added, for the measurements where a
+        prediction was available. """
+        return list(self._residuals)
+
+    def nextFocus(self, x, y, group: Optional[Hashable] = None) -> Optional[float]:
+        """ Returns the predicted focus at the next scan position, or None
+        if focus should be measured there and passed to addPoint. """
+        prediction = self.predict(x, y, group)
+        if (prediction is None or self._positionsSinceSample + 1 >= self._sampleInterval
+                or self._isNewGroupUncertain(group)):
+            _positionsCounter.inc(kind='measured', model=self._model)
+            return None
+
+        self._positionsSinceSample += 1
+        _positionsCounter.inc(kind='predicted', model=self._model)
+        return prediction
+
+    def addPoint(self, x, y, z, group: Optional[Hashable] = None) -> None:
+        """ Adds a focus measurement and adapts the sampling interval to how
+        well the map predicted it. """
+        prediction = self.predict(x, y, group)
+        if prediction is not None:
+            residual = abs(z - prediction)
+            self._residuals.append(residual)
+            _residualHistogram.observe(residual, model=self._model)
+            if residual > self._residualTolerance:
+                self._sampleInterval = max(self._sampleInterval // 2, 1)
+                self.__logger.debug(f'Focus at ({x}, {y}) is {residual:.2f} off the map, measuring'
+                                    f' every {self._sampleInterval} positions')
+            else:
+                self._sampleInterval = min(self._sampleInterval * 2, self._maxSampleInterval)
+
+        self._points.append((float(x), float(y), float(z)))
+        self._groups.append(group)
+        self._positionsSinceSample = 0
+        self._fit = None
+
+    def predict(self, x, y, group: Optional[Hashable] = None) -> Optional[float]:
+        """ Returns the focus predicted at a position, or None if the model
+        has no measurements to predict it from. """
+        if not self._points:
+            return None
+
+        if self._fit is None:
+            self._fit = self._fitModel()
+        return float(self._fit(np.array([[x, y]], dtype=float), group)[0])
+
+    def _isNewGroupUncertain(self, group):
+        return (self._model == 'offsets' and group not in self._groups
+                and self._offsetSpread > self._residualTolerance)
+
+    def _fitModel(self):
+        points = np.array(self._points)
+        xy, z = points[:, :2], points[:, 2]
+        if self._model == 'plane':
+            plane = _fitPlane(xy, z)
+            return lambda positions, group: plane(positions)
+
+        if self._model == 'spline':
+            plane = _fitPlane(xy, z)
+            if len(z) < 4:
+                return lambda positions, group: plane(positions)
+            try:
+                from scipy.interpolate import RBFInterpolator
+                spline = RBFInterpolator(xy, z, kernel='thin_plate_spline',
+                                         smoothing=self._smoothing)
+            except (ImportError, ValueError, np.linalg.LinAlgError) as e:
+                # e.g. all measurements on a line
+                self.__logger.debug(f'Falling back to a plane: {e}')
+                return lambda positions, group: plane(positions)
+            return lambda positions, group: spline(positions)
+
+        # the plane models the tilt of the plate, the offsets the wells; the
+        # tilt is fitted to the variation within the groups so that it isn't
+        # biased by the offsets, unless they don't span a plane, e.g. with one
+        # measurement per group
+        groups = np.array([str(group) for group in self._groups])
+        groupXY, groupZ = np.empty_like(xy), np.empty_like(z)
+        for group in set(groups):
+            inGroup = groups == group
+            groupXY[inGroup] = xy[inGroup].mean(axis=0)
+            groupZ[inGroup] = z[inGroup].mean()
+        if np.linalg.matrix_rank(xy - groupXY) >= 2:
+            tilt = np.linalg.lstsq(xy - groupXY, z - groupZ, rcond=None)[0]
+        else:
+            tilt = np.linalg.lstsq(xy - xy.mean(axis=0), z - z.mean(), rcond=None)[0]
+        offsets = {group: float(np.mean(groupZ[groups == group] - groupXY[groups == group] @ tilt))
+                   for group in set(groups)}
+        defaultOffset = float(np.median(list(offsets.values())))
+        self._offsetSpread = max(abs(offset - defaultOffset) for offset in offsets.values())
+        return lambda positions, group: offsets.get(str(group), defaultOffset) + positions @ tilt
+
+
+def _fitPlane(xy, z):
+    """ Least-squares fit of a plane through the points. Directions that the
+    points don't span (e.g. the y direction if all points are on one row)
+    are assumed flat. """
+    center = xy.mean(axis=0)
+    design = np.column_stack([np.ones(len(z)), xy - center])
+    coefficients = np.linalg.lstsq(design, z, rcond=None)[0]
+    return lambda positions: coefficients[0] + (positions - center) @ coefficients[1:]
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,82 @@
+import functools
+import os
+
+import numpy as np
+import scipy.fft
+
+
+def reconstructHologram(image, pixelsize, wavelength, dz, n=1.518, roiSize=1024, workers=None):
+    """ Returns the amplitude of an in-line hologram refocused by dz with the
+    angular spectrum method, in the center roiSize² region of the image
+    (zero-padded if the image is smaller). pixelsize, wavelength and dz are
+    in the same unit, and n is the refractive index of the medium. The
+    result is rotated like that of NanoImagingPack-based reconstructions
+    (two forward Fourier transforms). """
+    return refocusHologram(image, pixelsize, wavelength, [dz], n, roiSize, workers)[0]
+
+
+def refocusHologram(image, pixelsize, wavelength, dzs, n=1.518, roiSize=1024, workers=None):
+    """ Refocuses a hologram to several planes at once, see
+    reconstructHologram. Returns an array of amplitudes (planes, rows,
+    cols). """
+    field = _extractCenter(np.sqrt(np.asarray(image, dtype=np.float32)), (roiSize, roiSize))
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+
+    # The field is real, so its spectrum is Hermitian and only half of it is computed. The
+    # propagator depends only on the spatial frequency radius, so its real and imaginary parts
+    # are even, and each part times the half-spectrum is transformed back to a real field
+    spectrum = scipy.fft.rfft2(np.fft.ifftshift(field), workers=workers)
+    kernels = np.stack([propagationKernel(field.shape, pixelsize, wavelength, dz, n)
+                        for dz in np.atleast_1d(dzs)])
+    parts = scipy.fft.irfft2(kernels * spectrum, s=field.shape, workers=workers)
+    amplitude = np.hypot(parts[:, 0], parts[:, 1])
+
+    # Mirror the field through the center, as two forward transforms do, and flip it horizontally
+    amplitude = np.roll(amplitude[:, ::-1, ::-1], 1, axis=(1, 2))
+    return np.fft.fftshift(amplitude, axes=(1, 2))[:, :, ::-1]
+
+
+@functools.lru_cache(maxsize=32)
+def propagationKernel(shape, pixelsize, wavelength, dz, n=1.518):
+    """ Returns the real and imaginary parts (2, rows, cols // 2 + 1) of the
+    angular spectrum propagator of a (rows, cols) field by dz, on the
+    half-spectrum of a real-input FFT with the zero frequency first. The
+    kernels of the last parameters used are cached. """
+    fy = np.fft.fftfreq(shape[0], pixelsize)[:, np.newaxis]
+    fx = np.fft.rfftfreq(shape[1], pixelsize)[np.newaxis, :]
+
+    sinAlpha = np.minimum(np.hypot(fy, fx) * wavelength / n, 1 - 1e-9)
+    phase = 2 * np.pi * n / wavelength * np.sqrt(1 - sinAlpha ** 2) * dz
+    kernel = np.stack([np.cos(phase), np.sin(phase)]).astype(np.float32)
+    kernel.flags.writeable = False  # shared by all callers
+    return kernel
+
+
+def _extractCenter(image, shape):
+    """ Returns the shape region of image around its center, zero-padded
+    where it is outside the image, like NanoImagingPack's extract. """
+    result = np.zeros(shape, dtype=image.dtype)
+    source, target = [], []
+    for size, roiSize in zip(image.shape, shape):
+        start = size // 2 - roiSize // 2
+        source.append(slice(max(start, 0), min(start + roiSize, size)))
+        target.append(slice(max(-start, 0), max(-start, 0) + source[-1].stop - source[-1].start))
+    result[tuple(target)] = image[tuple(source)]
+    return result
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
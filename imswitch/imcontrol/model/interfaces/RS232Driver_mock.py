@@ -14,6 +14,9 @@ class MockRS232Driver:
         self.__logger.debug(f"Sending the following to {self._settings['port']}: {arg}")
         pass
 
+    def write(self, arg):
+        self.__logger.debug(f"Writing the following to {self._settings['port']}: {arg}")
+
     def initialize(self):
         pass
 
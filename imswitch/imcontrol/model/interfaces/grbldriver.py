@@ -4,6 +4,48 @@ import re
 import numpy as np
 import sys
 import glob
+import threading
+from collections import deque
+
+
+# size of GRBL's serial receive buffer, in characters
+GRBL_RX_BUFFER_SIZE = 128
+
+# commands that GRBL executes immediately, without buffering or acknowledging them
+GRBL_REALTIME_COMMANDS = ('?', '!', '~', '\x18')
+
+
+class GrblCommand:
+    """A line sent to GRBL. GRBL acknowledges each line with "ok" or
+    "error:..." once it has processed it; for motion commands, that is as soon
+    as the move has been added to the planner buffer."""
+
+    def __init__(self, line, callback=None):
+        self.line = line
+        self.response = []
+        self.error = None
+        self._callback = callback
+        self._acknowledged = threading.Event()
+
+    @property
+    def done(self):
+        return self._acknowledged.is_set()
+
+    def wait(self, timeout=120):
+        """Wait for the acknowledgement and return the lines GRBL sent in
+        response to the command"""
+        if not self._acknowledged.wait(timeout):
+            raise TimeoutError('No acknowledgement from GRBL for "{}" within {} s'.format(
+                self.line, timeout))
+        if self.error is not None:
+            raise RuntimeError('GRBL rejected command "{}": {}'.format(self.line, self.error))
+        return self.response
+
+    def _acknowledge(self, error=None):
+        self.error = error
+        self._acknowledged.set()
+        if error is None and self._callback is not None:
+            self._callback()
 
 
 class GrblDriver:
@@ -72,10 +114,30 @@ class GrblDriver:
         self.positions = (0,0,0)
         self.stepdivider = 1000
 
+        # character-counting state: commands sent but not acknowledged yet
+        self._write_lock = threading.Lock()
+        self._buffer_condition = threading.Condition()
+        self._inflight = deque()
+        self._inflight_chars = 0
+
+        # latest status report, filled in by the reader thread
+        self._status_condition = threading.Condition()
+        self._status = ('', {})
+        self._status_count = 0
+        self._reset_event = threading.Event()
+        self._messages = deque(maxlen=100)
+        self._alarms = deque()
+        self._reader_stop = threading.Event()
+        self._reader_thread = None
+
         #initialize and wait for grbl to wake up
-        self._write('\r\n\r\n')
-        time.sleep(2)
-        if self.is_connected: self.ser.reset_input_buffer()
+        if self.is_connected:
+            self._write_raw('\r\n\r\n')
+            time.sleep(2)
+            self.ser.reset_input_buffer()
+            self._reader_thread = threading.Thread(target=self._read_loop, name='GrblReader',
+                                                   daemon=True)
+            self._reader_thread.start()
 
         
         self.limit_x_max = 1000
@@ -161,130 +223,262 @@ class GrblDriver:
             'mm/sec2':self.zconfig['mm/sec2']
         }
 
-    def write_global_config(self, wait=0.02):
+    def write_global_config(self, timeout=5):
         """Should only need to be run at initial setup.  Configures
-        global options like homing speed, limit switch behavior."""
+        global options like homing speed, limit switch behavior. Only
+        settings that differ from the ones stored in GRBL are written."""
         if self.is_connected:
-            self.ser.reset_input_buffer()
+            current = self.read_settings()
             for k,v in self.globalconfig.items():
-                self._write('${}={}'.format(k,v))
-                time.sleep(wait) #longer wait time to write to EEPROM
-            resp = self._read_buffer()
-            for r in resp:
-                if(r != 'ok'):
-                    if self.is_debug:  print('Ok not received after attempted write.')
+                if current.get('${}'.format(k)) == v:
+                    continue
+                self._write_setting('${}={}'.format(k,v), timeout) #waits for the EEPROM write
         
-    def _write_settings(self, settings, settingsmap, wait=0.5):
-        """Utility function to write motor config settings to GRBL"""
-        #TODO: make this only write commands that have changed,
-        #to save on the number of writes to EEPROM
+    def _write_settings(self, settings, settingsmap, timeout=5, current=None):
+        """Utility function to write motor config settings to GRBL. Settings
+        whose value in current already matches are skipped, to save on the
+        number of writes to EEPROM."""
         if self.is_connected:
-            self.ser.reset_input_buffer()
+            current = current if current is not None else self.read_settings()
             for s, v in settings.items():
-                self._write(settingsmap[s]+'={:.3f}'.format(v))
-                time.sleep(wait) #longer wait time to write to EEPROM
-            resp = self._read_buffer()
-            for r in resp:
-                if(r != 'ok'):
-                    if self.is_debug: print('Ok not received after attempted write.')
+                if current.get(settingsmap[s]) == round(v, 3):
+                    continue
+                #waits for the EEPROM write
+                self._write_setting(settingsmap[s]+'={:.3f}'.format(v), timeout)
+
+    def _write_setting(self, command, timeout):
+        # GRBL must not receive further commands while it writes to EEPROM,
+        # so settings are sent one at a time instead of being streamed
+        try:
+            self.send(command, timeout).wait(timeout)
+        except (RuntimeError, TimeoutError) as e:
+            if self.is_debug: print('Ok not received after attempted write: '+str(e))
             
     def write_all_settings(self):
         """Write settings for all of the motors to GRBL"""
         if self.is_connected:
             self._update_writesettings()
+            current = self.read_settings()
             maps = (self.xsettingsmap, self.ysettingsmap, self.zsettingsmap)
             writemaps = (self.xwritesettings, self.ywritesettings, self.zwritesettings)
             for settingsmap, setting in zip(maps, writemaps):
-                self._write_settings(setting, settingsmap)
+                self._write_settings(setting, settingsmap, current=current)
+
+    def read_settings(self, timeout=5):
+        """Read the settings stored in GRBL, as a dict like {'$100': 780.0}"""
+        settings = {}
+        if not self.is_connected:
+            return settings
+        try:
+            resp = self.send('$$', timeout).wait(timeout)
+        except (RuntimeError, TimeoutError) as e:
+            if self.is_debug: print('Could not read settings: '+str(e))
+            return settings
+        for s in resp:
+            m = re.match(r'(\$\d{1,3})=(-?\d*\.?\d*)', s)
+            if m is not None:
+                settings[m.group(1)] = float(m.group(2))
+        return settings
 
     def verify_settings(self):
         """Verify that current GRBL settings match the desired config of this class"""
         if self.is_connected:
-            settingsre = re.compile(r'(\$\d{1,3})=(\d{1,5}\.?\d{0,3})')
-            
-            self.ser.reset_input_buffer()
-            
-            self._write('$$')
-            time.sleep(self.waittimeout)
-            resp = self._read_buffer()
-            maps = (self.xsettingsmap, self.ysettingsmap, self.zsettingsmap)
+            current = self.read_settings()
             writemaps = (self.xwritesettings, self.ywritesettings, self.zwritesettings)
+            maps = (self.xsettingsmap, self.ysettingsmap, self.zsettingsmap)
             for settingsmap, checksettings in zip(maps, writemaps):
-                # read settings specified in settingsmap
-                settings = {}
-                for s in resp:
-                    m = settingsre.match(s)
-                    if m is not None:
-                        cmd, reading = m.groups()
-                        for k, v in settingsmap.items():
-                            if cmd == v:
-                                settings[k] = float(reading)
-                                
                 # compare to checksettings to verify:
                 for s, v in checksettings.items():
-                    if settings[s] != checksettings[s]:
+                    if current.get(settingsmap[s]) != round(v, 3):
                         raise Exception(
                             ('Current setting for {} is {}, but {} is expected.'
                             ' Consider writing the settings again.'
-                            ).format(s,v,settings[s]))
+                            ).format(s,current.get(settingsmap[s]),v))
 
             #verify global config
-            for s in resp:
-                m = re.match(r'\$(\d*)=(\d*\.?\d*)',s)
-                if m is not None:
-                    cmd, reading = m.groups()
-                    cmd = int(cmd)
-                    reading = float(reading)
-                    if cmd in self.globalconfig.keys():
-                        if reading != self.globalconfig[cmd]:
-                            raise Exception(('Current setting for global config ${} is {},'
-                                'but {} is expected.').format(cmd,self.globalconfig[cmd],reading))
+            for k, v in self.globalconfig.items():
+                reading = current.get('${}'.format(k))
+                if reading != v:
+                    raise Exception(('Current setting for global config ${} is {},'
+                        'but {} is expected.').format(k,reading,v))
 
-            
         return True
         
     def _write(self, command, flush=False):
-        """Utility function, write string to GRBL"""
+        """Utility function, write string to GRBL. Realtime commands are
+        written immediately, other lines are queued using send."""
         if self.is_debug: print(command)
+        if command in GRBL_REALTIME_COMMANDS:
+            self._write_raw(command)
+            return None
+        return self.send(command)
+
+    def _write_raw(self, data):
         if self.is_connected:
-            self.ser.write(command.encode('ascii')+b'\r')
-            if flush:
-                self.ser.flushInput()
-                self.ser.flushOutput()
-        
+            with self._write_lock:
+                self.ser.write(data.encode('ascii'))
+
+    def send(self, line, timeout=120, callback=None):
+        """Send a line to GRBL using the character-counting protocol: the line
+        is written as soon as it fits into GRBL's receive buffer, counting the
+        characters of all lines that were not acknowledged yet. Returns a
+        GrblCommand that can be used to wait for the acknowledgement;
+        callback is called from the reader thread once it arrives."""
+        command = GrblCommand(line, callback)
+        if not self.is_connected:
+            command._acknowledge()
+            return command
+
+        length = len(line) + 1
+        if length > GRBL_RX_BUFFER_SIZE:
+            raise ValueError('Line is too long for GRBL\'s receive buffer: '+line)
+        deadline = time.monotonic() + timeout
+        with self._buffer_condition:
+            while self._inflight_chars + length > GRBL_RX_BUFFER_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError('GRBL did not accept "{}" within {} s'.format(line, timeout))
+                self._buffer_condition.wait(remaining)
+            # written while holding the lock, so that the order of the
+            # acknowledgements matches the order of the queue
+            self._inflight.append(command)
+            self._inflight_chars += length
+            self._write_raw(line + '\r')
+        return command
+
     def _read_buffer(self, maxreads = 100):
-        """Utility function, perform readlines into a list of readings
-        from GRBL.  Useful to clear the read buffer."""
+        """Utility function, return the messages received from GRBL that were
+        not the response to a command, and clear them."""
         resp = []
-        if self.is_connected:
-            i = 0
-            while i < maxreads:
+        while self._messages and len(resp) < maxreads:
+            resp.append(self._messages.popleft())
+        return resp
+
+    def _read_loop(self):
+        """Reader thread, dispatches everything GRBL sends"""
+        while not self._reader_stop.is_set():
+            try:
                 msg = self.ser.readline()
-                if msg == b'':
+            except Exception as e:
+                if self.is_debug: print("Reading from GRBL failed: "+str(e))
+                if self._reader_stop.wait(0.1):
                     break
-                try:
-                    resp.append(msg.decode().strip())
-                except:
-                    if self.is_debug: print("Something went wrong while deconding the return message from GRBL")
-                    self.ser.flush()
-                    break
-                time.sleep(self.waittimeout)
-                i+=1
-        return resp
-    
+                continue
+            if msg == b'':
+                continue
+            msg = msg.decode(errors='ignore').strip()
+            if msg:
+                self._handle_message(msg)
+        self._discard_inflight('Connection closed')
+
+    def _handle_message(self, msg):
+        if msg == 'ok' or msg.startswith('error'):
+            with self._buffer_condition:
+                command = None
+                if self._inflight:
+                    command = self._inflight.popleft()
+                    self._inflight_chars -= len(command.line) + 1
+                self._buffer_condition.notify_all()
+            if command is not None:
+                command._acknowledge(None if msg == 'ok' else msg)
+            elif self.is_debug:
+                print("Unexpected acknowledgement from GRBL: "+msg)
+        elif msg.startswith('<') and msg.endswith('>'):
+            status = self._parse_status_report(msg)
+            with self._status_condition:
+                self._status = status
+                self._status_count += 1
+                self._status_condition.notify_all()
+        elif msg.startswith('Grbl '):
+            # GRBL was reset and discarded all commands that were not acknowledged
+            self._discard_inflight('GRBL was reset')
+            self._messages.append(msg)
+            self._reset_event.set()
+        else:
+            if msg.startswith('ALARM'):
+                self._alarms.append(msg)
+            with self._buffer_condition:
+                if self._inflight:
+                    self._inflight[0].response.append(msg)
+            self._messages.append(msg)
+
+    def _discard_inflight(self, reason):
+        with self._buffer_condition:
+            commands = list(self._inflight)
+            self._inflight.clear()
+            self._inflight_chars = 0
+            self._buffer_condition.notify_all()
+        for command in commands:
+            command._acknowledge(reason)
+
+    def _wait_for_ack(self, timeout=120):
+        """Utility function, wait until GRBL acknowledged all commands"""
+        with self._buffer_condition:
+            if not self._buffer_condition.wait_for(lambda: not self._inflight, timeout):
+                raise TimeoutError('No acknowledgement from GRBL within {} s'.format(timeout))
+
+    def stream_gcode(self, lines, ack_callback=None, is_canceled=None, timeout=120):
+        """Stream G-code lines using GRBL's character-counting protocol, i.e.
+        keep GRBL's receive buffer filled instead of waiting for each line to
+        be acknowledged. ack_callback(i) is called from the reader thread once
+        line i has been acknowledged. Note that GRBL acknowledges motion
+        commands as soon as they are planned, while dwells and coolant
+        commands are only acknowledged once all preceding motion has finished.
+        Returns False if is_canceled() returned True before all lines were
+        acknowledged; raises if GRBL rejected a line."""
+        commands = []
+        for i, line in enumerate(lines):
+            if is_canceled is not None and is_canceled():
+                return False
+            callback = (lambda i=i: ack_callback(i)) if ack_callback is not None else None
+            commands.append(self.send(line, timeout, callback))
+            self._raise_for_errors(commands)
+
+        for command in commands:
+            deadline = time.monotonic() + timeout
+            while not command._acknowledged.wait(0.05):
+                if is_canceled is not None and is_canceled():
+                    return False
+                if time.monotonic() > deadline:
+                    raise TimeoutError('No acknowledgement from GRBL within {} s'.format(timeout))
+            self._raise_for_errors(commands)
+        return True
+
+    @staticmethod
+    def _raise_for_errors(commands):
+        for command in commands:
+            if command.error is not None:
+                command.wait(0)
+
+    def wait_for_idle(self, timeout=None, pingwait=0.05):
+        """Wait until GRBL acknowledged all commands and reports that it is
+        idle, i.e. all planned moves have finished. Returns False if that
+        didn't happen within the timeout (in seconds, None waits forever)."""
+        if not self.is_connected:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._buffer_condition:
+            if not self._buffer_condition.wait_for(
+                    lambda: not self._inflight,
+                    None if deadline is None else max(deadline - time.monotonic(), 0)):
+                return False
+        while True:
+            # status requested after the last acknowledgement, so that it
+            # includes all moves that were sent
+            state, _ = self.get_status_report()
+            if state == 'Idle':
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(pingwait)
 
     def _move(self, axis, steps, config, blocking = True, pingwait = 0.25):
-        """Move axis with optional blocking"""
+        """Move axis to an absolute position. Returns once GRBL has planned the
+        move, or has finished it if blocking"""
         pos = steps/self.stepdivider
-        self._write('G90')
-        self._write('G0 '+axis+str(pos))
+        self.send('G90 G0 {}{:.4f}'.format(axis, pos)).wait()
         if blocking:
-            time.sleep(self.waittimeout)
-            while True:
-                _status_report = self.get_status_report()
-                if _status_report[0] == 'Idle': # break once done?
-                    break
-                time.sleep(pingwait)
+            self.wait_for_idle(pingwait=pingwait)
             # currentsteps = self.get_positions()[axis]
 
     def shake_plate(self, d_shift=100, time_shake = 30):
@@ -309,33 +503,27 @@ class GrblDriver:
         
         
     def move_xyz(self, position=(0,0,0), blocking = True, pingwait = 0.25, config="abs"):
-        """Move axis with optional blocking"""
-        self.get_positions()
+        """Move all axes, absolute or relative to the last commanded position.
+        Returns once GRBL has added the move to its planner buffer, so that
+        consecutive non-blocking moves run at the planner's full rate; if
+        blocking, returns once the move has finished."""
         if config == "abs":
             to_go = np.array(position)
+            command = 'G90 G0 '
         elif config == "rel":
             to_go = np.array((position[0]+self.positions[0],
                      position[1]+self.positions[1],
                      position[2]+self.positions[2]))
-        
+            command = 'G91 G0 '
         
         self.positions = to_go 
         
-        #self.positions = to_go
         if self.is_debug: print("Current position: "+str(self.positions))
-        self._write('G90')
-        self._write('G0 '+ 'X'+str(to_go[0]/self.stepdivider) +
-                    'Y'+str(to_go[1]/self.stepdivider) +
-                    'Z'+str(to_go[2]/self.stepdivider))
+        command += ''.join('{}{:.4f}'.format(axis, value/self.stepdivider)
+                           for axis, value in zip('XYZ', position))
+        self.send(command).wait()
         if blocking:
-            time.sleep(self.waittimeout)
-            while True:
-                _status_report = self.get_status_report()
-                if self.is_debug: print("Status report: "+str(_status_report))
-                if _status_report[0] == 'Idle': # break once done?
-                    break
-                time.sleep(pingwait)
-        #self.get_positions()
+            self.wait_for_idle(pingwait=pingwait)
 
                 
     def xmove(self, steps, blocking = True):
@@ -350,21 +538,18 @@ class GrblDriver:
         """Move z-axis motor by requested number of steps"""
         self._move('Z', steps, self.zconfig, blocking=blocking)
 
-    def home(self, offset=(0,0,0), blocking=True, pingwait=0.01, zhome=False):
+    def home(self, offset=(0,0,0), blocking=True, pingwait=0.01, zhome=False, timeout=20):
         """Run the homing cycle for all axis"""
         self.reset_stage()
-        self._write('$21=1')
-        self._write('$H')
-        time.sleep(pingwait)
-        self._write("?")
-        timestart = time.time()
-        while(blocking):
-            # wait until we reach the homing position
-            _buf = self._read_buffer()
-            if(time.time()-timestart)>20 or any("Home" in h for h in _buf):
-                if self.is_debug: print(_buf)
-                break
-        self._write('$21=0')
+        self.send('$21=1')
+        homing = self.send('$H')
+        if blocking:
+            # GRBL acknowledges the homing command once the cycle has finished
+            try:
+                homing.wait(timeout)
+            except (RuntimeError, TimeoutError) as e:
+                if self.is_debug: print(str(e))
+        self.send('$21=0')
         self.reset_stage()
         if zhome:
             self.zhome()
@@ -377,40 +562,48 @@ class GrblDriver:
         self.move_rel((0,0,-np.sign(steps)*100), blocking = True)        
         self.positions=(self.positions[0],self.positions[1],0)
 
-    def get_status_report(self):
-        """Retrieve and parse GRBL status report"""
-        self.check_alarm(self._read_buffer())
-        self._write('?')
-        time.sleep(self.waittimeout)
-        resp = self._read_buffer()
-        self.check_alarm(resp)
-        resp=''.join(resp)
-        
-        if len(resp)==0 or re.match(r'\<.*\>',resp) is None: 
-            if self.is_debug: print('Error reading status report')
-            state = ''
-            status = {}
-        else:
-            resp = resp.strip('<>').split('|')
-            state = resp.pop(0)
-            status = {}
-            for r in resp:
-                s, v = re.match(r'(.*):(.*)',r).groups()
+    def get_status_report(self, timeout=1):
+        """Request a status report and return its state and fields"""
+        self.check_alarm()
+        if not self.is_connected:
+            return '', {}
+        with self._status_condition:
+            count = self._status_count
+            self._write_raw('?')
+            if not self._status_condition.wait_for(lambda: self._status_count > count, timeout):
+                if self.is_debug: print('Error reading status report')
+                return '', {}
+            return self._status
+
+    def _parse_status_report(self, resp):
+        resp = resp.strip('<>').split('|')
+        state = resp.pop(0)
+        status = {}
+        for r in resp:
+            m = re.match(r'(.*?):(.*)',r)
+            if m is not None:
+                s, v = m.groups()
                 status[s] = v
         return state, status
     
-    def check_alarm(self, bufferoutput):
-        for m in bufferoutput:
+    def check_alarm(self, bufferoutput=()):
+        alarms = list(bufferoutput)
+        while self._alarms:
+            alarms.append(self._alarms.popleft())
+        for m in alarms:
             if m.split(':')[0] == 'ALARM' or m.find("Alarm")>0:
                 if self.is_debug: print('Alarm status! Probably hit a hard limit!'
                                 'Perform soft_reset and alarm_reset to reset operation.')
                 self.reset_stage()
-                time.sleep(self.waittimeout)
+                break
                 
     def reset_stage(self):
-        self._write('$G')
-        self._write('$X')
-        self._write('?')
+        self.send('$G')
+        self.send('$X')
+        try:
+            self._wait_for_ack(timeout=5)
+        except TimeoutError as e:
+            if self.is_debug: print(str(e))
         msg=self._read_buffer()
         if self.is_debug: print(msg)
    
@@ -442,8 +635,8 @@ class GrblDriver:
     
     def zero_position(self):
         """assign new zero position to current position"""
-        self._write("G10 L20 P1 X0 Y0 Z0")
-        self._write("G10 P0 L20 X0 Y0 Z0")
+        self.send("G10 L20 P1 X0 Y0 Z0")
+        self.send("G10 P0 L20 X0 Y0 Z0")
 
 
     
@@ -469,10 +662,14 @@ class GrblDriver:
         cmd =  "G21 G90 " + prefix + " S"+str(self.laser_intensity)
         return self._write(cmd)
 
-    def soft_reset(self):
+    def soft_reset(self, timeout=2):
         """Perform soft-reset of GRBL.  Doesn't lose motor positions"""
+        self._reset_event.clear()
         self._write('\x18')
-        time.sleep(self.waittimeout)
+        # GRBL discards everything it has buffered and greets once it is back
+        if self.is_connected and not self._reset_event.wait(timeout):
+            if self.is_debug: print('No response from GRBL after reset')
+        self._discard_inflight('GRBL was reset')
         self._read_buffer()
         
     def controlled_stop(self, pingwait=0.25):
@@ -493,11 +690,15 @@ class GrblDriver:
 
     def alarm_reset(self):
         """Reset 'alarm' status, usually after emergency stop or hard limit."""
-        self._write('$X')
+        self.send('$X')
 
     def close(self):
         """Close GRBL serial connection"""
-        self.ser.close()
+        self._reader_stop.set()
+        if self._reader_thread is not None:
+            self._reader_thread.join()
+        if self.is_connected:
+            self.ser.close()
 
 
     def serial_ports(self):
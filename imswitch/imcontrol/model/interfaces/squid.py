@@ -5,6 +5,9 @@ import serial.tools.list_ports
 import time
 import numpy as np
 import threading
+import queue
+from collections import deque
+from dataclasses import dataclass
 
 
 from qtpy.QtCore import *
@@ -22,7 +25,66 @@ from imswitch.imcontrol.model.interfaces.squid_def import *
 
 # to do (7/28/2021) - add functions for configuring the stepper motors
 
+@dataclass(frozen=True)
+class SquidState:
+    """Snapshot of the last packet received from the microcontroller"""
+    x_pos: int = 0 # unit: microstep or encoder resolution
+    y_pos: int = 0
+    z_pos: int = 0
+    theta_pos: int = 0
+    button_and_switch_state: int = 0
+    joystick_button_pressed: bool = False
+    switch_state: bool = False
+    cmd_id_mcu: int = None # command id of mcu's last received command
+    cmd_execution_status: int = None
+    timestamp: float = 0.0
+
+
+class SquidCommand:
+    """A command queued for the microcontroller. The microcontroller reports
+    the id of the last command it received together with its execution
+    status; a command is completed once the microcontroller reports it (or a
+    later command) as executed."""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.cmd_id = None
+        self.status = None
+        self._received = threading.Event()
+        self._completed = threading.Event()
+
+    @property
+    def received(self):
+        return self._received.is_set()
+
+    @property
+    def completed(self):
+        return self._completed.is_set()
+
+    def wait(self, timeout=None):
+        """Wait until the command has been executed. Returns False on
+        timeout and raises if the microcontroller reported an error."""
+        if not self._completed.wait(timeout):
+            return False
+        if self.status not in (None, CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS):
+            raise RuntimeError('mcu command {} failed with status {}'.format(self.cmd_id,
+                                                                             self.status))
+        return True
+
+    def _complete(self, status):
+        self.status = status
+        self._received.set()
+        self._completed.set()
+
+
 class SQUID():
+    # number of commands that may be sent before the microcontroller reported
+    # receiving them
+    max_commands_in_flight = 8
+
+    # number of packets after which commands that were not received are resent
+    resend_after_packets = 10
+
     def __init__(self,parent=None,port=None):
         
         self.__logger = initLogger(self)
@@ -48,21 +110,33 @@ class SQUID():
         self.last_command = None
         self.timeout_counter = 0
 
+        # commands are written by a separate thread, so that callers never
+        # block on the serial port; sent commands stay pending until the
+        # microcontroller reports them as executed
+        self.state = SquidState()
+        self._command_queue = queue.Queue()
+        self._pending = deque()
+        self._pending_condition = threading.Condition()
+        self._n_unfinished = 0 # queued or pending commands
+        self._write_lock = threading.Lock()
+
         # establish serial communication
         if port is None:
             port = self.autodetectSerial()
         
         try:
-            self.serial = serial.Serial(port,2000000)            
+            self.serial = serial.Serial(port,2000000,timeout=0.1)            
         except:
             # one more attempt to find the serial:
             port = self.autodetectSerial()
-            self.serial = serial.Serial(port,2000000)  
+            self.serial = serial.Serial(port,2000000,timeout=0.1)  
         
         self.new_packet_callback_external = None
         self.terminate_reading_received_packet_thread = False
         self.thread_read_received_packet = threading.Thread(target=self.read_received_packet, daemon=True)
         self.thread_read_received_packet.start()
+        self.thread_send_command = threading.Thread(target=self._send_commands, daemon=True)
+        self.thread_send_command.start()
         
     def autodetectSerial(self):
         # AUTO-DETECT the Arduino! By Deepak
@@ -81,6 +155,8 @@ class SQUID():
 
     def close(self):
         self.terminate_reading_received_packet_thread = True
+        self._command_queue.put(None)
+        self.thread_send_command.join()
         self.thread_read_received_packet.join()
         self.serial.close()
 
@@ -518,83 +594,158 @@ class SQUID():
         self.send_command(cmd)
 
     def send_command(self,command):
-        self._cmd_id = (self._cmd_id + 1)%256
-        command[0] = self._cmd_id
-        # command[self.tx_buffer_length-1] = self._calculate_CRC(command)
-        self.serial.write(command)
-        self.mcu_cmd_execution_in_progress = True
-        self.last_command = command
-        self.timeout_counter = 0
+        """Queue a command for the microcontroller and return a SquidCommand
+        that tracks its acknowledgement. Does not block, so that several
+        commands (e.g. moves of different axes and illumination changes) can
+        be pipelined."""
+        squid_command = SquidCommand(command)
+        with self._pending_condition:
+            self._n_unfinished += 1
+            self.mcu_cmd_execution_in_progress = True
+        self._command_queue.put(squid_command)
+        return squid_command
+
+    def _send_commands(self):
+        while True:
+            squid_command = self._command_queue.get()
+            if squid_command is None:
+                break
+            with self._pending_condition:
+                # don't run too far ahead of the microcontroller
+                while (sum(not c.received for c in self._pending) >= self.max_commands_in_flight
+                       and not self.terminate_reading_received_packet_thread):
+                    self._pending_condition.wait(0.1)
+                self._cmd_id = (self._cmd_id + 1)%256
+                squid_command.cmd_id = self._cmd_id
+                squid_command.payload[0] = self._cmd_id
+                # command[self.tx_buffer_length-1] = self._calculate_CRC(command)
+                self._pending.append(squid_command)
+                self.last_command = squid_command.payload
+                self.timeout_counter = 0
+            with self._write_lock:
+                self.serial.write(squid_command.payload)
 
     def resend_last_command(self):
-        self.serial.write(self.last_command)
-        self.mcu_cmd_execution_in_progress = True
-        self.timeout_counter = 0
+        """Resend all commands that the microcontroller did not report as
+        received"""
+        with self._pending_condition:
+            unreceived = [c.payload for c in self._pending if not c.received]
+            self.timeout_counter = 0
+        with self._write_lock:
+            for payload in unreceived:
+                self.serial.write(payload)
+
+    def wait_until_idle(self, timeout=None):
+        """Wait until the microcontroller executed all queued commands.
+        Returns False on timeout."""
+        with self._pending_condition:
+            return self._pending_condition.wait_for(lambda: self._n_unfinished == 0, timeout)
+
+    def get_state(self):
+        return self.state
 
     def read_received_packet(self):
+        buffer = bytearray()
         while self.terminate_reading_received_packet_thread == False:
-            # wait to receive data
-            if self.serial.in_waiting==0:
+            # wait to receive data, the serial timeout keeps this from spinning
+            data = self.serial.read(max(self.serial.in_waiting, 1))
+            if not data:
                 continue
-            if self.serial.in_waiting % self.rx_buffer_length != 0:
+            buffer += data
+            n_packets = len(buffer)//self.rx_buffer_length
+            if n_packets == 0:
                 continue
-            
-            # get rid of old data
-            num_bytes_in_rx_buffer = self.serial.in_waiting
-            if num_bytes_in_rx_buffer > self.rx_buffer_length:
-                # print('getting rid of old data')
-                for i in range(num_bytes_in_rx_buffer-self.rx_buffer_length):
-                    self.serial.read()
-            
-            # read the buffer
-            msg=[]
-            for i in range(self.rx_buffer_length):
-                msg.append(ord(self.serial.read()))
-
-            # parse the message
-            '''
-            - command ID (1 byte)
-            - execution status (1 byte)
-            - X pos (4 bytes)
-            - Y pos (4 bytes)
-            - Z pos (4 bytes)
-            - Theta (4 bytes)
-            - buttons and switches (1 byte)
-            - reserved (4 bytes)
-            - CRC (1 byte)
-            '''
-            self._cmd_id_mcu = msg[0]
-            self._cmd_execution_status = msg[1]
-            if (self._cmd_id_mcu == self._cmd_id) and (self._cmd_execution_status == CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS):
-                if self.mcu_cmd_execution_in_progress == True:
-                    self.mcu_cmd_execution_in_progress = False
-                    print('   mcu command ' + str(self._cmd_id) + ' complete')
-                elif self._cmd_id_mcu != self._cmd_id and self.last_command != None:
-                    self.timeout_counter = self.timeout_counter + 1
-                    if self.timeout_counter > 10:
-                        self.resend_last_command()
-                        print('      *** resend the last command')
-            # print('command id ' + str(self._cmd_id) + '; mcu command ' + str(self._cmd_id_mcu) + ' status: ' + str(msg[1]) )
-
-            self.x_pos = self._payload_to_int(msg[2:6],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            self.y_pos = self._payload_to_int(msg[6:10],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            self.z_pos = self._payload_to_int(msg[10:14],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            self.theta_pos = self._payload_to_int(msg[14:18],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            
-            self.button_and_switch_state = msg[18]
-            # joystick button
-            tmp = self.button_and_switch_state & (1 << BIT_POS_JOYSTICK_BUTTON)
-            joystick_button_pressed = tmp > 0
-            if self.joystick_button_pressed == False and joystick_button_pressed == True:
-                self.signal_joystick_button_pressed_event = True
-                self.ack_joystick_button_pressed()
-            self.joystick_button_pressed = joystick_button_pressed
-            # switch
-            tmp = self.button_and_switch_state & (1 << BIT_POS_SWITCH)
-            self.switch_state = tmp > 0
 
-            if self.new_packet_callback_external is not None:
-                self.new_packet_callback_external(self)
+            # only the most recent packet matters, the microcontroller reports
+            # its full state in each of them
+            end = n_packets*self.rx_buffer_length
+            msg = bytes(buffer[end-self.rx_buffer_length:end])
+            del buffer[:end]
+            self._handle_packet(msg)
+
+    def _handle_packet(self, msg):
+        # parse the message
+        '''
+        - command ID (1 byte)
+        - execution status (1 byte)
+        - X pos (4 bytes)
+        - Y pos (4 bytes)
+        - Z pos (4 bytes)
+        - Theta (4 bytes)
+        - buttons and switches (1 byte)
+        - reserved (4 bytes)
+        - CRC (1 byte)
+        '''
+        self._cmd_id_mcu = msg[0]
+        self._cmd_execution_status = msg[1]
+        self._update_pending(self._cmd_id_mcu, self._cmd_execution_status)
+
+        # unit: microstep or encoder resolution
+        self.x_pos = self._payload_to_int(msg[2:6],MicrocontrollerDef.N_BYTES_POS)
+        self.y_pos = self._payload_to_int(msg[6:10],MicrocontrollerDef.N_BYTES_POS)
+        self.z_pos = self._payload_to_int(msg[10:14],MicrocontrollerDef.N_BYTES_POS)
+        self.theta_pos = self._payload_to_int(msg[14:18],MicrocontrollerDef.N_BYTES_POS)
+        
+        self.button_and_switch_state = msg[18]
+        # joystick button
+        tmp = self.button_and_switch_state & (1 << BIT_POS_JOYSTICK_BUTTON)
+        joystick_button_pressed = tmp > 0
+        if self.joystick_button_pressed == False and joystick_button_pressed == True:
+            self.signal_joystick_button_pressed_event = True
+            self.ack_joystick_button_pressed()
+        self.joystick_button_pressed = joystick_button_pressed
+        # switch
+        tmp = self.button_and_switch_state & (1 << BIT_POS_SWITCH)
+        self.switch_state = tmp > 0
+
+        self.state = SquidState(x_pos=self.x_pos, y_pos=self.y_pos, z_pos=self.z_pos,
+                                theta_pos=self.theta_pos,
+                                button_and_switch_state=self.button_and_switch_state,
+                                joystick_button_pressed=self.joystick_button_pressed,
+                                switch_state=self.switch_state,
+                                cmd_id_mcu=self._cmd_id_mcu,
+                                cmd_execution_status=self._cmd_execution_status,
+                                timestamp=time.time())
+
+        if self.new_packet_callback_external is not None:
+            self.new_packet_callback_external(self)
+
+    def _update_pending(self, cmd_id_mcu, status):
+        resend = False
+        with self._pending_condition:
+            # the microcontroller executes commands in order, so reporting a
+            # command implies that all earlier ones were received; the newest
+            # match is used since ids wrap around
+            index = None
+            for i in range(len(self._pending)-1, -1, -1):
+                if self._pending[i].cmd_id == cmd_id_mcu:
+                    index = i
+                    break
+
+            if index is None:
+                if any(not c.received for c in self._pending):
+                    self.timeout_counter = self.timeout_counter + 1
+                    resend = self.timeout_counter > self.resend_after_packets
+            else:
+                self.timeout_counter = 0
+                for i in range(index+1):
+                    self._pending[i]._received.set()
+                if status != CMD_EXECUTION_STATUS.IN_PROGRESS:
+                    for i in range(index+1):
+                        command = self._pending.popleft()
+                        self._n_unfinished -= 1
+                        command._complete(status if command.cmd_id == cmd_id_mcu
+                                          else CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS)
+                        if command.status != CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS:
+                            self.__logger.warning('mcu command {} failed with status {}'.format(
+                                command.cmd_id, command.status))
+
+            self.mcu_cmd_execution_in_progress = self._n_unfinished > 0
+            self._pending_condition.notify_all()
+
+        if resend:
+            self.__logger.debug('Resending commands that were not received')
+            self.resend_last_command()
 
     def get_pos(self):
         return self.x_pos, self.y_pos, self.z_pos, self.theta_pos
@@ -914,6 +1065,14 @@ class Microcontroller_Simulation():
     def is_busy(self):
         return self.mcu_cmd_execution_in_progress
 
+    def wait_until_idle(self, timeout=None):
+        start = time.time()
+        while self.mcu_cmd_execution_in_progress:
+            if timeout is not None and time.time() - start > timeout:
+                return False
+            time.sleep(0.005)
+        return True
+
     def send_command(self,command):
         self._cmd_id = (self._cmd_id + 1)%256
         command[0] = self._cmd_id
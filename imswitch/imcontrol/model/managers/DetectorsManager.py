@@ -1,10 +1,27 @@
+import time
 from time import sleep
 
 import numpy as np
 
 from imswitch.imcommon.framework import Mutex, Signal, SignalInterface, Thread, Timer, Worker
+from imswitch.imcommon.model import getMetricsRegistry
 from .MultiManager import MultiManager
 
+_metrics = getMetricsRegistry()
+_framesCounter = _metrics.counter(
+    'imswitch_detector_frames_total', 'Number of live view frames published per detector'
+)
+_activeAcquisitionsGauge = _metrics.gauge(
+    'imswitch_detector_active_acquisitions', 'Number of active acquisition handles'
+)
+_lvUpdateHistogram = _metrics.histogram(
+    'imswitch_liveview_update_seconds', 'Time spent fetching the latest frames for live view'
+)
+_lvOverrunsCounter = _metrics.counter(
+    'imswitch_liveview_overruns_total',
+    'Number of live view updates that took longer than the update period, i.e. dropped frames'
+)
+
 
 class DetectorsManager(MultiManager, SignalInterface):
     """ DetectorsManager is an interface for dealing with DetectorManagers. It
@@ -31,8 +48,8 @@ class DetectorsManager(MultiManager, SignalInterface):
                 continue
             # Connect signals
             self._subManagers[detectorName].sigImageUpdated.connect(
-                lambda image, init, detectorName=detectorName: self.sigImageUpdated.emit(
-                    detectorName, image, init, detectorName == self._currentDetectorName
+                lambda image, init, detectorName=detectorName: self._imageUpdated(
+                    detectorName, image, init
                 )
             )
 
@@ -81,6 +98,11 @@ class DetectorsManager(MultiManager, SignalInterface):
         if self._thread.isRunning():
             self.execOnCurrent(lambda c: c.updateLatestFrame(True))
 
+    def _imageUpdated(self, detectorName, image, init):
+        _framesCounter.inc(detector=detectorName)
+        self.sigImageUpdated.emit(detectorName, image, init,
+                                  detectorName == self._currentDetectorName)
+
     def execOnCurrent(self, func):
         """ Executes a function on the current detector and returns the result. """
         if not self.hasDevices():
@@ -107,6 +129,8 @@ class DetectorsManager(MultiManager, SignalInterface):
                 self._activeAcqLVHandles.append(handle)
                 enableLV = len(self._activeAcqLVHandles) == 1
             enableAcq = len(self._activeAcqHandles) + len(self._activeAcqLVHandles) == 1
+            _activeAcquisitionsGauge.set(len(self._activeAcqHandles), liveView=False)
+            _activeAcquisitionsGauge.set(len(self._activeAcqLVHandles), liveView=True)
         finally:
             self._activeAcqsMutex.unlock()
 
@@ -140,6 +164,8 @@ class DetectorsManager(MultiManager, SignalInterface):
                 self._activeAcqLVHandles.remove(handle)
                 disableLV = len(self._activeAcqLVHandles) < 1
             disableAcq = len(self._activeAcqHandles) < 1 and len(self._activeAcqLVHandles) < 1
+            _activeAcquisitionsGauge.set(len(self._activeAcqHandles), liveView=False)
+            _activeAcquisitionsGauge.set(len(self._activeAcqLVHandles), liveView=True)
         finally:
             self._activeAcqsMutex.unlock()
 
@@ -169,12 +195,18 @@ class LVWorker(Worker):
         self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(False),
                                          condition=lambda c: c.forAcquisition)
         self._vtimer = Timer()
-        self._vtimer.timeout.connect(
-            lambda: self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(True),
-                                                     condition=lambda c: c.forAcquisition)
-        )
+        self._vtimer.timeout.connect(self._update)
         self._vtimer.start(self._updatePeriod)
 
+    def _update(self):
+        startTime = time.perf_counter()
+        self._detectorsManager.execOnAll(lambda c: c.updateLatestFrame(True),
+                                         condition=lambda c: c.forAcquisition)
+        elapsed = time.perf_counter() - startTime
+        _lvUpdateHistogram.observe(elapsed)
+        if elapsed * 1000 > self._updatePeriod:
+            _lvOverrunsCounter.inc(int(elapsed * 1000 // self._updatePeriod))
+
     def stop(self):
         if self._vtimer is not None:
             self._vtimer.stop()
@@ -0,0 +1,501 @@
+import dataclasses
+import inspect
+import json
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import numpy as np
+import tifffile as tif
+
+from imswitch.imcommon.framework import Signal, SignalInterface, Thread, Worker
+from imswitch.imcommon.model import initLogger, getMetricsRegistry
+from imswitch.imcontrol.model import tiledscantools
+
+_metrics = getMetricsRegistry()
+_eventHistogram = _metrics.histogram(
+    'imswitch_mda_event_seconds', 'Time spent executing a single MDA event'
+)
+_latenessGauge = _metrics.gauge(
+    'imswitch_mda_lateness_seconds', 'How late the last timed MDA event started'
+)
+_writerQueueGauge = _metrics.gauge(
+    'imswitch_mda_writer_queue_depth', 'Number of MDA frames waiting to be written'
+)
+
+
+@dataclass
+class MDAEvent:
+    """ A single acquisition in a multi-dimensional acquisition. Coordinates
+    that are None are left unchanged. """
+
+    index: Dict[str, int] = field(default_factory=dict)
+    """ Index of the event along each dimension, e.g. ``{'t': 0, 'p': 2}``.
+    """
+
+    x: Optional[float] = None
+    y: Optional[float] = None
+    z: Optional[float] = None
+
+    channel: Optional[str] = None
+    """ Channel name. If it matches a laser name, that laser is enabled and
+    all other lasers disabled for the acquisition. """
+
+    exposure: Optional[float] = None
+    """ Exposure to set on the detector before acquiring. """
+
+    minStartTime: Optional[float] = None
+    """ Earliest start of the event in seconds, relative to the start of the
+    acquisition. """
+
+    @classmethod
+    def fromAny(cls, event):
+        """ Creates an MDAEvent from an MDAEvent, a dict with the fields of
+        this class or a useq-schema MDAEvent. """
+        if isinstance(event, cls):
+            return event
+        if isinstance(event, dict):
+            return cls(**event)
+
+        channel = getattr(event, 'channel', None)
+        if channel is not None and not isinstance(channel, str):
+            channel = getattr(channel, 'config', str(channel))
+        return cls(index=dict(getattr(event, 'index', {}) or {}),
+                   x=getattr(event, 'x_pos', None),
+                   y=getattr(event, 'y_pos', None),
+                   z=getattr(event, 'z_pos', None),
+                   channel=channel,
+                   exposure=getattr(event, 'exposure', None),
+                   minStartTime=getattr(event, 'min_start_time', None))
+
+
+def buildMDAEvents(positions=None, zOffsets=None, channels=None, timePoints=1, interval=0.0,
+                   exposure=None):
+    """ Builds the events of a multi-dimensional acquisition. positions is a
+    list of ``(x, y)`` or ``(x, y, z)`` tuples, zOffsets a list of z positions
+    relative to each position (absolute if the position has no z), channels a
+    list of channel names, and interval the time in seconds between the starts
+    of consecutive time points. """
+
+    positions = positions if positions else [(None, None)]
+    zOffsets = zOffsets if zOffsets else [None]
+    channels = channels if channels else [None]
+
+    events = []
+    for t in range(timePoints):
+        for p, position in enumerate(positions):
+            x, y = position[0], position[1]
+            baseZ = position[2] if len(position) > 2 else None
+            for c, channel in enumerate(channels):
+                for iz, zOffset in enumerate(zOffsets):
+                    if zOffset is None:
+                        z = baseZ
+                    elif baseZ is None:
+                        z = zOffset
+                    else:
+                        z = baseZ + zOffset
+                    events.append(MDAEvent(index={'t': t, 'p': p, 'c': c, 'z': iz},
+                                           x=x, y=y, z=z, channel=channel, exposure=exposure,
+                                           minStartTime=t * interval))
+    return events
+
+
+def parseMDASequence(sequence):
+    """ Returns a list of MDAEvents from a list of events, a useq-schema
+    MDASequence, or a dict (or JSON string) with the keyword arguments of
+    buildMDAEvents. """
+    if isinstance(sequence, str):
+        sequence = json.loads(sequence)
+    if isinstance(sequence, dict):
+        return buildMDAEvents(**sequence)
+    return [MDAEvent.fromAny(event) for event in sequence]
+
+
+def orderMDAEvents(events, startPosition=None, startChannel=None):
+    """ Reorders events to minimize stage travel and channel changes while
+    keeping time points in order. Within each time point, positions are
+    visited in nearest-neighbour order, channels are kept together per
+    position (starting with the channel that was used last) and z stacks are
+    acquired in alternating direction. The deadline of a time point is
+    carried by whichever event is executed first. """
+
+    # Group by time point, keeping time points in order of first appearance
+    timeBlocks = {}
+    for event in events:
+        timeKey = event.index.get('t', event.minStartTime)
+        timeBlocks.setdefault(timeKey, []).append(event)
+
+    ordered = []
+    currentPosition = startPosition
+    currentChannel = startChannel
+    zAscending = True
+    for blockEvents in timeBlocks.values():
+        deadlines = [e.minStartTime for e in blockEvents if e.minStartTime is not None]
+        blockDeadline = min(deadlines) if deadlines else None
+
+        positionGroups = {}
+        for event in blockEvents:
+            positionGroups.setdefault((event.x, event.y), []).append(event)
+
+        remaining = list(positionGroups.keys())
+        blockOrdered = []
+        while remaining:
+            positionKey = _nearestPosition(remaining, currentPosition)
+            remaining.remove(positionKey)
+            if positionKey != (None, None):
+                currentPosition = positionKey
+
+            channelGroups = {}
+            for event in positionGroups[positionKey]:
+                channelGroups.setdefault(event.channel, []).append(event)
+
+            channelOrder = list(channelGroups.keys())
+            if currentChannel in channelGroups:
+                channelOrder.remove(currentChannel)
+                channelOrder.insert(0, currentChannel)
+
+            for channel in channelOrder:
+                channelEvents = sorted(
+                    channelGroups[channel],
+                    key=lambda e: (e.z is None, e.z if e.z is not None else 0),
+                    reverse=not zAscending
+                )
+                zAscending = not zAscending
+                blockOrdered.extend(channelEvents)
+                currentChannel = channel
+
+        for i, event in enumerate(blockOrdered):
+            ordered.append(dataclasses.replace(
+                event, minStartTime=blockDeadline if i == 0 else None
+            ))
+
+    return ordered
+
+
+def _nearestPosition(positionKeys, currentPosition):
+    if currentPosition is None or currentPosition == (None, None):
+        return positionKeys[0]
+
+    def distance(key):
+        if key == (None, None):
+            return 0
+        return sum((a - b) ** 2 for a, b in zip(key, currentPosition)
+                   if a is not None and b is not None)
+
+    return min(positionKeys, key=distance)
+
+
+class MDAManager(SignalInterface):
+    """ MDAManager runs multi-dimensional acquisitions (time points, stage
+    positions, channels and z planes) on the configured hardware. Events are
+    reordered to minimize stage and channel changes, frames are written on a
+    separate thread while the stage is already moving to the next position,
+    and timed events are scheduled against the start of the acquisition so
+    that delays don't accumulate. """
+
+    sigMDAStarted = Signal()
+    sigMDAFinished = Signal(bool)  # (canceled)
+    sigMDAPaused = Signal(bool)  # (paused)
+    sigMDAFrameReady = Signal(object, np.ndarray)  # (event, frame)
+
+    def __init__(self, detectorsManager, positionersManager, lasersManager=None):
+        super().__init__()
+        self.__logger = initLogger(self)
+        self._detectorsManager = detectorsManager
+        self._positionersManager = positionersManager
+        self._lasersManager = lasersManager
+
+        self._events = []
+        self._savePath = None
+        self._detectorName = None
+        self._optimizeOrder = True
+
+        self.settleTimeout = 2.0  # maximum time in seconds to wait for the stage to settle
+        self.frameTimeout = 1.0  # maximum time in seconds to wait for a new frame
+
+        self._running = False
+        self._paused = False
+        self._canceled = False
+        self._pauseCondition = threading.Condition()
+        self._currentEventIndex = 0
+        self._lateness = 0.0
+
+        self._worker = MDAWorker(self)
+        self._thread = Thread()
+        self._worker.moveToThread(self._thread)
+        self._thread.started.connect(self._worker.run)
+
+    @property
+    def running(self):
+        return self._running
+
+    def startMDA(self, sequence, savePath=None, detectorName=None, optimizeOrder=True):
+        """ Starts a multi-dimensional acquisition. sequence may be anything
+        accepted by parseMDASequence. If savePath is specified, each frame is
+        saved there as a TIFF file. """
+        if self._running:
+            raise RuntimeError('An MDA is already running')
+
+        # The previous MDA may have finished but its thread not have stopped yet, in which case
+        # it wouldn't be started again
+        self._thread.wait()
+
+        self._events = parseMDASequence(sequence)
+        self._savePath = savePath
+        self._detectorName = detectorName
+        self._optimizeOrder = optimizeOrder
+        self._paused = False
+        self._canceled = False
+        self._currentEventIndex = 0
+        self._lateness = 0.0
+        self._running = True
+        self._thread.start()
+
+    def pauseMDA(self):
+        with self._pauseCondition:
+            self._paused = True
+        self.sigMDAPaused.emit(True)
+
+    def resumeMDA(self):
+        with self._pauseCondition:
+            self._paused = False
+            self._pauseCondition.notify_all()
+        self.sigMDAPaused.emit(False)
+
+    def cancelMDA(self, wait=False):
+        with self._pauseCondition:
+            self._canceled = True
+            self._pauseCondition.notify_all()
+        if wait:
+            self._thread.wait()
+
+    def getStatus(self):
+        """ Returns a dict describing the progress of the current MDA. """
+        return {
+            'running': self._running,
+            'paused': self._paused,
+            'currentEvent': self._currentEventIndex,
+            'numEvents': len(self._events),
+            'lateness': self._lateness
+        }
+
+    def finalize(self):
+        self.cancelMDA()
+        self._thread.quit()
+        self._thread.wait()
+
+    def _finished(self, canceled):
+        self._running = False
+        self._thread.quit()
+        self.sigMDAFinished.emit(canceled)
+
+
+class MDAWorker(Worker):
+    def __init__(self, mdaManager):
+        super().__init__()
+        self.__logger = initLogger(self)
+        self._manager = mdaManager
+        self._writerQueue = queue.Queue()
+        self._currentChannel = None
+        self._currentExposure = None
+
+    def run(self):
+        manager = self._manager
+        detectorsManager = manager._detectorsManager
+        detectorName = manager._detectorName or detectorsManager.getCurrentDetectorName()
+        detector = detectorsManager[detectorName]
+
+        events = manager._events
+        if manager._optimizeOrder:
+            events = orderMDAEvents(events, startPosition=self._getCurrentXY())
+            manager._events = events
+
+        writerThread = threading.Thread(target=self._writeFrames, daemon=True)
+        writerThread.start()
+        acqHandle = detectorsManager.startAcquisition()
+        manager.sigMDAStarted.emit()
+        self.__logger.info(f'MDA started with {len(events)} events')
+
+        canceled = False
+        startTime = time.perf_counter()
+        pausedTime = 0.0
+        try:
+            for i, event in enumerate(events):
+                manager._currentEventIndex = i
+                pausedTime += self._waitWhilePaused()
+                if manager._canceled:
+                    canceled = True
+                    break
+
+                if event.minStartTime is not None:
+                    # Deadlines are relative to the start, so delays don't accumulate
+                    deadline = startTime + pausedTime + event.minStartTime
+                    pausedTime += self._waitUntil(deadline)
+                    if manager._canceled:
+                        canceled = True
+                        break
+                    manager._lateness = max(0.0, time.perf_counter() - deadline)
+                    _latenessGauge.set(manager._lateness)
+
+                with _eventHistogram.time():
+                    moved = self._prepareHardware(event, blocking=True)
+                    for positioner, axes in moved.items():
+                        if not positioner.waitUntilSettled(timeout=manager.settleTimeout,
+                                                           axes=axes):
+                            self.__logger.warning(f'Stage did not settle at event {i}')
+
+                    # A frame that was exposed after the stage arrived and the channel changed
+                    frame = np.array(tiledscantools.grabFreshFrame(detector,
+                                                                   timeout=manager.frameTimeout))
+                    self._writerQueue.put((event, frame))
+                    _writerQueueGauge.set(self._writerQueue.qsize())
+
+                    # Start moving to the next position while the frame is written
+                    if i + 1 < len(events) and events[i + 1].minStartTime is None:
+                        self._moveStage(events[i + 1], blocking=False)
+        finally:
+            self._writerQueue.put(None)
+            writerThread.join()
+            detectorsManager.stopAcquisition(acqHandle)
+            self.__logger.info('MDA canceled' if canceled else 'MDA finished')
+            manager._canceled = False
+            manager._finished(canceled)
+
+    def _waitWhilePaused(self):
+        """ Blocks while the MDA is paused and returns the time spent. """
+        manager = self._manager
+        startTime = time.perf_counter()
+        with manager._pauseCondition:
+            while manager._paused and not manager._canceled:
+                manager._pauseCondition.wait()
+        return time.perf_counter() - startTime
+
+    def _waitUntil(self, deadline):
+        """ Waits until the deadline, returning the time spent paused. """
+        manager = self._manager
+        pausedTime = 0.0
+        with manager._pauseCondition:
+            while not manager._canceled:
+                if manager._paused:
+                    pauseStart = time.perf_counter()
+                    while manager._paused and not manager._canceled:
+                        manager._pauseCondition.wait()
+                    pausedTime += time.perf_counter() - pauseStart
+                    deadline += time.perf_counter() - pauseStart
+                    continue
+
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                manager._pauseCondition.wait(remaining)
+        return pausedTime
+
+    def _prepareHardware(self, event, blocking):
+        """ Moves the stage and sets the channel and exposure of an event.
+        Returns the axes to move per positioner, see _moveStage. """
+        moved = self._moveStage(event, blocking=blocking)
+
+        if event.channel is not None and event.channel != self._currentChannel:
+            self._setChannel(event.channel)
+            self._currentChannel = event.channel
+
+        if event.exposure is not None and event.exposure != self._currentExposure:
+            detectorsManager = self._manager._detectorsManager
+            detectorName = self._manager._detectorName or detectorsManager.getCurrentDetectorName()
+            detector = detectorsManager[detectorName]
+            if 'exposure' in detector.parameters:
+                detector.setParameter('exposure', event.exposure)
+            self._currentExposure = event.exposure
+        return moved
+
+    def _moveStage(self, event, blocking):
+        """ Moves the stage to the position of an event. Returns the axes with
+        a target position per positioner, also those that were already there,
+        since they may still be moving there from a non-blocking move. """
+        moved = {}
+        for axis, target in (('X', event.x), ('Y', event.y), ('Z', event.z)):
+            if target is None:
+                continue
+
+            positioner = self._getPositioner(axis)
+            if positioner is None:
+                continue
+            moved.setdefault(positioner, []).append(axis)
+
+            current = positioner.position[axis]
+            if not blocking and abs(target - current) < 1e-9:
+                continue
+
+            parameters = inspect.signature(positioner.move).parameters
+            kwargs = {}
+            if 'is_blocking' in parameters:
+                kwargs['is_blocking'] = blocking
+            elif not blocking:
+                continue  # Can't prefetch without blocking the acquisition
+
+            if 'is_absolute' in parameters:
+                positioner.move(target, axis, is_absolute=True, **kwargs)
+            elif abs(target - current) > 1e-9:
+                positioner.move(target - current, axis, **kwargs)
+        return moved
+
+    def _setChannel(self, channel):
+        lasersManager = self._manager._lasersManager
+        if lasersManager is None or channel not in lasersManager.getAllDeviceNames():
+            self.__logger.debug(f'Channel "{channel}" does not correspond to a laser')
+            return
+
+        for laserName, laser in lasersManager:
+            if laserName != channel:
+                laser.setEnabled(False)
+        lasersManager[channel].setEnabled(True)
+
+    def _getPositioner(self, axis):
+        for _, positioner in self._manager._positionersManager:
+            if positioner.forPositioning and axis in positioner.axes:
+                return positioner
+        return None
+
+    def _getCurrentXY(self):
+        positionerX, positionerY = self._getPositioner('X'), self._getPositioner('Y')
+        if positionerX is None or positionerY is None:
+            return None
+        return positionerX.position['X'], positionerY.position['Y']
+
+    def _writeFrames(self):
+        manager = self._manager
+        while True:
+            item = self._writerQueue.get()
+            _writerQueueGauge.set(self._writerQueue.qsize())
+            if item is None:
+                return
+
+            event, frame = item
+            try:
+                if manager._savePath is not None:
+                    os.makedirs(manager._savePath, exist_ok=True)
+                    indexStr = '_'.join(f'{key}{value}' for key, value in event.index.items())
+                    tif.imwrite(os.path.join(manager._savePath, f'mda_{indexStr}.tif'), frame)
+                manager.sigMDAFrameReady.emit(event, frame)
+            except Exception as e:
+                self.__logger.error(f'Failed to write MDA frame: {e}')
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
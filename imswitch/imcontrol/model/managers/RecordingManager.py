@@ -11,7 +11,7 @@ import tifffile as tiff
 import cv2
 
 from imswitch.imcommon.framework import Signal, SignalInterface, Thread, Worker
-from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.model import initLogger, getMetricsRegistry
 import abc
 import logging
 
@@ -19,6 +19,21 @@ from imswitch.imcontrol.model.managers.DetectorsManager import DetectorsManager
 
 logger = logging.getLogger(__name__)
 
+_metrics = getMetricsRegistry()
+_recordingActiveGauge = _metrics.gauge(
+    'imswitch_recording_active', 'Whether a recording is currently running'
+)
+_recordedFramesCounter = _metrics.counter(
+    'imswitch_recording_frames_total', 'Number of frames fetched for recording per detector'
+)
+_recordingChunkGauge = _metrics.gauge(
+    'imswitch_recording_chunk_frames',
+    'Number of frames in the most recently fetched chunk, i.e. the detector buffer depth'
+)
+_recordingFetchHistogram = _metrics.histogram(
+    'imswitch_recording_fetch_seconds', 'Time spent fetching a chunk of frames for recording'
+)
+
 
 class AsTemporayFile(object):
     """ A temporary file that when exiting the context manager is renamed to its original name. """
@@ -321,10 +336,12 @@ class RecordingWorker(Worker):
 
     def run(self):
         acqHandle = self.__recordingManager.detectorsManager.startAcquisition()
+        _recordingActiveGauge.set(1)
         try:
             self._record()
 
         finally:
+            _recordingActiveGauge.set(0)
             self.__recordingManager.detectorsManager.stopAcquisition(acqHandle)
 
     def _record(self):
@@ -639,8 +656,11 @@ class RecordingWorker(Worker):
         return files, fileDests, filePaths
 
     def _getNewFrames(self, detectorName):
-        newFrames = self.__recordingManager.detectorsManager[detectorName].getChunk()
-        newFrames = np.array(newFrames)
+        with _recordingFetchHistogram.time(detector=detectorName):
+            newFrames = self.__recordingManager.detectorsManager[detectorName].getChunk()
+            newFrames = np.array(newFrames)
+        _recordingChunkGauge.set(len(newFrames), detector=detectorName)
+        _recordedFramesCounter.inc(len(newFrames), detector=detectorName)
         return newFrames
 
 
@@ -1,5 +1,8 @@
 import copy
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import numpy as np
 
 from imswitch.imcommon.model import initLogger
 from ..errors import IncompatibilityError
@@ -43,6 +46,11 @@ class ScanManager(SuperScanManager):
 
         self._expectedSyncParameters = []
 
+        # recently generated scans by their parameters, since identical scans are often run
+        # repeatedly, e.g. in event-triggered or sequence acquisitions
+        self._fullScanCache = OrderedDict()
+        self._fullScanCacheSize = 4
+
     @property
     def sampleRate(self):
         self._checkScanDefined()
@@ -88,12 +96,61 @@ class ScanManager(SuperScanManager):
         parameterDict.update(TTLParameters)
         return self._TTLCycleDesigner.make_signal(parameterDict, self._setupInfo, scanInfoDict)
 
+    def getScanSignalsStream(self, scanParameters):
+        """ Generates scan signals as SegmentedSignals. """
+        self._checkScanDefined()
+        parameterDict = copy.deepcopy(self._setupInfo.scan.scanDesignerParams)
+        parameterDict.update(scanParameters)
+        return self._scanDesigner.make_signal_stream(parameterDict, self._setupInfo)
+
+    def getTTLCycleSignalsStream(self, TTLParameters, scanInfoDict=None):
+        """ Generates TTL cycle signals as SegmentedSignals. """
+        self._checkScanDefined()
+        parameterDict = copy.deepcopy(self._setupInfo.scan.TTLCycleDesignerParams)
+        parameterDict.update(TTLParameters)
+        return self._TTLCycleDesigner.make_signal_stream(parameterDict, self._setupInfo,
+                                                         scanInfoDict)
+
+    def makeFullScanStream(self, scanParameters, TTLParameters, staticPositioner=False):
+        """ Like makeFullScan, but the signals are SegmentedSignals, which
+        store repeated parts (frames, lines) only once. Pass the signal dicts
+        to iterSignalBlocks to write them to a device in fixed-size blocks
+        without materializing the whole scan. """
+        self._checkScanDefined()
+        return self._makeFullScan(scanParameters, TTLParameters, staticPositioner, stream=True)
+
     def makeFullScan(self, scanParameters, TTLParameters, staticPositioner=False):
-        """ Generates stage and TTL scan signals. """
+        """ Generates stage and TTL scan signals. Signals generated for the
+        same parameters are reused; the returned dicts may be modified, but
+        not the signal arrays in them. """
         self._checkScanDefined()
 
+        key = _parameterKey((scanParameters, TTLParameters, staticPositioner))
+        if key not in self._fullScanCache:
+            fullScan = self._makeFullScan(scanParameters, TTLParameters, staticPositioner)
+            if fullScan is None:
+                return
+            self._fullScanCache[key] = fullScan
+            while len(self._fullScanCache) > self._fullScanCacheSize:
+                self._fullScanCache.popitem(last=False)
+        else:
+            self.__logger.debug('Reusing scan signals generated for the same parameters')
+            self._fullScanCache.move_to_end(key)
+
+        signalDict, scanInfoDict = self._fullScanCache[key]
+        return (
+            {'scanSignalsDict': dict(signalDict['scanSignalsDict']),
+             'TTLCycleSignalsDict': dict(signalDict['TTLCycleSignalsDict'])},
+            dict(scanInfoDict)
+        )
+
+    def _makeFullScan(self, scanParameters, TTLParameters, staticPositioner, stream=False):
+        getScanSignals = self.getScanSignalsStream if stream else self.getScanSignalsDict
+        getTTLCycleSignals = (self.getTTLCycleSignalsStream if stream
+                              else self.getTTLCycleSignalsDict)
+
         if not staticPositioner:
-            scanSignalsDict, positions, scanInfoDict = self.getScanSignalsDict(scanParameters)
+            scanSignalsDict, positions, scanInfoDict = getScanSignals(scanParameters)
             if not self._scanDesigner.checkSignalComp(
                     scanParameters, self._setupInfo, scanInfoDict
             ):
@@ -103,9 +160,9 @@ class ScanManager(SuperScanManager):
                 )
                 return
 
-            TTLCycleSignalsDict = self.getTTLCycleSignalsDict(TTLParameters, scanInfoDict)
+            TTLCycleSignalsDict = getTTLCycleSignals(TTLParameters, scanInfoDict)
         else:
-            TTLCycleSignalsDict = self.getTTLCycleSignalsDict(TTLParameters)
+            TTLCycleSignalsDict = getTTLCycleSignals(TTLParameters)
             scanSignalsDict = {}
             scanInfoDict = {}
 
@@ -122,6 +179,20 @@ class ScanManager(SuperScanManager):
             )
 
 
+def _parameterKey(value):
+    """ Converts nested parameters to a hashable key that is equal for equal
+    parameters. """
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _parameterKey(v)) for k, v in value.items()))
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return tuple(_parameterKey(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
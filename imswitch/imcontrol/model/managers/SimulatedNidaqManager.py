@@ -0,0 +1,305 @@
+import threading
+import time
+
+import numpy as np
+
+from imswitch.imcommon.framework import Signal, SignalInterface
+from imswitch.imcommon.model import getMetricsRegistry, initLogger
+from ..signaldesigners import SegmentedSignal
+
+
+_metrics = getMetricsRegistry()
+_samplesCounter = _metrics.counter(
+    'imswitch_daq_samples_total', 'Number of samples read from simulated DAQ input tasks per task'
+)
+_readLatencyHistogram = _metrics.histogram(
+    'imswitch_daq_read_latency_seconds',
+    'Time from the last sample of a read being acquired to it being returned per task'
+)
+
+
+class VirtualBeadSample:
+    """ Virtual sample of fluorescent beads for the simulated DAQ: one bead
+    at a random position in every square cell of size spacing, so that the
+    sample is infinite and doesn't depend on the scanned area. Called with
+    an (axes, samples) array of scanner positions, of which the first two
+    axes are used, it returns the photon count rate at each position. """
+
+    def __init__(self, spacing=1.0, beadSize=0.1, brightness=5e6, background=1e4, seed=0):
+        self.spacing = spacing
+        self.beadSize = beadSize
+        self.brightness = brightness
+        self.background = background
+        self.seed = seed
+
+    def __call__(self, positions):
+        positions = np.atleast_2d(np.asarray(positions, dtype=float))
+        xy = np.zeros((2, positions.shape[1]))
+        xy[:min(len(positions), 2)] = positions[:2]
+        cells = np.floor(xy / self.spacing)
+
+        rate = np.full(xy.shape[1], float(self.background))
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cell = cells + np.array([[dx], [dy]])
+                bead = (cell + self._random(cell)) * self.spacing
+                distance2 = np.sum((xy - bead) ** 2, axis=0)
+                rate += self.brightness * np.exp(-distance2 / (2 * self.beadSize ** 2))
+        return rate
+
+    def _random(self, cell):
+        """ Deterministic pseudo-random position in [0, 1)² for each cell. """
+        h = np.sin(cell[0] * 12.9898 + cell[1] * 78.233 + self.seed * 37.719) * 43758.5453
+        return np.stack([h - np.floor(h), (h * 7.31) - np.floor(h * 7.31)])
+
+
+class SimulatedNidaqManager(SignalInterface):
+    """ Software stand-in for a National Instruments DAQ card, with the
+    interface that the point-scanning managers expect from the nidaqManager
+    low-level manager. runScan takes the scan signals from ScanManager as if
+    outputting them at the scan sample rate, and input tasks read counter
+    (``ci``) or analog (``ai``) input synthesized from a virtual sample at
+    the scanner positions, while the TTL signals are on.
+
+    In realtime mode, samples become available at the rate of the input
+    task after the scan starts, reads block until they are, and an input
+    buffer of bufferSize samples overflows if they aren't read in time, like
+    on the card. Otherwise, all samples are available immediately, which
+    makes for fast tests and benchmarks of the processing.
+
+    Args:
+        setupInfo: The setup info, for the scan sample rate.
+        sample: Function from an (axes, samples) array of scanner positions
+          to photon count rates; defaults to a VirtualBeadSample.
+        realtime: Whether to pace the input at the sample rates.
+        bufferSize: Size of the input buffers in samples; defaults to one
+          second of samples.
+        darkCountRate: Counts per second without illumination.
+        seed: Seed of the shot noise.
+    """
+
+    sigScanBuilt = Signal(object)  # (scanInfoDict)
+    sigScanBuildFailed = Signal()
+    sigScanStarted = Signal()
+    sigScanDone = Signal()
+
+    def __init__(self, setupInfo, sample=None, realtime=True, bufferSize=None,
+                 darkCountRate=100.0, seed=None):
+        super().__init__()
+        self.__logger = initLogger(self)
+
+        self._setupInfo = setupInfo
+        self.sample = sample if sample is not None else VirtualBeadSample()
+        self.realtime = realtime
+        self.bufferSize = bufferSize
+        self.darkCountRate = darkCountRate
+        self._rng = np.random.default_rng(seed)
+
+        self._lock = threading.Lock()
+        self._scan = None
+        self._inputTasks = {}
+        self._digitalValues = {}
+        self._analogValues = {}
+
+    @property
+    def scanSampleRate(self):
+        return self._setupInfo.scan.sampleRate if self._setupInfo.scan else 100000
+
+    def setDigital(self, target, enable):
+        """ Sets the digital line of the target device. """
+        self._digitalValues[target] = bool(enable)
+
+    def setAnalog(self, target, voltage, min_val=-1, max_val=1):
+        """ Sets the analog output of the target device. """
+        self._analogValues[target] = float(np.clip(voltage, min_val, max_val))
+
+    def runScan(self, signalDict, scanInfoDict):
+        """ Outputs the scan signals, which may be arrays or SegmentedSignals.
+        Input tasks started with a start trigger are triggered by the scan. """
+        try:
+            scan = _SimulatedScan(signalDict, self.scanSampleRate)
+        except ValueError as e:
+            self.__logger.error(f'Failed to build scan: {e}')
+            self.sigScanBuildFailed.emit()
+            return
+
+        with self._lock:
+            self._scan = scan
+        self.sigScanBuilt.emit(scanInfoDict)
+
+        with self._lock:
+            scan.startTime = time.perf_counter()
+            for task in self._inputTasks.values():
+                if task.startTrigger and not task.triggered.is_set():
+                    task.scan = scan
+                    task.startTime = scan.startTime
+                    task.triggered.set()
+        self.sigScanStarted.emit()
+
+        threading.Thread(target=self._finishScan, args=(scan,), name='SimulatedNidaqScan',
+                         daemon=True).start()
+
+    def stopScan(self):
+        """ Stops the running scan. """
+        with self._lock:
+            if self._scan is not None:
+                self._scan.stopped.set()
+
+    def startInputTask(self, name, taskType, channel, acquisitionType, source, rate, samples,
+                       startTrigger=False, reference_trigger=None, terminal=None):
+        """ Starts an input task that reads counter (``ci``) or analog
+        (``ai``) input at rate. Finite tasks end after the given number of
+        samples. With startTrigger, the task starts with the next scan,
+        otherwise immediately. """
+        if taskType not in ('ci', 'ai'):
+            raise ValueError(f'Unsupported input task type "{taskType}"')
+
+        samples = int(samples) if acquisitionType == 'finite' else None
+        task = _InputTask(taskType, float(rate), samples, startTrigger)
+        with self._lock:
+            if name in self._inputTasks:
+                raise RuntimeError(f'Input task "{name}" already exists')
+            if not startTrigger:
+                task.scan = self._scan
+                task.startTime = time.perf_counter()
+                task.triggered.set()
+            self._inputTasks[name] = task
+
+    def readInputTask(self, name, samples=0, timeout=None):
+        """ Returns the next samples of an input task. Counter input counts
+        up from the start of the task. """
+        task = self._inputTasks[name]
+        if task.numSamples is not None and task.position + samples > task.numSamples:
+            raise RuntimeError(f'Reading {samples} samples from "{name}" past the end of the'
+                               f' task ({task.numSamples} samples)')
+
+        if not task.triggered.wait(timeout):
+            raise TimeoutError(f'Input task "{name}" was not triggered within {timeout} s')
+
+        stop = task.position + samples
+        if self.realtime:
+            acquiredTime = task.startTime + stop / task.rate
+            waitTime = acquiredTime - time.perf_counter()
+            if timeout is not None and waitTime > timeout:
+                raise TimeoutError(f'{samples} samples not acquired by "{name}" within {timeout} s')
+            if waitTime > 0:
+                time.sleep(waitTime)
+
+            bufferSize = self.bufferSize if self.bufferSize is not None else int(task.rate)
+            acquired = (time.perf_counter() - task.startTime) * task.rate
+            if acquired - task.position > bufferSize:
+                raise RuntimeError(f'Input buffer of "{name}" overflowed: samples were not read'
+                                   f' fast enough')
+
+        counts = self._synthesize(task, task.position, stop)
+        if task.taskType == 'ci':
+            cumulative = task.count + np.cumsum(counts, dtype=np.uint64)
+            task.count = int(cumulative[-1]) if len(cumulative) > 0 else task.count
+            data = (cumulative % 2 ** 32).astype(np.uint32)  # counters wrap around
+        else:
+            data = counts.astype(float)
+        task.position = stop
+
+        _samplesCounter.inc(samples, task=name)
+        if self.realtime:
+            _readLatencyHistogram.observe(time.perf_counter() - acquiredTime, task=name)
+        return data
+
+    def inputTaskDone(self, name):
+        """ Stops and removes an input task. """
+        with self._lock:
+            self._inputTasks.pop(name, None)
+
+    def _synthesize(self, task, start, stop):
+        """ Returns the photon counts of the samples from start to stop of an
+        input task. """
+        rate = np.full(stop - start, self.darkCountRate / task.rate)
+        scan = task.scan
+        if scan is not None and len(scan) > 0 and stop > start:
+            # the scan samples that were output when the input samples were acquired
+            offset = (task.startTime - scan.startTime) * scan.rate
+            scanIndices = np.floor(offset + np.arange(start, stop) * scan.rate / task.rate)
+            scanIndices = scanIndices.astype(np.int64)
+            inScan = (scanIndices >= 0) & (scanIndices < len(scan))
+            if np.any(inScan):
+                first, last = scanIndices[inScan][0], scanIndices[inScan][-1] + 1
+                positions, illumination = scan.read(first, last)
+                indices = scanIndices[inScan] - first
+                photonRate = self.sample(positions[:, indices]) * illumination[indices]
+                rate[inScan] += photonRate / task.rate
+        return self._rng.poisson(rate)
+
+    def _finishScan(self, scan):
+        if self.realtime:
+            scan.stopped.wait(len(scan) / scan.rate)
+        with self._lock:
+            if self._scan is scan:
+                self._scan = None
+        self.sigScanDone.emit()
+
+
+class _SimulatedScan:
+    def __init__(self, signalDict, rate):
+        self.rate = rate
+        self.startTime = None
+        self.stopped = threading.Event()
+
+        self._positionSignals = [_asSegmentedSignal(signal)
+                                 for signal in signalDict.get('scanSignalsDict', {}).values()]
+        self._TTLSignals = [_asSegmentedSignal(signal)
+                            for signal in signalDict.get('TTLCycleSignalsDict', {}).values()]
+        lengths = {len(signal) for signal in self._positionSignals + self._TTLSignals}
+        if len(lengths) > 1:
+            raise ValueError(f'Signals have different lengths {sorted(lengths)}')
+        self._length = lengths.pop() if lengths else 0
+
+    def __len__(self):
+        return self._length
+
+    def read(self, start, stop):
+        """ Returns the scanner positions and whether the sample is
+        illuminated at the scan samples from start to stop. """
+        positions = np.array([signal.read(start, stop) for signal in self._positionSignals])
+        positions = positions.reshape(len(self._positionSignals), stop - start)
+        if self._TTLSignals:
+            illumination = np.any([signal.read(start, stop) for signal in self._TTLSignals],
+                                  axis=0).astype(float)
+        else:
+            illumination = np.ones(stop - start)
+        return positions, illumination
+
+
+class _InputTask:
+    def __init__(self, taskType, rate, numSamples, startTrigger):
+        self.taskType = taskType
+        self.rate = rate
+        self.numSamples = numSamples
+        self.startTrigger = startTrigger
+        self.triggered = threading.Event()
+        self.scan = None
+        self.startTime = None
+        self.position = 0
+        self.count = 0
+
+
+def _asSegmentedSignal(signal):
+    if isinstance(signal, SegmentedSignal):
+        return signal
+    return SegmentedSignal.fromArray(np.asarray(signal))
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -3,6 +3,7 @@ from .DetectorsManager import DetectorsManager, NoDetectorsError
 from .LasersManager import LasersManager
 from .LEDsManager import LEDsManager
 from .LEDMatrixsManager import LEDMatrixsManager
+from .MDAManager import MDAManager, MDAEvent, buildMDAEvents, orderMDAEvents
 from .MultiManager import MultiManager
 from .PositionersManager import PositionersManager
 from .RS232sManager import RS232sManager
@@ -11,6 +12,7 @@ from .RecordingManager import RecordingManager, RecMode, SaveMode, SaveFormat
 from .SLMManager import SLMManager
 from .UC2ConfigManager import UC2ConfigManager
 from .SIMManager import SIMManager
+from .SimulatedNidaqManager import SimulatedNidaqManager, VirtualBeadSample
 from .MCTManager import MCTManager
 from .HistoScanManager import HistoScanManager
 from .PixelCalibrationManager import PixelCalibrationManager
@@ -15,6 +15,11 @@ class APDManager(DetectorManager):
       is connected
     - ``ctrInputLine`` -- the counter that the physical input terminal is
       connected to
+    - ``linesPerRead`` -- number of lines to read from the Nidaq and add to
+      the image at once (optional, default 0: as many lines as are scanned in
+      ``updateTime``)
+    - ``updateTime`` -- time in seconds between image updates if
+      ``linesPerRead`` is 0 (optional, default 0.05)
     """
 
     def __init__(self, detectorInfo, name, nidaqManager, **_lowLevelManagers):
@@ -39,6 +44,8 @@ class APDManager(DetectorManager):
             self._channel = f'Dev1/ctr{self._channel}'  # for backwards compatibility
 
         self._terminal = detectorInfo.managerProperties["terminal"]
+        self._linesPerRead = int(detectorInfo.managerProperties.get("linesPerRead", 0))
+        self._updateTime = float(detectorInfo.managerProperties.get("updateTime", 0.05))
 
         self._scanWorker = None
         self._scanThread = None
@@ -71,8 +78,9 @@ class APDManager(DetectorManager):
             self._scanWorker.moveToThread(self._scanThread)
             self._scanThread.started.connect(self._scanWorker.run)
             self._scanWorker.scanning = True
-            self._scanWorker.newLine.connect(
-                lambda line_pixels, line_count, frame: self.updateImage(line_pixels, line_count, frame)
+            self._scanWorker.newLines.connect(
+                lambda lines_pixels, first_line, frame: self.updateImage(lines_pixels, first_line,
+                                                                         frame)
             )
             self._scanWorker.acqDoneSignal.connect(self.stopAcquisition)
 
@@ -98,10 +106,15 @@ class APDManager(DetectorManager):
     def getLatestFrame(self):
         return self._image
 
-    def updateImage(self, line_pixels, line_count, frame):
-        self._image[frame, -(line_count + 1), :] = line_pixels
+    def updateImage(self, lines_pixels, first_line, frame):
+        """ Adds consecutive lines, starting with first_line, to a frame.
+        Lines are filled in from the bottom of the image. """
+        lines_pixels = np.atleast_2d(lines_pixels)
+        n_lines = self._image.shape[1]
+        self._image[frame, n_lines - first_line - len(lines_pixels):n_lines - first_line, :] = \
+            lines_pixels[::-1]
         self.__currentFrame = frame
-        if line_count == 0:
+        if first_line == 0:
             # adjust viewbox shape to new image shape at the start of the image
             self.updateLatestFrame(True)
             self.__newFrameReady = True
@@ -152,7 +165,7 @@ class APDManager(DetectorManager):
 
 
 class ScanWorker(Worker):
-    newLine = Signal(np.ndarray, int, int)
+    newLines = Signal(np.ndarray, int, int)  # (lines_pixels, first_line, frame)
     acqDoneSignal = Signal()
 
     def __init__(self, manager, scanInfoDict):
@@ -270,56 +283,52 @@ class ScanWorker(Worker):
             self._manager.setPixelSize(float(scanInfoDict['pixel_size_ax1']),
                                        float(scanInfoDict['pixel_size_ax2']))
 
+        # number of lines to read and add to the image at once, since handling lines one by one
+        # limits the line rate
+        self._lines_per_read = self._manager._linesPerRead
+        if self._lines_per_read < 1:
+            self._lines_per_read = round(
+                self._manager._updateTime * self._manager._detection_samplerate
+                / self._samples_period
+            )
+        self._lines_per_read = min(max(self._lines_per_read, 1), self._n_lines)
+
+        # indices of the last samples before each pixel of the lines in a read, and of the last
+        # sample of each line
+        self._pixel_boundaries = (
+            np.arange(self._lines_per_read)[:, np.newaxis] * self._samples_period +
+            np.arange(self._pixels_line + 1) * self._frac_det_dwell - 1
+        )
+
         self._last_value = 0
         self._line_counter = 0
 
     def run(self):
-        #self.__logger.debug('scanWorker.run initiated')
-        #self.__logger.debug(f'Samples to throw init: {self._samples_throw_init}')
         throwdata = self._manager._nidaqManager.readInputTask(self._name, self._samples_throw_init)
-        #self.__logger.debug(f'sw0: throw data shape: {np.shape(throwdata)}')
         self._last_value = throwdata[-1]
         self._alldata += len(throwdata)
         for i in range(self._n_frames):
-            #self.__logger.debug(f'Currently data for frame {i+1} out of {self._n_frames}')
             throwdata = self._manager._nidaqManager.readInputTask(self._name, self._throw_init_frame)
             self._last_value = throwdata[-1]
             self._alldata += len(throwdata)
             while self._line_counter < self._n_lines:
                 if self.scanning:
-                    #self.__logger.debug(f'sw1: line {self._line_counter} started')
-                    if self._line_counter == self._n_lines - 1:
-                        # read a line
-                        data = self._manager._nidaqManager.readInputTask(self._name,
-                                                                        self._samples_line)
-                    else:
-                        # read a whole period, starting with the line and then the data during the
-                        # flyback
-                        data = self._manager._nidaqManager.readInputTask(self._name,
-                                                                        self._samples_period)
+                    n_lines = min(self._lines_per_read, self._n_lines - self._line_counter)
+                    # read whole periods, each starting with the line and then the data during
+                    # the flyback, except for the flyback after the last line
+                    n_samples = n_lines * self._samples_period
+                    if self._line_counter + n_lines == self._n_lines:
+                        n_samples -= self._samples_period - self._samples_line
+                    data = self._manager._nidaqManager.readInputTask(self._name, n_samples)
                     self._alldata += len(data)
-                    # galvo-sensor-data reading
-                    subtractionArray = np.concatenate(([self._last_value], data[:-1]))
-                    self._last_value = data[-1]
 
-                    # Now data is an array containing at each position the number of counts
-                    # at this position
-                    data = data - subtractionArray
-
-                    # only take the first samples that corresponds to the samples during the line
-                    line_samples = data[:self._samples_line]
-
-                    # translate sample stream to an array where each value corresponds to a pixel count
-                    line_pixels = self.samples_to_pixels(line_samples)
-
-                    self.newLine.emit(line_pixels, self._line_counter, i)
-                    self._line_counter += 1
+                    lines_pixels = self.samples_to_pixels(data, n_lines)
+                    self.newLines.emit(lines_pixels, self._line_counter, i)
+                    self._line_counter += n_lines
                 else:
                     self.__logger.debug('Close data reading: not scanning any longer')
                     self.close()
-            #throwdata = self._manager._nidaqManager.readInputTask(
-            #    self._name, self._throw_between_frames
-            #)
+                    return
             throwdatalen = self._throw_startzero + self._samples_frame * (i+1) - self._alldata
             if throwdatalen > 0:
                 throwdata = self._manager._nidaqManager.readInputTask(
@@ -327,27 +336,29 @@ class ScanWorker(Worker):
                 )
                 self._alldata += len(throwdata)
             self._line_counter = 0
-            #self.__logger.debug(f'length of all data after frame {i+1}: {self._alldata}')
 
-        throwdatalen = self._throw_startzero + self._throw_finalpos
+        # read the rest of the finite task, but not past its end
+        throwdatalen = self._samples_total - self._alldata
         if throwdatalen > 0:
-            throwdata = self._manager._nidaqManager.readInputTask(
-                self._name, self._throw_startzero + self._throw_finalpos
-            )
+            throwdata = self._manager._nidaqManager.readInputTask(self._name, throwdatalen)
             self._alldata += len(throwdata)
-        #self.__logger.debug(f'length of all data, end: {self._alldata}')
         self.acqDoneSignal.emit()
-        # self.__logger.debug(self._name)
-        # self.close()
 
-    def samples_to_pixels(self, line_samples):
-        """ Reshape read datastream over the line to a line with pixel counts.
-        Do this by summing elements, with the rate ratio calculated previously. """
+    def samples_to_pixels(self, data, n_lines=1):
+        """ Translate the counter values read over n_lines lines, each but the
+        last one followed by flyback samples, to an (n_lines, pixels) array of
+        pixel counts. """
         # If reading with higher sample rate (ex. 1 MHz, 1 us per sample) than scanning, sum N
         # samples for each pixel, since scanning curve is linear (ex. only allow dwell times as
-        # multiples of 1 us if sampling rate is 1 MHz)
-        line_pixels = np.array(line_samples).reshape(-1, self._frac_det_dwell).sum(axis=1)
-        return line_pixels
+        # multiples of 1 us if sampling rate is 1 MHz). As the counter counts up, that sum is the
+        # difference of the counter values at the pixel boundaries, so the other samples aren't
+        # touched.
+        data = np.asarray(data)
+        boundary_values = data[np.maximum(self._pixel_boundaries[:n_lines], 0)]
+        boundary_values[0, 0] = self._last_value  # the value before the first sample
+        self._last_value = data[-1]
+        # counter wrap-arounds are undone by the unsigned difference
+        return np.diff(boundary_values, axis=1).astype(np.int64)
 
     def close(self):
         self._manager._nidaqManager.inputTaskDone(self._name)
@@ -1,3 +1,4 @@
+import functools
 import traceback
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
@@ -6,7 +7,7 @@ from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 
 from imswitch.imcommon.framework import Signal, SignalInterface
-from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.model import initLogger, StateCache
 
 
 @dataclass
@@ -65,6 +66,16 @@ class DetectorManager(SignalInterface):
 
     sigImageUpdated = Signal(np.ndarray, bool)
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Serve parameter reads from the state cache, and drop cached values
+        # whenever the detector is reconfigured
+        if 'getParameter' in cls.__dict__:
+            cls.getParameter = _cachedGetParameter(cls.__dict__['getParameter'])
+        for methodName in ('setParameter', 'setBinning', 'crop'):
+            if methodName in cls.__dict__:
+                setattr(cls, methodName, _invalidatesParameters(cls.__dict__[methodName]))
+
     @abstractmethod
     def __init__(self, detectorInfo, name: str, fullShape: Tuple[int, int],
                  supportedBinnings: List[int], model: str, *,
@@ -90,6 +101,9 @@ class DetectorManager(SignalInterface):
         self.__logger = initLogger(self, instanceName=name)
 
         self._detectorInfo = detectorInfo
+        self._stateCache = StateCache(
+            name, detectorInfo.managerProperties.get('stateCacheTTL', 1.0)
+        )
 
         self._frameStart = (0, 0)
         self._shape = fullShape
@@ -138,8 +152,27 @@ class DetectorManager(SignalInterface):
             raise AttributeError(f'Non-existent parameter "{name}" specified')
 
         self.__parameters[name].value = value
+        self.invalidateStateCache()
         return self.parameters
 
+    def getParameter(self, name: str, fresh: bool = False) -> Any:
+        """ Returns the value of a parameter. Derived classes that read the
+        value back from the device have their reads cached for
+        ``stateCacheTTL`` seconds (set in managerProperties, defaults to 1),
+        and the cache is cleared whenever the detector is reconfigured; pass
+        fresh=True to always query the device. """
+
+        if name not in self.__parameters:
+            raise AttributeError(f'Non-existent parameter "{name}" specified')
+
+        return self.__parameters[name].value
+
+    def invalidateStateCache(self) -> None:
+        """ Drops all cached values read back from the device. """
+        stateCache = getattr(self, '_stateCache', None)
+        if stateCache is not None:
+            stateCache.invalidate()
+
     def setRGB(self, isRGB: bool) -> None:
         """ Sets the sensortype of the camera """
         self._isRGB = isRGB
@@ -270,6 +303,37 @@ class DetectorManager(SignalInterface):
         pass
 
 
+def _cachedGetParameter(getParameterFunc):
+    if getattr(getParameterFunc, '_cached', False):
+        return getParameterFunc
+
+    @functools.wraps(getParameterFunc)
+    def wrapper(self, name, *args, fresh=False, **kwargs):
+        stateCache = getattr(self, '_stateCache', None)
+        if stateCache is None or args or kwargs:
+            return getParameterFunc(self, name, *args, **kwargs)
+        return stateCache.get(('parameter', name), lambda: getParameterFunc(self, name),
+                              fresh=fresh)
+
+    wrapper._cached = True
+    return wrapper
+
+
+def _invalidatesParameters(func):
+    if getattr(func, '_invalidatesParameters', False):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.invalidateStateCache()
+
+    wrapper._invalidatesParameters = True
+    return wrapper
+
+
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
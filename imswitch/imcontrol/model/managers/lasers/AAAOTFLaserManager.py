@@ -39,7 +39,8 @@ class AAAOTFLaserManager(LaserManager):
         """
         valueaotf = round(power)  # assuming input value is [0,1023]
         cmd = 'L' + str(self._channel) + 'P' + str(valueaotf)
-        self._rs232manager.query(cmd)
+        # queued without waiting; while queued, newer values replace it
+        self._rs232manager.queryAsync(cmd, coalesceKey=('power', self._channel))
 
     def blankingOn(self):
         """Switch on the blanking of all the channels"""
@@ -44,7 +44,8 @@ class CoolLEDLaserManager(LaserManager):
         """
         cmd = "C" + self.__channel_index + "IX" + "{0:03.0f}".format(power)
         self.__logger.debug(cmd)
-        self._rs232manager.query(cmd)
+        # queued without waiting; while queued, newer values replace it
+        self._rs232manager.queryAsync(cmd, coalesceKey=('power', self.__channel_index))
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
@@ -1,12 +1,22 @@
+import functools
 from abc import ABC, abstractmethod
 
 from typing import Union
 
+from imswitch.imcommon.model import StateCache
+
 
 class LaserManager(ABC):
     """ Abstract base class for managers that control lasers. Each type of
     laser corresponds to a manager derived from this class. """
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Keep track of what was last written to the laser
+        for methodName, cacheKey in (('setValue', 'value'), ('setEnabled', 'enabled')):
+            if methodName in cls.__dict__:
+                setattr(cls, methodName, _recordsState(cls.__dict__[methodName], cacheKey))
+
     @abstractmethod
     def __init__(self, laserInfo, name: str, isBinary: bool, valueUnits: str,
                  valueDecimals: int, isModulated: bool = False) -> None:
@@ -31,6 +41,7 @@ class LaserManager(ABC):
         self.__valueUnits = valueUnits
         self.__valueDecimals = valueDecimals
         self.__isModulated = isModulated
+        self._stateCache = StateCache(name, laserInfo.managerProperties.get('stateCacheTTL', 1.0))
         if isModulated:
             self.__freqRangeMin = laserInfo.freqRangeMin
             self.__freqRangeMax = laserInfo.freqRangeMax
@@ -112,6 +123,28 @@ class LaserManager(ABC):
         """ Sets the value of the laser. """
         pass
 
+    def getValue(self, fresh: bool = False) -> Union[int, float]:
+        """ Returns the value of the laser. The value last written or read
+        back within ``stateCacheTTL`` seconds is returned without querying the
+        device, unless fresh is set. """
+        return self._stateCache.get('value', self._readValue, fresh=fresh)
+
+    def getEnabled(self, fresh: bool = False) -> bool:
+        """ Returns whether the laser is enabled, cached like getValue. """
+        return self._stateCache.get('enabled', self._readEnabled, fresh=fresh)
+
+    def _readValue(self) -> Union[int, float]:
+        """ Reads the value back from the device. Derived classes that support
+        this should override it; by default, the value last set is returned.
+        """
+        return self._stateCache.peek('value')
+
+    def _readEnabled(self) -> bool:
+        """ Reads back from the device whether the laser is enabled. Derived
+        classes that support this should override it; by default, the state
+        last set is returned. """
+        return self._stateCache.peek('enabled', False)
+
     def setModulationEnabled(self, enabled: bool) -> None:
         """ Sets wether the laser frequency modulation is enabled. """
         pass
@@ -133,6 +166,27 @@ class LaserManager(ABC):
         pass
 
 
+def _recordsState(setterFunc, cacheKey):
+    if getattr(setterFunc, '_recordsState', False):
+        return setterFunc
+
+    @functools.wraps(setterFunc)
+    def wrapper(self, value, *args, **kwargs):
+        stateCache = getattr(self, '_stateCache', None)
+        try:
+            result = setterFunc(self, value, *args, **kwargs)
+        except Exception:
+            if stateCache is not None:
+                stateCache.invalidate(cacheKey)
+            raise
+        if stateCache is not None:
+            stateCache.set(cacheKey, value)
+        return result
+
+    wrapper._recordsState = True
+    return wrapper
+
+
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
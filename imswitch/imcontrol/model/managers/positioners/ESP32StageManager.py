@@ -1,6 +1,5 @@
 from imswitch.imcommon.model import initLogger
 from .PositionerManager import PositionerManager
-import time
 import numpy as np
 
 PHYS_FACTOR = 1
@@ -153,12 +152,20 @@ class ESP32StageManager(PositionerManager):
         self.is_enabled = False
 
         # get bootup position and write to GUI
-        self._position = self.getPosition()
+        try:
+            self._position = self.getPosition()
+        except Exception:
+            self.__logger.error('Could not read the bootup position, assuming the initial position')
         # force setting the position
         self.setPosition(self._position['X'], "X")
         self.setPosition(self._position['Y'], "X")
         self.setPosition(self._position['Z'], "Z")
 
+        # read back the position in the background if requested
+        pollingInterval = positionerInfo.managerProperties.get('positionPollingInterval')
+        if pollingInterval:
+            self.startPositionPolling(pollingInterval)
+
     def setAxisOrder(self, order=[0, 1, 2, 3]):
         self._motor.setMotorAxisOrder(order=order)
 
@@ -215,6 +222,20 @@ class ESP32StageManager(PositionerManager):
         else:
             print('Wrong axis, has to be "X" "Y" or "Z".')
 
+    def _executeTrajectory(self, run):
+        # The firmware executes one motor command at a time, so each waypoint
+        # is sent as a single blocking XYZ move instead of one move per axis
+        for index, waypoint in enumerate(run.waypoints):
+            if run.canceled:
+                return
+            target = tuple(waypoint.position.get(axis, self._position[axis])
+                           for axis in ("X", "Y", "Z"))
+            speed = tuple(waypoint.speed if waypoint.speed is not None else self.speed[axis]
+                          for axis in ("X", "Y", "Z"))
+            self.move(value=target, axis="XYZ", is_absolute=True, is_blocking=True, speed=speed)
+            run.dwell(waypoint.dwell)
+            run.reachedWaypoint(index)
+
     def measure(self, sensorID=0, NAvg=100):
         return self._motor.read_sensor(sensorID=sensorID, NAvg=NAvg)
 
@@ -248,17 +269,21 @@ class ESP32StageManager(PositionerManager):
         pass
 
     def getPosition(self):
+        # a failed read raises, so that it isn't cached or taken for a settled position
         try:
-            time.sleep(0.5)
             allPositions = self._motor.get_position()
-            print(f"Motor reported {allPositions}")
+            self.__logger.debug(f"Motor reported {allPositions}")
         except Exception as e:
-            allPositions = [0, 0, 0, 0]
-            print(f"getposition failes: {e}")
+            self.__logger.error(f"getPosition failed: {e}")
+            raise
 
         return {"X": allPositions[1], "Y": allPositions[2], "Z": allPositions[3], "A": allPositions[0]}
 
 
+    @property
+    def canReadPosition(self):
+        return True
+
     def get_position(self):
         return self._position["X"], self._position["Y"], self._position["Z"]
 
@@ -17,6 +17,9 @@ DIR_X = -1
 DIR_Y = 1
 DIR_Z = 1
 
+# duration of the trigger pulse on the coolant output, in seconds
+TRIGGER_PULSE_TIME = 0.01
+
 class GRBLStageManager(PositionerManager):
     def __init__(self, positionerInfo, name, **lowLevelManagers):
         self._rs232manager = lowLevelManagers['rs232sManager'][
@@ -54,6 +57,73 @@ class GRBLStageManager(PositionerManager):
     def setPosition(self, value, axis):
         self._position[axis] = value
 
+    def waitUntilSettled(self, tolerance=1.0, timeout=10.0, axes=None, target=None):
+        # GRBL doesn't report positions while it streams, but knows when all
+        # planned moves have finished
+        return self.board.wait_for_idle(timeout=timeout)
+
+    def _executeTrajectory(self, run):
+        # Stream the whole trajectory as relative G-code moves. GRBL plans them
+        # as one continuous motion; only the trigger pulses on the coolant
+        # output and the dwells make it stop at a waypoint, and acknowledge
+        # once the waypoint has actually been reached. Other waypoints are
+        # reported as soon as GRBL has planned them, the last one once GRBL is
+        # idle.
+        factors = {'X': PHYS_TO_GRBL_FAC*DIR_X, 'Y': PHYS_TO_GRBL_FAC*DIR_Y,
+                   'Z': PHYS_TO_GRBL_FAC_Z*DIR_Z}
+        position = dict(self._position)
+        lines = ['G91']
+        lastLineOfWaypoint = {}
+        lastIndex = len(run.waypoints) - 1
+        for index, waypoint in enumerate(run.waypoints):
+            move = ''
+            for axis in ('X', 'Y', 'Z'):
+                if axis in waypoint.position:
+                    distance = waypoint.position[axis] - position[axis]
+                    position[axis] = waypoint.position[axis]
+                    move += f'{axis}{distance*factors[axis]/self.board.stepdivider:.4f}'
+            if waypoint.speed is not None:
+                # speed is in ImSwitch units per second, GRBL expects mm/min
+                move += f'F{abs(waypoint.speed*PHYS_TO_GRBL_FAC/self.board.stepdivider*60):.4f}'
+            lines.append('G1 ' + move if waypoint.speed is not None else 'G0 ' + move)
+            if waypoint.trigger:
+                lines.extend(['M8', f'G4 P{TRIGGER_PULSE_TIME:.3f}', 'M9'])
+            if waypoint.dwell > 0:
+                lines.append(f'G4 P{waypoint.dwell:.3f}')
+            if index < lastIndex or waypoint.trigger or waypoint.dwell > 0:
+                lastLineOfWaypoint[len(lines) - 1] = index
+        lines.append('G90')
+
+        def reached(index):
+            for axis, target in run.waypoints[index].position.items():
+                self._position[axis] = target
+            run.reachedWaypoint(index)
+
+        def onAck(lineIndex):
+            if lineIndex in lastLineOfWaypoint:
+                reached(lastLineOfWaypoint[lineIndex])
+
+        try:
+            completed = self.board.stream_gcode(lines, ack_callback=onAck,
+                                                is_canceled=lambda: run.canceled)
+        except Exception:
+            self.board._write('G90')
+            raise
+        finally:
+            self.board.get_positions()
+
+        if completed and lastIndex >= 0 and lastIndex not in lastLineOfWaypoint.values():
+            self.board.wait_for_idle()
+            reached(lastIndex)
+
+        if not completed:
+            # feed hold before resetting, so that GRBL keeps its position; the
+            # reset also restores absolute positioning
+            self.board._write('!')
+            time.sleep(self.settle_time)
+            self.board.soft_reset()
+            self.board.reset_stage()
+
     def closeEvent(self):
         self.board.close()
      
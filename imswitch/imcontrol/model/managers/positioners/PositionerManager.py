@@ -1,12 +1,119 @@
+import functools
+import threading
+import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
 
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
+
+from imswitch.imcommon.model import getMetricsRegistry, initLogger, StateCache
+
+_metrics = getMetricsRegistry()
+_moveHistogram = _metrics.histogram(
+    'imswitch_positioner_move_seconds', 'Time spent in positioner move calls'
+)
+_moveErrorsCounter = _metrics.counter(
+    'imswitch_positioner_move_errors_total', 'Number of positioner move calls that raised'
+)
+
+
+@dataclass
+class Waypoint:
+    """ A point on a trajectory, see PositionerManager.runTrajectory. """
+
+    position: Dict[str, float]
+    """ Absolute target position for each axis that should move, in the
+    format ``{ axis: position }``. """
+
+    speed: Optional[float] = None
+    """ Speed to move to the waypoint with, in the units that the
+    positioner uses. None means the current speed of each axis. """
+
+    dwell: float = 0.0
+    """ Time in seconds to wait at the waypoint before moving on. """
+
+    trigger: bool = False
+    """ Whether to fire the controller's trigger output once the waypoint is
+    reached, for positioners that support it. """
+
+    @classmethod
+    def fromAny(cls, waypoint):
+        """ Creates a Waypoint from a Waypoint, a dict with the fields above
+        or a dict of axis positions. """
+        if isinstance(waypoint, cls):
+            return waypoint
+        if 'position' in waypoint:
+            return cls(**waypoint)
+        return cls(position=dict(waypoint))
+
+
+@dataclass
+class TrajectoryRun:
+    """ Handle to a trajectory that is running on a positioner. """
+
+    waypoints: List[Waypoint]
+    progressCallback: Optional[Callable[[int, Waypoint], None]] = None
+    lastReachedIndex: int = -1
+    error: Optional[Exception] = None
+    _doneEvent: threading.Event = field(default_factory=threading.Event, repr=False)
+    _cancelEvent: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        """ Whether the trajectory has finished, was canceled or failed. """
+        return self._doneEvent.is_set()
+
+    @property
+    def canceled(self) -> bool:
+        """ Whether cancellation of the trajectory has been requested. """
+        return self._cancelEvent.is_set()
+
+    def cancel(self) -> None:
+        """ Requests the trajectory to stop. Waypoints that have not been sent
+        to the controller yet are skipped. """
+        self._cancelEvent.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """ Blocks until the trajectory is done, and returns whether it did
+        finish within the timeout. Re-raises the error that aborted the
+        trajectory, if any. """
+        finished = self._doneEvent.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return finished
+
+    def dwell(self, duration: float) -> None:
+        """ Waits for the specified number of seconds, or until the
+        trajectory is canceled. """
+        if duration > 0:
+            self._cancelEvent.wait(duration)
+
+    def reachedWaypoint(self, index: int) -> None:
+        """ Called by positioners once the waypoint with the specified index
+        has been reached. """
+        self.lastReachedIndex = index
+        if self.progressCallback is not None:
+            self.progressCallback(index, self.waypoints[index])
 
 
 class PositionerManager(ABC):
     """ Abstract base class for managers that control positioners. Each type of
     positioner corresponds to a manager derived from this class. """
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Instrument move implementations so that all callers are measured
+        if 'move' in cls.__dict__:
+            cls.move = _instrumentMove(cls.__dict__['move'])
+
+        # Serve position reads from the state cache, and drop the cached
+        # position whenever the positioner is moved or its position is set
+        if 'getPosition' in cls.__dict__:
+            cls.getPosition = _cachedGetPosition(cls.__dict__['getPosition'])
+        for methodName in _positionChangingMethods:
+            if methodName in cls.__dict__ and callable(cls.__dict__[methodName]):
+                setattr(cls, methodName, _invalidatesPosition(cls.__dict__[methodName]))
+
     @abstractmethod
     def __init__(self, positionerInfo, name: str, initialPosition: Dict[str, float]):
         """
@@ -41,6 +148,18 @@ class PositionerManager(ABC):
 
         self.__forPositioning = positionerInfo.forPositioning
         self.__forScanning = positionerInfo.forScanning
+        self._stateCache = StateCache(
+            name, positionerInfo.managerProperties.get('stateCacheTTL', 1.0)
+        )
+
+        # Latest position read back from the device, shared with the polling
+        # thread and waitUntilSettled
+        self._positionSampleCondition = threading.Condition()
+        self._positionSample = None  # (position, timestamp)
+        self._positionSampleCount = 0
+        self._pollingThread = None
+        self._pollingStopEvent = None
+
         if not positionerInfo.forPositioning and not positionerInfo.forScanning:
             raise ValueError('At least one of forPositioning and forScanning must be set in'
                              ' PositionerInfo.')
@@ -96,6 +215,93 @@ class PositionerManager(ABC):
         the positioner controls multiple axes, the axis must be specified. """
         pass
 
+    def getPosition(self, fresh: bool = False) -> Dict[str, float]:
+        """ Returns the position of each axis, read back from the device by
+        derived classes that support it. Reads are cached for
+        ``stateCacheTTL`` seconds (set in managerProperties, defaults to 1)
+        and the cache is cleared whenever the positioner is moved; pass
+        fresh=True to always query the device. """
+        return self.position
+
+    def invalidateStateCache(self) -> None:
+        """ Drops all cached values read back from the device, e.g. after it
+        was moved by something outside of ImSwitch. """
+        stateCache = getattr(self, '_stateCache', None)
+        if stateCache is not None:
+            stateCache.invalidate()
+
+    @property
+    def lastPositionSample(self) -> Optional[Tuple[Dict[str, float], float]]:
+        """ The position that was most recently read back from the device,
+        as a tuple ``(position, timestamp)`` where timestamp is taken from
+        ``time.monotonic()``. None if the position has not been read yet. """
+        with self._positionSampleCondition:
+            return self._positionSample
+
+    @property
+    def canReadPosition(self) -> bool:
+        """ Whether getPosition reads the position back from the device. If
+        not, it returns the commanded position and waitUntilSettled can't tell
+        whether the positioner is still moving. """
+        return False
+
+    @property
+    def isPollingPosition(self) -> bool:
+        """ Whether the position is being read back in the background. """
+        return self._pollingThread is not None and self._pollingThread.is_alive()
+
+    def startPositionPolling(self, interval: float) -> None:
+        """ Starts reading the position back from the device every interval
+        seconds on a background thread. The readings are kept in the state
+        cache, so that getPosition calls don't have to wait for the device. """
+        self.stopPositionPolling()
+        self._pollingStopEvent = threading.Event()
+        self._pollingThread = threading.Thread(
+            target=self._pollPosition, args=(interval, self._pollingStopEvent),
+            name=f'{self.name}PositionPolling', daemon=True
+        )
+        self._pollingThread.start()
+
+    def stopPositionPolling(self) -> None:
+        """ Stops reading the position back in the background. """
+        if self._pollingThread is None:
+            return
+        self._pollingStopEvent.set()
+        if self._pollingThread is not threading.current_thread():
+            self._pollingThread.join()
+        self._pollingThread = None
+
+    def waitUntilSettled(self, tolerance: float = 1.0, timeout: float = 10.0,
+                         axes: Optional[List[str]] = None,
+                         target: Optional[Dict[str, float]] = None) -> bool:
+        """ Blocks until the position read back from the device is within
+        tolerance of the target position and has stopped changing, i.e. two
+        consecutive readings differ by at most tolerance. The target defaults
+        to the last commanded position. Returns whether the positioner settled
+        before the timeout (in seconds) expired. """
+        axes = list(axes) if axes is not None else list(self.axes)
+        target = dict(self._position) if target is None else target
+        deadline = time.monotonic() + timeout
+
+        previousPosition = None
+        with self._positionSampleCondition:
+            sampleCount = self._positionSampleCount
+        while True:
+            sample = self._waitForPositionSample(sampleCount, deadline)
+            if sample is None:
+                return False
+            position, sampleCount = sample
+
+            onTarget = all(abs(position[axis] - target[axis]) <= tolerance
+                           for axis in axes if axis in position and axis in target)
+            stationary = previousPosition is not None and all(
+                abs(position[axis] - previousPosition[axis]) <= tolerance
+                for axis in axes if axis in position and axis in previousPosition
+            )
+            if onTarget and stationary:
+                return True
+            previousPosition = position
+
     # @abstractmethod
     # def _set_position(self, pos, axis):
     #     pass
@@ -110,9 +316,158 @@ class PositionerManager(ABC):
 
         pass
 
+    def runTrajectory(self, waypoints: List[Waypoint],
+                      progressCallback: Optional[Callable[[int, Waypoint], None]] = None,
+                      is_blocking: bool = False) -> TrajectoryRun:
+        """ Moves through a sequence of waypoints on a background thread and
+        returns a handle to the running trajectory. Positioners whose
+        controller can queue moves stream the whole trajectory in bulk;
+        others approach one waypoint at a time. progressCallback is called
+        from the trajectory thread with the index of each waypoint that is
+        reached, after its dwell time. """
+        run = TrajectoryRun([Waypoint.fromAny(waypoint) for waypoint in waypoints],
+                            progressCallback)
+        thread = threading.Thread(target=self._runTrajectoryThread, args=(run,),
+                                  name=f'{self.name}Trajectory', daemon=True)
+        thread.start()
+        if is_blocking:
+            run.wait()
+        return run
+
     def finalize(self) -> None:
         """ Close/cleanup positioner. """
-        pass
+        self.stopPositionPolling()
+
+    def _executeTrajectory(self, run: TrajectoryRun) -> None:
+        """ Moves through the waypoints of run, calling run.reachedWaypoint
+        for each of them. Derived classes whose controller can queue moves
+        should override this. The default implementation uses relative moves
+        and ignores the speed and trigger flag of each waypoint. """
+        for index, waypoint in enumerate(run.waypoints):
+            if run.canceled:
+                return
+            for axis, target in waypoint.position.items():
+                distance = target - self._position[axis]
+                if distance != 0:
+                    self.move(distance, axis)
+            run.dwell(waypoint.dwell)
+            run.reachedWaypoint(index)
+
+    def _runTrajectoryThread(self, run):
+        try:
+            self._executeTrajectory(run)
+        except Exception as e:
+            initLogger(self, instanceName=self.name).error(f'Trajectory failed: {e}')
+            run.error = e
+        finally:
+            self.invalidateStateCache()
+            run._doneEvent.set()
+
+    def _recordPositionSample(self, position):
+        with self._positionSampleCondition:
+            self._positionSample = (dict(position), time.monotonic())
+            self._positionSampleCount += 1
+            self._positionSampleCondition.notify_all()
+        return position
+
+    def _waitForPositionSample(self, afterCount, deadline):
+        """ Returns a position reading newer than reading number afterCount
+        together with its number, or None if the deadline passed first. """
+        if self.isPollingPosition:
+            with self._positionSampleCondition:
+                if not self._positionSampleCondition.wait_for(
+                    lambda: self._positionSampleCount > afterCount,
+                    timeout=max(0.0, deadline - time.monotonic())
+                ):
+                    return None
+                return self._positionSample[0], self._positionSampleCount
+
+        # Not polling, read the position ourselves at a limited rate, retrying failed reads
+        lastReadTime = self.lastPositionSample[1] if self.lastPositionSample is not None else None
+        while True:
+            if lastReadTime is not None:
+                waitTime = _settlePollInterval - (time.monotonic() - lastReadTime)
+                time.sleep(max(0.0, min(waitTime, deadline - time.monotonic())))
+            if time.monotonic() > deadline:
+                return None
+            try:
+                position = self.getPosition(fresh=True)
+            except Exception as e:
+                initLogger(self, instanceName=self.name).warning(f'Failed to read position: {e}')
+                lastReadTime = time.monotonic()
+                continue
+            with self._positionSampleCondition:
+                return dict(position), self._positionSampleCount
+
+    def _pollPosition(self, interval, stopEvent):
+        logger = initLogger(self, instanceName=self.name)
+        while not stopEvent.is_set():
+            startTime = time.monotonic()
+            try:
+                self.getPosition(fresh=True)
+            except Exception as e:
+                logger.warning(f'Failed to read position: {e}')
+            stopEvent.wait(max(0.0, interval - (time.monotonic() - startTime)))
+
+
+def _instrumentMove(moveFunc):
+    if getattr(moveFunc, '_instrumented', False):
+        return moveFunc
+
+    @functools.wraps(moveFunc)
+    def wrapper(self, *args, **kwargs):
+        axis = kwargs['axis'] if 'axis' in kwargs else (args[1] if len(args) > 1 else '')
+        startTime = time.perf_counter()
+        try:
+            return moveFunc(self, *args, **kwargs)
+        except Exception:
+            _moveErrorsCounter.inc(positioner=self.name, axis=axis)
+            raise
+        finally:
+            _moveHistogram.observe(time.perf_counter() - startTime,
+                                   positioner=self.name, axis=axis)
+
+    wrapper._instrumented = True
+    return wrapper
+
+
+_positionChangingMethods = ('move', 'setPosition', 'doHome', 'homing')
+_settlePollInterval = 0.05
+
+
+def _cachedGetPosition(getPositionFunc):
+    if getattr(getPositionFunc, '_cached', False):
+        return getPositionFunc
+
+    @functools.wraps(getPositionFunc)
+    def wrapper(self, *args, fresh=False, **kwargs):
+        stateCache = getattr(self, '_stateCache', None)
+        if stateCache is None or args or kwargs:
+            return getPositionFunc(self, *args, **kwargs)
+        # copies, so that neither the caller nor the positioner can change the cached position
+        position = stateCache.get(
+            'position', lambda: self._recordPositionSample(dict(getPositionFunc(self))),
+            fresh=fresh
+        )
+        return dict(position)
+
+    wrapper._cached = True
+    return wrapper
+
+
+def _invalidatesPosition(func):
+    if getattr(func, '_invalidatesPosition', False):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.invalidateStateCache()
+
+    wrapper._invalidatesPosition = True
+    return wrapper
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
@@ -15,6 +15,11 @@ class SQUIDStageManager(PositionerManager):
         ]
         self.__logger = initLogger(self, instanceName=name)
 
+        # read back the position in the background if requested
+        pollingInterval = positionerInfo.managerProperties.get('positionPollingInterval')
+        if pollingInterval:
+            self.startPositionPolling(pollingInterval)
+
     def move(self, value, axis, speed=1000):
         if axis == 'X':
             self._rs232manager._squid.move_x_usteps(int(value))
@@ -34,18 +39,23 @@ class SQUIDStageManager(PositionerManager):
         self._position[axis] = value
 
     def getPosition(self):
-        posX,posY,posZ,posTheta = self._rs232manager._squid.get_pos() 
-        self._position["X"]=posX
-        self._position["Y"]=posY
-        self._position["Z"]=posZ
-        return self._position
+        # the read-back position, self._position keeps the commanded one
+        posX,posY,posZ,posTheta = self._rs232manager._squid.get_pos()
+        return {"X": posX, "Y": posY, "Z": posZ}
         
+    @property
+    def canReadPosition(self):
+        return True
+
     def is_busy(self):
         return self._rs232manager._squid.is_busy()      
 
+    def waitUntilSettled(self, tolerance=1.0, timeout=10.0, axes=None, target=None):
+        # the microcontroller reports when it has executed all queued moves
+        return self._rs232manager._squid.wait_until_idle(timeout)
+
     def get_abs(self, axis=1):
-        self._position = self._rs232manager._squid.get_pos()
-        return self._position["Z"]
+        return self.getPosition(fresh=True)["Z"]
 
     def closeEvent(self):
         self._rs232manager._squid.close()
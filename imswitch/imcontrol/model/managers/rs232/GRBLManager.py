@@ -48,10 +48,13 @@ class GRBLManager:
     def query(self, arg: str) -> str:
         """ Sends the specified command to the RS232 device and returns a
         string encoded from the received bytes. """
-        return self._board._write(arg)
+        command = self._board._write(arg)
+        if command is None:
+            return ''  # realtime commands are not acknowledged
+        return '\n'.join(command.wait())
 
     def finalize(self):
-        self.self._board.close()
+        self._board.close()
 
 
 
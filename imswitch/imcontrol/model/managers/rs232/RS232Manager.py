@@ -1,4 +1,16 @@
-from imswitch.imcommon.model import initLogger
+from imswitch.imcommon.model import initLogger, getMetricsRegistry
+from imswitch.imcontrol.model.serialtransport import SerialTransport, PRIORITY_NORMAL
+
+_metrics = getMetricsRegistry()
+_queryHistogram = _metrics.histogram(
+    'imswitch_rs232_query_seconds', 'Round-trip time of RS232 queries per port'
+)
+_writesCounter = _metrics.counter(
+    'imswitch_rs232_writes_total', 'Number of RS232 writes per port'
+)
+_errorsCounter = _metrics.counter(
+    'imswitch_rs232_errors_total', 'Number of failed RS232 queries and writes per port'
+)
 
 
 class RS232Manager:
@@ -7,6 +19,10 @@ class RS232Manager:
     with all the standard serial communication protocol parameters as defined
     in the hardware control configuration.
 
+    All communication with the port goes through a transport thread, so that
+    devices sharing the port don't race each other; set-value commands can be
+    queued without waiting and are coalesced while queued.
+
     Manager properties:
 
     - ``port``
@@ -29,19 +45,49 @@ class RS232Manager:
         self._name = name
         self._port = rs232Info.managerProperties['port']
         self._rs232port = self._getRS232port(self._port, self._settings)
+        self._transport = SerialTransport(name)
 
-    def query(self, arg: str) -> str:
+    def query(self, arg: str, priority: int = PRIORITY_NORMAL) -> str:
         """ Sends the specified command to the RS232 device and returns a
         string encoded from the received bytes. """
-        return self._rs232port.query(arg)
+        return self._transport.call(self._query, arg, priority=priority)
+
+    def queryAsync(self, arg: str, priority: int = PRIORITY_NORMAL, coalesceKey=None):
+        """ Queues the specified command without waiting for the reply, and
+        returns a request whose result() is the reply. If a command with the
+        same coalesceKey is still queued, it is replaced by this one. """
+        return self._transport.submit(self._query, arg, priority=priority,
+                                      coalesceKey=coalesceKey)
 
-    def write(self, arg: str):
+    def write(self, arg: str, priority: int = PRIORITY_NORMAL):
         """ Sends the specified command to the RS232 device. """
-        return self._rs232port.write(arg)
+        return self._transport.call(self._write, arg, priority=priority)
+
+    def latencyStats(self):
+        """ Returns statistics of the time from queueing to completion of
+        recent commands, in seconds. """
+        return self._transport.latencyStats()
 
     def finalize(self):
+        self._transport.close()
         self._rs232port.close()
 
+    def _query(self, arg):
+        try:
+            with _queryHistogram.time(port=self._name):
+                return self._rs232port.query(arg)
+        except Exception:
+            _errorsCounter.inc(port=self._name)
+            raise
+
+    def _write(self, arg):
+        _writesCounter.inc(port=self._name)
+        try:
+            return self._rs232port.write(arg)
+        except Exception:
+            _errorsCounter.inc(port=self._name)
+            raise
+
     def _getRS232port(self, port, settings):
         try:
             from imswitch.imcontrol.model.interfaces.RS232Driver import generateDriverClass
@@ -0,0 +1,275 @@
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class AxisKinematics:
+    """ Motion properties of one stage axis, used to estimate travel times. """
+
+    speed: float = 1.0
+    """ Maximum speed, in position units per second. """
+
+    acceleration: float = np.inf
+    """ Acceleration, in position units per second squared. """
+
+    backlash: float = 0.0
+    """ Extra distance that the axis has to travel when it reverses
+    direction. """
+
+    def travelTime(self, distance):
+        """ Returns the time it takes to travel the specified distance(s) with
+        a trapezoidal velocity profile. """
+        distance = np.abs(distance)
+        if np.isinf(self.acceleration):
+            return distance / self.speed
+        rampDistance = self.speed ** 2 / self.acceleration
+        return np.where(distance >= rampDistance,
+                        distance / self.speed + self.speed / self.acceleration,
+                        2 * np.sqrt(distance / self.acceleration))
+
+
+@dataclass
+class ScanPath:
+    """ An ordering of scan positions, as returned by planScanPath. """
+
+    positions: np.ndarray
+    """ The positions in the order in which they should be visited, as an
+    array of shape ``(N, nAxes)``. """
+
+    order: np.ndarray
+    """ Indices into the positions that were passed to the planner. """
+
+    method: str
+    """ Name of the method that produced the ordering. """
+
+    estimatedTime: float
+    """ Estimated time in seconds spent travelling between the positions. """
+
+
+def serpentineGrid(xMin, xMax, xStep, yMin, yMax, yStep, fastAxis=0):
+    """ Returns the positions of a rectangular grid spanning
+    ``[xMin, xMax)`` and ``[yMin, yMax)`` as an array of shape ``(N, 2)``, in
+    serpentine order along the fast axis (0 for x, 1 for y). """
+    xs = np.arange(xMin, xMax, xStep)
+    ys = np.arange(yMin, yMax, yStep)
+    fast, slow = (xs, ys) if fastAxis == 0 else (ys, xs)
+
+    fastGrid = np.tile(fast, (len(slow), 1))
+    fastGrid[1::2] = fastGrid[1::2, ::-1]
+    slowGrid = np.repeat(slow, len(fast)).reshape(len(slow), len(fast))
+
+    grid = np.empty((len(slow) * len(fast), 2), dtype=np.result_type(xs, ys))
+    grid[:, fastAxis] = fastGrid.ravel()
+    grid[:, 1 - fastAxis] = slowGrid.ravel()
+    return grid
+
+
+def orderSerpentine(positions, fastAxis=0, rowTolerance=None):
+    """ Returns the indices that order the positions in rows along the fast
+    axis, alternating direction between rows. Positions whose slow-axis
+    coordinates differ by no more than rowTolerance share a row; by default,
+    the tolerance is half of the smallest spacing between rows. """
+    positions = np.asarray(positions, dtype=float)
+    slow = positions[:, 1 - fastAxis]
+    fast = positions[:, fastAxis]
+
+    rowIds = _quantize(slow, rowTolerance)
+    rowRanks = np.unique(rowIds, return_inverse=True)[1]
+    direction = np.where(rowRanks % 2 == 0, 1, -1)
+    return np.lexsort((fast * direction, rowRanks))
+
+
+def orderHilbert(positions):
+    """ Returns the indices that order the positions along a Hilbert
+    space-filling curve over the grid of distinct x and y coordinates, which
+    keeps consecutive positions close to each other in both axes. """
+    positions = np.asarray(positions, dtype=float)
+    x = np.unique(_quantize(positions[:, 0]), return_inverse=True)[1]
+    y = np.unique(_quantize(positions[:, 1]), return_inverse=True)[1]
+    size = 1 << int(np.ceil(np.log2(max(x.max(initial=0), y.max(initial=0)) + 1)))
+
+    distance = np.zeros(len(positions), dtype=np.int64)
+    x = x.astype(np.int64)
+    y = y.astype(np.int64)
+    s = size // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        distance += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant
+        flip = ~ry & rx
+        x = np.where(flip, s - 1 - x, x)
+        y = np.where(flip, s - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s //= 2
+    return np.argsort(distance, kind='stable')
+
+
+def orderNearestNeighbour(positions, start=None, kinematics=None):
+    """ Returns the indices that order the positions by always moving to the
+    closest (in travel time) position that has not been visited yet,
+    starting from the position closest to start. """
+    positions = np.asarray(positions, dtype=float)
+    kinematics = _defaultKinematics(kinematics, positions.shape[1])
+
+    remaining = np.ones(len(positions), dtype=bool)
+    order = np.empty(len(positions), dtype=np.int64)
+    current = positions[0] if start is None else np.asarray(start, dtype=float)
+    for i in range(len(positions)):
+        times = _segmentTimes(current, positions, kinematics)
+        times[~remaining] = np.inf
+        nearest = int(np.argmin(times))
+        order[i] = nearest
+        remaining[nearest] = False
+        current = positions[nearest]
+    return order
+
+
+def improveTwoOpt(positions, order, kinematics=None, maxPasses=50):
+    """ Improves an ordering of the positions by reversing sub-paths for as
+    long as that shortens the total travel time (2-opt). The first position
+    of the ordering is kept. """
+    positions = np.asarray(positions, dtype=float)
+    kinematics = _defaultKinematics(kinematics, positions.shape[1])
+    order = np.array(order, dtype=np.int64)
+    n = len(order)
+    if n < 4:
+        return order
+
+    times = np.stack([_segmentTimes(position, positions, kinematics)
+                      for position in positions])
+    for _ in range(maxPasses):
+        improved = False
+        for i in range(n - 2):
+            a, b = order[i], order[i + 1]
+            c = order[i + 2:]
+            d = np.append(order[i + 3:], -1)
+            # change in time from replacing edges (a, b) and (c, d) with (a, c) and (b, d)
+            delta = times[a, c] - times[a, b]
+            hasNext = d >= 0
+            delta[hasNext] += times[b, d[hasNext]] - times[c[hasNext], d[hasNext]]
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                order[i + 1:i + 3 + j] = order[i + 1:i + 3 + j][::-1]
+                improved = True
+        if not improved:
+            break
+    return order
+
+
+def estimateTravelTime(positions, kinematics=None, start=None):
+    """ Returns the estimated time in seconds it takes to visit the positions
+    in order, taking the speed, acceleration and backlash of each axis into
+    account. Axes are assumed to move simultaneously. """
+    positions = np.asarray(positions, dtype=float)
+    if len(positions) == 0:
+        return 0.0
+    kinematics = _defaultKinematics(kinematics, positions.shape[1])
+    if start is not None:
+        positions = np.vstack([np.asarray(start, dtype=float), positions])
+
+    steps = np.diff(positions, axis=0)
+    axisTimes = np.zeros_like(steps)
+    for axis, axisKinematics in enumerate(kinematics):
+        distances = np.abs(steps[:, axis])
+        if axisKinematics.backlash:
+            directions = np.sign(steps[:, axis])
+            moving = directions != 0
+            movingDirections = directions[moving]
+            reversals = np.zeros(len(movingDirections), dtype=bool)
+            reversals[1:] = movingDirections[1:] != movingDirections[:-1]
+            distances[np.flatnonzero(moving)[reversals]] += axisKinematics.backlash
+        axisTimes[:, axis] = axisKinematics.travelTime(distances)
+    return float(axisTimes.max(axis=1, initial=0).sum())
+
+
+def planScanPath(positions, method='auto', kinematics=None, start=None,
+                 fastAxis=0) -> ScanPath:
+    """ Orders scan positions so that the stage spends as little time as
+    possible travelling between them.
+
+    Args:
+        positions: Array-like of shape ``(N, nAxes)``.
+        method: One of "serpentine", "hilbert", "tsp" (nearest neighbour
+          followed by 2-opt) or "auto", which picks whichever of these has
+          the shortest estimated travel time.
+        kinematics: Sequence with one AxisKinematics per axis. Defaults to
+          unit speed, i.e. travel time equals the largest axis distance.
+        start: Current stage position, if known.
+        fastAxis: Axis that serpentine rows run along.
+    """
+    positions = np.asarray(positions)
+    if len(positions) == 0:
+        return ScanPath(positions, np.array([], dtype=np.int64), method, 0.0)
+    kinematics = _defaultKinematics(kinematics, positions.shape[1])
+
+    methods = ['serpentine', 'hilbert', 'tsp'] if method == 'auto' else [method]
+    best = None
+    for candidate in methods:
+        if candidate == 'serpentine':
+            order = orderSerpentine(positions, fastAxis)
+        elif candidate == 'hilbert':
+            order = orderHilbert(positions)
+        elif candidate == 'tsp':
+            if len(methods) > 1 and len(positions) > _maxTSPSize:
+                continue
+            order = orderNearestNeighbour(positions, start, kinematics)
+            if len(positions) <= _maxTSPSize:
+                order = improveTwoOpt(positions, order, kinematics)
+        else:
+            raise ValueError(f'Unknown scan path method "{candidate}"')
+
+        estimatedTime = estimateTravelTime(positions[order], kinematics, start)
+        if best is None or estimatedTime < best.estimatedTime:
+            best = ScanPath(positions[order], order, candidate, estimatedTime)
+    return best
+
+
+def _defaultKinematics(kinematics: Optional[Sequence[AxisKinematics]], nAxes):
+    if kinematics is None:
+        return [AxisKinematics()] * nAxes
+    if len(kinematics) != nAxes:
+        raise ValueError(f'Expected kinematics for {nAxes} axes, got {len(kinematics)}')
+    return list(kinematics)
+
+
+def _segmentTimes(fromPosition, toPositions, kinematics):
+    return np.max([axisKinematics.travelTime(toPositions[:, axis] - fromPosition[axis])
+                   for axis, axisKinematics in enumerate(kinematics)], axis=0)
+
+
+def _quantize(values, tolerance=None):
+    """ Maps values that lie within tolerance of each other to the same
+    integer. """
+    values = np.asarray(values, dtype=float)
+    uniqueValues = np.unique(values)
+    if tolerance is None:
+        spacings = np.diff(uniqueValues)
+        spacings = spacings[spacings > 1e-9]
+        tolerance = spacings.min() / 2 if len(spacings) > 0 else 0
+    if tolerance <= 0:
+        return np.unique(values, return_inverse=True)[1]
+    return np.round((values - uniqueValues[0]) / (2 * tolerance)).astype(np.int64)
+
+
+_maxTSPSize = 1500
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
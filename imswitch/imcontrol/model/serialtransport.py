@@ -0,0 +1,178 @@
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from imswitch.imcommon.model import getMetricsRegistry, initLogger
+
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+_metrics = getMetricsRegistry()
+_queueWaitHistogram = _metrics.histogram(
+    'imswitch_rs232_queue_wait_seconds', 'Time RS232 requests spend queued per port'
+)
+_coalescedCounter = _metrics.counter(
+    'imswitch_rs232_coalesced_total', 'Number of RS232 requests merged into a queued one per port'
+)
+_queueDepthGauge = _metrics.gauge(
+    'imswitch_rs232_queue_depth', 'Number of RS232 requests waiting per port'
+)
+
+
+class TransportRequest:
+    """ A request queued on a SerialTransport. """
+
+    def __init__(self, func, args, priority, coalesceKey):
+        self.priority = priority
+        self.coalesceKey = coalesceKey
+        self.queuedTime = time.perf_counter()
+        self._func = func
+        self._args = args
+        self._sequenceNumber = None  # of the queue entry that is executed, others are stale
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """ Waits until the request has been executed and returns its result,
+        or raises the exception it raised. """
+        if not self._done.wait(timeout):
+            raise TimeoutError(f'Request not executed within {timeout} s')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def _execute(self):
+        try:
+            self._result = self._func(*self._args)
+        except Exception as e:
+            self._exception = e
+        finally:
+            self._done.set()
+
+
+class SerialTransport:
+    """ Serializes all communication with one port on a dedicated thread, so
+    that devices sharing the port don't interleave their requests and each
+    response is returned to the request that caused it. Requests are executed
+    in priority order (first come, first served within the same priority).
+    Requests with a coalesce key, e.g. set-value commands, replace a request
+    with the same key that is still waiting, so that only the latest value is
+    sent. The merged request is moved to the place and priority of the latest
+    one, so it is still sent after the requests that were submitted before
+    it. """
+
+    def __init__(self, name, latencyHistorySize=1000):
+        self.__logger = initLogger(self, instanceName=name)
+        self._name = name
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._coalescable = {}
+        self._latencies = deque(maxlen=latencyHistorySize)
+        self._numCoalesced = 0
+        self._numStale = 0  # queue entries of requests that were moved by coalescing
+        self._thread = threading.Thread(target=self._run, name=f'SerialTransport-{name}',
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, priority=PRIORITY_NORMAL, coalesceKey=None):
+        """ Queues func(*args) and returns a TransportRequest without waiting
+        for it to be executed. """
+        with self._lock:
+            if coalesceKey is not None and coalesceKey in self._coalescable:
+                # the waiting request is sent with the latest value in the place of the latest one
+                request = self._coalescable[coalesceKey]
+                request._func, request._args = func, args
+                request.priority = priority
+                self._numStale += 1
+                self._numCoalesced += 1
+                _coalescedCounter.inc(port=self._name)
+            else:
+                request = TransportRequest(func, args, priority, coalesceKey)
+                if coalesceKey is not None:
+                    self._coalescable[coalesceKey] = request
+
+            request._sequenceNumber = next(self._sequence)
+            self._queue.put((priority, request._sequenceNumber, request))
+            _queueDepthGauge.set(self._numQueued(), port=self._name)
+        return request
+
+    def call(self, func, *args, priority=PRIORITY_NORMAL, timeout=None):
+        """ Executes func(*args) on the transport thread and returns its
+        result. """
+        if threading.current_thread() is self._thread:
+            return func(*args)  # already on the transport thread, e.g. a nested request
+        return self.submit(func, *args, priority=priority).result(timeout)
+
+    def latencyStats(self):
+        """ Returns statistics, in seconds, of the time from queueing to
+        completion of recent requests. """
+        latencies = np.array(self._latencies)
+        with self._lock:
+            numQueued = self._numQueued()
+        stats = {'count': len(latencies), 'queued': numQueued, 'coalesced': self._numCoalesced}
+        if len(latencies) > 0:
+            stats.update(mean=float(latencies.mean()),
+                         p50=float(np.percentile(latencies, 50)),
+                         p95=float(np.percentile(latencies, 95)),
+                         max=float(latencies.max()))
+        return stats
+
+    def close(self, timeout=None):
+        """ Executes all requests that are still queued and stops the
+        transport thread. """
+        self._queue.put((np.inf, next(self._sequence), None))
+        self._thread.join(timeout)
+
+    def _numQueued(self):
+        return self._queue.qsize() - self._numStale
+
+    def _run(self):
+        while True:
+            _, sequenceNumber, request = self._queue.get()
+            if request is None:
+                return
+
+            with self._lock:
+                if sequenceNumber != request._sequenceNumber:
+                    self._numStale -= 1  # moved further back in the queue by coalescing
+                    continue
+
+                # from here on, new requests with the same key are queued anew
+                if self._coalescable.get(request.coalesceKey) is request:
+                    del self._coalescable[request.coalesceKey]
+                _queueDepthGauge.set(self._numQueued(), port=self._name)
+            _queueWaitHistogram.observe(time.perf_counter() - request.queuedTime, port=self._name)
+
+            request._execute()
+            self._latencies.append(time.perf_counter() - request.queuedTime)
+            if request._exception is not None:
+                self.__logger.warning(f'Request failed: {request._exception}')
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
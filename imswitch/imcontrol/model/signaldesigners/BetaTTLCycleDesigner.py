@@ -1,6 +1,6 @@
 import numpy as np
 
-from .basesignaldesigners import TTLCycleDesigner
+from .basesignaldesigners import SegmentedSignal, TTLCycleDesigner
 
 
 class BetaTTLCycleDesigner(TTLCycleDesigner):
@@ -23,7 +23,14 @@ class BetaTTLCycleDesigner(TTLCycleDesigner):
         return 'ms'
 
     def make_signal(self, parameterDict, setupInfo, scanInfoDict=None):
+        signalDict = self.make_signal_stream(parameterDict, setupInfo, scanInfoDict)
+        if signalDict is None:
+            return None
+        return {target: signal.toArray() for target, signal in signalDict.items()}
 
+    def make_signal_stream(self, parameterDict, setupInfo, scanInfoDict=None):
+        """ Generates the TTL signals as SegmentedSignals, in which a line is
+        only stored once for all lines of a scan. """
         if not self.parameterCompatibility(parameterDict):
             self._logger.error('TTL parameters seem incompatible, this error should not be since'
                                ' this should be checked at program start-up')
@@ -45,7 +52,7 @@ class BetaTTLCycleDesigner(TTLCycleDesigner):
                 endSamp = int(np.round(parameterDict['TTL_end'][i][j] * sampleRate))
                 tmpSigArr[startSamp:endSamp] = True
 
-            signalDict[target] = np.copy(tmpSigArr)
+            signalDict[target] = SegmentedSignal.fromArray(np.copy(tmpSigArr))
 
         if scanInfoDict is not None:
             positions = scanInfoDict['positions']
@@ -59,11 +66,9 @@ class BetaTTLCycleDesigner(TTLCycleDesigner):
 
             # Tile and pad TTL signals according to sync parameters
             for target, signal in signalDict.items():
-                signal = np.tile(signal, positions[0])
+                signal = np.tile(signal.toArray(), positions[0])
                 signal = np.append(signal, np.zeros(TTLZeroPadSamples, dtype='bool'))
-                signal = np.tile(signal, positions[1] * positions[2])
-
-                signalDict[target] = signal
+                signalDict[target] = SegmentedSignal([(signal, positions[1] * positions[2])])
 
         return signalDict
 
@@ -1,7 +1,7 @@
 import numpy as np
 from scipy.interpolate import BPoly
 
-from .basesignaldesigners import ScanDesigner
+from .basesignaldesigners import ScanDesigner, SegmentedSignal
 
 from imswitch.imcommon.model import initLogger
 
@@ -16,6 +16,8 @@ class GalvoScanDesigner(ScanDesigner):
         super().__init__(*args, **kwargs)
 
         self.__logger = initLogger(self)
+        # evaluated curve pieces, which only depend on the parameters in the key
+        self.__curveCache = {}
 
         self._expectedParameters = ['target_device',
                                     'axis_length',
@@ -61,6 +63,13 @@ class GalvoScanDesigner(ScanDesigner):
         return True
 
     def make_signal(self, parameterDict, setupInfo):
+        sig_dict, axis_positions, scanInfoDict = self.make_signal_stream(parameterDict, setupInfo)
+        return ({target: signal.toArray() for target, signal in sig_dict.items()},
+                axis_positions, scanInfoDict)
+
+    def make_signal_stream(self, parameterDict, setupInfo):
+        """ Generates the scanning curves as SegmentedSignals, in which a
+        frame is only stored once for all frames of a 3D scan. """
         # time step of evaluated scanning curves [µs]
         self.__timestep = 1e6 / setupInfo.scan.sampleRate
         # arbitrary for now - should calculate this based on the abs(biggest) axis_centerpos and the
@@ -132,14 +141,17 @@ class GalvoScanDesigner(ScanDesigner):
             n_frames = int(self.axis_length[2] / self.axis_step_size[2])
             pixel_pos, line_pos, pad_betweenframes = self.__zero_pad_samelen(pixel_pos, line_pos)
             len_frame = len(pixel_pos)
-            pixel_pos, line_pos = self.__repeat_frames(pixel_pos, line_pos, n_frames)
-            frame_pos = self.__generate_step_scan_stepwise(len_frame, n_frames, self.axis_devs_order[2])
+            frame_pos = self.__generate_step_scan_stepwise(n_frames, self.axis_devs_order[2])
 
         # pad all signals
         if axis_count==2:
             pixel_axis_signal, line_axis_signal = self.__zero_padding_2axis(parameterDict, pixel_pos, line_pos)
+            pixel_axis_signal = SegmentedSignal.fromArray(pixel_axis_signal)
+            line_axis_signal = SegmentedSignal.fromArray(line_axis_signal)
         elif axis_count==3:
-            pixel_axis_signal, line_axis_signal, frame_axis_signal = self.__zero_padding_3axis(parameterDict, pixel_pos, line_pos, frame_pos)
+            pixel_axis_signal, line_axis_signal, frame_axis_signal = self.__zero_padding_3axis(
+                pixel_pos, line_pos, frame_pos, n_frames
+            )
 
         # create scan information dictionary
         pixels_line = int(self.axis_length[0] / self.axis_step_size[0])
@@ -168,8 +180,8 @@ class GalvoScanDesigner(ScanDesigner):
             scanInfoDict['scan_samples_period'] = samples_period - 1
             scanInfoDict['pixel_size_ax1'] = parameterDict['axis_step_size'][0]
             scanInfoDict['pixel_size_ax2'] = parameterDict['axis_step_size'][1]
-            scanInfoDict['minmax_pixel_axis'] = [min(pixel_axis_signal), max(pixel_axis_signal)]
-            scanInfoDict['minmax_line_axis'] = [min(line_axis_signal), max(line_axis_signal)]
+            scanInfoDict['minmax_pixel_axis'] = [pixel_axis_signal.min(), pixel_axis_signal.max()]
+            scanInfoDict['minmax_line_axis'] = [line_axis_signal.min(), line_axis_signal.max()]
             scanInfoDict['img_dims'] = [pixels_line, n_lines]
         elif axis_count==3:
             sig_dict = {parameterDict['target_device'][0]: pixel_axis_signal,
@@ -179,9 +191,9 @@ class GalvoScanDesigner(ScanDesigner):
             scanInfoDict['pixel_size_ax1'] = parameterDict['axis_step_size'][0]
             scanInfoDict['pixel_size_ax2'] = parameterDict['axis_step_size'][1]
             scanInfoDict['pixel_size_ax3'] = parameterDict['axis_step_size'][2]
-            scanInfoDict['minmax_pixel_axis'] = [min(pixel_axis_signal), max(pixel_axis_signal)]
-            scanInfoDict['minmax_line_axis'] = [min(line_axis_signal), max(line_axis_signal)]
-            scanInfoDict['minmax_frame_axis'] = [min(frame_axis_signal), max(frame_axis_signal)]
+            scanInfoDict['minmax_pixel_axis'] = [pixel_axis_signal.min(), pixel_axis_signal.max()]
+            scanInfoDict['minmax_line_axis'] = [line_axis_signal.min(), line_axis_signal.max()]
+            scanInfoDict['minmax_frame_axis'] = [frame_axis_signal.min(), frame_axis_signal.max()]
             scanInfoDict['img_dims'] = [pixels_line, n_lines, n_frames]
             scanInfoDict['scan_throw_zeropos_betweenframes'] = pad_betweenframes
         else:
@@ -190,8 +202,8 @@ class GalvoScanDesigner(ScanDesigner):
             scanInfoDict['scan_samples_period'] = samples_period - 1
             scanInfoDict['pixel_size_ax1'] = parameterDict['axis_step_size'][0]
             scanInfoDict['pixel_size_ax2'] = parameterDict['axis_step_size'][1]
-            scanInfoDict['minmax_pixel_axis'] = [min(pixel_axis_signal), max(pixel_axis_signal)]
-            scanInfoDict['minmax_line_axis'] = [min(line_axis_signal), max(line_axis_signal)]
+            scanInfoDict['minmax_pixel_axis'] = [pixel_axis_signal.min(), pixel_axis_signal.max()]
+            scanInfoDict['minmax_line_axis'] = [line_axis_signal.min(), line_axis_signal.max()]
             scanInfoDict['img_dims'] = [pixels_line, n_lines]
 
         # plot scan signal
@@ -230,11 +242,13 @@ class GalvoScanDesigner(ScanDesigner):
         """ Generate a smooth scanning curve with spline interpolation """
         n_lines = int(self.axis_length[1] / self.axis_step_size[1])  # number of lines
 
-        curve_poly, time_fix, pos_fix = self.__linescan_poly(parameterDict, v_max, a_max)
-        # calculate number of evaluation points for a line for decided timestep
-        n_eval = int(time_fix[-1] / self.__timestep)
+        line_key = ('line', self.axis_length[0], self.axis_centerpos[0], self.axis_step_size[0],
+                    parameterDict['sequence_time'], v_max, a_max)
+        line_eval, time_fix, pos_fix = self.__cached_curve(line_key, self.__evaluate_linescan,
+                                                           parameterDict, v_max, a_max)
+        n_eval = len(line_eval)
         # generate multiline curve for the whole frame
-        pos = self.__generate_smooth_multiline(curve_poly, time_fix, pos_fix, n_eval, n_lines)
+        pos = self.__generate_smooth_multiline(line_eval, n_lines)
         # add missing start and end piece
         pos_ret = self.__add_start_end(pos, pos_fix, v_max, a_max)
         return pos_ret, n_eval, n_lines
@@ -260,18 +274,9 @@ class GalvoScanDesigner(ScanDesigner):
         pos_ret = np.concatenate((pos_init, pos_steps, pos_final))
         return pos_ret
 
-    def __repeat_frames(self, pixel_pos, line_pos, n_frames):
-        """ Repeat pixel and line positions over multiple frames. """
-        pixel_pos_ret = pixel_pos
-        line_pos_ret = line_pos
-        for i in range(n_frames-1):
-            pixel_pos_ret = np.concatenate((pixel_pos_ret, pixel_pos))
-            line_pos_ret = np.concatenate((line_pos_ret, line_pos))
-        return pixel_pos_ret, line_pos_ret
-
-    def __generate_step_scan_stepwise(self, len_frame, n_frames, axis_name):
-        """ Generate a step-function scanning curve, with initial smooth
-        positioning """
+    def __generate_step_scan_stepwise(self, n_frames, axis_name):
+        """ Generate the positions of a step-function scanning curve, one
+        for each frame """
         l_scan = self.axis_length[2]
         c_scan = self.axis_centerpos[2]
         # create linspace for axis positions
@@ -279,10 +284,7 @@ class GalvoScanDesigner(ScanDesigner):
                      l_scan / (n_frames * 2) - l_scan / 2 + c_scan)
         if 'mock' in axis_name.lower():
             positions = positions - positions[0]
-        # repeat each middle element a number of times equal to the length of that between the
-        # faster axis repetitions
-        pos_ret = np.repeat(positions, len_frame)
-        return pos_ret
+        return positions
 
     def __get_axis_reps(self, pos, samples_period, n_lines):
         """ Get reps for each step on line axis, by looking at the maximum and
@@ -297,6 +299,25 @@ class GalvoScanDesigner(ScanDesigner):
         axis_reps = np.concatenate((first_line, rest_lines))
         return axis_reps
 
+    def __cached_curve(self, key, make_curve, *args):
+        """ Returns make_curve(*args), evaluated once per key and time step. """
+        key = key + (self.__timestep,)
+        if key not in self.__curveCache:
+            if len(self.__curveCache) >= 64:
+                self.__curveCache.clear()
+            self.__curveCache[key] = make_curve(*args)
+        return self.__curveCache[key]
+
+    def __evaluate_linescan(self, parameterDict, v_max, a_max):
+        """ Evaluate the one-line scanning curve at the time step, and return
+        it with the fixed points times and positions """
+        curve_poly, time_fix, pos_fix = self.__linescan_poly(parameterDict, v_max, a_max)
+        # calculate number of evaluation points for a line for decided timestep
+        n_eval = int(time_fix[-1] / self.__timestep)
+        line_eval = curve_poly(np.linspace(0, time_fix[-1], n_eval))
+        line_eval.setflags(write=False)
+        return line_eval, time_fix, pos_fix
+
     def __linescan_poly(self, parameterDict, v_max, a_max):
         """ Generate a Bernstein piecewise polynomial for a smooth one-line
         scanning curve, from the acquisition parameter settings, using
@@ -376,19 +397,18 @@ class GalvoScanDesigner(ScanDesigner):
         # return fixed points position and time
         return bpoly, time, pos
 
-    def __generate_smooth_multiline(self, pos_bpoly, time_fix, pos_fix, n_eval, n_lines):
-        """ Generate a smooth multiline curve by evaluating the polynomial with
-        the clock frequency used and copying it """
-        # get evaluation times for one line
-        x_eval = np.linspace(0, time_fix[-1], n_eval)
-        # evaluate polynomial
-        x_bpoly = pos_bpoly(x_eval)
-        pos_ret = []
-        # concatenate for number of lines in scan
-        pos_ret = np.tile(x_bpoly[:-1], n_lines - 1)
-        return pos_ret
+    def __generate_smooth_multiline(self, line_eval, n_lines):
+        """ Generate a smooth multiline curve by copying the curve of one line,
+        evaluated with the clock frequency used """
+        return np.tile(line_eval[:-1], n_lines - 1)
 
     def __init_positioning(self, initpos, v_max, a_max):
+        """ Generate a smooth initial positioning scanning curve from 0 to
+        initpos """
+        return self.__cached_curve(('init', initpos, v_max, a_max), self.__make_init_positioning,
+                                   initpos, v_max, a_max)
+
+    def __make_init_positioning(self, initpos, v_max, a_max):
         v_max = np.sign(initpos) * v_max
         a_max = np.sign(initpos) * a_max
 
@@ -455,10 +475,17 @@ class GalvoScanDesigner(ScanDesigner):
         t_eval = np.linspace(0, time[-1], n_eval)
         # evaluate polynomial
         poly_eval = bpoly(t_eval)
+        poly_eval.setflags(write=False)
         # return evaluated polynomial at the timestep I want
         return poly_eval
 
     def __final_positioning(self, initpos, v_max, a_max):
+        """ Generate a smooth final positioning scanning curve from initpos
+        to 0 """
+        return self.__cached_curve(('final', initpos, v_max, a_max), self.__make_final_positioning,
+                                   initpos, v_max, a_max)
+
+    def __make_final_positioning(self, initpos, v_max, a_max):
         """ Generate a polynomial for a smooth final positioning scanning
         curve, from the acquisition parameter settings """
         v_max = -np.sign(initpos) * v_max
@@ -527,6 +554,7 @@ class GalvoScanDesigner(ScanDesigner):
         t_eval = np.linspace(0, time[-1], n_eval)
         # evaluate polynomial
         poly_eval = bpoly(t_eval)
+        poly_eval.setflags(write=False)
         # return evaluated polynomial at the timestep I want
         return poly_eval
 
@@ -591,34 +619,20 @@ class GalvoScanDesigner(ScanDesigner):
         pos_ret2 = np.pad(pos2, padlen2, 'constant', constant_values=0)
         return pos_ret1, pos_ret2
 
-    def __zero_padding_3axis(self, parameterDict, pos1, pos2, pos3):
-        """ Pad zeros to the end of three scanning curves, for initial and final
-        settling of galvos """
+    def __zero_padding_3axis(self, pixel_frame, line_frame, frame_positions, n_frames):
+        """ Repeat the pixel and line axis curves of one frame for all frames,
+        step the frame axis between frames, and pad zeros to the start and
+        end of all three scanning curves, for initial and final settling of
+        galvos """
         padlen = int(round(self.__paddingtime / self.__timestep))
-        padlen1 = np.array([padlen, padlen])
-        padlen2 = np.array([padlen, padlen])
-        padlen3 = np.array([padlen, padlen])
-        # check that the length of pos1, pos2, and pos3 are identical
-        lendiff12 = len(pos1) - len(pos2)
-        lendiff13 = len(pos1) - len(pos3)
-        lendiff23 = len(pos2) - len(pos3)
-        # if not equal, add to the correct padding length to make them equal
-        if np.sum([abs(lendiff12),abs(lendiff13),abs(lendiff23)]) != 0:
-            longest = np.argmax([len(pos1), len(pos2), len(pos3)])
-            if longest==1:
-                padlen2 = padlen2 + np.array([0, abs(lendiff12)])
-                padlen3 = padlen3 + np.array([0, abs(lendiff13)])
-            elif longest==2:
-                padlen1 = padlen1 + np.array([0, abs(lendiff12)])
-                padlen3 = padlen3 + np.array([0, abs(lendiff23)])
-            elif longest==3:
-                padlen1 = padlen1 + np.array([0, abs(lendiff13)])
-                padlen2 = padlen2 + np.array([0, abs(lendiff23)])
-        
-        # pad position arrays
-        pos_ret1 = np.pad(pos1, padlen1, 'constant', constant_values=0)
-        pos_ret2 = np.pad(pos2, padlen2, 'constant', constant_values=0)
-        pos_ret3 = np.pad(pos3, padlen3, 'constant', constant_values=0)
+        len_frame = len(pixel_frame)
+        padding = (np.zeros(padlen), 1)
+        pos_ret1 = SegmentedSignal([padding, (pixel_frame, n_frames), padding])
+        pos_ret2 = SegmentedSignal([padding, (line_frame, n_frames), padding])
+        pos_ret3 = SegmentedSignal([padding] +
+                                   [(np.array([position]), len_frame)
+                                    for position in frame_positions] +
+                                   [padding])
         return pos_ret1, pos_ret2, pos_ret3
 
 # def __initial_positioning(self, initpos, v_max, a_max):
@@ -1,6 +1,6 @@
 import numpy as np
 
-from .basesignaldesigners import TTLCycleDesigner
+from .basesignaldesigners import SegmentedSignal, TTLCycleDesigner
 from imswitch.imcommon.model import initLogger
 
 class PointScanTTLCycleDesigner(TTLCycleDesigner):
@@ -25,13 +25,23 @@ class PointScanTTLCycleDesigner(TTLCycleDesigner):
         return 'lines'
 
     def make_signal(self, parameterDict, setupInfo, scanInfoDict=None):
+        signal_dict = self.make_signal_stream(parameterDict, setupInfo, scanInfoDict)
+        if signal_dict is None:
+            return None
+        return {target: signal.toArray() for target, signal in signal_dict.items()}
+
+    def make_signal_stream(self, parameterDict, setupInfo, scanInfoDict=None):
+        """ Generates the TTL signals as SegmentedSignals, in which a frame is
+        only stored once for all frames of a 3D scan. """
         if not self.parameterCompatibility(parameterDict):
             self._logger.error('TTL parameters seem incompatible, this error should not be since'
                                ' this should be checked at program start-up')
             return None
 
         if not scanInfoDict:
-            return self.__make_signal_stationary(parameterDict, setupInfo.scan.sampleRate)
+            signal_dict = self.__make_signal_stationary(parameterDict, setupInfo.scan.sampleRate)
+            return {target: SegmentedSignal.fromArray(signal)
+                    for target, signal in signal_dict.items()}
         else:
             signal_dict = {}
 
@@ -105,27 +115,18 @@ class PointScanTTLCycleDesigner(TTLCycleDesigner):
 
                 # repeat for third axis if applicable
                 axis_count = len(scanInfoDict['img_dims'])
-                if axis_count==3:
-                    n_frames = scanInfoDict['img_dims'][2]
-                    signal_tot = signal
-                    for i in range(n_frames-1):
-                        signal_tot = np.concatenate((signal_tot, signal))
-                    signal = signal_tot
-
-                signal = np.append(np.zeros(zeropad_start, dtype='bool'), signal)  # pad start zeros
-                # pad scanner phase delay to beginning to sync actual position with TTL
-                signal = np.append(np.zeros(zeropad_phasedelay, dtype='bool'), signal)
+                n_frames = scanInfoDict['img_dims'][2] if axis_count==3 else 1
 
+                # pad scanner phase delay and start zeros to beginning to sync actual
+                # position with TTL
+                startpad = np.zeros(zeropad_phasedelay + zeropad_start, dtype='bool')
+                signal = SegmentedSignal([(startpad, 1), (signal, n_frames)], dtype='bool')
                 # pad end zeros to same length as analog scanning
-                zeropad_end = samples_total - len(signal)
-                if zeropad_end > 0:
-                    signal = np.append(signal, np.zeros(zeropad_end, dtype='bool'))
-                elif zeropad_end < 0:
-                    signal = signal[:zeropad_end]
+                signal.resize(samples_total)
 
                 signal_dict[target] = signal
 
-            # return signal_dict, which contains bool arrays for each target
+            # return signal_dict, which contains bool signals for each target
             #import matplotlib.pyplot as plt
             #plt.figure(1)
             #for i, target in enumerate(targets):
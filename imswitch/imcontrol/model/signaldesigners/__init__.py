@@ -1 +1 @@
-from .basesignaldesigners import SignalDesignerFactory
+from .basesignaldesigners import SegmentedSignal, SignalDesignerFactory, iterSignalBlocks
@@ -1,10 +1,118 @@
 import importlib
 from abc import ABC, abstractmethod
 
+import numpy as np
+
 from imswitch.imcommon.model import pythontools, initLogger
 from ..errors import InvalidChildClassError
 
 
+class SegmentedSignal:
+    """ A signal described as a sequence of segments, each a sample array
+    repeated a number of times, e.g. padding, a frame repeated for every
+    frame of a scan, and more padding. Long scan signals can be generated in
+    blocks from it without ever holding the whole signal in memory. """
+
+    def __init__(self, segments=(), dtype=None):
+        self._segments = []
+        self._dtype = np.dtype(dtype) if dtype is not None else None
+        for samples, repeats in segments:
+            self.append(samples, repeats)
+
+    @classmethod
+    def fromArray(cls, samples):
+        return cls([(samples, 1)], dtype=np.asarray(samples).dtype)
+
+    @property
+    def dtype(self):
+        return self._dtype if self._dtype is not None else np.dtype(float)
+
+    @property
+    def segments(self):
+        return list(self._segments)
+
+    def __len__(self):
+        return sum(len(samples) * repeats for samples, repeats in self._segments)
+
+    def append(self, samples, repeats=1):
+        """ Appends samples, repeated the given number of times. """
+        samples = np.asarray(samples)
+        if self._dtype is None:
+            self._dtype = samples.dtype
+        if len(samples) > 0 and repeats > 0:
+            self._segments.append((samples, int(repeats)))
+        return self
+
+    def resize(self, length):
+        """ Pads the end with zeros or cuts it off, so that the signal has the
+        given length. """
+        excess = len(self) - length
+        if excess < 0:
+            self.append(np.zeros(-excess, dtype=self.dtype))
+        while excess > 0:
+            samples, repeats = self._segments.pop()
+            segmentLength = len(samples) * repeats
+            if segmentLength <= excess:
+                excess -= segmentLength
+                continue
+            keep = segmentLength - excess
+            if keep >= len(samples):
+                self._segments.append((samples, keep // len(samples)))
+            if keep % len(samples) > 0:
+                self._segments.append((samples[:keep % len(samples)], 1))
+            excess = 0
+        return self
+
+    def min(self):
+        return min(samples.min() for samples, _ in self._segments)
+
+    def max(self):
+        return max(samples.max() for samples, _ in self._segments)
+
+    def toArray(self):
+        """ Returns the whole signal as one array. """
+        if not self._segments:
+            return np.zeros(0, dtype=self.dtype)
+        return np.concatenate([np.tile(samples, repeats) if repeats > 1 else samples
+                               for samples, repeats in self._segments])
+
+    def blocks(self, blockSize):
+        """ Yields the signal in arrays of blockSize samples; the last one may
+        be shorter. """
+        position = 0
+        length = len(self)
+        while position < length:
+            yield self.read(position, min(position + blockSize, length))
+            position += blockSize
+
+    def read(self, start, stop):
+        """ Returns the samples from start to stop. """
+        out = np.empty(stop - start, dtype=self.dtype)
+        segmentStart = 0
+        for samples, repeats in self._segments:
+            segmentStop = segmentStart + len(samples) * repeats
+            if segmentStop > start and segmentStart < stop:
+                first, last = max(start, segmentStart), min(stop, segmentStop)
+                indices = np.arange(first - segmentStart, last - segmentStart) % len(samples)
+                out[first - start:last - start] = samples[indices]
+            if segmentStop >= stop:
+                break
+            segmentStart = segmentStop
+        return out
+
+
+def iterSignalBlocks(signalDict, blockSize):
+    """ Yields {target: block} dicts with consecutive blocks of blockSize
+    samples of all the SegmentedSignals in signalDict, which must have the
+    same length. """
+    lengths = {len(signal) for signal in signalDict.values()}
+    if len(lengths) > 1:
+        raise ValueError(f'Signals have different lengths {sorted(lengths)}')
+    iterators = {target: signal.blocks(blockSize) for target, signal in signalDict.items()}
+    for blocks in zip(*iterators.values()):
+        yield dict(zip(iterators.keys(), blocks))
+
+
 class SignalDesigner(ABC):
     """Parent class for any type of SignalDesigner. Any child should define
     self._expected_parameters and its own make_signal method."""
@@ -58,6 +166,16 @@ class ScanDesigner(SignalDesigner, ABC):
         {'target': signal} pairs. """
         pass
 
+    def make_signal_stream(self, parameterDict, setupInfo):
+        """ Like make_signal, but returns {'target': SegmentedSignal} pairs
+        that can be generated in blocks. Children that repeat parts of their
+        signals should override this to avoid generating the whole signals
+        up front. """
+        signalDict, positions, scanInfoDict = self.make_signal(parameterDict, setupInfo)
+        return ({target: SegmentedSignal.fromArray(signal)
+                 for target, signal in signalDict.items()},
+                positions, scanInfoDict)
+
 
 class TTLCycleDesigner(SignalDesigner, ABC):
     @property
@@ -71,6 +189,16 @@ class TTLCycleDesigner(SignalDesigner, ABC):
         {'target': signal} pairs. """
         pass
 
+    def make_signal_stream(self, parameterDict, setupInfo, scanInfoDict=None):
+        """ Like make_signal, but returns {'target': SegmentedSignal} pairs
+        that can be generated in blocks. Children that repeat parts of their
+        signals should override this to avoid generating the whole signals
+        up front. """
+        signalDict = self.make_signal(parameterDict, setupInfo, scanInfoDict)
+        if signalDict is None:
+            return None
+        return {target: SegmentedSignal.fromArray(signal) for target, signal in signalDict.items()}
+
 
 class SignalDesignerFactory:
     """Factory class for creating a SignalDesigner object. Factory checks
@@ -0,0 +1,190 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from imswitch.imcommon.model import getMetricsRegistry, initLogger
+
+
+_metrics = getMetricsRegistry()
+_stageHistogram = _metrics.histogram(
+    'imswitch_tiled_scan_stage_seconds', 'Time spent in each stage of a tiled scan tile'
+)
+_pendingWritesGauge = _metrics.gauge(
+    'imswitch_tiled_scan_pending_writes', 'Number of tiles waiting to be written'
+)
+
+
+class TiledScanExecutor:
+    """ Runs a tiled acquisition as a pipeline. For each tile, the stage is
+    moved, given time to settle, and the frames are acquired; writing them
+    happens on a separate thread, so that the stage is already moving to the
+    next tile while the previous one is being written. If the writer falls
+    more than maxPendingWrites tiles behind, acquisition waits for it. """
+
+    def __init__(self, moveTo, acquire, write, settle=None, maxPendingWrites=8):
+        """
+        Args:
+            moveTo: Function that takes a position and moves there, blocking
+              until the move has finished.
+            acquire: Function that takes the tile index and position and
+              returns the data to write, e.g. a frame or a list of frames.
+            write: Function that takes the tile index, position and the data
+              returned by acquire. Called on the writer thread.
+            settle: Optional function that takes a position and blocks until
+              the stage has settled there.
+            maxPendingWrites: Maximum number of acquired tiles waiting to be
+              written.
+        """
+        self.__logger = initLogger(self)
+        self._moveTo = moveTo
+        self._acquire = acquire
+        self._write = write
+        self._settle = settle
+        self._maxPendingWrites = maxPendingWrites
+        self._writeError = None
+
+    def run(self, positions, isRunning=None):
+        """ Acquires all tiles at the specified positions, unless isRunning
+        returns False before the scan has finished. Returns a dict with
+        timing statistics of the scan. Errors raised while writing stop the
+        scan and are re-raised. """
+        stats = {'tiles': 0, 'moveSeconds': 0.0, 'settleSeconds': 0.0,
+                 'acquireSeconds': 0.0, 'writeWaitSeconds': 0.0}
+        self._writeError = None
+        writeQueue = queue.Queue(maxsize=self._maxPendingWrites)
+        writerThread = threading.Thread(target=self._runWriter, args=(writeQueue,),
+                                        name='TiledScanWriter', daemon=True)
+        writerThread.start()
+
+        startTime = time.perf_counter()
+        try:
+            for index, position in enumerate(positions):
+                if isRunning is not None and not isRunning():
+                    break
+                if self._writeError is not None:
+                    break
+
+                stageStartTime = time.perf_counter()
+                self._moveTo(position)
+                stats['moveSeconds'] += self._observe('move', stageStartTime)
+
+                if self._settle is not None:
+                    stageStartTime = time.perf_counter()
+                    self._settle(position)
+                    stats['settleSeconds'] += self._observe('settle', stageStartTime)
+
+                stageStartTime = time.perf_counter()
+                data = self._acquire(index, position)
+                stats['acquireSeconds'] += self._observe('acquire', stageStartTime)
+
+                stageStartTime = time.perf_counter()
+                writeQueue.put((index, position, data))
+                _pendingWritesGauge.set(writeQueue.qsize())
+                stats['writeWaitSeconds'] += time.perf_counter() - stageStartTime
+                stats['tiles'] += 1
+        finally:
+            writeQueue.put(None)
+            writerThread.join()
+            _pendingWritesGauge.set(0)
+
+        stats['totalSeconds'] = time.perf_counter() - startTime
+        stats['secondsPerTile'] = stats['totalSeconds'] / max(stats['tiles'], 1)
+        self.__logger.debug(f'Tiled scan finished: {stats}')
+
+        if self._writeError is not None:
+            raise self._writeError
+        return stats
+
+    def _runWriter(self, writeQueue):
+        while True:
+            item = writeQueue.get()
+            if item is None:
+                return
+            if self._writeError is not None:
+                continue  # drain the queue so that acquisition doesn't block
+
+            startTime = time.perf_counter()
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.__logger.error(f'Failed to write tile {item[0]}: {e}')
+                self._writeError = e
+            self._observe('write', startTime)
+            _pendingWritesGauge.set(writeQueue.qsize())
+
+    @staticmethod
+    def _observe(stage, startTime):
+        duration = time.perf_counter() - startTime
+        _stageHistogram.observe(duration, stage=stage)
+        return duration
+
+
+def grabFreshFrame(detector, skipFrames=1, timeout=1.0, pollInterval=0.005):
+    """ Returns a frame that the detector started to expose after this
+    function was called, e.g. after switching on illumination. Frames are
+    considered new when they differ from the previous one; the first
+    skipFrames new frames are discarded since their exposure may have
+    started before the call. If no such frame arrives within the timeout,
+    the latest frame is returned. """
+    deadline = time.monotonic() + timeout
+    lastSample = sampleFrame(detector.getLatestFrame())
+    newFrames = 0
+    while True:
+        frame = detector.getLatestFrame()
+        sample = sampleFrame(frame)
+        if isNewSample(sample, lastSample):
+            newFrames += 1
+            lastSample = sample
+            if newFrames > skipFrames:
+                return frame
+        if time.monotonic() >= deadline:
+            return frame
+        time.sleep(pollInterval)
+
+
+def settleStage(positioner, settleTime, tolerance=1.0, timeout=10.0, axes=None):
+    """ Waits until the positioner has settled with
+    positioner.waitUntilSettled and returns whether it did. Positioners that
+    can't read back their position only know the commanded one, so for them,
+    at least settleTime seconds are waited for vibrations to decay. """
+    startTime = time.monotonic()
+    settled = positioner.waitUntilSettled(tolerance=tolerance, timeout=timeout, axes=axes)
+    if not positioner.canReadPosition:
+        time.sleep(max(0.0, settleTime - (time.monotonic() - startTime)))
+    return settled
+
+
+def sampleFrame(frame):
+    """ Returns a sparse copy of the pixels of a frame, which is enough to
+    tell frames apart with isNewSample, also for cameras that overwrite the
+    same buffer. """
+    return None if frame is None else np.array(frame[::17, ::17])
+
+
+def isNewSample(sample, lastSample):
+    """ Returns whether sample, as returned by sampleFrame, is of a different
+    frame than lastSample. """
+    if sample is None:
+        return False
+    if lastSample is None or sample.shape != lastSample.shape:
+        return True
+    return not np.array_equal(sample, lastSample)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,133 @@
+import h5py
+import numpy as np
+import pytest
+import tifffile
+
+from imswitch.imreconstruct.model import BatchReconstructor, DataObj, ReconstructionCancelled
+from imswitch.imreconstruct.model.BatchReconstructor import bleachingScales, correctBleaching
+
+
+scanParDict = {'dimensions': ['Right/Left', 'Up/Down', 'Back/Forth', 'Timepoints'],
+               'directions': ['pos', 'pos', 'pos'],
+               'steps': ['3', '3', '1', '1'],
+               'unidirectional': True}
+sigmas = [1.2, 9999]
+pattern = [2, 2, 8, 8]
+
+
+def _writeDatasets(tmp_path, numDatasets):
+    dataObjs = []
+    for i in range(numDatasets):
+        path = str(tmp_path / f'data{i}.hdf5')
+        with h5py.File(path, 'w') as file:
+            rng = np.random.default_rng(i)
+            file.create_dataset('data', data=rng.integers(1, 255, (9, 32, 32), dtype=np.uint16))
+        dataObjs.append(DataObj(f'data{i}', 'data', path=path))
+    return dataObjs
+
+
+def test_batch_reconstruction_in_processes(tmp_path):
+    dataObjs = _writeDatasets(tmp_path, 3)
+    progress = []
+
+    batchReconstructor = BatchReconstructor(workers=2)
+    batchReconstructor.sigProgress.connect(lambda done, total: progress.append((done, total)))
+    parallel = batchReconstructor.reconstruct(dataObjs, scanParDict, sigmas, pattern,
+                                              bleachingCorrection=True)
+    serial = BatchReconstructor(workers=1).reconstruct(dataObjs, scanParDict, sigmas, pattern,
+                                                       bleachingCorrection=True)
+
+    assert [reconObj.name for reconObj in parallel] == ['data0', 'data1', 'data2']
+    for parallelObj, serialObj in zip(parallel, serial):
+        assert np.allclose(parallelObj.getReconstruction(), serialObj.getReconstruction(),
+                           atol=1e-3)
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    assert not any(dataObj.dataLoaded for dataObj in dataObjs)
+
+
+def test_consolidated_batch_reconstruction(tmp_path):
+    dataObjs = _writeDatasets(tmp_path, 2)
+    batchReconstructor = BatchReconstructor(workers=1)
+    individual = batchReconstructor.reconstruct(dataObjs, scanParDict, sigmas, pattern)
+    consolidated = batchReconstructor.reconstruct(dataObjs, scanParDict, sigmas, pattern,
+                                                  consolidate=True)
+
+    assert len(consolidated) == 1
+    reconstruction = consolidated[0].getReconstruction()
+    assert reconstruction.shape[0] == 2  # datasets
+    for i, reconObj in enumerate(individual):
+        assert np.array_equal(reconstruction[i], reconObj.getReconstruction()[0])
+
+
+def test_batch_reconstruction_cancelled(tmp_path):
+    dataObjs = _writeDatasets(tmp_path, 3)
+    batchReconstructor = BatchReconstructor(workers=1)
+    batchReconstructor.sigProgress.connect(lambda done, total: batchReconstructor.cancel())
+    with pytest.raises(ReconstructionCancelled):
+        batchReconstructor.reconstruct(dataObjs, scanParDict, sigmas, pattern)
+    assert not batchReconstructor.isRunning()
+
+
+def test_batch_reconstruction_in_processes_cancelled(tmp_path):
+    dataObjs = _writeDatasets(tmp_path, 4)
+    batchReconstructor = BatchReconstructor(workers=2)
+    batchReconstructor.sigProgress.connect(lambda done, total: batchReconstructor.cancel())
+    with pytest.raises(ReconstructionCancelled):
+        batchReconstructor.reconstruct(dataObjs, scanParDict, sigmas, pattern)
+    assert not batchReconstructor.isRunning()
+
+
+def test_bleaching_correction_keeps_data_in_memory(tmp_path):
+    path = str(tmp_path / 'data.tif')
+    frames = np.random.default_rng(0).integers(1, 255, (9, 32, 32), dtype=np.uint16)
+    frames = (frames * np.linspace(1, 0.8, 9)[:, np.newaxis, np.newaxis]).astype(np.uint16)
+    tifffile.imwrite(path, frames, compression='zlib')  # compressed, so read into memory
+
+    dataObj = DataObj('data', None, path=path)
+    dataObj.checkAndLoadData()
+    assert dataObj.data.sharesMemory(dataObj.data[0:9])
+
+    batchReconstructor = BatchReconstructor(workers=1)
+    first, = batchReconstructor.reconstruct([dataObj], scanParDict, sigmas, pattern,
+                                            bleachingCorrection=True)
+    second, = batchReconstructor.reconstruct([dataObj], scanParDict, sigmas, pattern,
+                                             bleachingCorrection=True)
+    assert np.array_equal(np.asarray(dataObj.data), frames)
+    assert np.array_equal(first.getReconstruction(), second.getReconstruction())
+
+
+def test_blockwise_bleaching_correction():
+    data = np.random.default_rng(0).integers(100, 4000, (30, 20, 20))
+    data = (data * np.linspace(1, 0.9, 30)[:, np.newaxis, np.newaxis]).astype(np.uint16)
+    energy = np.sum(data, axis=(1, 2))
+    expected = np.array([frame * (energy[0] / frameEnergy) ** 4
+                         for frame, frameEnergy in zip(data, energy)]).astype(np.uint16)
+
+    corrected = correctBleaching(data)
+    assert corrected.dtype == np.uint16
+    assert np.array_equal(corrected, expected)
+
+    blocks = []
+    for i in range(0, 30, 7):
+        block = data[i:i + 7].copy()
+        blocks.append(correctBleaching(block, bleachingScales(energy[i:i + 7], energy[0]),
+                                       inPlace=True))
+        assert blocks[-1] is block
+    assert np.array_equal(np.concatenate(blocks), expected)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
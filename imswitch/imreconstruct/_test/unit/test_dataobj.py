@@ -0,0 +1,93 @@
+import h5py
+import numpy as np
+import pytest
+import tifffile
+import zarr
+
+from imswitch.imreconstruct.model import DataObj, LazyDataset
+
+
+frames = np.random.default_rng(0).integers(0, 4096, (23, 16, 12), dtype=np.uint16)
+
+
+def _writeHdf5(path):
+    with h5py.File(path, 'w') as file:
+        file.create_dataset('data', data=frames, chunks=(4, 16, 12))
+
+
+def _writeZarr(path):
+    group = zarr.open(str(path), mode='w')
+    group.create_dataset('data', data=frames, chunks=(5, 16, 12))
+
+
+def _writeTiff(path):
+    tifffile.imwrite(path, frames)
+
+
+@pytest.mark.parametrize('ext, write', [('.hdf5', _writeHdf5), ('.zarr', _writeZarr),
+                                        ('.tif', _writeTiff)])
+def test_data_read_lazily(tmp_path, ext, write):
+    path = str(tmp_path / f'data{ext}')
+    write(path)
+
+    dataObj = DataObj('data', None, path=path)
+    dataObj.checkAndLoadData()
+    assert dataObj.dataLoaded
+    assert isinstance(dataObj.data, LazyDataset)
+    assert dataObj.numFrames == 23
+    assert dataObj.data.shape == frames.shape
+    assert np.array_equal(dataObj.data[7], frames[7])
+    assert np.array_equal(np.asarray(dataObj.data), frames)
+
+    dataObj.data.maxBlockBytes = frames[0].nbytes * 9  # several blocks
+    assert np.allclose(dataObj.getMeanData(), np.mean(frames, 0))
+    assert np.allclose(dataObj.data.mean(step=3), np.mean(frames[::3], 0))
+    dataObj.checkAndUnloadData()
+
+
+def test_mean_of_frame_subset(tmp_path):
+    path = str(tmp_path / 'data.hdf5')
+    _writeHdf5(path)
+    dataObj = DataObj('data', 'data', path=path)
+    dataObj.checkAndLoadData()
+
+    assert np.allclose(dataObj.getMeanData(maxFrames=8), np.mean(frames[::3], 0))
+    assert np.allclose(dataObj.getMeanData(), np.mean(frames, 0))
+    # the mean of all frames is used once it has been computed
+    assert np.allclose(dataObj.getMeanData(maxFrames=8), np.mean(frames, 0))
+
+
+def test_blocks_of_whole_chunks():
+    with h5py.File('blocks', 'w', driver='core', backing_store=False) as file:
+        dataset = file.create_dataset('data', data=frames, chunks=(4, 8, 12))
+        data = LazyDataset(dataset, maxBlockBytes=frames[0].nbytes * 10)
+        assert data.blockFrames == 8
+
+        blocks = list(data.iterBlocks())
+        assert [start for start, _ in blocks] == [0, 8, 16]
+        assert np.array_equal(np.concatenate([block for _, block in blocks]), frames)
+
+        blocks = list(data.iterBlocks(blockFrames=3, step=2))
+        assert [start for start, _ in blocks] == [0, 6, 12, 18]
+        assert np.array_equal(np.concatenate([block for _, block in blocks]), frames[::2])
+
+        data.maxBlockBytes = 1  # at least one frame
+        assert data.blockFrames == 1
+
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,67 @@
+import h5py
+import numpy as np
+
+from imswitch.imreconstruct.model import DataObj, PatternFinder
+
+
+def _patternImage(shape, pattern, sigma=1.5):
+    def profile(size, offset, period):
+        distances = (np.arange(size) - offset) % period
+        return (np.exp(-distances ** 2 / (2 * sigma ** 2)) +
+                np.exp(-(distances - period) ** 2 / (2 * sigma ** 2)))
+
+    rows = profile(shape[0], pattern[0], pattern[2])
+    cols = profile(shape[1], pattern[1], pattern[3])
+    return 100 * rows[:, np.newaxis] * cols[np.newaxis, :] + 10
+
+
+def test_dataset_pattern_from_frame_subset_is_cached(tmp_path):
+    pattern = [5.5, 1.5, 11.2, 11.2]
+    rng = np.random.default_rng(0)
+    frames = rng.poisson(_patternImage((256, 256), pattern), (40, 256, 256)).astype(np.uint16)
+    path = str(tmp_path / 'data.hdf5')
+    with h5py.File(path, 'w') as file:
+        file.create_dataset('data', data=frames)
+
+    dataObj = DataObj('data', 'data', path=path)
+    dataObj.checkAndLoadData()
+    patternFinder = PatternFinder(maxFrames=10)
+    found = patternFinder.findDatasetPattern(dataObj)
+    assert np.allclose(found[2:], pattern[2:], atol=0.1)
+    assert np.allclose(found, patternFinder.findPattern(np.mean(frames, 0)), atol=0.1)
+
+    dataObj.checkAndUnloadData()  # the cached pattern doesn't need the data
+    assert patternFinder.findDatasetPattern(dataObj) == found
+
+
+def test_repeated_memory_recording_gets_its_own_pattern():
+    patternFinder = PatternFinder(maxFrames=10)
+    found = []
+    for pattern in ([5.5, 1.5, 11.2, 11.2], [3.0, 4.0, 8.5, 8.5]):
+        # recorded to memory under the same name both times
+        file = h5py.File(f'recording{len(found)}', 'w', driver='core', backing_store=False)
+        file.create_dataset('data', data=np.tile(_patternImage((256, 256), pattern), (10, 1, 1)))
+        dataObj = DataObj('recording', 'data', file=file)
+        found.append(patternFinder.findDatasetPattern(dataObj))
+        assert np.allclose(found[-1][2:], pattern[2:], atol=0.1)
+        assert patternFinder.findDatasetPattern(dataObj) == found[-1]
+        file.close()
+    assert found[0] != found[1]
+
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
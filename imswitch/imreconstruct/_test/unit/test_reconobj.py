@@ -0,0 +1,81 @@
+import numpy as np
+
+from imswitch.imreconstruct.model import ReconObj
+
+
+texts = ('Right/Left', 'Up/Down', 'Back/Forth', 'Timepoints', 'pos', 'neg')
+
+
+def _scanParDict(steps, dimensions=texts[:4], directions=('pos', 'pos', 'pos'),
+                 unidirectional=True):
+    return {'dimensions': list(dimensions), 'directions': list(directions),
+            'steps': [str(step) for step in steps], 'unidirectional': unidirectional}
+
+
+def _frameNumbers(frames, gridShape):
+    """ Coefficients that are the number of the frame they are from. """
+    return np.broadcast_to(np.arange(frames, dtype=float)[:, np.newaxis, np.newaxis],
+                           (frames, *gridShape))
+
+
+def test_coeffs_placed_in_scan_order():
+    reconObj = ReconObj('test', _scanParDict([4, 3, 2, 2]), *texts)
+    im = reconObj.coeffsToImage(_frameNumbers(48, (2, 5)), reconObj.getScanParams())
+    assert im.shape == (2, 2, 2 * 3, 5 * 4)
+
+    # each pixel of a grid cell (3 x 4 pixels) is from a different frame
+    cell = np.arange(12).reshape(3, 4)
+    for t in range(2):
+        for s in range(2):
+            expected = np.tile(cell + t * 24 + s * 12, (2, 5))
+            assert np.array_equal(im[t, s], expected)
+
+
+def test_coeffs_placed_bidirectional_and_negative():
+    scanParDict = _scanParDict([3, 3, 1, 1], dimensions=('Up/Down', 'Right/Left', 'Back/Forth',
+                                                         'Timepoints'),
+                               directions=('neg', 'pos', 'pos'), unidirectional=False)
+    reconObj = ReconObj('test', scanParDict, *texts)
+    im = reconObj.coeffsToImage(_frameNumbers(9, (1, 1)), scanParDict)
+
+    # fast axis is up/down, reversed on every other column, and starts at the bottom
+    expected = np.array([[2, 3, 8],
+                         [1, 4, 7],
+                         [0, 5, 6]])
+    assert np.array_equal(im[0, 0], expected)
+
+
+def test_update_images_of_all_bases():
+    scanParDict = _scanParDict([2, 3, 2, 1], dimensions=('Back/Forth', 'Right/Left', 'Up/Down',
+                                                         'Timepoints'))
+    reconObj = ReconObj('test', scanParDict, *texts)
+    coeffs = np.random.default_rng(0).random((2, 12, 4, 3))
+    reconObj.addCoeffsTP(coeffs)
+    reconObj.addCoeffsTP(coeffs[::-1])
+    reconObj.updateImages()
+
+    reconstructed = reconObj.getReconstruction()
+    assert reconstructed.shape == (2, 2, 1, 2, 4 * 2, 3 * 3)
+    for dataset, datasetCoeffs in enumerate([coeffs, coeffs[::-1]]):
+        for basis in range(2):
+            assert np.array_equal(reconstructed[dataset, basis],
+                                  reconObj.coeffsToImage(datasetCoeffs[basis], scanParDict))
+    assert np.isclose(reconstructed[0, 0].sum(), np.float32(coeffs[0]).sum(), rtol=1e-5)
+
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,68 @@
+import numpy as np
+
+from imswitch.imreconstruct.model import SignalExtractor
+from imswitch.imreconstruct.model.SignalExtractor import coeffGridSize
+
+
+def _patternData(coeffs, pattern, sigma, shape, background):
+    rows = np.arange(shape[0])[:, np.newaxis]
+    cols = np.arange(shape[1])[np.newaxis, :]
+    data = np.full((len(coeffs), *shape), float(background))
+    for i in range(coeffs.shape[1]):
+        for j in range(coeffs.shape[2]):
+            spot = np.exp(-((rows - pattern[0] - i * pattern[2]) ** 2 +
+                            (cols - pattern[1] - j * pattern[3]) ** 2) / (2 * sigma ** 2))
+            data += coeffs[:, i, j, np.newaxis, np.newaxis] * spot
+    return data
+
+
+def test_coeff_grid_size():
+    assert coeffGridSize(100, 50, [0, 5, 10, 10]) == (10, 5)
+    assert coeffGridSize(100, 50, [0.5, 4.5, 10, 10]) == (10, 5)
+    assert coeffGridSize(100, 50, [3, 3, 20.5, 12.5]) == (5, 4)
+
+
+def test_numpy_extraction_recovers_coefficients():
+    pattern = [3.3, 5.7, 10.4, 9.6]
+    sigma = 1.5
+    shape = (64, 57)
+    gridShape = coeffGridSize(*shape, pattern)
+    rng = np.random.default_rng(0)
+    coeffs = rng.uniform(50, 200, (6, *gridShape))
+    data = np.round(_patternData(coeffs, pattern, sigma, shape, background=20)).astype(np.uint16)
+
+    extractor = SignalExtractor()
+    result = extractor.extractSignal(data, [sigma, 9999], pattern, 'cpu')
+    assert result.shape == (2, 6, *gridShape)
+    assert np.allclose(result[0], coeffs, atol=1.5)
+    assert np.allclose(result[1], 20, atol=0.5)  # constant background
+
+    noBackground = extractor.extractSignalNumpy(data, [sigma, 0], pattern)
+    assert np.all(noBackground[1] == 0)
+
+
+def test_numpy_extraction_in_process_pool():
+    pattern = [2, 2, 8, 8]
+    data = np.random.default_rng(1).integers(0, 255, (5, 40, 40), dtype=np.uint8)
+
+    extractor = SignalExtractor()
+    serial = extractor.extractSignalNumpy(data, [1.2, 9999], pattern, workers=1)
+    parallel = extractor.extractSignalNumpy(data, [1.2, 9999], pattern, workers=3)
+    assert np.allclose(parallel, serial, atol=1e-3)
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -6,7 +6,7 @@ import tifffile as tiff
 
 import imswitch.imreconstruct.view.guitools as guitools
 from imswitch.imcommon.controller import PickDatasetsController
-from imswitch.imreconstruct.model import DataObj, ReconObj, PatternFinder, SignalExtractor
+from imswitch.imreconstruct.model import BatchReconstructor, DataObj, PatternFinder
 from .DataFrameController import DataFrameController
 from .MultiDataFrameController import MultiDataFrameController
 from .WatcherFrameController import WatcherFrameController
@@ -38,7 +38,16 @@ class ImRecMainViewController(ImRecWidgetController):
             PickDatasetsController, self._widget.pickDatasetsDialog
         )
 
-        self._signalExtractor = SignalExtractor()
+        self._batchReconstructor = BatchReconstructor(
+            dimensionTexts=(self._widget.r_l_text, self._widget.u_d_text, self._widget.b_f_text,
+                            self._widget.timepoints_text, self._widget.p_text,
+                            self._widget.n_text)
+        )
+        self._batchReconstructor.sigProgress.connect(self.reconstructionProgress)
+        self._batchReconstructor.sigReconstructed.connect(self.reconstructed)
+        self._batchReconstructor.sigFinished.connect(
+            lambda: self._widget.setReconstructionRunning(False)
+        )
         self._patternFinder = PatternFinder()
 
         self._currentDataObj = None
@@ -77,6 +86,7 @@ class ImRecMainViewController(ImRecWidgetController):
         )
         self._widget.sigQuickLoadData.connect(self.quickLoadData)
         self._widget.sigUpdate.connect(lambda: self.updateScanParams(applyOnCurrentRecon=True))
+        self._widget.sigCancelReconstruction.connect(self.cancelReconstruction)
 
         self._widget.sigShowPatternChanged.connect(self.togglePattern)
         self._widget.sigFindPattern.connect(self.findPattern)
@@ -107,12 +117,11 @@ class ImRecMainViewController(ImRecWidgetController):
         if self._currentDataObj is None:
             return
 
-        meanData = self._currentDataObj.getMeanData()
-        if len(meanData) < 1:
+        if not self._currentDataObj.numFrames:
             return
 
         self._logger.debug('Finding pattern')
-        pattern = self._patternFinder.findPattern(meanData)
+        pattern = self._patternFinder.findDatasetPattern(self._currentDataObj)
         self._logger.debug(f'Pattern found as: {self._pattern}')
         self.setPatternParams(pattern)
         self.updatePattern()
@@ -228,7 +237,9 @@ class ImRecMainViewController(ImRecWidgetController):
 
         self.updateScanParams()
 
-    def extractData(self, data):
+    def getSigmas(self):
+        """ Returns the sigmas of the bases, including the background, in
+        pixels. """
         fwhmNm = self._widget.getFwhmNm()
         bgModelling = self._widget.getBgModelling()
         if bgModelling == 'Constant':
@@ -243,16 +254,7 @@ class ImRecMainViewController(ImRecWidgetController):
             raise ValueError(f'Invalid BG modelling "{bgModelling}" specified; must be either'
                              f' "Constant", "Gaussian" or "No background".')
 
-        sigmas = np.divide(fwhmNm, 2.355 * self._widget.getPixelSizeNm())
-
-        device = self._widget.getComputeDevice()
-        pattern = self._pattern
-        if device == 'CPU' or device == 'GPU':
-            coeffs = self._signalExtractor.extractSignal(data, sigmas, pattern, device.lower())
-        else:
-            raise ValueError(f'Invalid device "{device}" specified; must be either "CPU" or "GPU"')
-
-        return coeffs
+        return np.divide(fwhmNm, 2.355 * self._widget.getPixelSizeNm())
 
     def reconstructCurrent(self):
         if self._currentDataObj is None:
@@ -264,52 +266,39 @@ class ImRecMainViewController(ImRecWidgetController):
         self.reconstruct(self._widget.getMultiDatas(), consolidate)
 
     def reconstruct(self, dataObjs, consolidate):
-        reconObj = None
-        for index, dataObj in enumerate(dataObjs):
-            preloaded = dataObj.dataLoaded
-            try:
-                dataObj.checkAndLoadData()
-
-                if np.prod(np.array(self._scanParDict['steps'], dtype=int)) < dataObj.numFrames:
-                    self._logger.error('Too many frames in data')
-                    return
+        if self._batchReconstructor.isRunning():
+            self._logger.warning('Reconstruction already running')
+            return
+
+        device = self._widget.getComputeDevice()
+        if device not in ['CPU', 'GPU']:
+            raise ValueError(f'Invalid device "{device}" specified; must be either "CPU" or "GPU"')
+
+        dataObjs = list(dataObjs)
+        self._widget.setReconstructionProgress(0, len(dataObjs))
+        self._widget.setReconstructionRunning(True)
+        self._batchReconstructor.start(dataObjs, copy.deepcopy(self._scanParDict), self.getSigmas(),
+                                       self._pattern,
+                                       consolidate=consolidate,
+                                       bleachingCorrection=self._widget.bleachBool.value(),
+                                       device=device.lower())
+
+    def cancelReconstruction(self):
+        self._batchReconstructor.cancel()
+
+    def reconstructionProgress(self, datasetsDone, numDatasets):
+        self._widget.setReconstructionProgress(datasetsDone, numDatasets)
+
+    def reconstructed(self, reconObjs, consolidated):
+        for reconObj in reconObjs:
+            self._widget.addNewData(reconObj,
+                                    f'{reconObj.name}_multi' if consolidated else reconObj.name)
 
-                if not consolidate or index == 0:
-                    reconObj = ReconObj(dataObj.name,
-                                        self._scanParDict,
-                                        self._widget.r_l_text,
-                                        self._widget.u_d_text,
-                                        self._widget.b_f_text,
-                                        self._widget.timepoints_text,
-                                        self._widget.p_text,
-                                        self._widget.n_text)
-
-                data = dataObj.data
-                if self._widget.bleachBool.value():
-                    data = self.bleachingCorrection(data)
-
-                coeffs = self.extractData(data)
-            finally:
-                if not preloaded:
-                    dataObj.checkAndUnloadData()
-
-            reconObj.addCoeffsTP(coeffs)
-            if not consolidate:
-                reconObj.updateImages()
-                self._widget.addNewData(reconObj, reconObj.name)
-
-        if consolidate and reconObj is not None:
-            reconObj.updateImages()
-            self._widget.addNewData(reconObj, f'{reconObj.name}_multi')
+        if consolidated and reconObjs:
             self._commChannel.sigExecutionFinished.emit(self.reconstructionController.getImage())
 
-    def bleachingCorrection(self, data):
-        correctedData = data.copy()
-        energy = np.sum(data, axis=(1, 2))
-        for i in range(data.shape[0]):
-            c = (energy[0] / energy[i]) ** 4
-            correctedData[i, :, :] = data[i, :, :] * c
-        return correctedData
+    def closeEvent(self):
+        self._batchReconstructor.cancel()
 
     def saveCurrent(self, dataType):
         """ Saves the reconstructed image or coefficeints from the current
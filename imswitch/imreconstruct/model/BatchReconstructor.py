@@ -0,0 +1,277 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from imswitch.imcommon.framework import Signal, SignalInterface, Thread, Worker
+from imswitch.imcommon.model import initLogger
+from .DataObj import DataObj
+from .ReconObj import ReconObj
+from .SignalExtractor import SignalExtractor
+
+
+defaultDimensionTexts = ('Right/Left', 'Up/Down', 'Back/Forth', 'Timepoints', 'pos', 'neg')
+
+
+class ReconstructionCancelled(Exception):
+    pass
+
+
+class BatchReconstructor(SignalInterface):
+    """ Reconstructs a batch of datasets. The signal of datasets that are
+    stored in files is extracted in a pool of worker processes, one dataset
+    per process, and the reconstructions are assembled in the order of the
+    datasets. Datasets that are only in memory are extracted in the calling
+    process.
+
+    reconstruct runs the batch and returns the reconstructions, which is how
+    to use it from scripts; start runs it in the background, emits
+    sigReconstructed with the results and then sigFinished, also if the batch
+    failed or was cancelled. Progress is reported with sigProgress after
+    each dataset. A running batch can be cancelled from any thread;
+    extractions that have already started in worker processes finish in the
+    background, but their results are discarded.
+
+    Args:
+        workers: Maximum number of worker processes; defaults to the number
+          of CPUs. With one worker, all datasets are extracted in the
+          calling process.
+        dimensionTexts: The names of the (right/left, up/down, back/forth,
+          timepoints) dimensions and the (positive, negative) directions
+          used in the scan parameters.
+    """
+
+    sigProgress = Signal(int, int)  # (datasetsDone, numDatasets)
+    sigReconstructed = Signal(object, bool)  # (reconObjs, consolidated)
+    sigFinished = Signal()
+    _sigStart = Signal(object)  # (kwargs)
+
+    def __init__(self, workers=None, dimensionTexts=defaultDimensionTexts):
+        super().__init__()
+        self.__logger = initLogger(self)
+
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.dimensionTexts = dimensionTexts
+        self._signalExtractor = SignalExtractor()
+        self._cancelEvent = threading.Event()
+        self._running = threading.Event()
+
+        self._worker = None
+        self._thread = None
+
+    def __del__(self):
+        if self._thread is not None:
+            self._thread.quit()
+            self._thread.wait()
+        if hasattr(super(), '__del__'):
+            super().__del__()
+
+    def isRunning(self):
+        return self._running.is_set()
+
+    def cancel(self):
+        """ Cancels the running batch. Does nothing if no batch is running. """
+        if self.isRunning():
+            self._cancelEvent.set()
+
+    def start(self, dataObjs, scanParDict, sigmas, pattern, **kwargs):
+        """ Runs reconstruct in the background, see reconstruct for the
+        arguments. """
+        if self._thread is None:
+            self._worker = _ReconstructionWorker(self)
+            self._thread = Thread()
+            self._worker.moveToThread(self._thread)
+            self._sigStart.connect(self._worker.reconstruct)
+            self._thread.start()
+
+        self._running.set()  # so that the batch can be cancelled before it starts
+        self._sigStart.emit(dict(kwargs, dataObjs=list(dataObjs), scanParDict=scanParDict,
+                                 sigmas=sigmas, pattern=pattern))
+
+    def reconstruct(self, dataObjs, scanParDict, sigmas, pattern, *, consolidate=False,
+                    bleachingCorrection=False, device='cpu'):
+        """ Reconstructs the datasets of dataObjs with the given scan
+        parameters, basis sigmas and pattern, see
+        SignalExtractor.extractSignal. Returns a list of one ReconObj per
+        dataset, or, if consolidate is True, a list with a single ReconObj
+        with the datasets as timepoints. Raises ReconstructionCancelled if
+        cancelled. """
+        self._running.set()
+        try:
+            dataObjs = list(dataObjs)
+            maxFrames = np.prod(np.array(scanParDict['steps'], dtype=int))
+            for dataObj in dataObjs:
+                if _numFrames(dataObj) > maxFrames:
+                    raise ValueError(f'Too many frames in data "{dataObj.name}"')
+
+            coeffs = self._extractAll(dataObjs, sigmas, pattern, bleachingCorrection, device)
+
+            reconObjs = []
+            for dataObj, dataCoeffs in zip(dataObjs, coeffs):
+                if not consolidate or not reconObjs:
+                    reconObjs.append(ReconObj(dataObj.name, scanParDict, *self.dimensionTexts))
+                reconObjs[-1].addCoeffsTP(dataCoeffs)
+            for reconObj in reconObjs:
+                reconObj.updateImages()
+            return reconObjs
+        finally:
+            self._cancelEvent.clear()
+            self._running.clear()
+
+    def _extractAll(self, dataObjs, sigmas, pattern, bleachingCorrection, device):
+        """ Returns the coefficients of each dataset, in order. """
+        coeffs = [None] * len(dataObjs)
+        inFiles = [i for i, dataObj in enumerate(dataObjs) if dataObj.dataPath is not None]
+        inMemory = [i for i in range(len(dataObjs)) if i not in inFiles]
+        workers = min(self.workers, len(inFiles))
+        if workers <= 1:
+            inMemory, inFiles = list(range(len(dataObjs))), []
+
+        def reportDone():
+            self.sigProgress.emit(sum(c is not None for c in coeffs), len(dataObjs))
+
+        pool = ProcessPoolExecutor(max_workers=workers) if inFiles else None
+        futures = {}
+        try:
+            for i in inFiles:
+                future = pool.submit(_extractFile, dataObjs[i].dataPath, dataObjs[i].datasetName,
+                                     sigmas, pattern, bleachingCorrection, device)
+                futures[future] = i
+
+            for i in inMemory:
+                self._checkCancelled()
+                coeffs[i] = self._extractLoaded(dataObjs[i], sigmas, pattern,
+                                                bleachingCorrection, device)
+                reportDone()
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                self._checkCancelled()
+                for future in done:
+                    coeffs[futures[future]] = future.result()
+                    reportDone()
+        finally:
+            if pool is not None:
+                for future in futures:
+                    future.cancel()  # those that haven't started yet
+                pool.shutdown(wait=False)
+        return coeffs
+
+    def _extractLoaded(self, dataObj, sigmas, pattern, bleachingCorrection, device):
+        preloaded = dataObj.dataLoaded
+        try:
+            dataObj.checkAndLoadData()
+            return extractCoeffs(dataObj, self._signalExtractor, sigmas, pattern,
+                                 bleachingCorrection, device, self._checkCancelled)
+        finally:
+            if not preloaded:
+                dataObj.checkAndUnloadData()
+
+    def _checkCancelled(self):
+        if self._cancelEvent.is_set():
+            raise ReconstructionCancelled('Reconstruction cancelled')
+
+
+class _ReconstructionWorker(Worker):
+    def __init__(self, batchReconstructor):
+        super().__init__()
+        self.__logger = initLogger(self, tryInheritParent=True)
+        self._batchReconstructor = batchReconstructor
+
+    def reconstruct(self, kwargs):
+        consolidate = kwargs.get('consolidate', False)
+        try:
+            reconObjs = self._batchReconstructor.reconstruct(**kwargs)
+        except ReconstructionCancelled:
+            self.__logger.info('Reconstruction cancelled')
+        except Exception as e:
+            self.__logger.error(f'Reconstruction failed: {e}')
+        else:
+            self._batchReconstructor.sigReconstructed.emit(reconObjs, consolidate)
+        finally:
+            self._batchReconstructor.sigFinished.emit()
+
+
+def extractCoeffs(dataObj, signalExtractor, sigmas, pattern, bleachingCorrection=False,
+                  device='cpu', checkCancelled=None):
+    """ Extracts the signal of a loaded dataset in blocks of frames, so that
+    the data doesn't have to fit in memory. With bleachingCorrection, the
+    frames of each block are corrected for bleaching, relative to the first
+    frame of the dataset, before the extraction. """
+    referenceEnergy = None
+    blockCoeffs = []
+    for _, data in dataObj.data.iterBlocks():
+        if checkCancelled is not None:
+            checkCancelled()
+        if bleachingCorrection:
+            energy = np.sum(data, axis=(1, 2))
+            if referenceEnergy is None:
+                referenceEnergy = energy[0]
+            # Blocks read from files are private copies, but those of in-memory datasets are views
+            inPlace = data.flags.writeable and not dataObj.data.sharesMemory(data)
+            data = correctBleaching(data, bleachingScales(energy, referenceEnergy),
+                                    inPlace=inPlace)
+        blockCoeffs.append(signalExtractor.extractSignal(data, sigmas, pattern, device))
+    return np.concatenate(blockCoeffs, axis=1)
+
+
+def bleachingScales(energy, referenceEnergy=None):
+    """ Returns the factors that correct frames with the given energies (sums
+    of pixel values) for bleaching, relative to a frame with
+    referenceEnergy, by default the first one. """
+    energy = np.asarray(energy)
+    if referenceEnergy is None:
+        referenceEnergy = energy[0]
+    return (referenceEnergy / energy) ** 4
+
+
+def correctBleaching(data, scales=None, inPlace=False):
+    """ Scales each frame of data by its factor in scales, by default the
+    bleaching correction relative to the first frame. The result has the
+    data type of data, and is written to data with inPlace. """
+    if scales is None:
+        scales = bleachingScales(np.sum(data, axis=(1, 2)))
+    out = data if inPlace else np.empty_like(data)
+    np.multiply(data, np.asarray(scales)[:, np.newaxis, np.newaxis], out=out, casting='unsafe')
+    return out
+
+
+def _numFrames(dataObj):
+    preloaded = dataObj.dataLoaded
+    try:
+        dataObj.checkAndLoadData()
+        return dataObj.numFrames
+    finally:
+        if not preloaded:
+            dataObj.checkAndUnloadData()
+
+
+def _extractFile(path, datasetName, sigmas, pattern, bleachingCorrection, device):
+    """ Extracts the signal of a dataset in a file, in a worker process. """
+    dataObj = DataObj(os.path.basename(path), datasetName, path=path)
+    dataObj.checkAndLoadData()
+    try:
+        # The datasets are already extracted in parallel
+        return extractCoeffs(dataObj, SignalExtractor(workers=1), sigmas, pattern,
+                             bleachingCorrection, device)
+    finally:
+        dataObj.checkAndUnloadData()
+
+
+# Copyright (C) 2020-2021 ImSwitch developers
+# This file is part of ImSwitch.
+#
+# ImSwitch is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ImSwitch is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
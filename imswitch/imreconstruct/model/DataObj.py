@@ -28,11 +28,15 @@ class DataObj:
             return self._data
 
         if isinstance(self._file, h5py.File):
-            self._data = np.array(self._file.get(self._datasetName)[:])
+            self._data = LazyDataset(self._file.get(self._datasetName))
         elif isinstance(self._file, tiff.TiffFile):
-            self._data = self._file.asarray()
+            try:
+                self._data = LazyDataset(tiff.memmap(self._file.filehandle.path, mode='r'))
+            except ValueError:
+                # Compressed or not contiguous, can't be read lazily
+                self._data = LazyDataset(self._file.asarray())
         elif isinstance(self._file, zarr.hierarchy.Group):
-            self._data = np.array(self._file[self._datasetName])
+            self._data = LazyDataset(self._file[self._datasetName])
         return self._data
 
     @property
@@ -86,11 +90,18 @@ class DataObj:
         self._attrs = None
         self._meanData = None
 
-    def getMeanData(self):
-        if self._meanData is None:
-            self._meanData = np.array(np.mean(self.data, 0), dtype=np.float32)
+    def getMeanData(self, maxFrames=None):
+        """ Returns the mean frame. With maxFrames, and unless the mean of all
+        frames has already been computed, it is the mean of at most maxFrames
+        evenly spaced frames. """
+        if self._meanData is not None:
+            return self._meanData
 
-        return self._meanData
+        step = int(np.ceil(self.numFrames / maxFrames)) if maxFrames else 1
+        meanData = self.data.mean(step=max(step, 1)).astype(np.float32)
+        if step <= 1:
+            self._meanData = meanData
+        return meanData
 
     @staticmethod
     def getDatasetNames(path):
@@ -152,6 +163,75 @@ class DataObj:
             raise OSError(f'Writing in progress')
 
 
+class LazyDataset:
+    """ Read-only (frames, rows, cols) dataset in an HDF5 file, Zarr group or
+    memory-mapped TIFF file, that only reads the frames that are indexed
+    from the file. Reductions over all frames are computed in blocks of
+    frames of at most maxBlockBytes (whole chunks if the dataset is
+    chunked), so that the memory they use doesn't depend on the number of
+    frames. np.asarray reads the whole dataset. """
+
+    def __init__(self, array, maxBlockBytes=256 * 1024 ** 2):
+        self._array = array
+        self.maxBlockBytes = maxBlockBytes
+
+    @property
+    def shape(self):
+        return tuple(self._array.shape)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return np.dtype(self._array.dtype)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    @property
+    def blockFrames(self):
+        """ The number of frames in the blocks of iterBlocks. """
+        frameBytes = max(int(np.prod(self.shape[1:])) * self.dtype.itemsize, 1)
+        frames = max(self.maxBlockBytes // frameBytes, 1)
+        chunks = getattr(self._array, 'chunks', None)
+        if chunks and chunks[0] < frames:
+            frames = frames // chunks[0] * chunks[0]
+        return min(frames, max(len(self), 1))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        return np.asarray(self._array[key])
+
+    def sharesMemory(self, frames):
+        """ Returns whether frames, as returned by indexing, share memory with
+        an in-memory dataset, so that writing to them changes the dataset. """
+        return isinstance(self._array, np.ndarray) and np.shares_memory(frames, self._array)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self._array[...], dtype=dtype)
+
+    def iterBlocks(self, blockFrames=None, step=1):
+        """ Yields the index of the first frame and the frames of each
+        consecutive block of frames, with only every step-th frame. """
+        blockFrames = blockFrames if blockFrames is not None else self.blockFrames
+        for start in range(0, len(self), blockFrames * step):
+            yield start, self[start:start + blockFrames * step:step]
+
+    def mean(self, step=1):
+        """ Returns the mean of every step-th frame, in double precision. """
+        total = np.zeros(self.shape[1:], dtype=np.float64)
+        numFrames = 0
+        for _, block in self.iterBlocks(step=step):
+            total += np.sum(block, axis=0, dtype=np.float64)
+            numFrames += len(block)
+        return total / max(numFrames, 1)
+
+
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
 #
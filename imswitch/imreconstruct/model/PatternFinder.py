@@ -1,9 +1,45 @@
+import weakref
+from collections import OrderedDict
+
 import numpy as np
 from scipy.optimize import curve_fit
 from scipy.signal import find_peaks
 
 
 class PatternFinder:
+    """ Finds the pattern in images or datasets. The mean frame of a dataset
+    is computed from at most maxFrames evenly spaced frames, as the pattern
+    is the same in all of them. The patterns of the last cacheSize datasets
+    from files are cached, and those of in-memory datasets as long as the
+    dataset exists. """
+
+    def __init__(self, maxFrames=100, cacheSize=32):
+        self.maxFrames = maxFrames
+        self.cacheSize = cacheSize
+        self._patterns = OrderedDict()
+        self._memoryPatterns = weakref.WeakKeyDictionary()
+
+    def findDatasetPattern(self, dataObj):
+        """ Finds the offsets and periods of the pattern in a loaded
+        dataset. """
+        if dataObj.dataPath is None:
+            # a recording can be repeated under the same name, so it is told apart by its object
+            if dataObj not in self._memoryPatterns:
+                meanData = dataObj.getMeanData(self.maxFrames)
+                self._memoryPatterns[dataObj] = self.findPattern(meanData)
+            return list(self._memoryPatterns[dataObj])
+
+        key = (dataObj.name, dataObj.dataPath, dataObj.datasetName)
+        if key in self._patterns:
+            self._patterns.move_to_end(key)
+            return list(self._patterns[key])
+
+        pattern = self.findPattern(dataObj.getMeanData(self.maxFrames))
+        self._patterns[key] = pattern
+        while len(self._patterns) > self.cacheSize:
+            self._patterns.popitem(last=False)
+        return list(pattern)
+
     def findPattern(self, image):
         """ Finds the offsets and periods of the pattern in the image. """
         image = image - image.min()
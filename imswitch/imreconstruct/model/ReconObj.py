@@ -1,3 +1,5 @@
+import functools
+
 import numpy as np
 
 from imswitch.imcommon.model import initLogger
@@ -59,114 +61,99 @@ class ReconObj:
         reconstructed and reassigned images of ALL the bases given to the
         reconstructor"""
         if self.coeffs is not None:
-            datasets = np.shape(self.coeffs)[0]
-            bases = np.shape(self.coeffs)[1]
-            self.reconstructed = np.array([
-                [self.coeffsToImage(self.coeffs[ds][b], self.scanParDict) for b in range(0, bases)]
-                for ds in range(0, datasets)
-            ])
+            # all datasets and bases at once, (datasets, bases, frames, rows, cols) -> (datasets,
+            # bases, timepoints, slices, rows, cols)
+            self.reconstructed = self._placeCoeffs(self.coeffs, self.scanParDict)
             self.__logger.debug(f'Shape of reconstructed: {np.shape(self.reconstructed)}')
         else:
             self.__logger.error('Cannot update images without coefficients')
 
-    def addGridOfCoeffs(self, im, coeffs, t, s, r0, c0, pr, pc):
-        # self.__logger.debug(f'Timepoint: {t}')
-        # self.__logger.debug(f'shape if im: {im.shape}')
-        # self.__logger.debug(f'shape if coeffts[i]: {coeffs.shape}')
-        # self.__logger.debug(f'r0: {r0}')
-        # self.__logger.debug(f'c0: {c0}')
-        # self.__logger.debug(f'pr: {pr}')
-        # self.__logger.debug(f'pc: {pc}')
-        im[t, s, r0::pr, c0::pc] = coeffs
-
     def coeffsToImage(self, coeffs, scanParDict):
         """Takes the 4d matrix of coefficients from the signal extraction and
         reshapes into images according to given parameters"""
-        frames = np.shape(coeffs)[0]
-        dim0Side = int(scanParDict['steps'][0])
-        dim1Side = int(scanParDict['steps'][1])
-        dim2Side = int(scanParDict['steps'][2])
-        dim3Side = int(scanParDict['steps'][3])  # Always timepoints
-        if not frames == dim0Side * dim1Side * dim2Side * dim3Side:
+        return self._placeCoeffs(coeffs, scanParDict)
+
+    def _placeCoeffs(self, coeffs, scanParDict):
+        """ Places the coefficients (..., frames, grid rows, grid cols) of
+        each frame in the grid of pixels of the scan position of the frame,
+        in images (..., timepoints, slices, rows, cols). """
+        coeffs = np.asarray(coeffs)
+        frames = np.shape(coeffs)[-3]
+        steps = tuple(int(step) for step in scanParDict['steps'])
+        if not frames == np.prod(steps):
             self.__logger.error('Wrong dimensional data')
-            pass
 
-        timepoints = int(
-            scanParDict['steps'][scanParDict['dimensions'].index(self.timepoints_text)]
+        t, s, r, c, shape = _frameIndices(
+            frames, steps, tuple(scanParDict['dimensions']), tuple(scanParDict['directions']),
+            bool(scanParDict['unidirectional']),
+            (self.r_l_text, self.u_d_text, self.b_f_text, self.timepoints_text)
         )
-        slices = int(scanParDict['steps'][scanParDict['dimensions'].index(self.b_f_text)])
-        sqRows = int(scanParDict['steps'][scanParDict['dimensions'].index(self.u_d_text)])
-        sqCols = int(scanParDict['steps'][scanParDict['dimensions'].index(self.r_l_text)])
+        timepoints, slices, sqRows, sqCols = shape
+        gridRows, gridCols = np.shape(coeffs)[-2:]
+        leading = np.shape(coeffs)[:-3]
+
+        # row r + k * sqRows of the image is row k of the grid of frames at scan row r, so the
+        # image is indexed by [..., t, s, k, r, l, c]
+        im = np.zeros([*leading, timepoints, slices, gridRows, sqRows, gridCols, sqCols],
+                      dtype=np.float32)
+        index = (Ellipsis, t, s, slice(None), r, slice(None), c)
+        # the frame axis comes first in the indexed array since the indices are not adjacent
+        im[index] = np.moveaxis(coeffs, -3, 0)
+        return im.reshape(*leading, timepoints, slices, gridRows * sqRows, gridCols * sqCols)
+
+
+@functools.lru_cache(maxsize=16)
+def _frameIndices(frames, steps, dimensions, directions, unidirectional, texts):
+    """ Returns the timepoint, slice, row and column in the scan of every
+    frame, and the number of timepoints, slices, rows and columns. """
+    r_l_text, u_d_text, b_f_text, timepoints_text = texts
+    dim0Side, dim1Side, dim2Side, dim3Side = steps  # dim3 is always timepoints
+
+    timepoints = steps[dimensions.index(timepoints_text)]
+    slices = steps[dimensions.index(b_f_text)]
+    sqRows = steps[dimensions.index(u_d_text)]
+    sqCols = steps[dimensions.index(r_l_text)]
+
+    i = np.arange(frames)
+    t = np.floor(i / (frames / dim3Side)).astype(int)
+
+    slow = (np.mod(i, frames / timepoints) / (dim0Side * dim1Side)).astype(int)
+    mid = (np.mod(i, dim0Side * dim1Side) / dim0Side).astype(int)
+    fast = np.mod(i, dim0Side)
+
+    if not unidirectional:
+        oddMidStep = np.mod(mid, 2)
+        fast = (1 - oddMidStep) * fast + oddMidStep * (dim1Side - 1 - fast)
+
+    neg = (int(directions[0] == 'neg'),
+           int(directions[1] == 'neg'),
+           int(directions[2] == 'neg'))
+
+    """Adjust for positive or negative direction"""
+    fast = (1 - neg[0]) * fast + neg[0] * (dim0Side - 1 - fast)
+    mid = (1 - neg[1]) * mid + neg[1] * (dim1Side - 1 - mid)
+    slow = (1 - neg[2]) * slow + neg[2] * (dim2Side - 1 - slow)
+
+    """Place dimensions in correct row/col/slice"""
+    if dimensions[0] == r_l_text:
+        if dimensions[1] == u_d_text:
+            c, r, s = fast, mid, slow
+        else:
+            c, r, s = fast, slow, mid
+    elif dimensions[0] == u_d_text:
+        if dimensions[1] == r_l_text:
+            c, r, s = mid, fast, slow
+        else:
+            c, r, s = slow, fast, mid
+    else:
+        if dimensions[1] == r_l_text:
+            c, r, s = mid, slow, fast
+        else:
+            c, r, s = slow, mid, fast
 
-        im = np.zeros(
-            [timepoints, slices, sqRows * np.shape(coeffs)[1], sqCols * np.shape(coeffs)[2]],
-            dtype=np.float32
-        )
-        for i in np.arange(np.shape(coeffs)[0]):
-
-            t = int(np.floor(i / (frames / dim3Side)))
-
-            slow = int(np.mod(i, frames / timepoints) / (dim0Side * dim1Side))
-            mid = int(np.mod(i, dim0Side * dim1Side) / dim0Side)
-            fast = np.mod(i, dim0Side)
-
-            if not scanParDict['unidirectional']:
-                oddMidStep = np.mod(mid, 2)
-                fast = (1 - oddMidStep) * fast + oddMidStep * (dim1Side - 1 - fast)
-
-            neg = (int(scanParDict['directions'][0] == 'neg'),
-                   int(scanParDict['directions'][1] == 'neg'),
-                   int(scanParDict['directions'][2] == 'neg'))
-
-            """Adjust for positive or negative direction"""
-            fast = (1 - neg[0]) * fast + neg[0] * (dim0Side - 1 - fast)
-            mid = (1 - neg[1]) * mid + neg[1] * (dim1Side - 1 - mid)
-            slow = (1 - neg[2]) * slow + neg[2] * (dim2Side - 1 - slow)
-
-            """Place dimensions in correct row/col/slice"""
-            if scanParDict['dimensions'][0] == self.r_l_text:
-                if scanParDict['dimensions'][1] == self.u_d_text:
-                    c = fast
-                    pc = dim0Side
-                    r = mid
-                    pr = dim1Side
-                    s = slow
-                else:
-                    c = fast
-                    pc = dim0Side
-                    r = slow
-                    pr = dim2Side
-                    s = mid
-            elif scanParDict['dimensions'][0] == self.u_d_text:
-                if scanParDict['dimensions'][1] == self.r_l_text:
-                    c = mid
-                    pc = dim1Side
-                    r = fast
-                    pr = dim0Side
-                    s = slow
-                else:
-                    c = slow
-                    pc = dim2Side
-                    r = fast
-                    pr = dim0Side
-                    s = mid
-            else:
-                if scanParDict['dimensions'][1] == self.r_l_text:
-                    c = mid
-                    pc = dim1Side
-                    r = slow
-                    pr = dim2Side
-                    s = fast
-                else:
-                    c = slow
-                    pc = dim2Side
-                    r = mid
-                    pr = dim1Side
-                    s = fast
-
-            self.addGridOfCoeffs(im, coeffs[i], t, s, r, c, pr, pc)
-
-        return im
+    for indices in (t, s, r, c):
+        indices.flags.writeable = False  # shared by all callers
+    return t, s, r, c, (timepoints, slices, sqRows, sqCols)
 
 
 # Copyright (C) 2020-2021 ImSwitch developers
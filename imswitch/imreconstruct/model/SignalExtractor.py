@@ -1,6 +1,7 @@
 import ctypes
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 
@@ -11,24 +12,32 @@ class SignalExtractor:
     """ This class takes the raw data together with pre-set
     parameters and recontructs and stores the final images (for the different
     bases).
+
+    On Windows, the signal is extracted by GPU_acc_recon.dll. Elsewhere, or if
+    the DLL cannot be loaded, it is extracted with NumPy, in parallel over
+    frames in a pool of up to workers processes (default: one per CPU).
     """
 
-    def __init__(self):
+    def __init__(self, workers=None):
         self.__logger = initLogger(self)
 
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.ReconstructionDLL = None
         if os.name != 'nt':
-            raise RuntimeError('This module does unfortunately currently not support non-Windows'
-                               ' operating systems.')
-
-        # TODO: Support non-Windows OS
-        # This is needed by the DLL containing CUDA code.
-        # ctypes.cdll.LoadLibrary(os.environ['CUDA_PATH_V9_0'] + '\\bin\\cudart64_90.dll')
-        ctypes.cdll.LoadLibrary(
-            os.path.join(dirtools.DataFileDirs.Libs, 'cudart64_90.dll')
-        )
-        self.ReconstructionDLL = ctypes.cdll.LoadLibrary(
-            os.path.join(dirtools.DataFileDirs.Libs, 'GPU_acc_recon.dll')
-        )
+            return
+
+        try:
+            # This is needed by the DLL containing CUDA code.
+            # ctypes.cdll.LoadLibrary(os.environ['CUDA_PATH_V9_0'] + '\\bin\\cudart64_90.dll')
+            ctypes.cdll.LoadLibrary(
+                os.path.join(dirtools.DataFileDirs.Libs, 'cudart64_90.dll')
+            )
+            self.ReconstructionDLL = ctypes.cdll.LoadLibrary(
+                os.path.join(dirtools.DataFileDirs.Libs, 'GPU_acc_recon.dll')
+            )
+        except OSError as e:
+            self.__logger.warning(f'Failed to load reconstruction DLL, extracting signal with'
+                                  f' NumPy instead: {e}')
 
     def make3dPtrArray(self, inData):
         assert len(np.shape(inData)) == 3, \
@@ -71,6 +80,14 @@ class SignalExtractor:
         Output is a 4D matrix where first dimension is base and last three
         are frame and pixel coordinates."""
 
+        if dev not in ['cpu', 'gpu']:
+            raise ValueError(f'Device must be either "cpu" or "gpu"; {dev} given')
+        if self.ReconstructionDLL is None:
+            if dev == 'gpu':
+                self.__logger.warning('GPU extraction requires the reconstruction DLL, extracting'
+                                      ' signal on the CPU instead')
+            return self.extractSignalNumpy(data, sigmas, pattern)
+
         self.__logger.debug(f'Max in data: {data.max()}')
         dataPtrArray = self.make3dPtrArray(data)
         p = ctypes.c_float * 4
@@ -114,6 +131,125 @@ class SignalExtractor:
         self.__logger.debug(f'Signal extraction performed in {elapsed} seconds')
         return resCoeffs
 
+    def extractSignalNumpy(self, data, sigmas, pattern, workers=None):
+        """ Extracts the signal like extractSignal, with NumPy. The
+        coefficients of all pattern positions are extracted at once, and
+        chunks of frames are extracted in parallel processes. """
+        data = np.asarray(data)
+        if data.ndim == 2:
+            data = data[np.newaxis]
+        workers = min(workers if workers is not None else self.workers, len(data))
+        t = time.time()
+
+        operator = _ExtractionOperator(data.shape[1:], sigmas, pattern)
+        chunkSize = min(_maxChunkFrames, int(np.ceil(len(data) / max(workers, 1))))
+        chunks = [data[i:i + chunkSize] for i in range(0, len(data), chunkSize)]
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                                     initargs=(operator,)) as pool:
+                results = list(pool.map(_extractChunk, chunks))
+        else:
+            results = [operator.apply(chunk) for chunk in chunks]
+        resCoeffs = np.concatenate(results, axis=1)
+
+        elapsed = time.time() - t
+        self.__logger.debug(f'Signal extraction of {len(data)} frames performed in {elapsed}'
+                            f' seconds with {max(workers, 1)} processes')
+        return resCoeffs
+
+
+def coeffGridSize(imRows, imCols, pattern):
+    """ Returns the number of rows and columns of pattern positions in an
+    image, with pattern given as [row offset, column offset, row period,
+    column period] in pixels. """
+    gridRows = int(np.floor((imRows - 1 - pattern[0]) / pattern[2])) + 1
+    gridCols = int(np.floor((imCols - 1 - pattern[1]) / pattern[3])) + 1
+    return max(gridRows, 0), max(gridCols, 0)
+
+
+class _ExtractionOperator:
+    """ Least-squares fit of the Gaussian bases (one per sigma, centered on a
+    pattern position) to the pixels within half a period of each pattern
+    position. The fits of all positions only depend on the image shape and
+    the parameters, so their pseudo-inverses are computed once and applied
+    to all frames. A sigma of 0 means no basis (its coefficients are 0), and
+    a very large sigma a constant background. """
+
+    def __init__(self, imShape, sigmas, pattern):
+        sigmas = np.atleast_1d(np.asarray(sigmas, dtype=float))
+        self.numBases = len(sigmas)
+        self.gridShape = coeffGridSize(imShape[0], imShape[1], pattern)
+        self.activeBases = np.flatnonzero(sigmas > 0)
+
+        rowIndices, rowBases = _windowBases(imShape[0], pattern[0], pattern[2], self.gridShape[0],
+                                            sigmas[self.activeBases])
+        colIndices, colBases = _windowBases(imShape[1], pattern[1], pattern[3], self.gridShape[1],
+                                            sigmas[self.activeBases])
+        self.rowIndices, self.colIndices = rowIndices, colIndices
+
+        # (bases, grid rows, grid cols, window pixels)
+        bases = np.einsum('bir,bjc->ijbrc', rowBases, colBases).reshape(
+            self.gridShape[0] * self.gridShape[1], len(self.activeBases), -1
+        )
+        self.pinv = np.linalg.pinv(np.swapaxes(bases, 1, 2)).astype(np.float32)
+
+    def apply(self, frames):
+        """ Returns the coefficients (bases, frames, grid rows, grid cols) of
+        the frames. """
+        windows = frames[:, self.rowIndices[:, np.newaxis, :, np.newaxis],
+                         self.colIndices[np.newaxis, :, np.newaxis, :]]
+        windows = windows.reshape(len(frames), self.pinv.shape[0], -1).astype(np.float32)
+        coeffs = np.zeros((self.numBases, len(frames), *self.gridShape), dtype=np.float32)
+        coeffs[self.activeBases] = np.einsum('gbp,fgp->bfg', self.pinv, windows).reshape(
+            len(self.activeBases), len(frames), *self.gridShape
+        )
+        return coeffs
+
+
+def _windowBases(imSize, offset, period, gridSize, sigmas):
+    """ Returns the pixel indices along one axis of the windows around the
+    pattern positions, and the Gaussian bases along that axis in them, which
+    are 0 outside the image. """
+    centers = offset + np.arange(gridSize) * period
+    halfWindow = max(int(round(period / 2)), 1)
+    indices = np.round(centers).astype(int)[:, np.newaxis] + np.arange(-halfWindow, halfWindow + 1)
+    distances = indices - centers[:, np.newaxis]
+    inImage = (indices >= 0) & (indices < imSize)
+    bases = np.exp(-distances ** 2 / (2 * sigmas[:, np.newaxis, np.newaxis] ** 2)) * inImage
+    return np.clip(indices, 0, imSize - 1), bases
+
+
+_maxChunkFrames = 32  # limits the memory used for the pixel windows
+_workerOperator = None
+
+
+def _initWorker(operator):
+    global _workerOperator
+    _workerOperator = operator
+
+
+def _extractChunk(frames):
+    return _workerOperator.apply(frames)
+
+
+def benchmark(frameCounts=(1, 10, 50, 200), imShape=(512, 512), pattern=(3.5, 3.5, 12.5, 12.5),
+              sigmas=(1.5, 9999), workers=None):
+    """ Times NumPy signal extraction of random data with one process and
+    with a pool of workers processes, for each number of frames. Returns a
+    list of (frames, serial seconds, parallel seconds). """
+    extractor = SignalExtractor(workers)
+    rng = np.random.default_rng(0)
+    results = []
+    for numFrames in frameCounts:
+        data = rng.integers(0, 255, (numFrames, *imShape), dtype=np.uint8)
+        times = []
+        for numWorkers in [1, extractor.workers]:
+            t = time.perf_counter()
+            extractor.extractSignalNumpy(data, sigmas, pattern, workers=numWorkers)
+            times.append(time.perf_counter() - t)
+        results.append((numFrames, *times))
+    return results
+
 
 # Copyright (C) 2020-2021 ImSwitch developers
 # This file is part of ImSwitch.
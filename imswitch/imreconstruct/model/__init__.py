@@ -1,4 +1,5 @@
-from .DataObj import DataObj
+from .BatchReconstructor import BatchReconstructor, ReconstructionCancelled
+from .DataObj import DataObj, LazyDataset
 from .PatternFinder import PatternFinder
 from .ReconObj import ReconObj
 from .SignalExtractor import SignalExtractor
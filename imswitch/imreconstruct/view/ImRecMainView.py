@@ -26,6 +26,7 @@ class ImRecMainView(QtWidgets.QMainWindow):
     sigReconstructMultiIndividual = QtCore.Signal()
     sigQuickLoadData = QtCore.Signal()
     sigUpdate = QtCore.Signal()
+    sigCancelReconstruction = QtCore.Signal()
 
     sigShowPatternChanged = QtCore.Signal(bool)
     sigFindPattern = QtCore.Signal()
@@ -88,12 +89,13 @@ class ImRecMainView(QtWidgets.QMainWindow):
         self.multiDataFrame = MultiDataFrame()
         self.watcherFrame = WatcherFrame()
 
-        btnFrame = BtnFrame()
-        btnFrame.sigReconstuctCurrent.connect(self.sigReconstuctCurrent)
-        btnFrame.sigReconstructMultiConsolidated.connect(self.sigReconstructMultiConsolidated)
-        btnFrame.sigReconstructMultiIndividual.connect(self.sigReconstructMultiIndividual)
-        btnFrame.sigQuickLoadData.connect(self.sigQuickLoadData)
-        btnFrame.sigUpdate.connect(self.sigUpdate)
+        self.btnFrame = BtnFrame()
+        self.btnFrame.sigReconstuctCurrent.connect(self.sigReconstuctCurrent)
+        self.btnFrame.sigReconstructMultiConsolidated.connect(self.sigReconstructMultiConsolidated)
+        self.btnFrame.sigReconstructMultiIndividual.connect(self.sigReconstructMultiIndividual)
+        self.btnFrame.sigQuickLoadData.connect(self.sigQuickLoadData)
+        self.btnFrame.sigUpdate.connect(self.sigUpdate)
+        self.btnFrame.sigCancelReconstruction.connect(self.sigCancelReconstruction)
 
         self.reconstructionWidget = ReconstructionView()
 
@@ -145,7 +147,7 @@ class ImRecMainView(QtWidgets.QMainWindow):
         rightContainer.setContentsMargins(0, 0, 0, 0)
 
         leftContainer.addWidget(parameterFrame, 1)
-        leftContainer.addWidget(btnFrame, 0)
+        leftContainer.addWidget(self.btnFrame, 0)
         leftContainer.addWidget(DataDock, 1)
         rightContainer.addWidget(self.reconstructionWidget)
 
@@ -173,6 +175,12 @@ class ImRecMainView(QtWidgets.QMainWindow):
     def addNewData(self, reconObj, name):
         self.reconstructionWidget.addNewData(reconObj, name)
 
+    def setReconstructionRunning(self, running):
+        self.btnFrame.setReconstructionRunning(running)
+
+    def setReconstructionProgress(self, datasetsDone, numDatasets):
+        self.btnFrame.setReconstructionProgress(datasetsDone, numDatasets)
+
     def getMultiDatas(self):
         dataList = self.multiDataFrame.dataList
         for i in range(dataList.count()):
@@ -264,6 +272,7 @@ class BtnFrame(QtWidgets.QFrame):
     sigReconstructMultiIndividual = QtCore.Signal()
     sigQuickLoadData = QtCore.Signal()
     sigUpdate = QtCore.Signal()
+    sigCancelReconstruction = QtCore.Signal()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -288,6 +297,11 @@ class BtnFrame(QtWidgets.QFrame):
         self.reconMultiIndividual.triggered.connect(self.sigReconstructMultiIndividual)
         self.reconMultiBtn.addAction(self.reconMultiIndividual)
 
+        self.reconProgressBar = QtWidgets.QProgressBar()
+        self.reconProgressBar.setFormat('%v/%m datasets')
+        self.cancelReconBtn = BetterPushButton('Cancel')
+        self.cancelReconBtn.clicked.connect(self.sigCancelReconstruction)
+
         layout = QtWidgets.QGridLayout()
         self.setLayout(layout)
 
@@ -295,6 +309,20 @@ class BtnFrame(QtWidgets.QFrame):
         layout.addWidget(self.reconCurrBtn, 1, 0)
         layout.addWidget(self.reconMultiBtn, 1, 1)
         layout.addWidget(self.updateBtn, 2, 0, 1, 2)
+        layout.addWidget(self.reconProgressBar, 3, 0)
+        layout.addWidget(self.cancelReconBtn, 3, 1)
+
+        self.setReconstructionRunning(False)
+
+    def setReconstructionRunning(self, running):
+        self.reconCurrBtn.setEnabled(not running)
+        self.reconMultiBtn.setEnabled(not running)
+        self.reconProgressBar.setVisible(running)
+        self.cancelReconBtn.setVisible(running)
+
+    def setReconstructionProgress(self, datasetsDone, numDatasets):
+        self.reconProgressBar.setMaximum(numDatasets)
+        self.reconProgressBar.setValue(datasetsDone)
 
 
 # Copyright (C) 2020-2021 ImSwitch developers